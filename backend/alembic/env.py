@@ -24,6 +24,7 @@ from app.models import (
     delivery_challan_item,
     invoice,
     stock_transaction,
+    job_work_snapshot,
     process,
     audit_log,
     employee_profile,
@@ -37,6 +38,8 @@ from app.models import (
     expense,
     payment,
     payment_allocation,
+    party_ledger_summary,
+    document_sequence,
     notification,
 )
 
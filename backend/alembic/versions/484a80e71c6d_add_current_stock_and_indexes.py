@@ -40,49 +40,51 @@ def upgrade() -> None:
         ), 0)
     """)
 
-    # 2. Create Trigger Function
-    op.execute("""
-        CREATE OR REPLACE FUNCTION update_item_stock()
-        RETURNS TRIGGER AS $$
-        BEGIN
-            IF (TG_OP = 'DELETE') THEN
-                IF (OLD.transaction_type = 'IN') THEN
-                    UPDATE items SET current_stock = current_stock - OLD.quantity WHERE id = OLD.item_id;
-                ELSIF (OLD.transaction_type = 'OUT') THEN
-                    UPDATE items SET current_stock = current_stock + OLD.quantity WHERE id = OLD.item_id;
-                END IF;
-                RETURN OLD;
-            ELSIF (TG_OP = 'INSERT') THEN
-                IF (NEW.transaction_type = 'IN') THEN
-                    UPDATE items SET current_stock = current_stock + NEW.quantity WHERE id = NEW.item_id;
-                ELSIF (NEW.transaction_type = 'OUT') THEN
-                    UPDATE items SET current_stock = current_stock - NEW.quantity WHERE id = NEW.item_id;
-                END IF;
-                RETURN NEW;
-            ELSIF (TG_OP = 'UPDATE') THEN
-                IF (OLD.transaction_type = 'IN') THEN
-                    UPDATE items SET current_stock = current_stock - OLD.quantity WHERE id = OLD.item_id;
-                ELSIF (OLD.transaction_type = 'OUT') THEN
-                    UPDATE items SET current_stock = current_stock + OLD.quantity WHERE id = OLD.item_id;
-                END IF;
-                IF (NEW.transaction_type = 'IN') THEN
-                    UPDATE items SET current_stock = current_stock + NEW.quantity WHERE id = NEW.item_id;
-                ELSIF (NEW.transaction_type = 'OUT') THEN
-                    UPDATE items SET current_stock = current_stock - NEW.quantity WHERE id = NEW.item_id;
+    # plpgsql trigger: PostgreSQL only (SQLite gets its own in 9c1e4b7d2a6f)
+    if op.get_bind().dialect.name == "postgresql":
+        # 2. Create Trigger Function
+        op.execute("""
+            CREATE OR REPLACE FUNCTION update_item_stock()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                IF (TG_OP = 'DELETE') THEN
+                    IF (OLD.transaction_type = 'IN') THEN
+                        UPDATE items SET current_stock = current_stock - OLD.quantity WHERE id = OLD.item_id;
+                    ELSIF (OLD.transaction_type = 'OUT') THEN
+                        UPDATE items SET current_stock = current_stock + OLD.quantity WHERE id = OLD.item_id;
+                    END IF;
+                    RETURN OLD;
+                ELSIF (TG_OP = 'INSERT') THEN
+                    IF (NEW.transaction_type = 'IN') THEN
+                        UPDATE items SET current_stock = current_stock + NEW.quantity WHERE id = NEW.item_id;
+                    ELSIF (NEW.transaction_type = 'OUT') THEN
+                        UPDATE items SET current_stock = current_stock - NEW.quantity WHERE id = NEW.item_id;
+                    END IF;
+                    RETURN NEW;
+                ELSIF (TG_OP = 'UPDATE') THEN
+                    IF (OLD.transaction_type = 'IN') THEN
+                        UPDATE items SET current_stock = current_stock - OLD.quantity WHERE id = OLD.item_id;
+                    ELSIF (OLD.transaction_type = 'OUT') THEN
+                        UPDATE items SET current_stock = current_stock + OLD.quantity WHERE id = OLD.item_id;
+                    END IF;
+                    IF (NEW.transaction_type = 'IN') THEN
+                        UPDATE items SET current_stock = current_stock + NEW.quantity WHERE id = NEW.item_id;
+                    ELSIF (NEW.transaction_type = 'OUT') THEN
+                        UPDATE items SET current_stock = current_stock - NEW.quantity WHERE id = NEW.item_id;
+                    END IF;
+                    RETURN NEW;
                 END IF;
-                RETURN NEW;
-            END IF;
-            RETURN NULL;
-        END;
-        $$ LANGUAGE plpgsql;
-    """)
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
 
-    # 3. Attach Trigger
-    op.execute("""
-        CREATE TRIGGER trg_stock_update
-        AFTER INSERT OR UPDATE OR DELETE ON stock_transactions
-        FOR EACH ROW EXECUTE FUNCTION update_item_stock();
-    """)
+        # 3. Attach Trigger
+        op.execute("""
+            CREATE TRIGGER trg_stock_update
+            AFTER INSERT OR UPDATE OR DELETE ON stock_transactions
+            FOR EACH ROW EXECUTE FUNCTION update_item_stock();
+        """)
     op.create_index('idx_payment_company_party', 'payments', ['company_id', 'party_id'], unique=False)
     op.create_index('idx_payment_date', 'payments', ['payment_date'], unique=False)
     # ### end Alembic commands ###
@@ -99,6 +101,7 @@ def downgrade() -> None:
     op.drop_index('idx_invoice_company_fy_status', table_name='invoice')
 
     # Drop Trigger and Function
-    op.execute("DROP TRIGGER IF EXISTS trg_stock_update ON stock_transactions;")
-    op.execute("DROP FUNCTION IF EXISTS update_item_stock();")
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP TRIGGER IF EXISTS trg_stock_update ON stock_transactions;")
+        op.execute("DROP FUNCTION IF EXISTS update_item_stock();")
     # ### end Alembic commands ###
@@ -0,0 +1,75 @@
+"""Add SQLite stock triggers
+
+Revision ID: 9c1e4b7d2a6f
+Revises: f4d8a2c6e1b7
+Create Date: 2026-10-18 16:20:11.402517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1e4b7d2a6f'
+down_revision: Union[str, Sequence[str], None] = 'f4d8a2c6e1b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Mirrors app/database/stock_triggers.py (PostgreSQL keeps trg_stock_update from 484a80e71c6d)
+_DELTA = "CASE {row}.transaction_type WHEN 'IN' THEN {row}.quantity WHEN 'OUT' THEN -{row}.quantity ELSE 0 END"
+
+TRIGGERS = {
+    'trg_stock_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stock_insert
+        AFTER INSERT ON stock_transactions
+        BEGIN
+            UPDATE items SET current_stock = current_stock + {_DELTA.format(row="NEW")} WHERE id = NEW.item_id;
+        END
+    """,
+    'trg_stock_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stock_delete
+        AFTER DELETE ON stock_transactions
+        BEGIN
+            UPDATE items SET current_stock = current_stock - {_DELTA.format(row="OLD")} WHERE id = OLD.item_id;
+        END
+    """,
+    'trg_stock_update': f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stock_update
+        AFTER UPDATE OF item_id, quantity, transaction_type ON stock_transactions
+        BEGIN
+            UPDATE items SET current_stock = current_stock - {_DELTA.format(row="OLD")} WHERE id = OLD.item_id;
+            UPDATE items SET current_stock = current_stock + {_DELTA.format(row="NEW")} WHERE id = NEW.item_id;
+        END
+    """,
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for ddl in TRIGGERS.values():
+        op.execute(ddl)
+    # current_stock drifted while SQLite had no trigger: recompute it once
+    op.execute("""
+        UPDATE items
+        SET current_stock = COALESCE((
+            SELECT SUM(
+                CASE WHEN transaction_type = 'IN' THEN quantity
+                     WHEN transaction_type = 'OUT' THEN -quantity
+                     ELSE 0 END
+            )
+            FROM stock_transactions
+            WHERE stock_transactions.item_id = items.id
+        ), 0)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
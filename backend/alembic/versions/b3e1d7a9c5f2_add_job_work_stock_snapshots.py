@@ -0,0 +1,107 @@
+"""Add job_work_stock_snapshots
+
+Revision ID: b3e1d7a9c5f2
+Revises: 7393ccc785ba
+Create Date: 2026-10-18 10:12:41.208113
+
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e1d7a9c5f2'
+down_revision: Union[str, Sequence[str], None] = '7393ccc785ba'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _period(value):
+    if isinstance(value, str):
+        value = datetime.strptime(value[:10], "%Y-%m-%d").date()
+    if isinstance(value, datetime):
+        value = value.date()
+    return date(value.year, value.month, 1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('job_work_stock_snapshots'):
+        op.create_table(
+            'job_work_stock_snapshots',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('company_id', sa.Integer(), nullable=False),
+            sa.Column('party_id', sa.Integer(), nullable=False),
+            sa.Column('item_id', sa.Integer(), nullable=False),
+            sa.Column('period', sa.Date(), nullable=False),
+            sa.Column('inward_qty', sa.Numeric(precision=14, scale=2), nullable=False),
+            sa.Column('outward_qty', sa.Numeric(precision=14, scale=2), nullable=False),
+            sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+            sa.ForeignKeyConstraint(['company_id'], ['company.id'], ),
+            sa.ForeignKeyConstraint(['party_id'], ['party.id'], ),
+            sa.ForeignKeyConstraint(['item_id'], ['items.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('company_id', 'party_id', 'item_id', 'period', name='uix_jw_snapshot_key'),
+        )
+    else:
+        # Already created by init_db()'s create_all (which runs before the
+        # migrations) and maybe partly filled since: rebuild it from the challans
+        op.execute("DELETE FROM job_work_stock_snapshots")
+    op.create_index('idx_jw_snapshot_company_period', 'job_work_stock_snapshots', ['company_id', 'period'], unique=False, if_not_exists=True)
+    snapshots = sa.table(
+        'job_work_stock_snapshots',
+        sa.column('company_id', sa.Integer()),
+        sa.column('party_id', sa.Integer()),
+        sa.column('item_id', sa.Integer()),
+        sa.column('period', sa.Date()),
+        sa.column('inward_qty', sa.Numeric(precision=14, scale=2)),
+        sa.column('outward_qty', sa.Numeric(precision=14, scale=2)),
+    )
+
+    # Backfill monthly buckets from existing challans (same rules as the report)
+    buckets = defaultdict(lambda: [0, 0])
+
+    inward = bind.execute(sa.text("""
+        SELECT pc.company_id, pc.party_id, pci.item_id, pc.challan_date, pci.quantity_ordered
+        FROM party_challan_items pci
+        JOIN party_challan pc ON pc.id = pci.party_challan_id
+        WHERE pc.status != 'cancelled' AND pc.challan_date IS NOT NULL
+    """))
+    for company_id, party_id, item_id, challan_date, qty in inward:
+        buckets[(company_id, party_id, item_id, _period(challan_date))][0] += qty or 0
+
+    outward = bind.execute(sa.text("""
+        SELECT dc.company_id, pc.party_id, pci.item_id, dc.challan_date, dci.quantity
+        FROM delivery_challan_items dci
+        JOIN delivery_challan dc ON dc.id = dci.challan_id
+        JOIN party_challan_items pci ON pci.id = dci.party_challan_item_id
+        JOIN party_challan pc ON pc.id = pci.party_challan_id
+        WHERE dc.status != 'cancelled' AND dc.challan_date IS NOT NULL
+    """))
+    for company_id, party_id, item_id, challan_date, qty in outward:
+        buckets[(company_id, party_id, item_id, _period(challan_date))][1] += qty or 0
+
+    if buckets:
+        op.bulk_insert(snapshots, [
+            {
+                'company_id': company_id,
+                'party_id': party_id,
+                'item_id': item_id,
+                'period': period,
+                'inward_qty': inward_qty,
+                'outward_qty': outward_qty,
+            }
+            for (company_id, party_id, item_id, period), (inward_qty, outward_qty) in buckets.items()
+        ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_jw_snapshot_company_period', table_name='job_work_stock_snapshots')
+    op.drop_table('job_work_stock_snapshots')
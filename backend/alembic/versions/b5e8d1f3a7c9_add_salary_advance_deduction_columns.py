@@ -0,0 +1,43 @@
+"""Add salary advance deduction columns
+
+Revision ID: b5e8d1f3a7c9
+Revises: 9c1e4b7d2a6f
+Create Date: 2026-10-18 17:42:05.913264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e8d1f3a7c9'
+down_revision: Union[str, Sequence[str], None] = '9c1e4b7d2a6f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Previously added at request time by /employees/{id}/salary; live
+    # databases may already have them
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    existing_columns = [col['name'] for col in inspector.get_columns('salary_advances')]
+
+    if 'deducted_month' not in existing_columns:
+        op.add_column('salary_advances', sa.Column('deducted_month', sa.Integer(), nullable=True))
+    if 'deducted_year' not in existing_columns:
+        op.add_column('salary_advances', sa.Column('deducted_year', sa.Integer(), nullable=True))
+
+    existing_indexes = [ix['name'] for ix in inspector.get_indexes('salary_advances')]
+    if 'idx_salary_advance_user_date' not in existing_indexes:
+        op.create_index('idx_salary_advance_user_date', 'salary_advances', ['user_id', 'date'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_salary_advance_user_date', table_name='salary_advances')
+    op.drop_column('salary_advances', 'deducted_year')
+    op.drop_column('salary_advances', 'deducted_month')
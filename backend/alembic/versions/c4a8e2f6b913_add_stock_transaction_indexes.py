@@ -0,0 +1,30 @@
+"""Add stock_transactions access-path indexes
+
+Revision ID: c4a8e2f6b913
+Revises: b3e1d7a9c5f2
+Create Date: 2026-10-18 11:03:27.551904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a8e2f6b913'
+down_revision: Union[str, Sequence[str], None] = 'b3e1d7a9c5f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_st_company_item_created_type', 'stock_transactions', ['company_id', 'item_id', 'created_at', 'transaction_type'], unique=False, if_not_exists=True)
+    op.create_index('idx_st_reference', 'stock_transactions', ['reference_type', 'reference_id'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_st_reference', table_name='stock_transactions', if_exists=True)
+    op.drop_index('idx_st_company_item_created_type', table_name='stock_transactions', if_exists=True)
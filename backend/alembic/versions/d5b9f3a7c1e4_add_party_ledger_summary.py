@@ -0,0 +1,131 @@
+"""Add party_ledger_summary
+
+Revision ID: d5b9f3a7c1e4
+Revises: c4a8e2f6b913
+Create Date: 2026-10-18 11:48:09.337215
+
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5b9f3a7c1e4'
+down_revision: Union[str, Sequence[str], None] = 'c4a8e2f6b913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UNDATED = date(1900, 1, 1)
+
+
+def _period(value):
+    if not value:
+        return UNDATED
+    if isinstance(value, str):
+        value = datetime.strptime(value[:10], "%Y-%m-%d").date()
+    if isinstance(value, datetime):
+        value = value.date()
+    return date(value.year, value.month, 1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('party_ledger_summary'):
+        op.create_table(
+            'party_ledger_summary',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('company_id', sa.Integer(), nullable=False),
+            sa.Column('party_id', sa.Integer(), nullable=False),
+            sa.Column('financial_year_id', sa.Integer(), nullable=False),
+            sa.Column('period', sa.Date(), nullable=False),
+            sa.Column('invoice_total', sa.Numeric(precision=14, scale=2), nullable=False),
+            sa.Column('invoice_paid', sa.Numeric(precision=14, scale=2), nullable=False),
+            sa.Column('open_due', sa.Numeric(precision=14, scale=2), nullable=False),
+            sa.Column('open_invoices', sa.Integer(), nullable=False),
+            sa.Column('received_total', sa.Numeric(precision=14, scale=2), nullable=False),
+            sa.Column('paid_total', sa.Numeric(precision=14, scale=2), nullable=False),
+            sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+            sa.ForeignKeyConstraint(['company_id'], ['company.id'], ),
+            sa.ForeignKeyConstraint(['party_id'], ['party.id'], ),
+            sa.ForeignKeyConstraint(['financial_year_id'], ['financial_year.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('company_id', 'party_id', 'financial_year_id', 'period', name='uix_party_ledger_summary_key'),
+        )
+    else:
+        # Already created by init_db()'s create_all (which runs before the
+        # migrations) and maybe partly filled since: rebuild it from the documents
+        op.execute("DELETE FROM party_ledger_summary")
+    op.create_index('idx_party_ledger_company_party', 'party_ledger_summary', ['company_id', 'party_id'], unique=False, if_not_exists=True)
+    summary = sa.table(
+        'party_ledger_summary',
+        sa.column('company_id', sa.Integer()),
+        sa.column('party_id', sa.Integer()),
+        sa.column('financial_year_id', sa.Integer()),
+        sa.column('period', sa.Date()),
+        sa.column('invoice_total', sa.Numeric(precision=14, scale=2)),
+        sa.column('invoice_paid', sa.Numeric(precision=14, scale=2)),
+        sa.column('open_due', sa.Numeric(precision=14, scale=2)),
+        sa.column('open_invoices', sa.Integer()),
+        sa.column('received_total', sa.Numeric(precision=14, scale=2)),
+        sa.column('paid_total', sa.Numeric(precision=14, scale=2)),
+    )
+
+    # Backfill from existing invoices and payments (same rules as party_ledger_service)
+    buckets = defaultdict(lambda: [0, 0, 0, 0, 0, 0])
+
+    invoices = bind.execute(sa.text("""
+        SELECT company_id, party_id, financial_year_id, invoice_date,
+               grand_total, paid_amount, payment_status
+        FROM invoice
+        WHERE status != 'CANCELLED'
+    """))
+    for company_id, party_id, fy_id, invoice_date, total, paid, payment_status in invoices:
+        row = buckets[(company_id, party_id, fy_id, _period(invoice_date))]
+        row[0] += total or 0
+        row[1] += paid or 0
+        if payment_status in ('PENDING', 'PARTIAL'):
+            if total is not None and paid is not None:
+                row[2] += total - paid
+            row[3] += 1
+
+    payments = bind.execute(sa.text("""
+        SELECT company_id, party_id, financial_year_id, payment_date, amount, payment_type
+        FROM payments
+    """))
+    for company_id, party_id, fy_id, payment_date, amount, payment_type in payments:
+        row = buckets[(company_id, party_id, fy_id, _period(payment_date))]
+        if payment_type == 'RECEIVED':
+            row[4] += amount or 0
+        elif payment_type == 'PAID':
+            row[5] += amount or 0
+
+    rows = [
+        {
+            'company_id': company_id,
+            'party_id': party_id,
+            'financial_year_id': fy_id,
+            'period': period,
+            'invoice_total': values[0],
+            'invoice_paid': values[1],
+            'open_due': values[2],
+            'open_invoices': values[3],
+            'received_total': values[4],
+            'paid_total': values[5],
+        }
+        for (company_id, party_id, fy_id, period), values in buckets.items()
+        if any(values)
+    ]
+    if rows:
+        op.bulk_insert(summary, rows)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_party_ledger_company_party', table_name='party_ledger_summary')
+    op.drop_table('party_ledger_summary')
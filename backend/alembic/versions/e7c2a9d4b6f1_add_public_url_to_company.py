@@ -0,0 +1,33 @@
+"""add_public_url_to_company
+
+Revision ID: e7c2a9d4b6f1
+Revises: d5b9f3a7c1e4
+Create Date: 2026-10-18 14:05:41.208311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7c2a9d4b6f1'
+down_revision: Union[str, Sequence[str], None] = 'd5b9f3a7c1e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    existing_columns = [col['name'] for col in inspector.get_columns('company')]
+
+    if 'public_url' not in existing_columns:
+        op.add_column('company', sa.Column('public_url', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('company', 'public_url')
@@ -0,0 +1,46 @@
+"""Add document_sequence
+
+Revision ID: f4d8a2c6e1b7
+Revises: e7c2a9d4b6f1
+Create Date: 2026-10-18 14:05:37.128904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4d8a2c6e1b7'
+down_revision: Union[str, Sequence[str], None] = 'e7c2a9d4b6f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Rows are seeded lazily from the existing documents on first use;
+    # init_db()'s create_all may already have created the (empty) table
+    if sa.inspect(op.get_bind()).has_table('document_sequence'):
+        return
+    op.create_table(
+        'document_sequence',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('company_id', sa.Integer(), nullable=False),
+        sa.Column('financial_year_id', sa.Integer(), nullable=False),
+        sa.Column('doc_type', sa.String(length=30), nullable=False),
+        sa.Column('party_id', sa.Integer(), nullable=False),
+        sa.Column('last_value', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['company_id'], ['company.id'], ),
+        sa.ForeignKeyConstraint(['financial_year_id'], ['financial_year.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('company_id', 'financial_year_id', 'doc_type', 'party_id', name='uix_document_sequence_key'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('document_sequence')
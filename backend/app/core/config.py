@@ -14,6 +14,19 @@ class Settings(BaseSettings):
 
     # ================= DATABASE =================
     DATABASE_URL: str = DEFAULT_DB_URL
+    # Threads that run the blocking DB work of async routes; unset means 8,
+    # capped at the connection pool size (5 on the SQLite profile). DB_LOOP_GUARD:
+    # "warn" logs DB calls made on the event loop, "raise" fails them, "off"
+    # disables the check.
+    DB_EXECUTOR_WORKERS: int | None = None
+    DB_LOOP_GUARD: str = "warn"
+    # SQLite profile (desktop): pooled connections, seconds a writer waits for
+    # the lock, page cache (KB) and memory-mapped I/O (bytes) per connection.
+    SQLITE_POOL_SIZE: int = 5
+    SQLITE_BUSY_TIMEOUT: float = 30.0
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE: int = 268435456
+    SQLITE_FOREIGN_KEYS: bool = True
 
     # ================= JWT =================
     JWT_SECRET_KEY: str
@@ -27,6 +40,45 @@ class Settings(BaseSettings):
     BACKEND_URL: str | None = None
     SUPER_ADMIN_ALLOWED_IPS: str = ""
 
+    # ================= PUBLIC LINKS =================
+    # Honour Forwarded / X-Forwarded-* headers when building QR / share links.
+    # Only enable behind a reverse proxy that sets them; otherwise any client
+    # could choose the host its links point to.
+    TRUST_PROXY_HEADERS: bool = False
+    # Desktop app: re-probe the LAN address this often (seconds) so links follow
+    # network changes. Servers resolve it once.
+    LINK_REFRESH_SECONDS: int = 30
+
+    # ================= CACHE =================
+    # "sqlite" shares report caches between workers via a file in APP_DATA_DIR/cache.
+    # "memory" keeps them per process (enough for the single-process desktop app).
+    REPORT_CACHE_BACKEND: str = "sqlite"
+
+    # ================= RENDERING =================
+    # Worker threads for QR / template rendering in print routes, how many jobs
+    # may wait for a worker, and how long (seconds) a request waits before a 503.
+    RENDER_WORKERS: int = 4
+    RENDER_QUEUE_SIZE: int = 32
+    RENDER_QUEUE_TIMEOUT: float = 10.0
+    # Documents loaded and rendered per step while streaming a bulk print
+    BULK_PRINT_BATCH_SIZE: int = 25
+    # QR PNGs kept in memory per process (also persisted under APP_DATA_DIR/cache/qr)
+    QR_CACHE_SIZE: int = 2048
+    # Rendered public / client-portal documents kept under APP_DATA_DIR/cache/documents
+    DOCUMENT_CACHE_ENABLED: bool = True
+    # Compiled Jinja templates kept under APP_DATA_DIR/cache/templates across restarts
+    TEMPLATE_BYTECODE_CACHE: bool = True
+
+    # ================= PDF =================
+    # "html" returns HTML for the browser to print (default, works on shared hosting).
+    # "weasyprint" / "chromium" render real PDFs in PDF_WORKERS worker processes.
+    PDF_BACKEND: str = "html"
+    PDF_WORKERS: int = 2
+    PDF_QUEUE_SIZE: int = 16
+    PDF_QUEUE_TIMEOUT: float = 30.0
+    PDF_JOB_TIMEOUT: float = 60.0
+    PDF_MAX_JOBS_PER_WORKER: int = 200
+
     # ================= CRON =================
     # Used to authenticate the internal /backup/cron endpoint.
     # Set this in .env on the server. Keep it secret!
@@ -59,33 +111,12 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-import socket
 
 def get_backend_url() -> str:
     """
     Returns the backend URL for QR codes and external links.
-    Priority:
-    1. ENV VAR: BACKEND_URL (Explicit override for Production)
-    2. LAN IP: http://192.168.x.x:8000 (Auto-detected for Local Dev)
-    3. LOCALHOST: http://localhost:8000 (Fallback)
+    Kept for compatibility; routes should call link_service.base_url(request, ...)
+    so reverse-proxy headers and tenant domains are honoured.
     """
-    # 1. Check Env Var (Highest Priority)
-    if settings.BACKEND_URL and "localhost" not in settings.BACKEND_URL:
-         return settings.BACKEND_URL.rstrip("/")
-
-    # 2. Detect LAN IP (For local network testing if no remote URL set)
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        # Doesn't actually connect, just determines route
-        s.connect(("8.8.8.8", 80))
-        lan_ip = s.getsockname()[0]
-        s.close()
-        return f"http://{lan_ip}:8000"
-    except Exception:
-        pass
-
-    # 3. Last Resort Fallback (or if Env is localhost)
-    if settings.BACKEND_URL:
-        return settings.BACKEND_URL.rstrip("/")
-
-    return "http://localhost:8000"
+    from app.services.link_service import link_service
+    return link_service.base_url()
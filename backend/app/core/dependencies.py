@@ -7,18 +7,18 @@ from datetime import date
 from app.core.config import settings
 from app.database.session import get_db
 from app.models.user import User, UserRole
-from app.models.company import Company
 from app.models.financial_year import FinancialYear
+from app.core.principal import PrincipalContext, resolve_principal
 
 security = HTTPBearer()
 
 # ============================================================
-# 🔐 AUTHENTICATION (JWT → USER)
+# 🪪 PRINCIPAL CONTEXT (USER + COMPANY + PLAN + FY, ONE LOOKUP)
 # ============================================================
-def get_current_user(
+def get_principal(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db),
-) -> User:
+) -> PrincipalContext:
     token = credentials.credentials
 
     try:
@@ -42,30 +42,33 @@ def get_current_user(
             detail="Invalid token",
         )
 
-    user = (
-        db.query(User)
-        .filter(
-            User.id == user_id,
-            User.is_active == True,
-        )
-        .first()
-    )
+    token_version = payload.get("token_version", 1)
+    principal = resolve_principal(db, user_id, token_version)
 
-    if not user:
+    if not principal:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found or inactive",
         )
         
     # Check if the token version matches the DB (Force Logout feature)
-    token_version = payload.get("token_version", 1)
-    if not payload.get("is_impersonated") and token_version != user.token_version:
+    if not payload.get("is_impersonated") and token_version != principal.token_version:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Session expired. Please log in again.",
         )
 
-    return user
+    return principal
+
+
+# ============================================================
+# 🔐 AUTHENTICATION (JWT → USER)
+# ============================================================
+def get_current_user(
+    principal: PrincipalContext = Depends(get_principal),
+    db: Session = Depends(get_db),
+) -> User:
+    return principal.attach_user(db)
 
 
 # ============================================================
@@ -111,18 +114,11 @@ def get_company_id(
 # ============================================================
 def enforce_company_subscription(
     company_id: int = Depends(get_company_id),
-    db: Session = Depends(get_db),
+    principal: PrincipalContext = Depends(get_principal),
 ) -> int:
-    company = (
-        db.query(Company)
-        .filter(
-            Company.id == company_id,
-            Company.is_active == True,
-        )
-        .first()
-    )
+    company = principal.company_row
 
-    if not company:
+    if not company or not company["is_active"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Company is inactive or not found",
@@ -130,13 +126,13 @@ def enforce_company_subscription(
 
     today = date.today()
 
-    if company.subscription_start > today:
+    if company["subscription_start"] > today:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Subscription not yet active",
         )
 
-    if company.subscription_end < today:
+    if company["subscription_end"] < today:
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
             detail="Subscription expired. Please renew.",
@@ -151,20 +147,18 @@ def enforce_company_subscription(
 def require_feature(flag_name: str):
     def checker(
         current_user: User = Depends(get_current_user), 
-        db: Session = Depends(get_db)
+        principal: PrincipalContext = Depends(get_principal)
     ) -> User:
         if current_user.legacy_role == UserRole.SUPER_ADMIN.value:
             return current_user # Super Admins bypass flag checks
             
-        company = db.query(Company).filter(Company.id == current_user.company_id).first()
-        
-        if not company or not company.plan:
+        if not principal.company_row or principal.feature_flags is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="No active subscription plan assigned to your company."
             )
             
-        feature_flags = company.plan.feature_flags or []
+        feature_flags = principal.feature_flags
         if flag_name not in feature_flags:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -181,17 +175,10 @@ def require_feature(flag_name: str):
 # ============================================================
 def get_active_financial_year(
     company_id: int = Depends(enforce_company_subscription),
+    principal: PrincipalContext = Depends(get_principal),
     db: Session = Depends(get_db),
 ) -> FinancialYear:
-    fy = (
-        db.query(FinancialYear)
-        .filter(
-            FinancialYear.company_id == company_id,
-            FinancialYear.is_active == True,
-            FinancialYear.is_locked == False,
-        )
-        .first()
-    )
+    fy = principal.attach_active_fy(db)
 
     if not fy:
         raise HTTPException(
@@ -23,9 +23,10 @@ APP_DATA_DIR = get_app_data_dir()
 UPLOAD_DIR  = os.path.join(APP_DATA_DIR, "uploads")
 LOG_DIR     = os.path.join(APP_DATA_DIR, "logs")
 BACKUP_DIR  = os.path.join(APP_DATA_DIR, "backups")
+CACHE_DIR   = os.path.join(APP_DATA_DIR, "cache")
 DB_PATH     = os.path.join(APP_DATA_DIR, "sql_app.db")
 DATABASE_URL = f"sqlite:///{DB_PATH}"
 
 # Ensure directories exist
-for _d in [UPLOAD_DIR, LOG_DIR, BACKUP_DIR]:
+for _d in [UPLOAD_DIR, LOG_DIR, BACKUP_DIR, CACHE_DIR]:
     os.makedirs(_d, exist_ok=True)
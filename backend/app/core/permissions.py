@@ -1,6 +1,7 @@
 """
 Permission decorators for protecting API endpoints
 """
+import inspect
 from functools import wraps
 from typing import List
 from fastapi import HTTPException, status, Depends
@@ -8,6 +9,61 @@ from sqlalchemy.orm import Session
 from app.models.user import User
 from app.services.permission_service import PermissionService
 from app.database.session import get_db
+from app.database.executor import db_executor
+
+
+def _guarded(func, check, detail: str):
+    """
+    Wrap ``func`` so ``check(current_user, db)`` must pass before it runs.
+
+    The wrapper keeps the kind of the handler: sync handlers get a sync
+    wrapper, which FastAPI runs in its threadpool like any other ``def``
+    route, and async handlers get an async wrapper that runs the check on
+    the DB executor. (An ``async`` wrapper around a sync handler would run
+    its blocking ORM code on the event loop and serialize every request.)
+    ``@wraps`` keeps the signature, so FastAPI still resolves ``Depends``.
+    """
+    def authorize(kwargs):
+        current_user = kwargs.get('current_user')
+        db = kwargs.get('db')
+
+        if not current_user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated"
+            )
+
+        if not db:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Database session not available"
+            )
+        return current_user, db
+
+    def deny():
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=detail
+        )
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            current_user, db = authorize(kwargs)
+            if not await db_executor.run(check, current_user, db):
+                deny()
+            return await func(*args, **kwargs)
+
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        current_user, db = authorize(kwargs)
+        if not check(current_user, db):
+            deny()
+        return func(*args, **kwargs)
+
+    return wrapper
 
 
 def require_permission(permission_code: str):
@@ -21,34 +77,11 @@ def require_permission(permission_code: str):
             ...
     """
     def decorator(func):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            # Extract current_user and db from kwargs
-            current_user = kwargs.get('current_user')
-            db = kwargs.get('db')
-            
-            if not current_user:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Not authenticated"
-                )
-            
-            if not db:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Database session not available"
-                )
-            
-            # Check permission
-            if not PermissionService.has_permission(current_user, permission_code, db):
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Permission denied: {permission_code} required"
-                )
-            
-            return await func(*args, **kwargs) if asyncio.iscoroutinefunction(func) else func(*args, **kwargs)
-        
-        return wrapper
+        return _guarded(
+            func,
+            lambda user, db: PermissionService.has_permission(user, permission_code, db),
+            f"Permission denied: {permission_code} required",
+        )
     return decorator
 
 
@@ -63,33 +96,11 @@ def require_any_permission(*permission_codes: str):
             ...
     """
     def decorator(func):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            current_user = kwargs.get('current_user')
-            db = kwargs.get('db')
-            
-            if not current_user:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Not authenticated"
-                )
-            
-            if not db:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Database session not available"
-                )
-            
-            # Check if user has any of the permissions
-            if not PermissionService.has_any_permission(current_user, list(permission_codes), db):
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Permission denied: One of {permission_codes} required"
-                )
-            
-            return await func(*args, **kwargs) if asyncio.iscoroutinefunction(func) else func(*args, **kwargs)
-        
-        return wrapper
+        return _guarded(
+            func,
+            lambda user, db: PermissionService.has_any_permission(user, list(permission_codes), db),
+            f"Permission denied: One of {permission_codes} required",
+        )
     return decorator
 
 
@@ -105,5 +116,3 @@ def check_permission(user: User, permission_code: str, db: Session) -> bool:
     """
     return PermissionService.has_permission(user, permission_code, db)
 
-
-import asyncio
@@ -0,0 +1,188 @@
+"""
+Authenticated-principal context
+
+Every company request needs the same four facts before its handler runs:
+the user behind the JWT, the company's subscription window, the plan's
+feature flags and the active financial year. Resolving them separately
+costs one query per dependency, so they are loaded together in a single
+outer-join query and kept in a short-TTL, per-worker cache keyed on
+(user_id, token_version).
+
+Cached rows are plain column snapshots. They are re-attached to the
+request's Session with ``merge(load=False)`` so handlers still receive
+normal ORM instances (relationships lazy-load as usual) without a SELECT.
+
+Invalidation:
+- ``invalidate_principal_user`` / ``invalidate_principal_company`` are
+  called explicitly from force-logout, subscription extension and FY
+  activation.
+- A Session listener drops affected entries after any committed change
+  to User, Company, SubscriptionPlan or FinancialYear rows, so edits made
+  elsewhere (deactivation, role change, 2FA, password) are not served stale.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import and_, event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.models.user import User
+from app.models.company import Company
+from app.models.subscription_plan import SubscriptionPlan
+from app.models.financial_year import FinancialYear
+
+
+PRINCIPAL_CACHE_TTL = 30  # seconds
+
+_principal_cache: Dict[Tuple[int, int], Tuple[float, "PrincipalContext"]] = {}
+_principal_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class PrincipalContext:
+    user_id: int
+    token_version: int
+    company_id: Optional[int]
+    user_row: Dict[str, Any]
+    company_row: Optional[Dict[str, Any]]
+    feature_flags: Optional[Tuple[str, ...]]   # None = no plan assigned
+    active_fy_row: Optional[Dict[str, Any]]
+
+    def attach_user(self, db: Session) -> User:
+        return _attach(db, User, self.user_row)
+
+    def attach_active_fy(self, db: Session) -> Optional[FinancialYear]:
+        if not self.active_fy_row:
+            return None
+        return _attach(db, FinancialYear, self.active_fy_row)
+
+
+# ============================================================
+# SNAPSHOT HELPERS
+# ============================================================
+def _snapshot(obj) -> Dict[str, Any]:
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(type(obj)).column_attrs}
+
+
+def _attach(db: Session, model, row: Dict[str, Any]):
+    """Rebuild a persistent instance from a column snapshot without a SELECT"""
+    existing = db.identity_map.get(inspect(model).identity_key_from_primary_key((row["id"],)))
+    if existing is not None:
+        return existing
+
+    obj = model(**row)
+    make_transient_to_detached(obj)
+    return db.merge(obj, load=False)
+
+
+def _load_principal(db: Session, user_id: int) -> Optional[PrincipalContext]:
+    row = (
+        db.query(User, Company, SubscriptionPlan, FinancialYear)
+        .outerjoin(Company, Company.id == User.company_id)
+        .outerjoin(SubscriptionPlan, SubscriptionPlan.id == Company.plan_id)
+        .outerjoin(
+            FinancialYear,
+            and_(
+                FinancialYear.company_id == User.company_id,
+                FinancialYear.is_active == True,
+                FinancialYear.is_locked == False,
+            ),
+        )
+        .filter(User.id == user_id, User.is_active == True)
+        .first()
+    )
+    if not row:
+        return None
+
+    user, company, plan, fy = row
+    return PrincipalContext(
+        user_id=user.id,
+        token_version=user.token_version,
+        company_id=user.company_id,
+        user_row=_snapshot(user),
+        company_row=_snapshot(company) if company else None,
+        feature_flags=tuple(plan.feature_flags or []) if plan else None,
+        active_fy_row=_snapshot(fy) if fy else None,
+    )
+
+
+# ============================================================
+# CACHE
+# ============================================================
+def resolve_principal(db: Session, user_id: int, token_version: int) -> Optional[PrincipalContext]:
+    """Return the cached principal for (user_id, token_version), loading it on a miss"""
+    key = (user_id, token_version)
+    now = time.monotonic()
+    cached = _principal_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    ctx = _load_principal(db, user_id)
+    if ctx is not None:
+        with _principal_lock:
+            _principal_cache[key] = (now + PRINCIPAL_CACHE_TTL, ctx)
+    return ctx
+
+
+def invalidate_principal_user(user_id: int) -> None:
+    with _principal_lock:
+        for key in [k for k in _principal_cache if k[0] == user_id]:
+            _principal_cache.pop(key, None)
+
+
+def invalidate_principal_company(company_id: int) -> None:
+    with _principal_lock:
+        for key, (_, ctx) in list(_principal_cache.items()):
+            if ctx.company_id == company_id:
+                _principal_cache.pop(key, None)
+
+
+def clear_principal_cache() -> None:
+    with _principal_lock:
+        _principal_cache.clear()
+
+
+# ============================================================
+# SESSION LISTENERS (invalidate after commit)
+# ============================================================
+_PENDING_KEY = "principal_invalidations"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_principal_changes(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            pending.add(("user", obj.id))
+        elif isinstance(obj, Company):
+            pending.add(("company", obj.id))
+        elif isinstance(obj, FinancialYear):
+            pending.add(("company", obj.company_id))
+        elif isinstance(obj, SubscriptionPlan):
+            pending.add(("all", None))
+    for obj in session.new:
+        if isinstance(obj, FinancialYear):
+            pending.add(("company", obj.company_id))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_principal_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for kind, ident in pending:
+        if kind == "all":
+            clear_principal_cache()
+            return
+    for kind, ident in pending:
+        if kind == "user":
+            invalidate_principal_user(ident)
+        elif kind == "company" and ident is not None:
+            invalidate_principal_company(ident)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_principal_changes(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
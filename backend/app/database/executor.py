@@ -0,0 +1,160 @@
+"""
+executor.py
+===========
+Runs blocking SQLAlchemy work for ``async def`` routes off the event loop.
+
+The print / download / e-way bill routes are ``async def`` (they await the
+render pool, the PDF workers or the NIC API) but the ORM is synchronous, so
+every ``db.query(...)`` in them used to run on the event loop thread and
+stall all other requests on the worker while it waited for the database.
+
+Async routes now wrap their database section in a plain function and await
+it here:
+
+    def load():
+        invoice = db.query(Invoice).filter(...).first()
+        ...
+        return invoice, company
+
+    invoice, company = await db_executor.run(load)
+
+``run`` reuses the request's Session (from ``get_db``) on a bounded pool of
+DB_EXECUTOR_WORKERS threads; the route only touches that Session again
+after the job has finished, so it is never used by two threads at once.
+``run_session`` opens a Session of its own for work that is not tied to a
+request (background jobs).
+
+Unless DB_EXECUTOR_WORKERS is set, the pool has DEFAULT_WORKERS threads
+capped at the engine's connection pool size (``pool_size``: 10 on
+PostgreSQL, SQLITE_POOL_SIZE on the desktop build), so its threads do not
+queue for a connection.
+
+Loop guard: a ``before_cursor_execute`` hook notices statements executed on
+a thread that is running an event loop. DB_LOOP_GUARD="warn" logs each
+offending call site once, "raise" fails the statement (used by the tests),
+"off" does not install the hook.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.database.session import SessionLocal, engine
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_SKIP_DIRS = (os.path.dirname(os.path.abspath(sqlalchemy.__file__)), os.path.abspath(__file__))
+
+
+DEFAULT_WORKERS = 8
+
+
+class BlockingDBCallError(RuntimeError):
+    """A database statement was executed on the event loop thread."""
+
+
+# ============================================================
+# EXECUTOR
+# ============================================================
+class DBExecutor:
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="db"
+                    )
+        return self._executor
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run ``fn(*args, **kwargs)`` on the DB pool and await its result."""
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), functools.partial(context.run, fn, *args, **kwargs)
+        )
+
+    async def run_session(self, fn: Callable, *args, **kwargs) -> Any:
+        """Like run(), with a fresh Session passed as the first argument and closed afterwards."""
+        def job():
+            db = SessionLocal()
+            try:
+                return fn(db, *args, **kwargs)
+            finally:
+                db.close()
+        return await self.run(job)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def default_workers(bind: Engine) -> int:
+    """DEFAULT_WORKERS, capped at the size of the engine's connection pool."""
+    pool_size = getattr(bind.pool, "size", None)
+    if callable(pool_size):
+        return max(1, min(DEFAULT_WORKERS, pool_size()))
+    return DEFAULT_WORKERS  # StaticPool / NullPool: no fixed size
+
+
+db_executor = DBExecutor(max_workers=settings.DB_EXECUTOR_WORKERS or default_workers(engine))
+
+
+# ============================================================
+# LOOP GUARD
+# ============================================================
+_reported = set()
+
+
+def _call_site() -> str:
+    """First real frame outside SQLAlchemy and this module, as 'path:line (function)'."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith("<") and not os.path.abspath(filename).startswith(_SKIP_DIRS):
+            return f"{os.path.relpath(filename, _ROOT_DIR)}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return "unknown"
+
+
+def _on_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _guard(conn, cursor, statement, parameters, context, executemany):
+    if not _on_loop():
+        return
+    site = _call_site()
+    if settings.DB_LOOP_GUARD == "raise":
+        raise BlockingDBCallError(f"Blocking database call on the event loop at {site}")
+    if site not in _reported:
+        _reported.add(site)
+        logger.warning(f"[DB] Blocking database call on the event loop at {site}; use db_executor.run()")
+
+
+def install_loop_guard() -> None:
+    if settings.DB_LOOP_GUARD != "off" and not event.contains(Engine, "before_cursor_execute", _guard):
+        event.listen(Engine, "before_cursor_execute", _guard)
+
+
+install_loop_guard()
@@ -24,6 +24,11 @@ def init_db():
     
     print("Creating tables...")
     Base.metadata.create_all(bind=engine)
+
+    # SQLite has no plpgsql stock trigger: install ours on existing databases
+    from app.database.stock_triggers import ensure_stock_triggers
+    if ensure_stock_triggers(engine):
+        print("Installed stock triggers and recalculated current stock.")
     
     # Safe auto-migration for new SalaryAdvance columns
     try:
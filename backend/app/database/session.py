@@ -3,6 +3,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.database import sqlite_profile
 
 # In Passenger environments using lazy ASGI loading (a2wsgi), the engine is created 
 # after the fork, making QueuePool safe to use and highly recommended for performance.
@@ -13,11 +14,19 @@ engine_kwargs = {
     "pool_recycle": 1800,  # Recycle connections after 30 mins to prevent timeouts
 }
 
+_is_sqlite = sqlite_profile.is_sqlite(settings.DATABASE_URL)
+if _is_sqlite:
+    # Desktop / frozen build: WAL, PRAGMAs and an in-process write serializer
+    engine_kwargs = sqlite_profile.engine_kwargs(settings.DATABASE_URL)
+
 engine = create_engine(
     settings.DATABASE_URL,
     **engine_kwargs
 )
 
+if _is_sqlite:
+    sqlite_profile.configure(engine, settings.DATABASE_URL)
+
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
@@ -0,0 +1,136 @@
+"""
+sqlite_profile.py
+=================
+Engine settings for SQLite (the desktop / frozen build, where DATABASE_URL
+points at APP_DATA_DIR/sql_app.db).
+
+The engine used to be created with the same QueuePool arguments as the
+PostgreSQL server and the SQLite defaults: rollback journal (readers and the
+writer block each other), ``synchronous=FULL`` (an fsync per commit), a 2 MB
+page cache, no busy timeout beyond pysqlite's 5 s and foreign keys off.
+
+File databases now get, on every new connection:
+
+    * ``journal_mode=WAL``      readers never wait for the writer
+    * ``synchronous=NORMAL``    safe with WAL; fsync at checkpoints only
+    * ``cache_size`` / ``mmap_size`` / ``temp_store=MEMORY``
+    * ``busy_timeout``          wait for a lock instead of failing
+    * ``foreign_keys=ON``       same integrity rules as PostgreSQL
+
+SQLite allows one writer at a time. When two request threads both write,
+the one that loses can get "database is locked" no matter the busy timeout
+(a deferred transaction that must upgrade its lock is not retried). The
+write serializer below makes writers queue in-process instead: a
+connection takes the engine's write lock before its first INSERT / UPDATE /
+DELETE / DDL and gives it back at COMMIT / ROLLBACK (or when it returns to
+the pool). Reads are not affected. Ownership is per connection: code
+writing through a second connection while its first one still holds the
+lock waits like any other writer (and gives up waiting after
+SQLITE_BUSY_TIMEOUT, leaving it to SQLite's own locking).
+
+In-memory databases (the tests) keep SQLAlchemy's default pool, since each
+pooled connection would otherwise be a separate empty database.
+"""
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+from app.core.config import settings
+from app.core.logger import logger
+
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+_HOLDS_LOCK = "sqlite_write_lock"
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_memory(url: str) -> bool:
+    database = make_url(url).database
+    return not database or database == ":memory:" or "mode=memory" in url
+
+
+def engine_kwargs(url: str) -> dict:
+    """create_engine() arguments for a SQLite URL."""
+    kwargs = {
+        "connect_args": {
+            "check_same_thread": False,
+            "timeout": settings.SQLITE_BUSY_TIMEOUT,
+        },
+    }
+    if not _is_memory(url):
+        # Connections are cheap local file handles: no pre-ping / recycle needed
+        kwargs.update(pool_size=settings.SQLITE_POOL_SIZE, max_overflow=settings.SQLITE_POOL_SIZE)
+    return kwargs
+
+
+# ============================================================
+# PRAGMAS
+# ============================================================
+def _set_pragmas(dbapi_connection, connection_record, memory: bool):
+    cursor = dbapi_connection.cursor()
+    try:
+        if not memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT * 1000)}")
+        cursor.execute(f"PRAGMA foreign_keys={'ON' if settings.SQLITE_FOREIGN_KEYS else 'OFF'}")
+    finally:
+        cursor.close()
+
+
+# ============================================================
+# WRITE SERIALIZER
+# ============================================================
+class WriteSerializer:
+    """One in-process writer at a time per engine (see module docstring)."""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def acquire(self, info: dict) -> None:
+        if info.get(_HOLDS_LOCK):
+            return
+        if not self._lock.acquire(timeout=self.timeout):
+            logger.warning("[DB] SQLite write lock wait timed out; continuing without it")
+            return
+        info[_HOLDS_LOCK] = True
+
+    def release(self, info: dict) -> None:
+        if info.pop(_HOLDS_LOCK, False):
+            self._lock.release()
+
+    # -- event hooks --------------------------------------------------------
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:7].upper().startswith(_WRITE_PREFIXES):
+            self.acquire(conn.info)
+
+    def end_transaction(self, conn):
+        self.release(conn.info)
+
+    def checkin(self, dbapi_connection, connection_record):
+        if connection_record is not None:
+            self.release(connection_record.info)
+
+    def reset(self, dbapi_connection, connection_record, reset_state):
+        self.checkin(dbapi_connection, connection_record)
+
+
+def configure(engine: Engine, url: str) -> WriteSerializer:
+    """Install the PRAGMAs and the write serializer on a SQLite engine."""
+    memory = _is_memory(url)
+    event.listen(engine, "connect", lambda conn, record: _set_pragmas(conn, record, memory))
+
+    serializer = WriteSerializer(timeout=settings.SQLITE_BUSY_TIMEOUT)
+    event.listen(engine, "before_cursor_execute", serializer.before_cursor_execute)
+    event.listen(engine, "commit", serializer.end_transaction)
+    event.listen(engine, "rollback", serializer.end_transaction)
+    event.listen(engine, "reset", serializer.reset)
+    event.listen(engine, "checkin", serializer.checkin)
+    return serializer
@@ -0,0 +1,92 @@
+"""
+stock_triggers.py
+=================
+Keeps ``items.current_stock`` in step with ``stock_transactions`` on SQLite.
+
+On PostgreSQL the plpgsql trigger ``trg_stock_update`` (migration
+484a80e71c6d) adds / subtracts every inserted, updated or deleted ledger
+row. The desktop build runs on SQLite, where that trigger never existed, so
+``current_stock`` drifted and the low-stock alerts and AI-insight stock
+projections read stale numbers.
+
+This module ports the same rules to SQLite triggers (IN adds, OUT
+subtracts, anything else is ignored). Being triggers, they also see the
+set-based INSERT ... SELECT / DELETE statements of the stock rebuild,
+which ORM events would miss.
+
+They are installed:
+    * when ``stock_transactions`` is created (``after_create``, covers
+      create_all for new desktop databases and the tests);
+    * by ``ensure_stock_triggers()`` from init_db for existing databases,
+      which also recomputes current_stock once, since it drifted before.
+"""
+from sqlalchemy import text
+
+_DELTA = "CASE {row}.transaction_type WHEN 'IN' THEN {row}.quantity WHEN 'OUT' THEN -{row}.quantity ELSE 0 END"
+
+SQLITE_STOCK_TRIGGERS = {
+    "trg_stock_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stock_insert
+        AFTER INSERT ON stock_transactions
+        BEGIN
+            UPDATE items SET current_stock = current_stock + {_DELTA.format(row="NEW")} WHERE id = NEW.item_id;
+        END
+    """,
+    "trg_stock_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stock_delete
+        AFTER DELETE ON stock_transactions
+        BEGIN
+            UPDATE items SET current_stock = current_stock - {_DELTA.format(row="OLD")} WHERE id = OLD.item_id;
+        END
+    """,
+    "trg_stock_update": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stock_update
+        AFTER UPDATE OF item_id, quantity, transaction_type ON stock_transactions
+        BEGIN
+            UPDATE items SET current_stock = current_stock - {_DELTA.format(row="OLD")} WHERE id = OLD.item_id;
+            UPDATE items SET current_stock = current_stock + {_DELTA.format(row="NEW")} WHERE id = NEW.item_id;
+        END
+    """,
+}
+
+# Whole-table recompute, as in the 484a80e71c6d backfill
+RECOMPUTE_CURRENT_STOCK = """
+    UPDATE items
+    SET current_stock = COALESCE((
+        SELECT SUM(
+            CASE WHEN transaction_type = 'IN' THEN quantity
+                 WHEN transaction_type = 'OUT' THEN -quantity
+                 ELSE 0 END
+        )
+        FROM stock_transactions
+        WHERE stock_transactions.item_id = items.id
+    ), 0)
+"""
+
+
+def install_stock_triggers(target, connection, **kw) -> None:
+    """``after_create`` listener for the stock_transactions table."""
+    if connection.dialect.name != "sqlite":
+        return
+    for ddl in SQLITE_STOCK_TRIGGERS.values():
+        connection.execute(text(ddl))
+
+
+def ensure_stock_triggers(engine) -> bool:
+    """
+    Install missing SQLite stock triggers on an existing database and
+    recompute current_stock. Returns True if anything was installed.
+    """
+    if engine.dialect.name != "sqlite":
+        return False
+    with engine.begin() as conn:
+        existing = {
+            row[0] for row in conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'stock_transactions'"
+            ))
+        }
+        if set(SQLITE_STOCK_TRIGGERS) <= existing:
+            return False
+        install_stock_triggers(None, conn)
+        conn.execute(text(RECOMPUTE_CURRENT_STOCK))
+    return True
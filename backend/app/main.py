@@ -49,6 +49,9 @@ from app.core.config import settings
 from app.auth.auth_router import router as auth_router
 from app.auth.two_factor_router import router as two_factor_router
 from app.services.pdf_service import pdf_manager
+from app.services.render_service import render_service
+from app.database.executor import db_executor
+from app.services.template_env import precompile_templates
 from app.services.backup_service import backup_manager
 from app.core.paths import APP_DATA_DIR, UPLOAD_DIR, LOG_DIR, BACKUP_DIR, DB_PATH, DATABASE_URL
 
@@ -75,6 +78,9 @@ from app.models.payment import Payment
 from app.models.payment_allocation import PaymentAllocation
 from app.models.expense import Expense
 from app.models.stock_transaction import StockTransaction
+from app.models.job_work_snapshot import JobWorkStockSnapshot
+from app.models.party_ledger_summary import PartyLedgerSummary
+from app.models.document_sequence import DocumentSequence
 from app.models.attendance import Attendance
 from app.models.salary_advance import SalaryAdvance
 from app.models.notification import Notification
@@ -166,6 +172,7 @@ async def app_lifespan(app: FastAPI):
             await asyncio.to_thread(sync_db_setup)
 
             # 3. Start Services
+            await asyncio.to_thread(precompile_templates)
             await pdf_manager.start()
             backup_manager.start_scheduler()
             
@@ -177,6 +184,8 @@ async def app_lifespan(app: FastAPI):
     yield
 
     await pdf_manager.stop()
+    render_service.shutdown()
+    db_executor.shutdown()
 
 app = FastAPI(title=settings.PROJECT_NAME, lifespan=app_lifespan)
 
@@ -22,6 +22,9 @@ from app.models.payment import Payment
 from app.models.payment_allocation import PaymentAllocation
 from app.models.expense import Expense
 from app.models.stock_transaction import StockTransaction
+from app.models.job_work_snapshot import JobWorkStockSnapshot
+from app.models.party_ledger_summary import PartyLedgerSummary
+from app.models.document_sequence import DocumentSequence
 from app.models.attendance import Attendance
 from app.models.short_link import ShortLink
 from app.models.salary_advance import SalaryAdvance
@@ -34,6 +34,7 @@ class Company(Base):
     logo = Column(String(500), nullable=True)
     state_code = Column(String(2), nullable=True)  # GST state code for e-way bill
     pincode = Column(String(6), nullable=True)      # Pincode for e-way bill API
+    public_url = Column(String(255), nullable=True)  # Custom domain for QR / share links
 
     # =========================
     # 🔐 SUBSCRIPTION CONTROL (SUPER ADMIN)
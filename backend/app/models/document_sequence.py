@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint
+
+from app.database.base import Base
+
+
+class DocumentSequence(Base):
+    """
+    Last number handed out per (company, financial year, document type, party).
+
+    ``party_id`` is 0 for sequences that are not numbered per party (invoices,
+    party challans). Rows are only ever changed by an UPDATE ... SET
+    last_value = last_value + 1 inside the document's own transaction, see
+    app.services.document_sequence.
+    """
+    __tablename__ = "document_sequence"
+
+    id = Column(Integer, primary_key=True)
+
+    company_id = Column(Integer, ForeignKey("company.id"), nullable=False)
+    financial_year_id = Column(Integer, ForeignKey("financial_year.id"), nullable=False)
+    doc_type = Column(String(30), nullable=False)  # INVOICE, DELIVERY_CHALLAN, PARTY_CHALLAN
+    party_id = Column(Integer, nullable=False, default=0)
+    last_value = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("company_id", "financial_year_id", "doc_type", "party_id", name="uix_document_sequence_key"),
+    )
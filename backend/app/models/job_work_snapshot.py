@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, Date, Numeric, ForeignKey, Index, UniqueConstraint
+
+from app.database.base import Base
+
+
+class JobWorkStockSnapshot(Base):
+    """
+    Monthly job-work movement per (party, item).
+
+    One row holds the inward (party challan) and outward (delivery challan)
+    quantity booked in the calendar month starting at ``period``. Summing
+    every row before a month gives that month's opening balance without
+    scanning the challan history. Maintained by
+    app.services.job_work_snapshot_service.
+    """
+    __tablename__ = "job_work_stock_snapshots"
+
+    id = Column(Integer, primary_key=True)
+
+    company_id = Column(Integer, ForeignKey("company.id"), nullable=False)
+    party_id = Column(Integer, ForeignKey("party.id"), nullable=False)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=False)
+    period = Column(Date, nullable=False)  # first day of the month
+
+    inward_qty = Column(Numeric(14, 2), nullable=False, default=0)
+    outward_qty = Column(Numeric(14, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("company_id", "party_id", "item_id", "period", name="uix_jw_snapshot_key"),
+        Index("idx_jw_snapshot_company_period", "company_id", "period"),
+    )
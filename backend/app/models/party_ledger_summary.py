@@ -0,0 +1,37 @@
+from sqlalchemy import Column, Integer, Date, Numeric, ForeignKey, Index, UniqueConstraint
+
+from app.database.base import Base
+
+
+class PartyLedgerSummary(Base):
+    """
+    Monthly receivables totals per party and financial year.
+
+    Invoices are bucketed by invoice_date and payments by payment_date;
+    undated rows land in the UNDATED period. Summing a party's rows gives its
+    outstanding balance without touching invoices / payments. Maintained by
+    app.services.party_ledger_service.
+    """
+    __tablename__ = "party_ledger_summary"
+
+    id = Column(Integer, primary_key=True)
+
+    company_id = Column(Integer, ForeignKey("company.id"), nullable=False)
+    party_id = Column(Integer, ForeignKey("party.id"), nullable=False)
+    financial_year_id = Column(Integer, ForeignKey("financial_year.id"), nullable=False)
+    period = Column(Date, nullable=False)  # first day of the month
+
+    # Non-cancelled invoices
+    invoice_total = Column(Numeric(14, 2), nullable=False, default=0)
+    invoice_paid = Column(Numeric(14, 2), nullable=False, default=0)
+    # Non-cancelled invoices still PENDING / PARTIAL
+    open_due = Column(Numeric(14, 2), nullable=False, default=0)
+    open_invoices = Column(Integer, nullable=False, default=0)
+    # Payments
+    received_total = Column(Numeric(14, 2), nullable=False, default=0)
+    paid_total = Column(Numeric(14, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("company_id", "party_id", "financial_year_id", "period", name="uix_party_ledger_summary_key"),
+        Index("idx_party_ledger_company_party", "company_id", "party_id"),
+    )
@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Numeric, Boolean
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, Numeric, Boolean, Index
 from sqlalchemy.orm import relationship
 from app.database.base import Base
 
 class SalaryAdvance(Base):
     __tablename__ = "salary_advances"
 
+    __table_args__ = (
+        # Payroll runs: advances of many employees up to a month end
+        Index("idx_salary_advance_user_date", "user_id", "date"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     
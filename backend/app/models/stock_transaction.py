@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, Index, event
 from sqlalchemy.orm import relationship
 
 from app.database.base import Base
+from app.database.stock_triggers import install_stock_triggers
 from app.models.company import Company
 from app.models.financial_year import FinancialYear
 from app.models.item import Item
@@ -10,6 +11,13 @@ from app.models.item import Item
 class StockTransaction(Base):
     __tablename__ = "stock_transactions"
 
+    __table_args__ = (
+        # Ledger / opening-balance scans: equality on company + item, range on created_at
+        Index("idx_st_company_item_created_type", "company_id", "item_id", "created_at", "transaction_type"),
+        # Document lookups and joins back to challans / invoices
+        Index("idx_st_reference", "reference_type", "reference_id"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
 
     company_id = Column(Integer, ForeignKey("company.id"), nullable=False)
@@ -24,3 +32,7 @@ class StockTransaction(Base):
     company = relationship(Company)
     financial_year = relationship(FinancialYear)
     item = relationship(Item)
+
+
+# items.current_stock maintenance on SQLite (PostgreSQL has trg_stock_update)
+event.listen(StockTransaction.__table__, "after_create", install_stock_triggers)
@@ -6,11 +6,12 @@ from datetime import datetime, timedelta
 from app.database.session import get_db
 from app.core.dependencies import get_company_id, get_active_financial_year
 from app.models.invoice import Invoice
-from app.models.invoice_item import InvoiceItem
 from app.models.item import Item
 from app.models.stock_transaction import StockTransaction
 from app.models.party import Party
 from app.models.payment import Payment
+from app.services.party_ledger_service import get_party_balance, party_totals_query
+from app.services.forecast_service import get_sales_model, get_stock_forecasts
 
 router = APIRouter(prefix="/ai-insights", tags=["AI Insights"])
 
@@ -28,15 +29,9 @@ def _stock_subquery(db: Session, company_id: int):
 # ─── Helper: outstanding balance for a party ─────────────────────────────────
 # Outstanding = sum(grand_total - paid_amount) across all non-cancelled invoices
 def _party_outstanding(db: Session, party_id: int, company_id: int) -> float:
-    result = db.query(
-        func.sum(Invoice.grand_total - Invoice.paid_amount)
-    ).filter(
-        Invoice.party_id == party_id,
-        Invoice.company_id == company_id,
-        Invoice.status != "CANCELLED",
-    ).scalar()
+    balance = get_party_balance(db, company_id, party_id)
     opening = db.query(Party.opening_balance).filter(Party.id == party_id).scalar() or 0
-    return float(result or 0) + float(opening)
+    return balance.unpaid + float(opening)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -133,123 +128,91 @@ def get_anomalies(
     fy=Depends(get_active_financial_year),
     db: Session = Depends(get_db),
 ):
-    anomalies = []
     today = datetime.now().date()
+    activity = _party_activity(db, company_id, today)
+    return _evaluate_anomalies(activity, today)
+
 
-    # ── 1. Dormant Customers ──────────────────────────────────────────────────
-    # Active in last 6 months BUT no invoice in last 45 days
+# ─── Helper: per-party activity aggregates in one grouped query ──────────────
+# last invoice date, invoices in the last 6 months / 45 days, lifetime spend
+# (non-cancelled invoices) and open dues from the party ledger summary.
+def _party_activity(db: Session, company_id: int, today):
     six_months_ago = today - timedelta(days=180)
     forty_five_days_ago = today - timedelta(days=45)
 
-    active_ids = [
-        r[0]
-        for r in db.query(Invoice.party_id)
-        .filter(
-            Invoice.company_id == company_id,
-            Invoice.invoice_date >= six_months_ago,
-            Invoice.status != "CANCELLED",
+    invoices = (
+        db.query(
+            Invoice.party_id.label("party_id"),
+            func.max(Invoice.invoice_date).label("last_invoice_date"),
+            func.sum(case((Invoice.invoice_date >= six_months_ago, 1), else_=0)).label("active_6m"),
+            func.sum(case((Invoice.invoice_date >= forty_five_days_ago, 1), else_=0)).label("active_45d"),
+            func.sum(Invoice.grand_total).label("total_spent"),
         )
-        .distinct()
-        .all()
-    ]
-
-    if active_ids:
-        recent_ids = [
-            r[0]
-            for r in db.query(Invoice.party_id)
-            .filter(
-                Invoice.company_id == company_id,
-                Invoice.invoice_date >= forty_five_days_ago,
-                Invoice.party_id.in_(active_ids),
-                Invoice.status != "CANCELLED",
-            )
-            .distinct()
-            .all()
-        ]
-
-        dormant_ids = set(active_ids) - set(recent_ids)
-
-        if dormant_ids:
-            dormant_parties = db.query(Party).filter(Party.id.in_(dormant_ids)).all()
-            for party in dormant_parties:
-                last_inv = (
-                    db.query(Invoice)
-                    .filter(
-                        Invoice.party_id == party.id,
-                        Invoice.company_id == company_id,
-                    )
-                    .order_by(Invoice.invoice_date.desc())
-                    .first()
-                )
-                days_since = (today - last_inv.invoice_date).days if last_inv else 0
-                anomalies.append({
-                    "type": "DORMANT_CUSTOMER",
-                    "severity": "medium",
-                    "title": f"Dormant Customer: {party.name}",
-                    "description": f"Has not purchased in {days_since} days. Last invoice was on {last_inv.invoice_date.strftime('%d %b %Y') if last_inv else 'N/A'}.",
-                    "metadata": {"party_id": party.id, "days_since": days_since},
-                })
-
-    # ── 2. High Outstanding Balance ───────────────────────────────────────────
-    # Parties with unpaid invoice amount > ₹50,000
-    HIGH_DEBT_THRESHOLD = 50000
+        .filter(Invoice.company_id == company_id, Invoice.status != "CANCELLED")
+        .group_by(Invoice.party_id)
+        .subquery()
+    )
+    ledger = party_totals_query(company_id).subquery()
 
-    # Get all parties that have invoices for this company
-    party_ids_with_invoices = [
-        r[0]
-        for r in db.query(Invoice.party_id)
-        .filter(
-            Invoice.company_id == company_id,
-            Invoice.status != "CANCELLED",
-            Invoice.payment_status.in_(["PENDING", "PARTIAL"]),
+    return (
+        db.query(
+            Party.id,
+            Party.name,
+            Party.opening_balance,
+            invoices.c.last_invoice_date,
+            invoices.c.active_6m,
+            invoices.c.active_45d,
+            invoices.c.total_spent,
+            ledger.c.open_due,
+            ledger.c.open_invoices,
         )
-        .distinct()
+        .join(invoices, invoices.c.party_id == Party.id)
+        .outerjoin(ledger, ledger.c.party_id == Party.id)
+        .filter(Party.company_id == company_id)
+        .order_by(Party.name)
         .all()
-    ]
-
-    for party_id in party_ids_with_invoices:
-        outstanding = db.query(
-            func.sum(Invoice.grand_total - Invoice.paid_amount)
-        ).filter(
-            Invoice.party_id == party_id,
-            Invoice.company_id == company_id,
-            Invoice.status != "CANCELLED",
-            Invoice.payment_status.in_(["PENDING", "PARTIAL"]),
-        ).scalar() or 0
+    )
 
-        opening = db.query(Party.opening_balance).filter(Party.id == party_id).scalar() or 0
-        total_outstanding = float(outstanding) + float(opening)
 
-        if total_outstanding > HIGH_DEBT_THRESHOLD:
-            party = db.query(Party).filter(Party.id == party_id).first()
-            if party:
-                anomalies.append({
+def _evaluate_anomalies(activity, today) -> list:
+    HIGH_DEBT_THRESHOLD = 50000      # unpaid invoice amount + opening balance
+    HIGH_VALUE_CUSTOMER = 100000     # lifetime spend that upgrades a dormant alert
+
+    dormant, high_debt = [], []
+    for row in activity:
+        total_spent = float(row.total_spent or 0)
+
+        # ── 1. Dormant Customers ──────────────────────────────────────────────
+        # Active in last 6 months BUT no invoice in last 45 days
+        if row.active_6m and not row.active_45d:
+            last_date = row.last_invoice_date
+            days_since = (today - last_date).days if last_date else 0
+            anomaly = {
+                "type": "DORMANT_CUSTOMER",
+                "severity": "medium",
+                "title": f"Dormant Customer: {row.name}",
+                "description": f"Has not purchased in {days_since} days. Last invoice was on {last_date.strftime('%d %b %Y') if last_date else 'N/A'}.",
+                "metadata": {"party_id": row.id, "days_since": days_since, "total_spent": total_spent},
+            }
+            if total_spent > HIGH_VALUE_CUSTOMER:
+                anomaly["severity"] = "high"
+                anomaly["title"] = f"Risk: High Value Customer Dormant ({row.name})"
+            dormant.append(anomaly)
+
+        # ── 2. High Outstanding Balance ───────────────────────────────────────
+        # Parties with open (PENDING / PARTIAL) dues > ₹50,000
+        if row.open_invoices:
+            total_outstanding = float(row.open_due or 0) + float(row.opening_balance or 0)
+            if total_outstanding > HIGH_DEBT_THRESHOLD:
+                high_debt.append({
                     "type": "HIGH_DEBT",
                     "severity": "high",
-                    "title": f"High Outstanding: {party.name}",
+                    "title": f"High Outstanding: {row.name}",
                     "description": f"Owes ₹{total_outstanding:,.0f}. Immediate collection follow-up recommended.",
-                    "metadata": {"party_id": party.id, "amount": total_outstanding},
+                    "metadata": {"party_id": row.id, "amount": total_outstanding},
                 })
-    
-    # ── 3. Update Dormant Customers with Total Spent ──────────────────────────
-    # Iterate through existing anomalies to add total_spent for DORMANT_CUSTOMER
-    for anomaly in anomalies:
-        if anomaly["type"] == "DORMANT_CUSTOMER":
-            pid = anomaly["metadata"].get("party_id")
-            if pid:
-                total_spent = db.query(func.sum(Invoice.grand_total)).filter(
-                    Invoice.company_id == company_id,
-                    Invoice.party_id == pid,
-                    Invoice.status != "CANCELLED"
-                ).scalar() or 0
-                anomaly["metadata"]["total_spent"] = float(total_spent)
-                
-                # Upgrade severity if high value customer (> 1 Lakh)
-                if total_spent > 100000:
-                    anomaly["severity"] = "high"
-                    anomaly["title"] = f"Risk: High Value Customer Dormant ({anomaly['title'].split(': ')[1]})"
-
-    return anomalies
+
+    return dormant + high_debt
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -261,56 +224,24 @@ def get_predictions(
     fy=Depends(get_active_financial_year),
     db: Session = Depends(get_db),
 ):
-    predictions = []
     today = datetime.now().date()
-    thirty_days_ago = today - timedelta(days=30)
-
-    # Stock subquery
-    sq = _stock_subquery(db, company_id)
-
-    # Top selling items in last 30 days
-    top_items = (
-        db.query(InvoiceItem.item_id, func.sum(InvoiceItem.quantity).label("total_qty"))
-        .join(Invoice)
-        .filter(
-            Invoice.company_id == company_id,
-            Invoice.invoice_date >= thirty_days_ago,
-            Invoice.status != "CANCELLED",
-        )
-        .group_by(InvoiceItem.item_id)
-        .order_by(desc("total_qty"))
-        .limit(20)
-        .all()
-    )
-
-    for item_id, total_qty in top_items:
-        avg_daily = float(total_qty) / 30
-        if avg_daily <= 0:
-            continue
-
-        item = db.query(Item).filter(Item.id == item_id).first()
-        if not item:
-            continue
-
-        # Get current stock from subquery
-        stock_row = db.query(sq.c.current_stock).filter(sq.c.item_id == item_id).scalar()
-        current_stock = float(stock_row) if stock_row is not None else 0
-
-        # Ignore if plenty of stock (e.g. > 90 days)
-        if current_stock <= 0:
-            continue
-
-        days_left = current_stock / avg_daily
+    predictions = []
 
-        if days_left < 14: # Increased horizon to 14 days for better warnings
-            predictions.append({
-                "type": "STOCKOUT_RISK",
-                "item_name": item.name,
-                "current_stock": current_stock,
-                "avg_daily_sales": round(avg_daily, 2),
-                "days_remaining": round(days_left, 1),
-                "predicted_date": (today + timedelta(days=int(days_left))).isoformat(),
-            })
+    # Items expected to run out within 14 days (most urgent first)
+    for row in get_stock_forecasts(db, company_id, today):
+        days_left = row["days_remaining"]
+        if days_left >= 14:
+            break
+        predictions.append({
+            "type": "STOCKOUT_RISK",
+            "item_name": row["item_name"],
+            "current_stock": row["current_stock"],
+            "avg_daily_sales": round(row["burn_rate"], 2),
+            "days_remaining": round(days_left, 1),
+            "predicted_date": (today + timedelta(days=int(days_left))).isoformat(),
+        })
+        if len(predictions) == 20:
+            break
 
     return predictions
 
@@ -325,66 +256,35 @@ def get_stock_projections(
     Used for 'Stock Burn-Down' chart.
     """
     today = datetime.now().date()
-    thirty_days_ago = today - timedelta(days=30)
-    
-    # 1. Identify at-risk items (Same logic as notifications, but we need the raw data)
-    sq = _stock_subquery(db, company_id)
-    
-    top_items = (
-        db.query(InvoiceItem.item_id, func.sum(InvoiceItem.quantity).label("total_qty"))
-        .join(Invoice)
-        .filter(
-            Invoice.company_id == company_id,
-            Invoice.invoice_date >= thirty_days_ago,
-            Invoice.status != "CANCELLED",
-        )
-        .group_by(InvoiceItem.item_id)
-        .order_by(desc("total_qty"))
-        .limit(30) # Check top 30 moving items
-        .all()
-    )
-    
     projections = []
-    
-    for item_id, total_qty in top_items:
-        avg_daily = float(total_qty) / 30
-        if avg_daily < 0.1: continue
-        
-        # Get current stock
-        stock_row = db.query(sq.c.current_stock).filter(sq.c.item_id == item_id).scalar()
-        current_stock = float(stock_row) if stock_row is not None else 0
-        
-        if current_stock <= 0: continue
-        
-        days_left = current_stock / avg_daily
-        
-        # We only care about items running out in next 21 days for the chart
-        if days_left < 21:
-            item = db.query(Item).filter(Item.id == item_id).first()
-            if not item: continue
-            
-            # Generate daily points: (Date, Projected Stock)
-            data_points = []
-            # Start from today
-            current_simulated_stock = current_stock
-            
-            # Project for 14 days or until 0
-            for i in range(15):
-                date_point = today + timedelta(days=i)
-                val = max(0, current_simulated_stock - (avg_daily * i))
-                data_points.append({
-                    "date": date_point.isoformat(),
-                    "stock": round(val, 1)
-                })
-                if val <= 0: break
-                
-            projections.append({
-                "item_name": item.name,
-                "current_stock": current_stock,
-                "burn_rate": round(avg_daily, 2),
-                "data": data_points
+
+    # We only care about items running out in next 21 days for the chart
+    for row in get_stock_forecasts(db, company_id, today):
+        if row["days_remaining"] >= 21:
+            break
+        if row["burn_rate"] < 0.1:
+            continue
+
+        # Generate daily points: (Date, Projected Stock), 14 days or until 0
+        data_points = []
+        remaining = row["current_stock"]
+        for i in range(15):
+            if i:
+                remaining -= row["daily_forecast"][i - 1]
+            val = max(0, remaining)
+            data_points.append({
+                "date": (today + timedelta(days=i)).isoformat(),
+                "stock": round(val, 1)
             })
-            
+            if val <= 0: break
+
+        projections.append({
+            "item_name": row["item_name"],
+            "current_stock": row["current_stock"],
+            "burn_rate": round(row["burn_rate"], 2),
+            "data": data_points
+        })
+
     # Return top 5 most critical
     projections.sort(key=lambda x: len(x['data'])) # Shortest data = runs out fastest
     return projections[:5]
@@ -396,7 +296,8 @@ def get_sales_forecast(
     db: Session = Depends(get_db),
 ):
     """
-    Returns last 30 days of actual sales + next 7 days of linear forecast.
+    Returns last 30 days of actual sales + next 7 days of forecast
+    (seasonal exponential smoothing, see forecast_service).
     """
     today = datetime.now().date()
     thirty_days_ago = today - timedelta(days=30)
@@ -415,52 +316,21 @@ def get_sales_forecast(
     # Fill gaps with 0
     sales_map = {r.invoice_date: float(r.total) for r in daily_sales}
     formatted_data = []
-    
-    # Prepare data for regression (x = day index, y = sales)
-    x_vals = []
-    y_vals = []
-    
     for i in range(31): # 0 to 30
         d = thirty_days_ago + timedelta(days=i)
-        val = sales_map.get(d, 0)
         formatted_data.append({
             "date": d.isoformat(),
-            "actual": val,
+            "actual": sales_map.get(d, 0),
             "forecast": None
         })
-        x_vals.append(i)
-        y_vals.append(val)
-        
-    # 2. Simple Linear Regression (y = mx + c)
-    n = len(x_vals) # 31
-    if n > 1:
-        sum_x = sum(x_vals)
-        sum_y = sum(y_vals)
-        sum_xy = sum(x*y for x,y in zip(x_vals, y_vals))
-        sum_xx = sum(x*x for x in x_vals)
-        
-        denominator = (n * sum_xx - sum_x * sum_x)
-        if denominator != 0:
-            slope = (n * sum_xy - sum_x * sum_y) / denominator
-            intercept = (sum_y - slope * sum_x) / n
-        else:
-            slope = 0
-            intercept = sum_y / n
-    else:
-        slope = 0
-        intercept = 0
-        
-    # 3. Generate Forecast for next 7 days
-    # Last x was 30. Next are 31..37
+
+    # 2. Forecast for next 7 days (model index 0 is today)
+    forecast = get_sales_model(db, company_id, today)
     for i in range(1, 8):
-        future_x = 30 + i
-        future_date = today + timedelta(days=i)
-        predicted_val = max(0, slope * future_x + intercept) # No negative sales
-        
         formatted_data.append({
-            "date": future_date.isoformat(),
+            "date": (today + timedelta(days=i)).isoformat(),
             "actual": None,
-            "forecast": round(predicted_val, 2)
+            "forecast": round(forecast[i], 2)
         })
         
     # Add a "bridge" point at today so the line connects
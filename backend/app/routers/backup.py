@@ -30,7 +30,7 @@ async def get_backup_config():
 
 
 @router.post("/cron")
-async def cron_backup(x_cron_secret: str = Header(...)):
+def cron_backup(x_cron_secret: str = Header(...)):
     """
     Trigger an automatic backup from a cPanel cron job.
     Secured by the X-Cron-Secret header — no JWT required.
@@ -48,14 +48,14 @@ async def cron_backup(x_cron_secret: str = Header(...)):
 
 
 @router.get("/list")
-async def list_backups(
+def list_backups(
     current_user: User = Depends(require_role(UserRole.SUPER_ADMIN, UserRole.COMPANY_ADMIN))
 ):
     """List all available backups on the server."""
     return backup_manager.list_backups()
 
 @router.post("/create")
-async def create_backup(
+def create_backup(
     current_user: User = Depends(require_role(UserRole.SUPER_ADMIN, UserRole.COMPANY_ADMIN)),
     password: Optional[str] = Form(None),
     format: str = Form("sql"), # sql or dump
@@ -80,7 +80,7 @@ async def create_backup(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{filename}")
-async def delete_backup(
+def delete_backup(
     filename: str,
     current_user: User = Depends(require_role(UserRole.SUPER_ADMIN, UserRole.COMPANY_ADMIN)),
     db: Session = Depends(get_db)
@@ -101,7 +101,7 @@ async def delete_backup(
     return {"message": "Backup deleted"}
 
 @router.get("/download/{filename}")
-async def download_backup(
+def download_backup(
     filename: str,
     current_user: User = Depends(require_role(UserRole.SUPER_ADMIN, UserRole.COMPANY_ADMIN)),
     db: Session = Depends(get_db)
@@ -134,7 +134,7 @@ async def download_backup(
 
 
 @router.post("/import")
-async def import_backup(
+def import_backup(
     file: UploadFile = File(...),
     password: Optional[str] = Form(None),
     current_user: User = Depends(require_role(UserRole.SUPER_ADMIN, UserRole.COMPANY_ADMIN)),
@@ -6,6 +6,7 @@ from decimal import Decimal
 import math
 
 from app.database.session import get_db
+from app.database.executor import db_executor
 from app.models.delivery_challan import DeliveryChallan
 from app.models.delivery_challan_item import DeliveryChallanItem
 from app.models.party_challan import PartyChallan
@@ -17,36 +18,52 @@ from app.core.permissions import require_permission
 from app.models.user import User
 from app.models.party import Party
 from app.utils.stock import get_current_stock
+from app.services import document_sequence
+from app.services.stock_lock import lock_company_stock
 
 router = APIRouter(prefix="/challan", tags=["Delivery Challan"])
 
 
-def generate_challan_number(db: Session, company_id: int, fy_id: int, party_id: int) -> str:
-    """Generate next challan number for the company, financial year, and party"""
-    # Get all challan numbers for this company/FY/Party
-    last_challan = (
-        db.query(DeliveryChallan)
-        .filter(
-            DeliveryChallan.company_id == company_id,
-            DeliveryChallan.financial_year_id == fy_id,
-            DeliveryChallan.party_id == party_id
+def _challan_serial(challan_number: Optional[str]) -> int:
+    """Trailing number of "DC-001" (0 if it has none)."""
+    try:
+        return int(challan_number.split("-")[-1]) if challan_number else 0
+    except ValueError:
+        return 0
+
+
+def generate_challan_number(db: Session, company_id: int, fy_id: int, party_id: int, preview: bool = False) -> str:
+    """Generate next challan number for the company, financial year, and party
+    (from document_sequence; ``preview`` does not reserve it)"""
+    scope = (
+        DeliveryChallan.company_id == company_id,
+        DeliveryChallan.financial_year_id == fy_id,
+        DeliveryChallan.party_id == party_id
+    )
+
+    def seed():
+        # First use of this sequence: continue from the party's latest challan
+        last_number = (
+            db.query(DeliveryChallan.challan_number)
+            .filter(*scope)
+            .order_by(DeliveryChallan.id.desc())
+            .limit(1)
+            .scalar()
         )
-        .order_by(DeliveryChallan.id.desc())
-        .first()
+        return _challan_serial(last_number)
+
+    def is_taken(numbers):
+        return db.query(DeliveryChallan.id).filter(*scope, DeliveryChallan.challan_number.in_(numbers)).first() is not None
+
+    def highest_taken():
+        numbers = db.query(DeliveryChallan.challan_number).filter(*scope)
+        return max((_challan_serial(n) for (n,) in numbers), default=0)
+
+    return document_sequence.next_number(
+        db, company_id, fy_id, document_sequence.DELIVERY_CHALLAN,
+        lambda n: f"DC-{n:03d}", party_id=party_id,
+        seed=seed, is_taken=is_taken, highest_taken=highest_taken, preview=preview,
     )
-    
-    if last_challan and last_challan.challan_number:
-        try:
-            # Extract number from format like "DC-001"
-            parts = last_challan.challan_number.split("-")
-            last_num = int(parts[-1])
-            next_num = last_num + 1
-        except:
-            next_num = 1
-    else:
-        next_num = 1
-    
-    return f"DC-{next_num:03d}"
 
 
 @router.post("/", response_model=ChallanResponse)
@@ -58,6 +75,7 @@ def create_challan(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    lock_company_stock(db, company_id)
     # Server-side Validations
     if not data.items or len(data.items) == 0:
         raise HTTPException(status_code=400, detail="Delivery challan must contain at least one item")
@@ -200,6 +218,7 @@ def update_challan(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    lock_company_stock(db, company_id)
     # Get existing challan with full relationship tree
     challan = db.query(DeliveryChallan).options(
         joinedload(DeliveryChallan.items)
@@ -514,7 +533,7 @@ def get_next_challan_number(
     current_user: User = Depends(get_current_user)
 ):
     """Get the next challan number that will be generated"""
-    next_number = generate_challan_number(db, company_id, fy.id, party_id)
+    next_number = generate_challan_number(db, company_id, fy.id, party_id, preview=True)
     return {"next_challan_number": next_number}
 
 
@@ -655,6 +674,7 @@ def delete_challan(
     company_id: int = Depends(get_company_id),
     db: Session = Depends(get_db)
 ):
+    lock_company_stock(db, company_id)
     challan = db.query(DeliveryChallan).filter(
         DeliveryChallan.id == challan_id,
         DeliveryChallan.company_id == company_id
@@ -738,49 +758,29 @@ def delete_challan(
 # PDF Generation
 # ===============================
 from fastapi.responses import Response
-from jinja2 import Environment, FileSystemLoader
-from app.services.pdf_service import generate_pdf
+from app.core.config import settings
+from app.services.pdf_service import generate_pdf, media_type_for, bulk_document_response
+from app.services.render_service import render_service
+from app.services.template_env import env
+from app.services.qr_cache import get_qr_base64
+from app.services.link_service import link_service
 from app.models.company import Company
 from pydantic import BaseModel
 from typing import List, Dict, Any, Set
-import os
-
-# Set up Jinja2
-templates_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
-env = Environment(loader=FileSystemLoader(templates_dir))
 
 class BulkPrintRequest(BaseModel):
     challan_ids: List[int]
 
-def prepare_challan_print_data(challan) -> Dict[str, Any]:
+def prepare_challan_print_data(challan, base_url: str) -> Dict[str, Any]:
     """Helper to prepare data for a single challan print"""
     # Calculate Total Qty
     total_qty = sum(float(item.quantity) for item in challan.items)
 
-    # Generate QR Code
-    import qrcode
-    import io
-    import base64
-
-    # Generate Public Download URL
-    from app.core.config import get_backend_url
-    from app.core.security import create_url_signature
+    # Public Download URL (ID is signed to prevent IDOR)
+    download_url = link_service.challan_download_url(base_url, challan.id)
     
-    base_url = get_backend_url()
-            
-    # Sign the ID to prevent IDOR
-    signature = create_url_signature(str(challan.id))
-    download_url = f"{base_url}/public/challan/{challan.id}/download?token={signature}"
-    
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(download_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    # Generate QR Code (cached: the signed URL is the same on every print)
+    qr_code_b64 = get_qr_base64(download_url)
     
     # Prepare items data with calculated stats (Aggregated by Item Name)
     grouped_data = {}
@@ -937,6 +937,7 @@ def prepare_challan_print_data(challan) -> Dict[str, Any]:
 @require_permission("challans.view")
 async def bulk_print_challans(
     request: BulkPrintRequest,
+    http_request: Request,
     company_id: int = Depends(get_company_id),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -946,52 +947,50 @@ async def bulk_print_challans(
         if not request.challan_ids:
             raise HTTPException(status_code=400, detail="No challan IDs provided")
 
-        # Fetch all challans
-        challans = db.query(DeliveryChallan).options(
-            joinedload(DeliveryChallan.party),
-            joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.item),
-            joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.party_challan),
-            joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.process)
-        ).filter(
-            DeliveryChallan.id.in_(request.challan_ids),
-            DeliveryChallan.company_id == company_id
-        ).all()
-        
-        if not challans:
-            raise HTTPException(status_code=404, detail="No valid challans found")
-
-        # Sort challans by ID desc (or user preference? Usually Descending or as provided)
-        # We will map to input order.
-        challan_map = {c.id: c for c in challans}
-        ordered_challans = []
-        for cid in request.challan_ids:
-            if cid in challan_map:
-                ordered_challans.append(challan_map[cid])
-            
-        # Fetch company
-        company = db.query(Company).filter(Company.id == company_id).first()
-        
-        # Prepare data for each challan
-        challans_data = []
-        for challan in ordered_challans:
-            data = prepare_challan_print_data(challan)
-            challans_data.append(data)
-            
-        # Render Template
-        template = env.get_template("delivery_challan_bulk.html")
-        html = template.render(
-            challans_list=challans_data,
-            company=company
-        )
-        
-        # Generate PDF
-        pdf_content = await generate_pdf(html)
-        
-        return Response(
-            content=pdf_content,
-            media_type="text/html",
-            headers={"Content-Disposition": "inline; filename=bulk-delivery-challans.pdf"}
+        def load():
+            # Validate ownership up front; challans are loaded batch by batch while streaming
+            valid_ids = {
+                challan_id for (challan_id,) in db.query(DeliveryChallan.id).filter(
+                    DeliveryChallan.id.in_(request.challan_ids),
+                    DeliveryChallan.company_id == company_id
+                )
+            }
+            if not valid_ids:
+                raise HTTPException(status_code=404, detail="No valid challans found")
+
+            # Map to input order
+            ordered_ids = [cid for cid in request.challan_ids if cid in valid_ids]
+
+            # Fetch company
+            company = db.query(Company).filter(Company.id == company_id).first()
+            return ordered_ids, company
+
+        ordered_ids, company = await db_executor.run(load)
+        base_url = link_service.base_url(http_request, company=company)
+
+        def load_batch(batch_ids):
+            challans = db.query(DeliveryChallan).options(
+                joinedload(DeliveryChallan.party),
+                joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.item),
+                joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.party_challan),
+                joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.process)
+            ).filter(
+                DeliveryChallan.id.in_(batch_ids),
+                DeliveryChallan.company_id == company_id
+            ).all()
+            challan_map = {c.id: c for c in challans}
+            return [prepare_challan_print_data(challan_map[cid], base_url) for cid in batch_ids if cid in challan_map]
+
+        batch_size = max(1, settings.BULK_PRINT_BATCH_SIZE)
+        chunks = render_service.stream_pages(
+            "challan.bulk", env, "delivery_challan_bulk.html",
+            (ordered_ids[i:i + batch_size] for i in range(0, len(ordered_ids), batch_size)),
+            load_batch,
+            {"challans_list": [], "company": company},
         )
+        return await bulk_document_response(chunks, "bulk-delivery-challans.pdf")
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         error_msg = traceback.format_exc()
@@ -1015,29 +1014,34 @@ async def print_challan(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    # Fetch challan
-    challan = db.query(DeliveryChallan).options(
-        joinedload(DeliveryChallan.party),
-        joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.item),
-        joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.party_challan),
-        joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.process)
-    ).filter(
-        DeliveryChallan.id == challan_id,
-        DeliveryChallan.company_id == company_id
-    ).first()
+    def load():
+        # Fetch challan
+        challan = db.query(DeliveryChallan).options(
+            joinedload(DeliveryChallan.party),
+            joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.item),
+            joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.party_challan),
+            joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.process)
+        ).filter(
+            DeliveryChallan.id == challan_id,
+            DeliveryChallan.company_id == company_id
+        ).first()
     
-    if not challan:
-        raise HTTPException(status_code=404, detail="Delivery Challan not found")
+        if not challan:
+            raise HTTPException(status_code=404, detail="Delivery Challan not found")
     
-    # Fetch company
-    company = db.query(Company).filter(Company.id == company_id).first()
+        # Fetch company
+        company = db.query(Company).filter(Company.id == company_id).first()
+        return challan, company
+
+    challan, company = await db_executor.run(load)
     
     # Prepare data
-    data = prepare_challan_print_data(challan)
+    base_url = link_service.base_url(request, company=company)
+    data = await render_service.run("challan.prepare", prepare_challan_print_data, challan, base_url)
 
     # Render Template
-    template = env.get_template("delivery_challan.html")
-    html = template.render(
+    html = await render_service.render(
+        env, "delivery_challan.html",
         challan=data["challan"],
         party=data["party"],
         company=company,
@@ -1053,9 +1057,11 @@ async def print_challan(
         # Return PDF
         return Response(
             content=pdf_content,
-            media_type="text/html",
+            media_type=media_type_for(pdf_content),
             headers={"Content-Disposition": f"inline; filename=DC-{challan.challan_number}.pdf"}
         )
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         print(f"PDF Generation Error: {str(e)}")
@@ -1065,16 +1071,15 @@ async def print_challan(
 
 @router.get("/{challan_id}/share")
 @require_permission("challans.view")
-async def share_challan(
+def share_challan(
     challan_id: int,
+    request: Request,
     company_id: int = Depends(get_company_id),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     _ = Depends(require_feature("WHATSAPP_SHARE"))
 ):
     """Generate a WhatsApp-ready sharing link and message for a delivery challan"""
-    from app.core.config import get_backend_url
-    from app.core.security import create_url_signature
     import urllib.parse
     
     challan = db.query(DeliveryChallan).options(
@@ -1087,9 +1092,8 @@ async def share_challan(
     if not challan:
         raise HTTPException(status_code=404, detail="Delivery Challan not found")
 
-    base_url = get_backend_url()
-    signature = create_url_signature(str(challan.id))
-    download_url = f"{base_url}/public/challan/{challan.id}/download?token={signature}"
+    base_url = link_service.base_url(request, db=db, company_id=company_id)
+    download_url = link_service.challan_download_url(base_url, challan.id)
     
     # Generate Short Link (with fallback to long link if DB fails)
     short_download_url = download_url
@@ -1117,7 +1121,7 @@ async def share_challan(
         db.commit()
         
         # If successful, use the short URL
-        short_download_url = f"{base_url}/public/challan/dl/{short_code}"
+        short_download_url = link_service.short_url(base_url, "challan", short_code)
     except Exception as e:
         print(f"Failed to generate short link (DB issue?): {e}")
         db.rollback()
@@ -1176,6 +1180,7 @@ def delete_challan(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    lock_company_stock(db, company_id)
     # Get existing challan with full relationship tree
     challan = db.query(DeliveryChallan).options(
         joinedload(DeliveryChallan.items)
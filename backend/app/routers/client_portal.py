@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
 from fastapi.responses import Response
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, desc
 from typing import List, Optional
 
 from app.database.session import get_db
+from app.database.executor import db_executor
 from app.client_dependencies import get_current_client
 from app.models.client_login import ClientLogin
 from app.models.invoice import Invoice
@@ -16,6 +17,11 @@ from app.models.delivery_challan import DeliveryChallan
 from app.models.delivery_challan_item import DeliveryChallanItem
 from app.models.company import Company
 from app.schemas.invoice import InvoiceResponse
+from app.services.party_ledger_service import get_party_balance
+from app.services.render_service import render_service
+from app.services.template_env import env, format_inr
+from app.services.link_service import link_service
+from app.services.document_cache import document_cache
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/client", tags=["client-portal"])
@@ -77,35 +83,9 @@ def get_client_dashboard(
     party_id = client.party_id
     party = client.party
     
-    # 1. Calculate Balance (Using logic from Party router)
-     # Sum of Invoices (Debit)
-    invoice_query = db.query(func.sum(Invoice.grand_total)).filter(
-        Invoice.party_id == party_id,
-        Invoice.status != "CANCELLED"
-    )
-    if financial_year_id:
-        invoice_query = invoice_query.filter(Invoice.financial_year_id == financial_year_id)
-    invoice_total = invoice_query.scalar() or 0
-    
-    # Sum of Payments Received
-    payment_received_query = db.query(func.sum(Payment.amount)).filter(
-        Payment.party_id == party_id,
-        Payment.payment_type == "RECEIVED"
-    )
-    if financial_year_id:
-        payment_received_query = payment_received_query.filter(Payment.financial_year_id == financial_year_id)
-    total_received = payment_received_query.scalar() or 0
-    
-    # Sum of Payments Paid (Rare for clients, but usually refunds)
-    payment_paid_query = db.query(func.sum(Payment.amount)).filter(
-        Payment.party_id == party_id,
-        Payment.payment_type == "PAID"
-    )
-    if financial_year_id:
-        payment_paid_query = payment_paid_query.filter(Payment.financial_year_id == financial_year_id)
-    total_paid = payment_paid_query.scalar() or 0
-    
-    current_balance = float(party.opening_balance) + float(invoice_total) - float(total_received) + float(total_paid)
+    # 1. Calculate Balance (Using logic from Party router, served from party_ledger_summary)
+    balance = get_party_balance(db, party.company_id, party_id, financial_year_id)
+    current_balance = float(party.opening_balance or 0) + balance.net
     
     # 2. Last Payment
     last_payment = db.query(Payment).filter(
@@ -284,6 +264,7 @@ def get_client_invoice_details(
 @router.get("/invoices/{invoice_id}/download")
 async def download_invoice_pdf(
     invoice_id: int,
+    request: Request,
     client: ClientLogin = Depends(get_current_client),
     db: Session = Depends(get_db)
 ):
@@ -292,52 +273,48 @@ async def download_invoice_pdf(
     from app.models.invoice_item import InvoiceItem
     from app.models.company import Company
     from app.services.pdf_service import generate_pdf
-    from jinja2 import Environment, FileSystemLoader, select_autoescape
-    import os
-    import io
-    import base64
-    import qrcode
     from num2words import num2words
-    from app.core.config import get_backend_url
-    from app.core.security import create_url_signature
 
-    # Verify ownership matches client's party
-    invoice = db.query(Invoice).options(
-        joinedload(Invoice.party),
-        joinedload(Invoice.financial_year),
-        joinedload(Invoice.items).joinedload(InvoiceItem.item)
-    ).filter(
-        Invoice.id == invoice_id,
-        Invoice.party_id == client.party_id
-    ).first()
+    def load():
+        # Verify ownership matches client's party
+        head = db.query(Invoice.company_id, Invoice.invoice_number, Invoice.updated_at).filter(
+            Invoice.id == invoice_id,
+            Invoice.party_id == client.party_id
+        ).first()
+        if not head:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+
+        # The QR points at the public link, so the base URL is part of the version
+        base_url = link_service.base_url(request, db=db, company_id=head.company_id)
+        version = document_cache.version("invoice.html", head.updated_at, base_url)
+        cached = document_cache.get(head.company_id, "invoice", invoice_id, "portal", version)
+        if cached:
+            return document_cache.response(request, cached, f"Invoice-{head.invoice_number}.pdf")
+
+        invoice = db.query(Invoice).options(
+            joinedload(Invoice.party),
+            joinedload(Invoice.financial_year),
+            joinedload(Invoice.items).joinedload(InvoiceItem.item)
+        ).filter(
+            Invoice.id == invoice_id,
+            Invoice.party_id == client.party_id
+        ).first()
     
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
+        if not invoice:
+            raise HTTPException(status_code=404, detail="Invoice not found")
         
-    company = db.query(Company).get(invoice.company_id)
-    
-    # Helper for currency
-    def format_inr(number):
-        try:
-            s, *d = str("{:.2f}".format(float(number))).partition(".")
-            r = ",".join([s[x-2:x] for x in range(-3, -len(s), -2)][::-1] + [s[-3:]])
-            return "".join([r] + d) if r else d[0]
-        except:
-            return str(number)
+        company = db.query(Company).get(invoice.company_id)
+        return base_url, version, invoice, company
 
-    # Generate QR Code (Points to public download link)
-    base_url = get_backend_url()
-    signature = create_url_signature(str(invoice_id))
-    download_url = f"{base_url}/public/invoice/{invoice_id}/download?token={signature}"
+    loaded = await db_executor.run(load)
+    if isinstance(loaded, Response):
+        return loaded
+    base_url, version, invoice, company = loaded
     
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(download_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
+    # Generate QR Code (Points to public download link)
+    download_url = link_service.invoice_download_url(base_url, invoice_id)
     
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    qr_code_b64 = await render_service.qr_base64(download_url)
     
     # Calculate words
     try:
@@ -345,16 +322,9 @@ async def download_invoice_pdf(
     except:
         grand_total_words = f"{invoice.grand_total} Only"
 
-    # Set up Jinja2
-    templates_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
-    env = Environment(
-        loader=FileSystemLoader(templates_dir),
-        autoescape=select_autoescape(['html', 'xml'])
-    )
-
     # Render Template
-    template = env.get_template("invoice.html")
-    html = template.render(
+    html = await render_service.render(
+        env, "invoice.html",
         invoice=invoice,
         company=company,
         party=invoice.party,
@@ -367,16 +337,15 @@ async def download_invoice_pdf(
     # Generate PDF
     try:
         pdf_content = await generate_pdf(html)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"PDF Generation Error: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate PDF")
 
     # Return PDF
-    return Response(
-        content=pdf_content,
-        media_type="text/html",
-        headers={"Content-Disposition": f"inline; filename=Invoice-{invoice.invoice_number}.pdf"}
-    )
+    document = document_cache.put(invoice.company_id, "invoice", invoice_id, "portal", version, pdf_content)
+    return document_cache.response(request, document, f"Invoice-{invoice.invoice_number}.pdf")
 
 
 # ==================================================
@@ -542,6 +511,7 @@ def get_client_ledger(
 
 @router.get("/ledger/download")
 async def download_client_ledger_pdf(
+    request: Request,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     financial_year_id: Optional[int] = None,
@@ -552,149 +522,149 @@ async def download_client_ledger_pdf(
     Renders and returns a professional Statement of Account HTML document
     using the executive party_statement.html template.
     """
-    from jinja2 import Environment, FileSystemLoader
-    import os, io, base64, qrcode
     from datetime import datetime
     from app.models.company import Company
-    from app.core.config import get_backend_url
     from app.core.security import create_url_signature
 
-    party = client.party
-    company = db.query(Company).get(party.company_id) if party else None
-
-    # 1. Invoices
-    invoices_query = db.query(Invoice).filter(
-        Invoice.party_id == party.id,
-        Invoice.status != "CANCELLED"
-    )
-    if financial_year_id:
-        invoices_query = invoices_query.filter(Invoice.financial_year_id == financial_year_id)
-    if start_date:
-        invoices_query = invoices_query.filter(Invoice.invoice_date >= start_date)
-    if end_date:
-        invoices_query = invoices_query.filter(Invoice.invoice_date <= end_date)
-    invoices = invoices_query.all()
-
-    # 2. Payments
-    payments_query = db.query(Payment).filter(
-        Payment.party_id == party.id,
-        Payment.payment_type.in_(["RECEIVED"])
-    )
-    if financial_year_id:
-        payments_query = payments_query.filter(Payment.financial_year_id == financial_year_id)
-    if start_date:
-        payments_query = payments_query.filter(Payment.payment_date >= start_date)
-    if end_date:
-        payments_query = payments_query.filter(Payment.payment_date <= end_date)
-    payments = payments_query.all()
+    def load():
+        party = client.party
+        company = db.query(Company).get(party.company_id) if party else None
 
-    # 3. Opening Balance
-    opening_balance = float(party.opening_balance) if party and party.opening_balance else 0.0
-    if start_date:
-        prior_inv_query = db.query(func.sum(Invoice.grand_total)).filter(
+        # 1. Invoices
+        invoices_query = db.query(Invoice).filter(
             Invoice.party_id == party.id,
-            Invoice.status != "CANCELLED",
-            Invoice.invoice_date < start_date
+            Invoice.status != "CANCELLED"
         )
         if financial_year_id:
-            prior_inv_query = prior_inv_query.filter(Invoice.financial_year_id == financial_year_id)
-        prior_inv = prior_inv_query.scalar() or 0
-
-        prior_pay_query = db.query(func.sum(Payment.amount)).filter(
+            invoices_query = invoices_query.filter(Invoice.financial_year_id == financial_year_id)
+        if start_date:
+            invoices_query = invoices_query.filter(Invoice.invoice_date >= start_date)
+        if end_date:
+            invoices_query = invoices_query.filter(Invoice.invoice_date <= end_date)
+        invoices = invoices_query.all()
+
+        # 2. Payments
+        payments_query = db.query(Payment).filter(
             Payment.party_id == party.id,
-            Payment.payment_type == "RECEIVED",
-            Payment.payment_date < start_date
+            Payment.payment_type.in_(["RECEIVED"])
         )
         if financial_year_id:
-            prior_pay_query = prior_pay_query.filter(Payment.financial_year_id == financial_year_id)
-        prior_pay = prior_pay_query.scalar() or 0
-
-        opening_balance = opening_balance + float(prior_inv) - float(prior_pay)
-
-    # 4. Merge transactions
-    ledger_items = []
-    total_debit = 0.0
-    total_credit = 0.0
-
-    for inv in invoices:
-        amt = float(inv.grand_total)
-        total_debit += amt
-        ledger_items.append({
-            "date": inv.invoice_date,
-            "type": "INVOICE",
-            "ref_number": inv.invoice_number,
-            "description": "Invoice Generated",
-            "debit": amt,
-            "credit": 0.0,
-            "raw_date": inv.invoice_date
-        })
-
-    for pay in payments:
-        amt = float(pay.amount)
-        total_credit += amt
-        ledger_items.append({
-            "date": pay.payment_date,
-            "type": "PAYMENT",
-            "ref_number": pay.reference_number or "-",
-            "description": f"Payment via {pay.payment_mode}",
-            "debit": 0.0,
-            "credit": amt,
-            "raw_date": pay.payment_date
-        })
-
-    def get_sort_date(item):
-        d = item["raw_date"]
-        if isinstance(d, datetime):
-            return d.date()
-        return d
-
-    ledger_items.sort(key=get_sort_date)
-
-    # 5. Running Balance & Formatted Rows
-    running_balance = opening_balance
-    formatted_transactions = []
-    for item in ledger_items:
-        running_balance = running_balance + item["debit"] - item["credit"]
-        d_val = item["raw_date"]
-        d_str = d_val.strftime("%d/%m/%Y") if hasattr(d_val, "strftime") else str(d_val)
-        formatted_transactions.append({
-            "date": d_str,
-            "type": item["type"],
-            "ref": item["ref_number"],
-            "ref_number": item["ref_number"],
-            "description": item["description"],
-            "debit": f"{item['debit']:,.2f}" if item["debit"] > 0 else "-",
-            "credit": f"{item['credit']:,.2f}" if item["credit"] > 0 else "-",
-            "balance": f"{running_balance:,.2f}"
-        })
+            payments_query = payments_query.filter(Payment.financial_year_id == financial_year_id)
+        if start_date:
+            payments_query = payments_query.filter(Payment.payment_date >= start_date)
+        if end_date:
+            payments_query = payments_query.filter(Payment.payment_date <= end_date)
+        payments = payments_query.all()
+
+        # 3. Opening Balance
+        opening_balance = float(party.opening_balance) if party and party.opening_balance else 0.0
+        if start_date:
+            prior_inv_query = db.query(func.sum(Invoice.grand_total)).filter(
+                Invoice.party_id == party.id,
+                Invoice.status != "CANCELLED",
+                Invoice.invoice_date < start_date
+            )
+            if financial_year_id:
+                prior_inv_query = prior_inv_query.filter(Invoice.financial_year_id == financial_year_id)
+            prior_inv = prior_inv_query.scalar() or 0
+
+            prior_pay_query = db.query(func.sum(Payment.amount)).filter(
+                Payment.party_id == party.id,
+                Payment.payment_type == "RECEIVED",
+                Payment.payment_date < start_date
+            )
+            if financial_year_id:
+                prior_pay_query = prior_pay_query.filter(Payment.financial_year_id == financial_year_id)
+            prior_pay = prior_pay_query.scalar() or 0
+
+            opening_balance = opening_balance + float(prior_inv) - float(prior_pay)
+
+        # 4. Merge transactions
+        ledger_items = []
+        total_debit = 0.0
+        total_credit = 0.0
+
+        for inv in invoices:
+            amt = float(inv.grand_total)
+            total_debit += amt
+            ledger_items.append({
+                "date": inv.invoice_date,
+                "type": "INVOICE",
+                "ref_number": inv.invoice_number,
+                "description": "Invoice Generated",
+                "debit": amt,
+                "credit": 0.0,
+                "raw_date": inv.invoice_date
+            })
+
+        for pay in payments:
+            amt = float(pay.amount)
+            total_credit += amt
+            ledger_items.append({
+                "date": pay.payment_date,
+                "type": "PAYMENT",
+                "ref_number": pay.reference_number or "-",
+                "description": f"Payment via {pay.payment_mode}",
+                "debit": 0.0,
+                "credit": amt,
+                "raw_date": pay.payment_date
+            })
+
+        def get_sort_date(item):
+            d = item["raw_date"]
+            if isinstance(d, datetime):
+                return d.date()
+            return d
+
+        ledger_items.sort(key=get_sort_date)
+
+        # 5. Running Balance & Formatted Rows
+        running_balance = opening_balance
+        formatted_transactions = []
+        for item in ledger_items:
+            running_balance = running_balance + item["debit"] - item["credit"]
+            d_val = item["raw_date"]
+            d_str = d_val.strftime("%d/%m/%Y") if hasattr(d_val, "strftime") else str(d_val)
+            formatted_transactions.append({
+                "date": d_str,
+                "type": item["type"],
+                "ref": item["ref_number"],
+                "ref_number": item["ref_number"],
+                "description": item["description"],
+                "debit": f"{item['debit']:,.2f}" if item["debit"] > 0 else "-",
+                "credit": f"{item['credit']:,.2f}" if item["credit"] > 0 else "-",
+                "balance": f"{running_balance:,.2f}"
+            })
+
+        # Financial Year string
+        fy_str = "All Periods"
+        if financial_year_id:
+            fy_obj = db.query(FinancialYear).get(financial_year_id)
+            if fy_obj:
+                fy_str = f"{fy_obj.start_date.year}-{str(fy_obj.end_date.year)[-2:]}"
+        return (
+            party, company, opening_balance, formatted_transactions, running_balance,
+            total_debit, total_credit, fy_str,
+        )
 
-    # Financial Year string
-    fy_str = "All Periods"
-    if financial_year_id:
-        fy_obj = db.query(FinancialYear).get(financial_year_id)
-        if fy_obj:
-            fy_str = f"{fy_obj.start_date.year}-{str(fy_obj.end_date.year)[-2:]}"
+    (
+        party, company, opening_balance, formatted_transactions, running_balance,
+        total_debit, total_credit, fy_str,
+    ) = await db_executor.run(load)
 
     # QR verification code
-    base_url = get_backend_url()
-    signature = create_url_signature(str(party.id))
-    verify_url = f"{base_url}/public/reports/statement/download?party_id={party.id}&company_id={party.company_id}&token={signature}"
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(verify_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-
-    templates_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
-    env = Environment(loader=FileSystemLoader(templates_dir))
-    template = env.get_template("party_statement.html")
+    base_url = link_service.base_url(request, company=company)
+    verify_url = link_service.url(
+        base_url, "/public/reports/statement/download",
+        party_id=party.id, company_id=party.company_id, token=create_url_signature(str(party.id)),
+    )
+    qr_code_b64 = await render_service.qr_base64(verify_url)
 
     s_date_str = start_date.strftime("%d/%m/%Y") if start_date else (formatted_transactions[0]["date"] if formatted_transactions else datetime.now().strftime("%d/%m/%Y"))
     e_date_str = end_date.strftime("%d/%m/%Y") if end_date else datetime.now().strftime("%d/%m/%Y")
 
-    html_content = template.render(
+    html_content = await render_service.render(
+        env, "party_statement.html",
         company=company,
         party=party,
         financial_year=fy_str,
@@ -1006,130 +976,121 @@ async def download_delivery_challan_pdf(
 ):
     """Download a Delivery Challan PDF from the client portal."""
     from fastapi.responses import Response
-    from jinja2 import Environment, FileSystemLoader, select_autoescape
-    from app.services.pdf_service import generate_pdf
+    from app.services.pdf_service import generate_pdf, media_type_for
     from app.models.company import Company
-    import os
-    import qrcode
-    import io
-    import base64
-
-    # Verify ownership — the challan must belong to this client's party
-    challan = db.query(DeliveryChallan).options(
-        joinedload(DeliveryChallan.party),
-        joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.item),
-        joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.party_challan),
-        joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.process)
-    ).filter(
-        DeliveryChallan.id == challan_id,
-        DeliveryChallan.party_id == client.party_id  # Security: only own challans
-    ).first()
 
-    if not challan:
-        raise HTTPException(status_code=404, detail="Delivery Challan not found")
+    def load():
+        # Verify ownership — the challan must belong to this client's party
+        challan = db.query(DeliveryChallan).options(
+            joinedload(DeliveryChallan.party),
+            joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.item),
+            joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.party_challan),
+            joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.process)
+        ).filter(
+            DeliveryChallan.id == challan_id,
+            DeliveryChallan.party_id == client.party_id  # Security: only own challans
+        ).first()
+
+        if not challan:
+            raise HTTPException(status_code=404, detail="Delivery Challan not found")
+
+        company = db.query(Company).filter(Company.id == challan.company_id).first()
+
+        # Calculate Total Qty
+        total_qty = sum(float(item.quantity) for item in challan.items)
+
+        # Group items (same logic as public_challan.py)
+        grouped_data = {}
+        for item in challan.items:
+            pc_item = item.party_challan_item
+            item_id = pc_item.item_id if pc_item else item.id
+
+            if item_id not in grouped_data:
+                grouped_data[item_id] = {
+                    "item_obj": item,
+                    "pc_items": set(),
+                    "ref_challans": {},
+                    "dispatch": 0.0,
+                    "ok": 0.0,
+                    "cr": 0.0,
+                    "mr": 0.0
+                }
+
+            if pc_item:
+                grouped_data[item_id]["pc_items"].add(pc_item)
+                if pc_item.party_challan:
+                    grouped_data[item_id]["ref_challans"][pc_item.party_challan_id] = pc_item.party_challan
+
+            grouped_data[item_id]["dispatch"] += float(item.quantity)
+            grouped_data[item_id]["ok"] += float(item.ok_qty)
+            grouped_data[item_id]["cr"] += float(item.cr_qty)
+            grouped_data[item_id]["mr"] += float(item.mr_qty)
+
+        items_data = []
+        sorted_keys = sorted(
+            grouped_data.keys(),
+            key=lambda k: grouped_data[k]["item_obj"].party_challan_item.item.name
+            if grouped_data[k]["item_obj"].party_challan_item else ""
+        )
 
-    company = db.query(Company).filter(Company.id == challan.company_id).first()
+        for key in sorted_keys:
+            data = grouped_data[key]
+            current_dispatch = data["dispatch"]
+
+            opening_qty = 0
+            balance_qty = 0
+
+            if data["pc_items"]:
+                item_ordered_total = sum(float(pci.quantity_ordered) for pci in data["pc_items"])
+                item_delivered_total = sum(float(pci.quantity_delivered) for pci in data["pc_items"])
+                raw_closing_balance = item_ordered_total - item_delivered_total
+                raw_opening_balance = raw_closing_balance + current_dispatch
+                opening_qty = max(0, raw_opening_balance)
+                balance_qty = max(0, raw_closing_balance)
+
+            ref_list = []
+            for pc_obj in data["ref_challans"].values():
+                pc_grand_total = int(sum(float(i.quantity_ordered) for i in pc_obj.items))
+                ref_str = f"{pc_obj.challan_number} | {pc_obj.challan_date.strftime('%d-%m-%Y')} | {pc_grand_total}"
+                ref_list.append(ref_str)
+
+            class ProxyItem:
+                def __init__(self, original, ok, cr, mr):
+                    self.party_challan_item = original.party_challan_item
+                    self.process = original.process
+                    self.ok_qty = int(ok)
+                    self.cr_qty = int(cr)
+                    self.mr_qty = int(mr)
+                    eff_rate = float(original.rate) if original.rate and original.rate > 0 else (
+                        float(original.party_challan_item.rate) if original.party_challan_item and original.party_challan_item.rate and original.party_challan_item.rate > 0 else (
+                            float(original.party_challan_item.item.rate) if original.party_challan_item and original.party_challan_item.item and original.party_challan_item.item.rate else 0.0
+                        )
+                    )
+                    self.rate = eff_rate
+                    self.party_rate = float(original.party_rate or 0)
+                    total_qty_item = self.ok_qty + self.cr_qty + self.mr_qty
+                    self.amount_formatted = "{:.2f}".format((self.rate + self.party_rate) * total_qty_item)
 
-    # Calculate Total Qty
-    total_qty = sum(float(item.quantity) for item in challan.items)
-
-    # Group items (same logic as public_challan.py)
-    grouped_data = {}
-    for item in challan.items:
-        pc_item = item.party_challan_item
-        item_id = pc_item.item_id if pc_item else item.id
-
-        if item_id not in grouped_data:
-            grouped_data[item_id] = {
-                "item_obj": item,
-                "pc_items": set(),
-                "ref_challans": {},
-                "dispatch": 0.0,
-                "ok": 0.0,
-                "cr": 0.0,
-                "mr": 0.0
-            }
+            proxy_item_obj = ProxyItem(data["item_obj"], data["ok"], data["cr"], data["mr"])
 
-        if pc_item:
-            grouped_data[item_id]["pc_items"].add(pc_item)
-            if pc_item.party_challan:
-                grouped_data[item_id]["ref_challans"][pc_item.party_challan_id] = pc_item.party_challan
-
-        grouped_data[item_id]["dispatch"] += float(item.quantity)
-        grouped_data[item_id]["ok"] += float(item.ok_qty)
-        grouped_data[item_id]["cr"] += float(item.cr_qty)
-        grouped_data[item_id]["mr"] += float(item.mr_qty)
-
-    items_data = []
-    sorted_keys = sorted(
-        grouped_data.keys(),
-        key=lambda k: grouped_data[k]["item_obj"].party_challan_item.item.name
-        if grouped_data[k]["item_obj"].party_challan_item else ""
-    )
+            items_data.append({
+                "item_obj": proxy_item_obj,
+                "opening": int(opening_qty),
+                "dispatch": int(current_dispatch),
+                "balance": int(balance_qty),
+                "ref_list": ref_list
+            })
+        return challan, company, items_data, total_qty
 
-    for key in sorted_keys:
-        data = grouped_data[key]
-        current_dispatch = data["dispatch"]
-
-        opening_qty = 0
-        balance_qty = 0
-
-        if data["pc_items"]:
-            item_ordered_total = sum(float(pci.quantity_ordered) for pci in data["pc_items"])
-            item_delivered_total = sum(float(pci.quantity_delivered) for pci in data["pc_items"])
-            raw_closing_balance = item_ordered_total - item_delivered_total
-            raw_opening_balance = raw_closing_balance + current_dispatch
-            opening_qty = max(0, raw_opening_balance)
-            balance_qty = max(0, raw_closing_balance)
-
-        ref_list = []
-        for pc_obj in data["ref_challans"].values():
-            pc_grand_total = int(sum(float(i.quantity_ordered) for i in pc_obj.items))
-            ref_str = f"{pc_obj.challan_number} | {pc_obj.challan_date.strftime('%d-%m-%Y')} | {pc_grand_total}"
-            ref_list.append(ref_str)
-
-        class ProxyItem:
-            def __init__(self, original, ok, cr, mr):
-                self.party_challan_item = original.party_challan_item
-                self.process = original.process
-                self.ok_qty = int(ok)
-                self.cr_qty = int(cr)
-                self.mr_qty = int(mr)
-                eff_rate = float(original.rate) if original.rate and original.rate > 0 else (
-                    float(original.party_challan_item.rate) if original.party_challan_item and original.party_challan_item.rate and original.party_challan_item.rate > 0 else (
-                        float(original.party_challan_item.item.rate) if original.party_challan_item and original.party_challan_item.item and original.party_challan_item.item.rate else 0.0
-                    )
-                )
-                self.rate = eff_rate
-                self.party_rate = float(original.party_rate or 0)
-                total_qty_item = self.ok_qty + self.cr_qty + self.mr_qty
-                self.amount_formatted = "{:.2f}".format((self.rate + self.party_rate) * total_qty_item)
-
-        proxy_item_obj = ProxyItem(data["item_obj"], data["ok"], data["cr"], data["mr"])
-
-        items_data.append({
-            "item_obj": proxy_item_obj,
-            "opening": int(opening_qty),
-            "dispatch": int(current_dispatch),
-            "balance": int(balance_qty),
-            "ref_list": ref_list
-        })
+    challan, company, items_data, total_qty = await db_executor.run(load)
 
     # Generate QR
     qr_data = f"Challan: {challan.challan_number}\nDate: {challan.challan_date}\nParty: {challan.party.name if challan.party else 'N/A'}"
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    qr_code_b64 = await render_service.qr_base64(qr_data)
 
     # Render Template
-    templates_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
-    env = Environment(loader=FileSystemLoader(templates_dir), autoescape=select_autoescape(['html', 'xml']))
-    template = env.get_template("delivery_challan.html")
-    html = template.render(
+    html = await render_service.render(
+        env, "delivery_challan.html",
         challan=challan,
         company=company,
         party=challan.party,
@@ -1140,18 +1101,20 @@ async def download_delivery_challan_pdf(
 
     try:
         pdf_content = await generate_pdf(html)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate PDF: {str(e)}")
 
     return Response(
         content=pdf_content,
-        media_type="text/html",
+        media_type=media_type_for(pdf_content),
         headers={"Content-Disposition": f"inline; filename=DC-{challan.challan_number}.pdf"}
     )
 
 
 @router.get("/party-challans/{challan_id}/report/download")
-async def download_party_challan_report(
+def download_party_challan_report(
     challan_id: int,
     client: ClientLogin = Depends(get_current_client),
     db: Session = Depends(get_db)
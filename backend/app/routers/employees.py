@@ -7,20 +7,20 @@ from datetime import date, datetime
 from calendar import monthrange
 import shutil
 import os
-import qrcode
-import io
-import base64
 from jose import jwt
 from app.core.config import settings
-from jinja2 import Environment, FileSystemLoader
 from num2words import num2words
 
-from app.services.pdf_service import generate_pdf
+from app.services.pdf_service import generate_pdf, media_type_for
+from app.services.render_service import render_service
+from app.services.template_env import env
+from app.services.payroll_service import compute_salary_slips, load_employees, pay_salary_slips, salary_description
 
 from app.database.session import get_db
+from app.database.executor import db_executor
 from app.models.user import User, UserRole
 from app.core.paths import UPLOAD_DIR
-from app.models.employee_profile import EmployeeProfile, SalaryType
+from app.models.employee_profile import EmployeeProfile
 from app.models.attendance import Attendance, AttendanceStatus
 from app.models.salary_advance import SalaryAdvance
 from app.models.holiday import Holiday
@@ -29,7 +29,8 @@ from app.models.role import Role
 from app.schemas.user import (
     UserCreate, UserResponse, UserUpdate, 
     AttendanceCreate, AttendanceResponse, SalarySlip,
-    SalaryAdvanceCreate, SalaryAdvanceResponse
+    SalaryAdvanceCreate, SalaryAdvanceResponse,
+    PayrollRunResponse, PayrollRunSlip
 )
 from pydantic import BaseModel
 from app.core.dependencies import get_company_id, get_active_financial_year, get_current_user, require_role
@@ -177,28 +178,32 @@ async def download_my_salary_slip(
     """
     Download salary slip PDF for current employee
     """
-    # Reuse the existing salary slip PDF generation
-    try:
-        salary_slip = calculate_salary(
-            user_id=current_user.id,
-            month=month,
-            year=year,
-            company_id=current_user.company_id,
-            db=db
-        )
-    except HTTPException as e:
-        raise e
+    def load():
+        # Reuse the existing salary slip PDF generation
+        try:
+            salary_slip = calculate_salary(
+                user_id=current_user.id,
+                month=month,
+                year=year,
+                company_id=current_user.company_id,
+                db=db
+            )
+        except HTTPException as e:
+            raise e
     
-    # Fetch User & Company Details
-    user = db.query(User).options(joinedload(User.employee_profile)).filter(
-        User.id == current_user.id,
-        User.company_id == current_user.company_id
-    ).first()
+        # Fetch User & Company Details
+        user = db.query(User).options(joinedload(User.employee_profile)).filter(
+            User.id == current_user.id,
+            User.company_id == current_user.company_id
+        ).first()
     
-    if not user:
-        raise HTTPException(status_code=404, detail="Employee not found")
+        if not user:
+            raise HTTPException(status_code=404, detail="Employee not found")
     
-    company = user.company
+        company = user.company
+        return salary_slip, user, company
+
+    salary_slip, user, company = await db_executor.run(load)
     
     # Prepare Template Context
     month_name = date(year, month, 1).strftime("%B")
@@ -216,8 +221,8 @@ async def download_my_salary_slip(
     except Exception:
         final_payable_words = f"Rupees {salary_slip.final_payable:,.2f} Only"
 
-    template = env.get_template("salary_slip.html")
-    html_content = template.render(
+    html_content = await render_service.render(
+        env, "salary_slip.html",
         company=company,
         employee=user,
         month_name=month_name,
@@ -245,7 +250,7 @@ async def download_my_salary_slip(
     
     return Response(
         content=pdf_content,
-        media_type="text/html",
+        media_type=media_type_for(pdf_content),
         headers={"Content-Disposition": f"inline; filename={filename}"}
     )
 
@@ -670,6 +675,51 @@ def get_daily_attendance(
 # SALARY
 # ================================
 
+@router.post("/payroll/run", response_model=PayrollRunResponse)
+def run_payroll(
+    month: int = Query(..., ge=1, le=12),
+    year: int = Query(..., ge=2000, le=2100),
+    deduct_advances: bool = True,
+    persist: bool = False,
+    payment_method: str = "Cash",
+    current_user: User = Depends(require_role(UserRole.SUPER_ADMIN, UserRole.COMPANY_ADMIN)),
+    company_id: int = Depends(get_company_id),
+    fy = Depends(get_active_financial_year),
+    db: Session = Depends(get_db)
+):
+    """
+    Salary slips for every employee of the company for one month.
+    With persist=true, the unpaid slips (net payable > 0) are paid together:
+    one Salary expense each and their advances settled, in one transaction.
+    """
+    users = load_employees(db, company_id)
+    slips = compute_salary_slips(db, company_id, month, year, users, deduct_advances)
+    total_payable = round(sum(s.final_payable for s in slips if not s.is_paid and s.final_payable > 0), 2)
+
+    paid = {}
+    if persist:
+        paid = pay_salary_slips(
+            db, company_id, fy.id, month, year, users, slips,
+            payment_method=payment_method, deduct_advances=deduct_advances,
+        )
+
+    names = {u.id: u.name for u in users}
+    return PayrollRunResponse(
+        month=f"{year}-{month:02d}",
+        employee_count=len(slips),
+        paid_count=len(paid),
+        total_payable=total_payable,
+        slips=[
+            PayrollRunSlip(
+                **slip.model_dump(),
+                employee_name=names[slip.user_id],
+                expense_id=paid.get(slip.user_id),
+            )
+            for slip in slips
+        ],
+    )
+
+
 @router.get("/{user_id}/salary", response_model=SalarySlip)
 def calculate_salary(
     user_id: int,
@@ -680,235 +730,10 @@ def calculate_salary(
     db: Session = Depends(get_db)
 ):
     try:
-        user = db.query(User).options(joinedload(User.employee_profile)).filter(
-            User.id == user_id,
-            User.company_id == company_id
-        ).first()
-
-        if not user:
+        users = load_employees(db, company_id, [user_id])
+        if not users:
             raise HTTPException(status_code=404, detail="Employee not found")
-
-        profile = user.employee_profile
-        if not profile:
-            class MockProfile:
-                base_salary = 0.0
-                salary_type = SalaryType.MONTHLY
-                work_hours_per_day = 8.0
-                enable_tds = False
-                tds_percentage = 0.0
-                professional_tax = 0.0
-            profile = MockProfile()
-
-        base_salary = float(profile.base_salary or 0.0)
-        
-        # Get attendance
-        records = db.query(Attendance).filter(
-            Attendance.user_id == user_id,
-            extract('month', Attendance.date) == month,
-            extract('year', Attendance.date) == year
-        ).all()
-
-        present_days = 0.0
-        total_overtime_pay = 0.0
-        total_bonus = 0.0
-
-        company = db.query(Company).filter(Company.id == company_id).first()
-        off_days = company.off_days if company and company.off_days else [] # List of ints [0-6]
-        
-        _, days_in_month = monthrange(year, month)
-        off_days_count = 0
-        
-        if off_days:
-            for day in range(1, days_in_month + 1):
-                 current_date = date(year, month, day)
-                 if current_date.weekday() in off_days:
-                     off_days_count += 1
-                     
-        working_days_in_month = max(1, days_in_month - off_days_count)
-
-        # Calculate exact hourly rate for Overtime based on salary type
-        daily_work_hours = float(profile.work_hours_per_day) if profile.work_hours_per_day else 8.0
-        if profile.salary_type == SalaryType.DAILY:
-            effective_daily_rate = base_salary
-        else:
-            effective_daily_rate = base_salary / working_days_in_month
-            
-        hourly_rate = effective_daily_rate / daily_work_hours
-
-        total_hours_worked = 0.0
-
-        for r in records:
-            # Use exact hours worked if provided and > 0, else fallback to Status for old/legacy records
-            if r.hours_worked and float(r.hours_worked) > 0:
-                total_hours_worked += float(r.hours_worked)
-            else:
-                if r.status == AttendanceStatus.PRESENT:
-                    total_hours_worked += daily_work_hours
-                elif r.status == AttendanceStatus.HALF_DAY:
-                    total_hours_worked += (daily_work_hours / 2.0)
-            
-            # Add explicit OT (if any) and Bonus
-            if r.overtime_hours:
-                total_overtime_pay += float(r.overtime_hours) * hourly_rate
-            if r.bonus_amount:
-                total_bonus += float(r.bonus_amount)
-                
-        # Convert total exact hours into equivalent 'present days' for daily rate multiplication
-        present_days = total_hours_worked / daily_work_hours if daily_work_hours > 0 else 0.0
-        
-        # [NEW] Add Holidays to Present Days (if no attendance marked)
-        holidays = db.query(Holiday).filter(
-            Holiday.company_id == company_id,
-            extract('month', Holiday.date) == month,
-            extract('year', Holiday.date) == year
-        ).all()
-        
-        holiday_dates = {h.date for h in holidays}
-        attended_dates = {r.date for r in records}
-
-        # Only add automatic paid holidays for MONTHLY salaried employees
-        if profile.salary_type == SalaryType.MONTHLY:
-            for h_date in holiday_dates:
-                # If no attendance marked for this holiday, count as full paid day
-                if h_date not in attended_dates:
-                    present_days += 1.0
-        
-        # Logic
-        calculated_amount = 0.0
-        
-        if profile.salary_type == SalaryType.MONTHLY:
-            daily_rate = base_salary / working_days_in_month
-            calculated_amount = daily_rate * present_days
-            
-        elif profile.salary_type == SalaryType.DAILY:
-            calculated_amount = base_salary * present_days
-
-        # Check if already paid
-        # Construct description to match pay_salary logic
-        month_name = date(year, month, 1).strftime("%B")
-        expected_desc = f"Salary for {user.name} - {month_name} {year}"
-        
-        existing_expense = db.query(Expense).filter(
-            Expense.category == "Salary",
-            Expense.description == expected_desc,
-            Expense.company_id == company_id
-        ).first()
-
-        is_paid = existing_expense is not None
-
-        # Calculate Advances
-        _, days_in_calc_month = monthrange(year, month)
-        cutoff_date = date(year, month, days_in_calc_month)
-
-        # Ensure DB columns deducted_month and deducted_year exist on live database
-        try:
-            from sqlalchemy import text
-            db.execute(text("ALTER TABLE salary_advances ADD COLUMN IF NOT EXISTS deducted_month INTEGER"))
-            db.execute(text("ALTER TABLE salary_advances ADD COLUMN IF NOT EXISTS deducted_year INTEGER"))
-            db.commit()
-        except Exception:
-            db.rollback()
-            try:
-                from sqlalchemy import text
-                db.execute(text("ALTER TABLE salary_advances ADD COLUMN deducted_month INTEGER"))
-                db.commit()
-            except Exception:
-                db.rollback()
-            try:
-                from sqlalchemy import text
-                db.execute(text("ALTER TABLE salary_advances ADD COLUMN deducted_year INTEGER"))
-                db.commit()
-            except Exception:
-                db.rollback()
-
-        try:
-            if is_paid:
-                # For paid salaries, fetch advances deducted for this specific month/year
-                advances = db.query(SalaryAdvance).filter(
-                    SalaryAdvance.user_id == user_id,
-                    SalaryAdvance.deducted_month == month,
-                    SalaryAdvance.deducted_year == year
-                ).all()
-
-                # Legacy fallback for historical paid records created before deducted_month tracking
-                if not advances and deduct_advances:
-                    legacy_advances = db.query(SalaryAdvance).filter(
-                        SalaryAdvance.user_id == user_id,
-                        SalaryAdvance.date <= cutoff_date,
-                        SalaryAdvance.is_deducted == True,
-                        SalaryAdvance.deducted_month == None
-                    ).order_by(SalaryAdvance.date.asc()).all()
-
-                    if legacy_advances:
-                        advances = legacy_advances
-                        for adv in legacy_advances:
-                            adv.deducted_month = month
-                            adv.deducted_year = year
-                        try:
-                            db.commit()
-                        except Exception:
-                            db.rollback()
-
-                total_advances = sum([float(a.amount) for a in advances])
-            elif deduct_advances:
-                # For pending salaries, fetch all unsettled advances up to cutoff_date
-                advances = db.query(SalaryAdvance).filter(
-                    SalaryAdvance.user_id == user_id,
-                    SalaryAdvance.date <= cutoff_date,
-                    SalaryAdvance.is_deducted == False
-                ).order_by(SalaryAdvance.date.asc()).all()
-                
-                total_advances = sum([float(a.amount) for a in advances])
-            else:
-                total_advances = 0.0
-        except Exception as query_err:
-            print(f"Warning: Salary advance deduction query fallback triggered: {query_err}")
-            # Graceful fallback if database schema does not have new columns yet
-            if is_paid:
-                advances = db.query(SalaryAdvance).filter(
-                    SalaryAdvance.user_id == user_id,
-                    SalaryAdvance.date <= cutoff_date,
-                    SalaryAdvance.is_deducted == True
-                ).all()
-            elif deduct_advances:
-                advances = db.query(SalaryAdvance).filter(
-                    SalaryAdvance.user_id == user_id,
-                    SalaryAdvance.date <= cutoff_date,
-                    SalaryAdvance.is_deducted == False
-                ).all()
-            else:
-                advances = []
-            total_advances = sum([float(a.amount) for a in advances])
-
-        # Calculate Tax (TDS)
-        # Gross Earnings = Base Pay + OT + Bonus
-        gross_earnings = calculated_amount + total_overtime_pay + total_bonus
-        if profile.enable_tds:
-            tds_percentage = float(profile.tds_percentage) if profile.tds_percentage else 0.0
-            tax_deduction = (gross_earnings * tds_percentage) / 100
-        else:
-            tax_deduction = 0.0
-        
-        # Professional Tax (Fixed Amount)
-        professional_tax = float(profile.professional_tax) if profile.professional_tax else 0.0
-        
-        final_payable = gross_earnings - total_advances - tax_deduction - professional_tax
-        
-        return SalarySlip(
-            user_id=user_id,
-            month=f"{year}-{month:02d}",
-            base_salary=base_salary,
-            salary_type=profile.salary_type.value if profile.salary_type else "monthly",
-            total_days=working_days_in_month,
-            present_days=present_days,
-            total_overtime_pay=round(total_overtime_pay, 2),
-            total_bonus=round(total_bonus, 2),
-            total_advances_deducted=round(total_advances, 2),
-            tax_deduction=round(tax_deduction, 2),
-            professional_tax_deduction=round(professional_tax, 2),
-            final_payable=round(final_payable, 2),
-            is_paid=is_paid
-        )
+        return compute_salary_slips(db, company_id, month, year, users, deduct_advances)[0]
     except HTTPException:
         raise
     except Exception as e:
@@ -978,9 +803,6 @@ def upload_document(
 # PDF GENERATION
 # ================================
 
-templates_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
-env = Environment(loader=FileSystemLoader(templates_dir))
-
 @router.get("/{user_id}/salary/pdf")
 async def get_salary_slip_pdf(
     user_id: int,
@@ -989,23 +811,27 @@ async def get_salary_slip_pdf(
     company_id: int = Depends(get_company_id),
     db: Session = Depends(get_db)
 ):
-    # 1. Calculate Salary Data
-    try:
-        # We call the synchronous function directly
-        salary_slip = calculate_salary(user_id=user_id, month=month, year=year, company_id=company_id, db=db)
-    except HTTPException as e:
-        raise e
+    def load():
+        # 1. Calculate Salary Data
+        try:
+            # We call the synchronous function directly
+            salary_slip = calculate_salary(user_id=user_id, month=month, year=year, company_id=company_id, db=db)
+        except HTTPException as e:
+            raise e
         
-    # 2. Fetch User & Company Details
-    user = db.query(User).options(joinedload(User.employee_profile)).filter(
-        User.id == user_id, 
-        User.company_id == company_id
-    ).first()
+        # 2. Fetch User & Company Details
+        user = db.query(User).options(joinedload(User.employee_profile)).filter(
+            User.id == user_id, 
+            User.company_id == company_id
+        ).first()
     
-    if not user:
-        raise HTTPException(status_code=404, detail="Employee not found")
+        if not user:
+            raise HTTPException(status_code=404, detail="Employee not found")
         
-    company = user.company # Assuming relationship exists
+        company = user.company # Assuming relationship exists
+        return salary_slip, user, company
+
+    salary_slip, user, company = await db_executor.run(load)
     
     # 3. Prepare Template Context
     month_name = date(year, month, 1).strftime("%B")
@@ -1018,8 +844,8 @@ async def get_salary_slip_pdf(
     except Exception:
         final_payable_words = f"Rupees {salary_slip.final_payable:,.2f} Only"
 
-    template = env.get_template("salary_slip.html")
-    html_content = template.render(
+    html_content = await render_service.render(
+        env, "salary_slip.html",
         company=company,
         employee=user,
         month_name=month_name,
@@ -1047,7 +873,7 @@ async def get_salary_slip_pdf(
     
     return Response(
         content=pdf_content,
-        media_type="text/html",
+        media_type=media_type_for(pdf_content),
         headers={"Content-Disposition": f"inline; filename={filename}"}
     )
 
@@ -1080,7 +906,6 @@ def pay_salary(
     # 2. Get Employee Name
     user = db.query(User).filter(User.id == user_id).first()
     emp_name = user.name if user else "Employee"
-    month_name = date(year, month, 1).strftime("%B")
 
     # 3. Create Expense
     expense = Expense(
@@ -1088,7 +913,7 @@ def pay_salary(
         financial_year_id=fy.id,
         date=date.today(),
         category="Salary",
-        description=f"Salary for {emp_name} - {month_name} {year}",
+        description=salary_description(emp_name, month, year),
         amount=slip.final_payable,
         payment_method=payment_method,
         payee_name=emp_name,  # Add employee name for cheque printing
@@ -1129,16 +954,20 @@ async def get_id_card_pdf(
     company_id: int = Depends(get_company_id),
     db: Session = Depends(get_db)
 ):
-    # 1. Fetch User
-    user = db.query(User).options(joinedload(User.employee_profile)).filter(
-        User.id == user_id, 
-        User.company_id == company_id
-    ).first()
+    def load():
+        # 1. Fetch User
+        user = db.query(User).options(joinedload(User.employee_profile)).filter(
+            User.id == user_id, 
+            User.company_id == company_id
+        ).first()
     
-    if not user:
-        raise HTTPException(status_code=404, detail="Employee not found")
+        if not user:
+            raise HTTPException(status_code=404, detail="Employee not found")
         
-    company = user.company
+        company = user.company
+        return user, company
+
+    user, company = await db_executor.run(load)
     
     # 2. Generate QR Code (VCard format or just info)
     # Simple VCard
@@ -1158,21 +987,14 @@ async def get_id_card_pdf(
     
     verification_url = f"{base_url}/verify-id/{user.id}?token={token}"
     
-    qr = qrcode.QRCode(box_size=2, border=1)
-    qr.add_data(verification_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    qr_base64 = await render_service.qr_base64(verification_url, box_size=2, border=1, version=None)
     
     # 3. Render Template
     # Base URL for images
     request_base_url = str(request.base_url).rstrip("/")
     
-    template = env.get_template("id_card.html")
-    html_content = template.render(
+    html_content = await render_service.render(
+        env, "id_card.html",
         company=company,
         employee=user,
         qr_code_base64=qr_base64,
@@ -1189,7 +1011,7 @@ async def get_id_card_pdf(
     
     return Response(
         content=pdf_content,
-        media_type="text/html",
+        media_type=media_type_for(pdf_content),
         headers={"Content-Disposition": f"inline; filename={filename}"}
     )
 
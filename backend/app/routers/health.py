@@ -1,7 +1,20 @@
 from fastapi import APIRouter
 
+from app.services.render_service import render_service
+from app.services.pdf_service import pdf_manager
+
 router = APIRouter(tags=["Health"])
 
 @router.get("/health")
 def health_check():
     return {"status": "ok"}
+
+@router.get("/health/render")
+def render_metrics():
+    """Print render pool load and per-job timings (see render_service)."""
+    return render_service.metrics()
+
+@router.get("/health/pdf")
+def pdf_metrics():
+    """PDF backend, worker pool state and job outcome counters (see pdf_service)."""
+    return pdf_manager.metrics()
@@ -1,20 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_, func, case
+from sqlalchemy import or_, func, case, insert
 from typing import List, Optional
 from datetime import date
-import io
-import base64
-import qrcode
 import socket
-import os
 from num2words import num2words
 from pydantic import BaseModel
 
 from fastapi.responses import Response
-from jinja2 import Environment, FileSystemLoader, select_autoescape
 
 from app.database.session import get_db
+from app.database.executor import db_executor
 from app.models.invoice import Invoice
 from app.models.invoice_item import InvoiceItem
 from app.models.delivery_challan import DeliveryChallan
@@ -22,83 +18,87 @@ from app.models.delivery_challan_item import DeliveryChallanItem
 from app.models.stock_transaction import StockTransaction
 from app.models.company import Company
 from app.models.party import Party
-import os
 from app.models.user import User, UserRole
 
-from app.schemas.invoice import InvoiceResponse, InvoiceCreate
+from app.schemas.invoice import InvoiceResponse, InvoiceCreate, InvoiceBulkCreate, InvoiceBulkResult, InvoiceBulkResponse
 from app.core.dependencies import get_company_id, get_active_financial_year, require_role, require_feature, get_current_user
 from app.core.permissions import require_permission
-from app.core.security import create_url_signature, verify_url_signature
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.security import verify_url_signature
 from app.utils.gst import calculate_gst
-from app.services.pdf_service import generate_pdf
+from app.services.pdf_service import generate_pdf, media_type_for, bulk_document_response
+from app.services.render_service import render_service
+from app.services import document_sequence
+from app.services.stock_lock import lock_company_stock
+from app.services.template_env import env, format_inr
+from app.services.qr_cache import get_qr_base64
+from app.services.link_service import link_service
+from app.services.document_cache import document_cache
 
 router = APIRouter(prefix="/invoice", tags=["Invoice"])
 
-# Setup Jinja2
-templates_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
-env = Environment(
-    loader=FileSystemLoader(templates_dir),
-    autoescape=select_autoescape(['html', 'xml'])
-)
 
 
-def generate_invoice_number(db: Session, company_id: int, fy_id: int) -> str:
-    """Generate next invoice number (e.g. INV/24-25/001) for the company and FY.
+def _invoice_serial(invoice_number: Optional[str]) -> int:
+    """Trailing number of "INV/24-25/001"; 0 for the old "INV-001" format."""
+    try:
+        return int(invoice_number.split("/")[-1]) if invoice_number and "/" in invoice_number else 0
+    except ValueError:
+        return 0
+
+
+def generate_invoice_numbers(db: Session, company_id: int, fy_id: int, count: int = 1, preview: bool = False) -> List[str]:
+    """Generate the next ``count`` invoice numbers (e.g. INV/24-25/001) for the company and FY.
     
-    Uses SELECT FOR UPDATE to lock the last invoice row, preventing race conditions
-    when two users create invoices simultaneously on multi-worker deployments.
+    Numbers come from the company/FY row in document_sequence, incremented in
+    the caller's transaction, so concurrent invoices never reuse a number and
+    a failed save does not leave a gap. ``preview`` returns the next numbers
+    without reserving them.
     """
     # 1. Get FY Short Name (e.g. 24-25)
     from app.models.financial_year import FinancialYear
     fy = db.query(FinancialYear).filter(FinancialYear.id == fy_id).first()
     if not fy:
         # Fallback if no FY found (shouldn't happen)
-        return "INV-001"
+        return [f"INV-{n:03d}" for n in range(1, count + 1)]
         
     start_yy = fy.start_date.strftime("%y")
     end_yy = fy.end_date.strftime("%y")
     fy_prefix = f"{start_yy}-{end_yy}" # e.g. "24-25"
 
-    # [FIX] SELECT FOR UPDATE: Locks the last invoice row until this transaction
-    # commits. If two requests hit simultaneously, the second one WAITS here
-    # instead of reading stale data — eliminating the duplicate number race condition.
-    last_invoice = (
-        db.query(Invoice)
-        .filter(
-            Invoice.company_id == company_id,
-            Invoice.financial_year_id == fy_id
+    def seed():
+        # First use of this sequence: continue from the latest invoice
+        last_number = (
+            db.query(Invoice.invoice_number)
+            .filter(
+                Invoice.company_id == company_id,
+                Invoice.financial_year_id == fy_id
+            )
+            .order_by(Invoice.id.desc())
+            .limit(1)
+            .scalar()
         )
-        .order_by(Invoice.id.desc())
-        .with_for_update()   # ← DB-level lock: prevents concurrent reads
-        .first()
+        return _invoice_serial(last_number)
+
+    def is_taken(numbers):
+        # Invoice numbers are unique across companies (and may be entered by hand)
+        return db.query(Invoice.id).filter(Invoice.invoice_number.in_(numbers)).first() is not None
+
+    def highest_taken():
+        numbers = db.query(Invoice.invoice_number).filter(Invoice.invoice_number.like(f"INV/{fy_prefix}/%"))
+        return max((_invoice_serial(n) for (n,) in numbers), default=0)
+
+    return document_sequence.next_numbers(
+        db, company_id, fy_id, document_sequence.INVOICE,
+        lambda n: f"INV/{fy_prefix}/{n:03d}", count,
+        seed=seed, is_taken=is_taken, highest_taken=highest_taken, preview=preview,
     )
-    
-    if last_invoice and last_invoice.invoice_number:
-        try:
-            # Expected format "INV/24-25/001"
-            if "/" in last_invoice.invoice_number:
-                parts = last_invoice.invoice_number.split("/")
-                last_num = int(parts[-1])
-                next_num = last_num + 1
-            else:
-                # Handle migration from old format INV-001
-                next_num = 1 
-        except (ValueError, IndexError):
-            next_num = 1
-    else:
-        next_num = 1
-        
-    # Safety loop: skip any number already taken (e.g. manually entered invoices)
-    while True:
-        next_invoice_num = f"INV/{fy_prefix}/{next_num:03d}"
-        exists = db.query(Invoice).filter(
-            Invoice.invoice_number == next_invoice_num
-        ).first()
-        
-        if not exists:
-            return next_invoice_num
-            
-        next_num += 1
+
+
+def generate_invoice_number(db: Session, company_id: int, fy_id: int, preview: bool = False) -> str:
+    """Generate next invoice number (e.g. INV/24-25/001) for the company and FY."""
+    return generate_invoice_numbers(db, company_id, fy_id, preview=preview)[0]
 
 
 @router.get("/next-number")
@@ -109,7 +109,7 @@ def get_next_invoice_number(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    next_num = generate_invoice_number(db, company_id, fy.id)
+    next_num = generate_invoice_number(db, company_id, fy.id, preview=True)
     return {"next_invoice_number": next_num}
 
 
@@ -171,6 +171,7 @@ def create_invoice(
     db: Session = Depends(get_db)
 ):
     from app.services.audit_service import log_audit_action
+    lock_company_stock(db, company_id)
     """Create a direct invoice (not from challan)"""
     try:
         invoice_number = generate_invoice_number(db, company_id, fy.id)
@@ -319,6 +320,209 @@ def create_invoice(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _linked_challan_item_ids(line) -> List[int]:
+    ids = []
+    if line.delivery_challan_item_id:
+        ids.append(line.delivery_challan_item_id)
+    if line.delivery_challan_item_ids:
+        ids.extend(line.delivery_challan_item_ids)
+    return ids
+
+
+BULK_INSERT_CHUNK = 500
+
+
+@router.post("/bulk", response_model=InvoiceBulkResponse)
+@require_permission("invoices.create")
+def create_invoices_bulk(
+    data: InvoiceBulkCreate,
+    current_user: User = Depends(get_current_user),
+    company_id: int = Depends(get_company_id),
+    fy = Depends(get_active_financial_year),
+    db: Session = Depends(get_db)
+):
+    """Create many direct invoices at once (e.g. month-end billing).
+
+    Same rules as POST /invoice/, but the whole request is validated with one
+    query per table, items and stock transactions go in as multi-row INSERTs
+    and everything (numbers, challan status, audit log) commits once.
+    Invoices that fail validation are reported by index and skipped.
+    """
+    from app.models.audit_log import AuditLog
+    from app.models.item import Item as ItemModel
+    from app.services.notification_service import create_notification_raw
+    # Stock rows go in as Core INSERTs, which the before_flush hook never sees
+    lock_company_stock(db, company_id)
+
+    # 1. Validate all invoices together
+    party_ids = {inv.party_id for inv in data.invoices}
+    item_ids = {line.item_id for inv in data.invoices for line in inv.items}
+    linked_ids = {cid for inv in data.invoices for line in inv.items for cid in _linked_challan_item_ids(line)}
+
+    valid_parties = {pid for (pid,) in db.query(Party.id).filter(
+        Party.id.in_(party_ids), Party.company_id == company_id
+    )}
+    valid_items = {iid for (iid,) in db.query(ItemModel.id).filter(
+        ItemModel.id.in_(item_ids), ItemModel.company_id == company_id
+    )} if item_ids else set()
+    challan_items = {}
+    if linked_ids:
+        rows = db.query(
+            DeliveryChallanItem.id, DeliveryChallanItem.challan_id,
+            DeliveryChallanItem.ok_qty, DeliveryChallanItem.cr_qty, DeliveryChallanItem.mr_qty
+        ).join(DeliveryChallan).filter(
+            DeliveryChallanItem.id.in_(linked_ids),
+            DeliveryChallan.company_id == company_id
+        )
+        challan_items = {row.id: row for row in rows}
+
+    results: List[Optional[InvoiceBulkResult]] = [None] * len(data.invoices)
+    accepted = []
+    for index, inv in enumerate(data.invoices):
+        error = None
+        if not inv.items:
+            error = "Invoice must contain at least one item"
+        elif inv.party_id not in valid_parties:
+            error = "Party not found"
+        elif any(line.item_id not in valid_items for line in inv.items):
+            error = "Item not found"
+        elif any(cid not in challan_items for line in inv.items for cid in _linked_challan_item_ids(line)):
+            error = "Delivery challan item not found"
+        if error:
+            results[index] = InvoiceBulkResult(index=index, error=error)
+        else:
+            accepted.append((index, inv))
+
+    if not accepted:
+        return InvoiceBulkResponse(created=0, failed=len(results), results=results)
+
+    try:
+        # 2. One block of invoice numbers, invoices inserted in one flush
+        numbers = generate_invoice_numbers(db, company_id, fy.id, count=len(accepted))
+        invoices = []
+        for (index, inv), invoice_number in zip(accepted, numbers):
+            subtotal = sum(float(line.quantity) * float(line.rate) for line in inv.items)
+            gst_amount, grand_total = calculate_gst(subtotal, inv.gst_rate)
+            invoices.append(Invoice(
+                company_id=company_id,
+                financial_year_id=fy.id,
+                party_id=inv.party_id,
+                invoice_number=invoice_number,
+                invoice_date=inv.invoice_date,
+                due_date=inv.due_date,
+                notes=inv.notes,
+                subtotal=subtotal,
+                gst_amount=gst_amount,
+                grand_total=grand_total,
+                status="OPEN",
+                is_locked=False
+            ))
+        db.add_all(invoices)
+        db.flush()
+
+        # 3. Items and stock transactions as multi-row INSERTs
+        item_rows, stock_rows, billed_ids = [], [], set()
+        for (index, inv), invoice in zip(accepted, invoices):
+            for line in inv.items:
+                linked = _linked_challan_item_ids(line)
+                billed_ids.update(linked)
+                ok_qty, cr_qty, mr_qty = line.ok_qty, line.cr_qty, line.mr_qty
+                if not ok_qty and not cr_qty and not mr_qty and linked:
+                    # Backfill quantities from the challan items
+                    sources = [challan_items[cid] for cid in set(linked)]
+                    ok_qty = sum(float(ci.ok_qty or 0) for ci in sources)
+                    cr_qty = sum(float(ci.cr_qty or 0) for ci in sources)
+                    mr_qty = sum(float(ci.mr_qty or 0) for ci in sources)
+
+                item_rows.append(dict(
+                    invoice_id=invoice.id,
+                    item_id=line.item_id,
+                    grn_no=line.grn_no,
+                    delivery_challan_item_id=line.delivery_challan_item_id,
+                    quantity=line.quantity,
+                    rate=line.rate,
+                    amount=float(line.quantity) * float(line.rate),
+                    ok_qty=ok_qty,
+                    cr_qty=cr_qty,
+                    mr_qty=mr_qty,
+                    challan_item_ids=line.delivery_challan_item_ids
+                ))
+                # Stock OUT only for direct lines (challan lines left stock on delivery)
+                if not linked:
+                    stock_rows.append(dict(
+                        company_id=company_id,
+                        financial_year_id=fy.id,
+                        item_id=line.item_id,
+                        quantity=line.quantity,
+                        transaction_type="OUT",
+                        reference_type="INVOICE",
+                        reference_id=invoice.id
+                    ))
+
+        for model, rows in ((InvoiceItem, item_rows), (StockTransaction, stock_rows)):
+            for start in range(0, len(rows), BULK_INSERT_CHUNK):
+                db.execute(insert(model).values(rows[start:start + BULK_INSERT_CHUNK]))
+
+        # 4. Linked challans are billed
+        challan_ids = {challan_items[cid].challan_id for cid in billed_ids}
+        if challan_ids:
+            db.query(DeliveryChallan).filter(
+                DeliveryChallan.id.in_(challan_ids)
+            ).update({DeliveryChallan.status: "delivered"}, synchronize_session=False)
+
+        # [AUDIT] Same entries as single creation, same transaction
+        db.add_all([
+            AuditLog(
+                user_id=current_user.id,
+                action="INVOICE_CREATE",
+                company_id=company_id,
+                details=f"Created Direct Invoice {invoice.invoice_number} for {invoice.grand_total} (bulk)"
+            )
+            for invoice in invoices
+        ])
+
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    for (index, inv), invoice in zip(accepted, invoices):
+        results[index] = InvoiceBulkResult(
+            index=index,
+            invoice_id=invoice.id,
+            invoice_number=invoice.invoice_number,
+            grand_total=float(invoice.grand_total)
+        )
+
+    # [LOW STOCK ALERT] One query for every invoiced item, one commit
+    # Non-fatal: any failure here must NOT break the response
+    try:
+        low_items = db.query(ItemModel.name, ItemModel.current_stock).filter(
+            ItemModel.id.in_(item_ids),
+            ItemModel.company_id == company_id,
+            func.coalesce(ItemModel.current_stock, 0) <= 5
+        ).all()
+        for name, current_stock in low_items:
+            create_notification_raw(
+                db=db,
+                company_id=company_id,
+                title=f"Low Stock: {name}",
+                message=f"Only {float(current_stock or 0):.0f} unit(s) remaining. Consider restocking.",
+                type="warning",
+            )
+        if low_items:
+            db.commit()
+    except Exception as notify_err:
+        db.rollback()
+        logger.warning(f"[Invoice] Low stock notification failed (non-fatal): {notify_err}")
+
+    return InvoiceBulkResponse(
+        created=len(accepted),
+        failed=len(results) - len(accepted),
+        results=results
+    )
+
+
 @router.get("/{invoice_id}", response_model=InvoiceResponse)
 @require_permission("invoices.view")
 def get_invoice(
@@ -358,6 +562,7 @@ def update_invoice(
     db: Session = Depends(get_db)
 ):
     from app.services.audit_service import log_audit_action
+    lock_company_stock(db, company_id)
     invoice = db.query(Invoice).filter(
         Invoice.id == invoice_id,
         Invoice.company_id == company_id
@@ -532,6 +737,7 @@ def delete_invoice(
     db: Session = Depends(get_db)
 ):
     from app.services.audit_service import log_audit_action
+    lock_company_stock(db, company_id)
     invoice = db.query(Invoice).filter(
         Invoice.id == invoice_id,
         Invoice.company_id == company_id
@@ -730,14 +936,6 @@ def list_invoices(
     return invoices
 
 
-def format_inr(number):
-    try:
-        s, *d = str("{:.2f}".format(float(number))).partition(".")
-        r = ",".join([s[x-2:x] for x in range(-3, -len(s), -2)][::-1] + [s[-3:]])
-        return "".join([r] + d) if r else d[0]
-    except:
-        return str(number)
-
 class BulkPrintInvoiceRequest(BaseModel):
     invoice_ids: list[int]
 
@@ -745,6 +943,7 @@ class BulkPrintInvoiceRequest(BaseModel):
 @require_permission("invoices.view")
 async def bulk_print_invoices(
     request: BulkPrintInvoiceRequest,
+    http_request: Request,
     company_id: int = Depends(get_company_id),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -753,65 +952,65 @@ async def bulk_print_invoices(
         if not request.invoice_ids:
             raise HTTPException(400, "No invoice IDs provided")
 
-        invoices = db.query(Invoice).options(
-            joinedload(Invoice.party),
-            joinedload(Invoice.challan),
-            joinedload(Invoice.items).joinedload(InvoiceItem.item),
-            joinedload(Invoice.items).joinedload(InvoiceItem.delivery_challan_item)
-        ).filter(
-            Invoice.id.in_(request.invoice_ids),
-            Invoice.company_id == company_id
-        ).all()
-    
-        if not invoices:
-            raise HTTPException(404, "No valid invoices found")
-
-        # Map to input order
-        inv_map = {inv.id: inv for inv in invoices}
-        ordered_invoices = [inv_map[cid] for cid in request.invoice_ids if cid in inv_map]
-
-        company = db.query(Company).filter(Company.id == company_id).first()
-        from app.core.config import get_backend_url
-        base_url = get_backend_url()
-
-        invoices_data = []
-        for invoice in ordered_invoices:
-            signature = create_url_signature(str(invoice.id))
-            download_url = f"{base_url}/public/invoice/{invoice.id}/download?token={signature}"
-            qr = qrcode.QRCode(version=1, box_size=10, border=5)
-            qr.add_data(download_url)
-            qr.make(fit=True)
-            img = qr.make_image(fill_color="black", back_color="white")
-            buffered = io.BytesIO()
-            img.save(buffered, format="PNG")
-            qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-            
-            try:
-                grand_total_words = num2words(invoice.grand_total, lang='en_IN').title().replace(",", "") + " Only"
-            except:
-                grand_total_words = f"{invoice.grand_total} Only"
-                
-            invoices_data.append({
-                "invoice": invoice,
-                "items": invoice.items,
-                "company": company,
-                "party": invoice.party,
-                "qr_code": qr_code_b64,
-                "grand_total_words": grand_total_words
-            })
-
-        template = env.get_template("invoice_bulk.html")
-        html = template.render(
-            invoices=invoices_data,
-            format_currency=format_inr
-        )
-    
-        pdf_content = await generate_pdf(html)
-        return Response(
-            content=pdf_content,
-            media_type="text/html",
-            headers={"Content-Disposition": "inline; filename=bulk-invoices.pdf"}
+        def load():
+            # Validate ownership up front; documents are loaded batch by batch while streaming
+            valid_ids = {
+                invoice_id for (invoice_id,) in db.query(Invoice.id).filter(
+                    Invoice.id.in_(request.invoice_ids),
+                    Invoice.company_id == company_id
+                )
+            }
+            if not valid_ids:
+                raise HTTPException(404, "No valid invoices found")
+
+            # Keep input order
+            ordered_ids = [cid for cid in request.invoice_ids if cid in valid_ids]
+
+            company = db.query(Company).filter(Company.id == company_id).first()
+            return ordered_ids, company
+
+        ordered_ids, company = await db_executor.run(load)
+        base_url = link_service.base_url(http_request, company=company)
+
+        def load_batch(batch_ids):
+            invoices = db.query(Invoice).options(
+                joinedload(Invoice.party),
+                joinedload(Invoice.challan),
+                joinedload(Invoice.items).joinedload(InvoiceItem.item),
+                joinedload(Invoice.items).joinedload(InvoiceItem.delivery_challan_item)
+            ).filter(
+                Invoice.id.in_(batch_ids),
+                Invoice.company_id == company_id
+            ).all()
+            inv_map = {inv.id: inv for inv in invoices}
+
+            pages = []
+            for invoice in (inv_map[cid] for cid in batch_ids if cid in inv_map):
+                try:
+                    grand_total_words = num2words(invoice.grand_total, lang='en_IN').title().replace(",", "") + " Only"
+                except:
+                    grand_total_words = f"{invoice.grand_total} Only"
+
+                pages.append({
+                    "invoice": invoice,
+                    "items": invoice.items,
+                    "company": company,
+                    "party": invoice.party,
+                    "qr_code": get_qr_base64(link_service.invoice_download_url(base_url, invoice.id)),
+                    "grand_total_words": grand_total_words
+                })
+            return pages
+
+        batch_size = max(1, settings.BULK_PRINT_BATCH_SIZE)
+        chunks = render_service.stream_pages(
+            "invoice.bulk", env, "invoice_bulk.html",
+            (ordered_ids[i:i + batch_size] for i in range(0, len(ordered_ids), batch_size)),
+            load_batch,
+            {"invoices": [], "format_currency": format_inr},
         )
+        return await bulk_document_response(chunks, "bulk-invoices.pdf")
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         error_msg = traceback.format_exc()
@@ -832,36 +1031,30 @@ async def print_invoice(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    invoice = db.query(Invoice).options(
-        joinedload(Invoice.party),
-        joinedload(Invoice.challan),
-        joinedload(Invoice.items).joinedload(InvoiceItem.item),
-        joinedload(Invoice.items).joinedload(InvoiceItem.delivery_challan_item)
-    ).filter(
-        Invoice.id == invoice_id,
-        Invoice.company_id == company_id
-    ).first()
+    def load():
+        invoice = db.query(Invoice).options(
+            joinedload(Invoice.party),
+            joinedload(Invoice.challan),
+            joinedload(Invoice.items).joinedload(InvoiceItem.item),
+            joinedload(Invoice.items).joinedload(InvoiceItem.delivery_challan_item)
+        ).filter(
+            Invoice.id == invoice_id,
+            Invoice.company_id == company_id
+        ).first()
     
-    if not invoice:
-        raise HTTPException(404, "Invoice not found")
+        if not invoice:
+            raise HTTPException(404, "Invoice not found")
         
-    company = db.query(Company).filter(Company.id == company_id).first()
+        company = db.query(Company).filter(Company.id == company_id).first()
+        return invoice, company
+
+    invoice, company = await db_executor.run(load)
     
     # Generate QR Code for Public Download
-    from app.core.config import get_backend_url
-    base_url = get_backend_url()
-            
-    signature = create_url_signature(str(invoice_id))
-    download_url = f"{base_url}/public/invoice/{invoice_id}/download?token={signature}"
-    
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(download_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
+    base_url = link_service.base_url(request, company=company)
+    download_url = link_service.invoice_download_url(base_url, invoice_id)
     
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    qr_code_b64 = await render_service.qr_base64(download_url)
     
     # Calculate words
     try:
@@ -870,8 +1063,8 @@ async def print_invoice(
         grand_total_words = f"{invoice.grand_total} Only"
 
     # Render
-    template = env.get_template("invoice.html")
-    html = template.render(
+    html = await render_service.render(
+        env, "invoice.html",
         invoice=invoice,
         company=company,
         party=invoice.party,
@@ -885,7 +1078,7 @@ async def print_invoice(
     
     return Response(
         content=pdf_content,
-        media_type="text/html",
+        media_type=media_type_for(pdf_content),
         headers={"Content-Disposition": f"inline; filename={invoice.invoice_number}.pdf"}
     )
 
@@ -897,34 +1090,44 @@ public_router = APIRouter(prefix="/public/invoice", tags=["Public Invoice"])
 async def public_download_invoice(
     invoice_id: int,
     token: str,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     from app.routers.public_challan import render_public_error_page
 
     if not verify_url_signature(str(invoice_id), token):
         return render_public_error_page("Link Expired or Invalid", "This download link is invalid or has expired.", status_code=403)
-        
-    invoice = db.query(Invoice).options(
-        joinedload(Invoice.party),
-        joinedload(Invoice.items).joinedload(InvoiceItem.item)
-    ).filter(Invoice.id == invoice_id).first()
+
+    def load():
+        # Serve the rendered copy when the invoice has not changed since
+        head = db.query(Invoice.company_id, Invoice.invoice_number, Invoice.updated_at).filter(Invoice.id == invoice_id).first()
+        if not head:
+            return render_public_error_page("Invoice Deleted", "This invoice has been deleted and is no longer available.", status_code=404)
+        version = document_cache.version("invoice.html", head.updated_at)
+        cached = document_cache.get(head.company_id, "invoice", invoice_id, "public", version)
+        if cached:
+            return document_cache.response(request, cached, f"{head.invoice_number}.pdf")
+
+        invoice = db.query(Invoice).options(
+            joinedload(Invoice.party),
+            joinedload(Invoice.items).joinedload(InvoiceItem.item)
+        ).filter(Invoice.id == invoice_id).first()
     
-    if not invoice:
-        return render_public_error_page("Invoice Deleted", "This invoice has been deleted and is no longer available.", status_code=404)
+        if not invoice:
+            return render_public_error_page("Invoice Deleted", "This invoice has been deleted and is no longer available.", status_code=404)
         
-    company = db.query(Company).filter(Company.id == invoice.company_id).first()
+        company = db.query(Company).filter(Company.id == invoice.company_id).first()
+        return version, invoice, company
+
+    loaded = await db_executor.run(load)
+    if isinstance(loaded, Response):
+        return loaded
+    version, invoice, company = loaded
     
     # Re-generate QR (could abstract this)
     # For now, simplistic QR or same link
     qr_data = f"Invoice: {invoice.invoice_number}\nDate: {invoice.invoice_date}\nAmount: {invoice.grand_total}"
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    qr_code_b64 = await render_service.qr_base64(qr_data)
     
     # Calculate words
     try:
@@ -932,8 +1135,8 @@ async def public_download_invoice(
     except:
         grand_total_words = f"{invoice.grand_total} Only"
 
-    template = env.get_template("invoice.html")
-    html = template.render(
+    html = await render_service.render(
+        env, "invoice.html",
         invoice=invoice,
         company=company,
         party=invoice.party,
@@ -944,16 +1147,12 @@ async def public_download_invoice(
     )
     
     pdf_content = await generate_pdf(html)
-    
-    return Response(
-        content=pdf_content,
-        media_type="text/html",
-        headers={"Content-Disposition": f"inline; filename={invoice.invoice_number}.pdf"}
-    )
+    document = document_cache.put(invoice.company_id, "invoice", invoice_id, "public", version, pdf_content)
+    return document_cache.response(request, document, f"{invoice.invoice_number}.pdf")
 
 
 @public_router.get("/dl/{code}")
-async def redirect_invoice_short_link(
+def redirect_invoice_short_link(
     code: str,
     db: Session = Depends(get_db)
 ):
@@ -977,16 +1176,15 @@ async def redirect_invoice_short_link(
 
 @router.get("/{invoice_id}/share")
 @require_permission("invoices.view")
-async def share_invoice(
+def share_invoice(
     invoice_id: int,
+    request: Request,
     company_id: int = Depends(get_company_id),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     _ = Depends(require_feature("WHATSAPP_SHARE"))
 ):
     """Generate a WhatsApp-ready short sharing link and message for an invoice"""
-    from app.core.config import get_backend_url
-    from app.core.security import create_url_signature
     import urllib.parse
     
     try:
@@ -1000,9 +1198,8 @@ async def share_invoice(
         if not invoice:
             raise HTTPException(404, "Invoice not found")
 
-        base_url = get_backend_url()
-        signature = create_url_signature(str(invoice_id))
-        download_url = f"{base_url}/public/invoice/{invoice_id}/download?token={signature}"
+        base_url = link_service.base_url(request, db=db, company_id=company_id)
+        download_url = link_service.invoice_download_url(base_url, invoice_id)
         
         # Generate Short Link (with fallback to long link if DB fails)
         short_download_url = download_url
@@ -1030,7 +1227,7 @@ async def share_invoice(
             db.commit()
             
             # If successful, use the short URL
-            short_download_url = f"{base_url}/public/invoice/dl/{short_code}"
+            short_download_url = link_service.short_url(base_url, "invoice", short_code)
         except Exception as e:
             print(f"Failed to generate invoice short link (DB issue?): {e}")
             db.rollback()
@@ -1176,25 +1373,29 @@ async def generate_eway_bill_preview(
     db: Session = Depends(get_db)
 ):
     """Generate e-way bill preview data (without saving)"""
-    invoice = db.query(Invoice).options(
-        joinedload(Invoice.party),
-        joinedload(Invoice.items).joinedload(InvoiceItem.item)
-    ).filter(
-        Invoice.id == invoice_id,
-        Invoice.company_id == company_id
-    ).first()
+    def load():
+        invoice = db.query(Invoice).options(
+            joinedload(Invoice.party),
+            joinedload(Invoice.items).joinedload(InvoiceItem.item)
+        ).filter(
+            Invoice.id == invoice_id,
+            Invoice.company_id == company_id
+        ).first()
     
-    if not invoice:
-        raise HTTPException(404, "Invoice not found")
+        if not invoice:
+            raise HTTPException(404, "Invoice not found")
     
-    # Validate eligibility
-    if not validate_eway_bill_eligibility(invoice.grand_total):
-        raise HTTPException(
-            400,
-            f"E-way bill not required for invoices below ₹50,000"
-        )
+        # Validate eligibility
+        if not validate_eway_bill_eligibility(invoice.grand_total):
+            raise HTTPException(
+                400,
+                f"E-way bill not required for invoices below ₹50,000"
+            )
     
-    company = db.query(Company).filter(Company.id == company_id).first()
+        company = db.query(Company).filter(Company.id == company_id).first()
+        return invoice, company
+
+    invoice, company = await db_executor.run(load)
     
     # Calculate validity
     validity_days, validity_desc = calculate_eway_bill_validity(data.transport_distance)
@@ -1219,15 +1420,14 @@ async def generate_eway_bill_preview(
     }
     
     # Render HTML template
-    template = env.get_template("eway_bill.html")
-    html = template.render(**eway_data, format_currency=format_inr)
+    html = await render_service.render(env, "eway_bill.html", **eway_data, format_currency=format_inr)
     
     # Generate PDF
     pdf_content = await generate_pdf(html)
     
     return Response(
         content=pdf_content,
-        media_type="text/html",
+        media_type=media_type_for(pdf_content),
         headers={"Content-Disposition": f"inline; filename=EWayBill_{invoice.invoice_number}.pdf"}
     )
 
@@ -1240,29 +1440,33 @@ async def print_eway_bill(
 ):
     """Print e-way bill using saved transport details"""
     try:
-        invoice = db.query(Invoice).options(
-            joinedload(Invoice.party),
-            joinedload(Invoice.items).joinedload(InvoiceItem.item)
-        ).filter(
-            Invoice.id == invoice_id,
-            Invoice.company_id == company_id
-        ).first()
+        def load():
+            invoice = db.query(Invoice).options(
+                joinedload(Invoice.party),
+                joinedload(Invoice.items).joinedload(InvoiceItem.item)
+            ).filter(
+                Invoice.id == invoice_id,
+                Invoice.company_id == company_id
+            ).first()
         
-        if not invoice:
-            raise HTTPException(404, "Invoice not found")
+            if not invoice:
+                raise HTTPException(404, "Invoice not found")
         
-        # Check if transport details are saved
-        if not invoice.transport_mode or not invoice.vehicle_number or not invoice.transport_distance:
-            raise HTTPException(
-                400,
-                "E-way bill transport details not found. Please save transport details first."
-            )
+            # Check if transport details are saved
+            if not invoice.transport_mode or not invoice.vehicle_number or not invoice.transport_distance:
+                raise HTTPException(
+                    400,
+                    "E-way bill transport details not found. Please save transport details first."
+                )
         
-        # Validate eligibility
-        if not validate_eway_bill_eligibility(invoice.grand_total):
-            raise HTTPException(400, "E-way bill not required for invoices below ₹50,000")
+            # Validate eligibility
+            if not validate_eway_bill_eligibility(invoice.grand_total):
+                raise HTTPException(400, "E-way bill not required for invoices below ₹50,000")
         
-        company = db.query(Company).filter(Company.id == company_id).first()
+            company = db.query(Company).filter(Company.id == company_id).first()
+            return invoice, company
+
+        invoice, company = await db_executor.run(load)
         
         # Calculate validity
         validity_days, validity_desc = calculate_eway_bill_validity(invoice.transport_distance)
@@ -1290,15 +1494,14 @@ async def print_eway_bill(
         }
         
         # Render HTML template
-        template = env.get_template("eway_bill.html")
-        html = template.render(**eway_data, format_currency=format_inr)
+        html = await render_service.render(env, "eway_bill.html", **eway_data, format_currency=format_inr)
         
         # Generate PDF
         pdf_content = await generate_pdf(html)
         
         return Response(
             content=pdf_content,
-            media_type="text/html",
+            media_type=media_type_for(pdf_content),
             headers={"Content-Disposition": f"inline; filename=EWayBill_{invoice.invoice_number}.pdf"}
         )
     except HTTPException as he:
@@ -1336,53 +1539,57 @@ async def generate_eway_bill_online(
     """
     from app.services.eway_bill_service import eway_bill_service
 
-    # ── 1. Fetch invoice with relations ──────────────────────────────────────
-    invoice = (
-        db.query(Invoice)
-        .options(
-            joinedload(Invoice.items).joinedload(InvoiceItem.item),
-            joinedload(Invoice.party),
-            joinedload(Invoice.company),
+    def load():
+        # ── 1. Fetch invoice with relations ──────────────────────────────────────
+        invoice = (
+            db.query(Invoice)
+            .options(
+                joinedload(Invoice.items).joinedload(InvoiceItem.item),
+                joinedload(Invoice.party),
+                joinedload(Invoice.company),
+            )
+            .filter(Invoice.id == invoice_id, Invoice.company_id == company_id)
+            .first()
         )
-        .filter(Invoice.id == invoice_id, Invoice.company_id == company_id)
-        .first()
-    )
-    if not invoice:
-        raise HTTPException(404, "Invoice not found")
+        if not invoice:
+            raise HTTPException(404, "Invoice not found")
 
-    # ── 2. Guard: already has an EWB number ──────────────────────────────────
-    if invoice.eway_bill_number:
-        raise HTTPException(
-            400,
-            f"E-Way Bill already exists for this invoice: {invoice.eway_bill_number}. "
-            "Cancel it first before generating a new one."
-        )
+        # ── 2. Guard: already has an EWB number ──────────────────────────────────
+        if invoice.eway_bill_number:
+            raise HTTPException(
+                400,
+                f"E-Way Bill already exists for this invoice: {invoice.eway_bill_number}. "
+                "Cancel it first before generating a new one."
+            )
 
-    # ── 3. Eligibility check ─────────────────────────────────────────────────
-    if not validate_eway_bill_eligibility(invoice.grand_total):
-        raise HTTPException(
-            400,
-            f"E-Way Bill not required for invoices below ₹50,000. "
-            f"Current amount: ₹{invoice.grand_total}"
-        )
+        # ── 3. Eligibility check ─────────────────────────────────────────────────
+        if not validate_eway_bill_eligibility(invoice.grand_total):
+            raise HTTPException(
+                400,
+                f"E-Way Bill not required for invoices below ₹50,000. "
+                f"Current amount: ₹{invoice.grand_total}"
+            )
 
-    # ── 4. Company GST required ──────────────────────────────────────────────
-    company = db.query(Company).filter(Company.id == company_id).first()
-    if not company or not company.gst_number:
-        raise HTTPException(400, "Company GSTIN is required to generate an E-Way Bill.")
+        # ── 4. Company GST required ──────────────────────────────────────────────
+        company = db.query(Company).filter(Company.id == company_id).first()
+        if not company or not company.gst_number:
+            raise HTTPException(400, "Company GSTIN is required to generate an E-Way Bill.")
 
-    # ── 5. Build NIC payload ─────────────────────────────────────────────────
-    transport_dict = data.model_dump()
-    try:
-        payload = eway_bill_service.build_ewb_payload(
-            invoice=invoice,
-            company=company,
-            party=invoice.party,
-            items=invoice.items,
-            transport_data=transport_dict,
-        )
-    except Exception as e:
-        raise HTTPException(400, f"Could not build EWB payload: {str(e)}")
+        # ── 5. Build NIC payload ─────────────────────────────────────────────────
+        transport_dict = data.model_dump()
+        try:
+            payload = eway_bill_service.build_ewb_payload(
+                invoice=invoice,
+                company=company,
+                party=invoice.party,
+                items=invoice.items,
+                transport_data=transport_dict,
+            )
+        except Exception as e:
+            raise HTTPException(400, f"Could not build EWB payload: {str(e)}")
+        return invoice, payload
+
+    invoice, payload = await db_executor.run(load)
 
     # ── 6. Call NIC API ──────────────────────────────────────────────────────
     try:
@@ -1398,17 +1605,20 @@ async def generate_eway_bill_online(
         raise HTTPException(502, "NIC API returned success but no EWB number. Please retry.")
 
     # ── 7. Save to invoice ───────────────────────────────────────────────────
-    invoice.eway_bill_number    = ewb_number
-    invoice.eway_bill_date      = date.today()
-    invoice.transport_mode      = data.transport_mode
-    invoice.vehicle_number      = data.vehicle_number
-    invoice.transporter_id      = data.transporter_id
-    invoice.transport_distance  = data.transport_distance
-    invoice.vehicle_type        = data.vehicle_type or "Regular"
-    invoice.transporter_doc_no  = data.transporter_doc_no
-    invoice.transporter_doc_date = data.transporter_doc_date
-    db.commit()
-    db.refresh(invoice)
+    def save():
+        invoice.eway_bill_number    = ewb_number
+        invoice.eway_bill_date      = date.today()
+        invoice.transport_mode      = data.transport_mode
+        invoice.vehicle_number      = data.vehicle_number
+        invoice.transporter_id      = data.transporter_id
+        invoice.transport_distance  = data.transport_distance
+        invoice.vehicle_type        = data.vehicle_type or "Regular"
+        invoice.transporter_doc_no  = data.transporter_doc_no
+        invoice.transporter_doc_date = data.transporter_doc_date
+        db.commit()
+        db.refresh(invoice)
+
+    await db_executor.run(save)
 
     # ── 8. Build response ────────────────────────────────────────────────────
     validity_days, validity_desc = calculate_eway_bill_validity(data.transport_distance)
@@ -1578,10 +1788,12 @@ async def cancel_eway_bill_via_api(
     """
     from app.services.eway_bill_service import eway_bill_service
 
-    invoice = db.query(Invoice).filter(
-        Invoice.id == invoice_id,
-        Invoice.company_id == company_id
-    ).first()
+    invoice = await db_executor.run(
+        lambda: db.query(Invoice).filter(
+            Invoice.id == invoice_id,
+            Invoice.company_id == company_id
+        ).first()
+    )
     if not invoice:
         raise HTTPException(404, "Invoice not found")
     if not invoice.eway_bill_number:
@@ -1602,7 +1814,7 @@ async def cancel_eway_bill_via_api(
     cancelled_ewb = invoice.eway_bill_number
     invoice.eway_bill_number  = None
     invoice.eway_bill_date    = None
-    db.commit()
+    await db_executor.run(db.commit)
 
     return {
         "message": f"E-Way Bill {cancelled_ewb} cancelled successfully via NIC API.",
@@ -1664,10 +1876,12 @@ async def get_eway_bill_api_status(
     """
     from app.services.eway_bill_service import eway_bill_service
 
-    invoice = db.query(Invoice).filter(
-        Invoice.id == invoice_id,
-        Invoice.company_id == company_id
-    ).first()
+    invoice = await db_executor.run(
+        lambda: db.query(Invoice).filter(
+            Invoice.id == invoice_id,
+            Invoice.company_id == company_id
+        ).first()
+    )
     if not invoice:
         raise HTTPException(404, "Invoice not found")
     if not invoice.eway_bill_number:
@@ -1,24 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session, joinedload
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-import os
 
 from app.database.session import get_db
+from app.database.executor import db_executor
 from app.models.invoice import Invoice
 from app.models.invoice_item import InvoiceItem
 from app.models.company import Company
 from app.core.dependencies import get_company_id
-from app.services.pdf_service import generate_pdf
+from app.services.pdf_service import generate_pdf, media_type_for
+from app.services.render_service import render_service
+from app.services.template_env import env
 
 router = APIRouter(prefix="/invoice", tags=["Invoice PDF"])
 
-# Set up Jinja2
-templates_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
-env = Environment(
-    loader=FileSystemLoader(templates_dir),
-    autoescape=select_autoescape(['html', 'xml'])
-)
-
 
 @router.get("/{invoice_id}/pdf")
 async def download_invoice_pdf(
@@ -26,24 +20,28 @@ async def download_invoice_pdf(
     company_id: int = Depends(get_company_id),
     db: Session = Depends(get_db)
 ):
-    # Fetch invoice with relationships
-    invoice = db.query(Invoice).options(
-        joinedload(Invoice.party),
-        joinedload(Invoice.financial_year),
-        joinedload(Invoice.items).joinedload(InvoiceItem.item)
-    ).filter(
-        Invoice.id == invoice_id,
-        Invoice.company_id == company_id
-    ).first()
+    def load():
+        # Fetch invoice with relationships
+        invoice = db.query(Invoice).options(
+            joinedload(Invoice.party),
+            joinedload(Invoice.financial_year),
+            joinedload(Invoice.items).joinedload(InvoiceItem.item)
+        ).filter(
+            Invoice.id == invoice_id,
+            Invoice.company_id == company_id
+        ).first()
+
+        if not invoice:
+            raise HTTPException(status_code=404, detail="Invoice not found")
 
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
+        company = db.query(Company).get(company_id)
+        return invoice, company
 
-    company = db.query(Company).get(company_id)
+    invoice, company = await db_executor.run(load)
 
     # Render Template
-    template = env.get_template("invoice.html")
-    html = template.render(
+    html = await render_service.render(
+        env, "invoice.html",
         invoice=invoice,
         company=company,
         party=invoice.party,
@@ -56,6 +54,6 @@ async def download_invoice_pdf(
     # Return PDF
     return Response(
         content=pdf_content,
-        media_type="text/html",
+        media_type=media_type_for(pdf_content),
         headers={"Content-Disposition": f"inline; filename=Invoice-{invoice.id}.pdf"}
     )
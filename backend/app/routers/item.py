@@ -1,26 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import Response
 from sqlalchemy.orm import Session, joinedload
-from jinja2 import Environment, FileSystemLoader
-import os
-import qrcode
-import io
-import base64
 
 from app.database.session import get_db
+from app.database.executor import db_executor
 from app.models.item import Item
 from app.models.user import User, UserRole
 from app.models.delivery_challan_item import DeliveryChallanItem
 from app.models.invoice_item import InvoiceItem
 from app.schemas.item import ItemCreate, ItemResponse
-from app.services.pdf_service import generate_pdf
+from app.services.pdf_service import generate_pdf, media_type_for
+from app.services.render_service import render_service
+from app.services.template_env import env
 from app.core.dependencies import get_company_id, get_active_financial_year, require_role, get_current_user
 from app.core.permissions import require_permission, require_any_permission
 
-# Set up Jinja2
-templates_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
-env = Environment(loader=FileSystemLoader(templates_dir))
-
 router = APIRouter(prefix="/item", tags=["Item"])
 
 
@@ -217,12 +211,14 @@ async def print_item_barcode(
     current_user: User = Depends(get_current_user)
 ):
     try:
-        item = db.query(Item).options(
-            joinedload(Item.company)
-        ).filter(
-            Item.id == item_id,
-            Item.company_id == company_id
-        ).first()
+        item = await db_executor.run(
+            lambda: db.query(Item).options(
+                joinedload(Item.company)
+            ).filter(
+                Item.id == item_id,
+                Item.company_id == company_id
+            ).first()
+        )
 
         if not item:
             raise HTTPException(
@@ -237,15 +233,7 @@ async def print_item_barcode(
             )
 
         # Generate QR Code
-        qr = qrcode.QRCode(version=1, box_size=10, border=1)
-        qr.add_data(item.barcode)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to base64
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        qr_code_b64 = await render_service.qr_base64(item.barcode, border=1)
 
         # Format date if provided
         formatted_date = None
@@ -259,8 +247,8 @@ async def print_item_barcode(
                 formatted_date = date # Fallback or keep as is
 
         # Render Template
-        template = env.get_template("item_barcode.html")
-        html_content = template.render(
+        html_content = await render_service.render(
+            env, "item_barcode.html",
             item=item,
             qr_code=qr_code_b64,
             count=count,
@@ -293,7 +281,7 @@ async def print_item_barcode(
 
         return Response(
             content=pdf_content,
-            media_type="text/html",
+            media_type=media_type_for(pdf_content),
             headers={"Content-Disposition": f"attachment; filename=barcode_{item.barcode}_{format}.pdf"}
         )
 
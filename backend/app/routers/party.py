@@ -1,18 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
 from app.database.session import get_db
 from app.models.party import Party
 from app.models.user import User, UserRole
-from app.models.invoice import Invoice
-from app.models.payment import Payment
-from app.models.payment import Payment
 from app.models.client_login import ClientLogin
 from app.schemas.party import PartyCreate, PartyResponse
 from app.core.dependencies import get_company_id, get_active_financial_year, require_role, get_current_user
 from app.core.permissions import require_permission, require_any_permission
 from app.core.security import get_password_hash
+from app.services.party_ledger_service import PartyBalance, get_party_balances
 
 router = APIRouter(prefix="/party", tags=["Party"])
 
@@ -82,42 +79,21 @@ def list_parties(
     current_user: User = Depends(get_current_user)
 ):
     from sqlalchemy.orm import joinedload
-    
+
     parties = db.query(Party).options(
         joinedload(Party.client_login)
     ).filter(
         Party.company_id == company_id
     ).all()
-    
-    # Calculate current balance for each party
-    # This could be optimized with a SQL aggregation query, but for now we loop
+
+    # Invoice / payment totals from the maintained party ledger summary
+    balances = get_party_balances(db, company_id)
     for party in parties:
-        # Sum of Invoices (Debit)
-        invoice_total = db.query(func.sum(Invoice.grand_total)).filter(
-            Invoice.party_id == party.id,
-            Invoice.company_id == company_id,
-            Invoice.status != "CANCELLED"
-        ).scalar() or 0
-        
-        # Sum of Payments Received (Credit - decreases receivable)
-        total_received = db.query(func.sum(Payment.amount)).filter(
-            Payment.party_id == party.id,
-            Payment.company_id == company_id,
-            Payment.payment_type == "RECEIVED"
-        ).scalar() or 0
-        
-        # Sum of Payments Paid (Debit - increases receivable/decreases payable)
-        total_paid = db.query(func.sum(Payment.amount)).filter(
-            Payment.party_id == party.id,
-            Payment.company_id == company_id,
-            Payment.payment_type == "PAID"
-        ).scalar() or 0
-        
-        # Calculate Balance
+        balance = balances.get(party.id, PartyBalance())
         # Net Balance = Opening + Invoiced - Received + Paid
-        party.current_balance = float(party.opening_balance) + float(invoice_total) - float(total_received) + float(total_paid)
-        party.total_received = float(total_received)
-        
+        party.current_balance = float(party.opening_balance) + balance.net
+        party.total_received = balance.received_total
+
     return parties
 
 
@@ -18,32 +18,52 @@ from app.schemas.party_challan import (
 from app.core.dependencies import get_company_id, get_active_financial_year, get_current_user
 from app.core.permissions import require_permission
 from app.models.user import User
+from app.services import document_sequence
+from app.services.stock_lock import lock_company_stock
 
 router = APIRouter(prefix="/party-challan", tags=["Party Challan"])
 
 
-def generate_party_challan_number(db: Session, company_id: int, fy_id: int) -> str:
-    """Generate next party challan number for the company and financial year"""
-    last_challan = (
-        db.query(PartyChallan)
-        .filter(
-            PartyChallan.company_id == company_id,
-            PartyChallan.financial_year_id == fy_id
+def _party_challan_serial(challan_number: Optional[str]) -> int:
+    """Number part of "PC-001" (0 for hand-typed numbers in another format)."""
+    try:
+        return int(challan_number.split("-")[1]) if challan_number else 0
+    except (ValueError, IndexError):
+        return 0
+
+
+def generate_party_challan_number(db: Session, company_id: int, fy_id: int, preview: bool = False) -> str:
+    """Generate next party challan number for the company and financial year
+    (from document_sequence; ``preview`` does not reserve it)"""
+    scope = (
+        PartyChallan.company_id == company_id,
+        PartyChallan.financial_year_id == fy_id
+    )
+
+    def seed():
+        # First use of this sequence: continue from the latest party challan
+        last_number = (
+            db.query(PartyChallan.challan_number)
+            .filter(*scope)
+            .order_by(PartyChallan.id.desc())
+            .limit(1)
+            .scalar()
         )
-        .order_by(PartyChallan.id.desc())
-        .first()
+        return _party_challan_serial(last_number)
+
+    def is_taken(numbers):
+        # Numbers can also be typed in by hand
+        return db.query(PartyChallan.id).filter(*scope, PartyChallan.challan_number.in_(numbers)).first() is not None
+
+    def highest_taken():
+        numbers = db.query(PartyChallan.challan_number).filter(*scope, PartyChallan.challan_number.like("PC-%"))
+        return max((_party_challan_serial(n) for (n,) in numbers), default=0)
+
+    return document_sequence.next_number(
+        db, company_id, fy_id, document_sequence.PARTY_CHALLAN,
+        lambda n: f"PC-{n:03d}",
+        seed=seed, is_taken=is_taken, highest_taken=highest_taken, preview=preview,
     )
-    
-    if last_challan and last_challan.challan_number:
-        try:
-            last_num = int(last_challan.challan_number.split("-")[1])
-            next_num = last_num + 1
-        except:
-            next_num = 1
-    else:
-        next_num = 1
-    
-    return f"PC-{next_num:03d}"
 
 
 @router.post("/", response_model=PartyChallanResponse)
@@ -55,6 +75,7 @@ def create_party_challan(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    lock_company_stock(db, company_id)
     # Server-side Validations
     if not data.items or len(data.items) == 0:
         raise HTTPException(status_code=400, detail="Party challan must contain at least one item")
@@ -372,6 +393,7 @@ def update_party_challan(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    lock_company_stock(db, company_id)
     challan = db.query(PartyChallan).filter(
         PartyChallan.id == challan_id,
         PartyChallan.company_id == company_id
@@ -523,6 +545,7 @@ def delete_party_challan(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    lock_company_stock(db, company_id)
     challan = db.query(PartyChallan).filter(
         PartyChallan.id == challan_id,
         PartyChallan.company_id == company_id
@@ -629,7 +652,7 @@ def get_next_party_challan_number(
     current_user: User = Depends(get_current_user)
 ):
     """Get the next party challan number that will be generated"""
-    next_number = generate_party_challan_number(db, company_id, fy.id)
+    next_number = generate_party_challan_number(db, company_id, fy.id, preview=True)
     return {"next_challan_number": next_number}
 
 
@@ -1,25 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from fastapi.responses import HTMLResponse, StreamingResponse
-from jinja2 import Environment, FileSystemLoader
 import io
 import os
 
 
 from app.database.session import get_db
+from app.database.executor import db_executor
 from app.models.pdi_report import PDIReport
 from app.models.delivery_challan import DeliveryChallan
 from app.schemas.pdi_report import PDIReportCreate, PDIReportUpdate, PDIReportResponse
 from app.core.dependencies import get_current_user
 from app.models.user import User
-from app.services.pdf_service import pdf_manager
+from app.services.pdf_service import pdf_manager, media_type_for
+from app.services.render_service import render_service
+from app.services.template_env import TEMPLATES_DIR, env as template_env
+from app.services.qr_cache import get_qr_base64
+from app.services.link_service import link_service
 
 router = APIRouter()
 
-templates_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
-template_env = Environment(loader=FileSystemLoader(templates_dir))
-
 @router.post("/", response_model=PDIReportResponse)
 def create_pdi_report(report: PDIReportCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     # Check if challan exists
@@ -60,7 +61,7 @@ def update_pdi_report(report_id: int, report_update: PDIReportUpdate, db: Sessio
     return db_report
 
 @router.get("/{report_id}/html", response_class=HTMLResponse)
-def view_pdi_report_html(report_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def view_pdi_report_html(report_id: int, request: Request, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     try:
         report = db.query(PDIReport).filter(PDIReport.id == report_id).first()
         if not report:
@@ -91,29 +92,15 @@ def view_pdi_report_html(report_id: int, db: Session = Depends(get_db), current_
             pdi_equipment = item.pdi_equipment if item.pdi_equipment else []
         
         # Generate QR Code for Public Summary
-        import qrcode
-        import io
-        import base64
-        from app.core.config import get_backend_url
-        from app.core.security import create_url_signature
-        
-        base_url = get_backend_url()
-        signature = create_url_signature(str(challan.id))
-        summary_url = f"{base_url}/public/challan/{challan.id}/summary?token={signature}"
-        
-        qr = qrcode.QRCode(version=1, box_size=5, border=2)
-        qr.add_data(summary_url)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
+        base_url = link_service.base_url(request, company=challan.company)
+        summary_url = link_service.challan_summary_url(base_url, challan.id)
         
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        qr_code_b64 = get_qr_base64(summary_url, box_size=5, border=2)
         
         # Verify template exists before rendering
-        if not os.path.exists(os.path.join(templates_dir, "pdi_report.html")):
-             print(f"[PDI ERROR] Template not found at {os.path.join(templates_dir, 'pdi_report.html')}")
-             return HTMLResponse(content=f"<html><body><h1>Template Not Found</h1><p>{os.path.join(templates_dir, 'pdi_report.html')}</p></body></html>", status_code=500)
+        if not os.path.exists(os.path.join(TEMPLATES_DIR, "pdi_report.html")):
+             print(f"[PDI ERROR] Template not found at {os.path.join(TEMPLATES_DIR, 'pdi_report.html')}")
+             return HTMLResponse(content=f"<html><body><h1>Template Not Found</h1><p>{os.path.join(TEMPLATES_DIR, 'pdi_report.html')}</p></body></html>", status_code=500)
              
         # Calculate total quantity from all challan items
         total_qty = sum(float(item.quantity) for item in challan.items)
@@ -142,68 +129,60 @@ def view_pdi_report_html(report_id: int, db: Session = Depends(get_db), current_
 
 
 @router.get("/{report_id}/pdf")
-async def generate_pdi_report_pdf(report_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    report = db.query(PDIReport).filter(PDIReport.id == report_id).first()
-    if not report:
-        raise HTTPException(status_code=404, detail="PDI Report not found")
+async def generate_pdi_report_pdf(report_id: int, request: Request, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    def load():
+        report = db.query(PDIReport).filter(PDIReport.id == report_id).first()
+        if not report:
+            raise HTTPException(status_code=404, detail="PDI Report not found")
         
-    challan = db.query(DeliveryChallan).filter(DeliveryChallan.id == report.challan_id).first()
-    
-    # Fetch item PDI configuration from the first challan item
-    from app.models.delivery_challan_item import DeliveryChallanItem
-    from app.models.party_challan_item import PartyChallanItem
-    from sqlalchemy.orm import joinedload
-    
-    challan_item = db.query(DeliveryChallanItem).filter(
-        DeliveryChallanItem.challan_id == challan.id
-    ).options(
-        joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.item)
-    ).first()
+        challan = db.query(DeliveryChallan).filter(DeliveryChallan.id == report.challan_id).first()
     
-    item = None
-    pdi_parameters = []
-    pdi_dimensions = []
-    pdi_equipment = []
+        # Fetch item PDI configuration from the first challan item
+        from app.models.delivery_challan_item import DeliveryChallanItem
+        from app.models.party_challan_item import PartyChallanItem
+        from sqlalchemy.orm import joinedload
     
-    if challan_item and challan_item.party_challan_item and challan_item.party_challan_item.item:
-        item = challan_item.party_challan_item.item
-        pdi_parameters = item.pdi_parameters if item.pdi_parameters else []
-        pdi_dimensions = item.pdi_dimensions if item.pdi_dimensions else []
-        pdi_equipment = item.pdi_equipment if item.pdi_equipment else []
-
-    # Generate QR Code for Public Summary
-    import qrcode
-    import io
-    import base64
-    from app.core.config import get_backend_url
-    from app.core.security import create_url_signature
+        challan_item = db.query(DeliveryChallanItem).filter(
+            DeliveryChallanItem.challan_id == challan.id
+        ).options(
+            joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.item)
+        ).first()
     
-    base_url = get_backend_url()
-    signature = create_url_signature(str(challan.id))
-    summary_url = f"{base_url}/public/challan/{challan.id}/summary?token={signature}"
+        item = None
+        pdi_parameters = []
+        pdi_dimensions = []
+        pdi_equipment = []
     
-    qr = qrcode.QRCode(version=1, box_size=5, border=2)
-    qr.add_data(summary_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
+        if challan_item and challan_item.party_challan_item and challan_item.party_challan_item.item:
+            item = challan_item.party_challan_item.item
+            pdi_parameters = item.pdi_parameters if item.pdi_parameters else []
+            pdi_dimensions = item.pdi_dimensions if item.pdi_dimensions else []
+            pdi_equipment = item.pdi_equipment if item.pdi_equipment else []
+
+        # Generate QR Code for Public Summary
+        base_url = link_service.base_url(request, company=challan.company)
+        summary_url = link_service.challan_summary_url(base_url, challan.id)
+
+        # Calculate total quantity from all challan items
+        total_qty = sum(float(item.quantity) for item in challan.items)
+        return report, challan, challan.party, item, pdi_parameters, pdi_dimensions, pdi_equipment, summary_url, total_qty
+
+    (
+        report, challan, party, item, pdi_parameters, pdi_dimensions, pdi_equipment, summary_url, total_qty,
+    ) = await db_executor.run(load)
     
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    qr_code_b64 = await render_service.qr_base64(summary_url, box_size=5, border=2)
     
     
     print(f"[PDI DEBUG] Rendering template for report {report_id}...")
     
-    # Calculate total quantity from all challan items
-    total_qty = sum(float(item.quantity) for item in challan.items)
-    
-    template = template_env.get_template("pdi_report.html")
     try:
-        html_content = template.render(
+        html_content = await render_service.render(
+            template_env, "pdi_report.html",
             report=report,
             challan=challan,
             company=challan.company,
-            party=challan.party,
+            party=party,
             items=challan.items,
             item=item,
             pdi_parameters=pdi_parameters,
@@ -223,6 +202,8 @@ async def generate_pdi_report_pdf(report_id: int, db: Session = Depends(get_db),
         print("[PDI DEBUG] Calling PDF Manager...")
         pdf_data = await pdf_manager.generate(html_content, options={"landscape": True})
         print(f"[PDI DEBUG] PDF Generated. Size: {len(pdf_data)} bytes.")
+    except HTTPException:
+         raise
     except Exception as e:
          print(f"[PDI ERROR] PDF Generation failed: {e}")
          import traceback
@@ -233,7 +214,7 @@ async def generate_pdi_report_pdf(report_id: int, db: Session = Depends(get_db),
     headers = {
         'Content-Disposition': f'inline; filename="PDI_Report_{challan.challan_number}.pdf"'
     }
-    return StreamingResponse(io.BytesIO(pdf_data), headers=headers, media_type='text/html')
+    return StreamingResponse(io.BytesIO(pdf_data), headers=headers, media_type=media_type_for(pdf_data))
 
 @router.get("/test-pdf")
 async def test_pdf_generation():
@@ -242,7 +223,9 @@ async def test_pdf_generation():
     try:
         pdf_data = await pdf_manager.generate(html)
         print(f"[PDI DEBUG] Test PDF generated. Size: {len(pdf_data)}")
-        return StreamingResponse(io.BytesIO(pdf_data), media_type='text/html', headers={'Content-Disposition': 'inline; filename="test.pdf"'})
+        return StreamingResponse(io.BytesIO(pdf_data), media_type=media_type_for(pdf_data), headers={'Content-Disposition': 'inline; filename="test.pdf"'})
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[PDI ERROR] Test PDF failed: {e}")
         return {"error": str(e)}
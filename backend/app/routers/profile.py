@@ -10,6 +10,7 @@ from app.models.company import Company
 from app.schemas.profile import ProfileUpdate, CompanyProfileUpdate
 from jose import jwt
 from app.core.config import settings
+from app.services.link_service import link_service, normalize_public_url
 
 router = APIRouter(prefix="/profile", tags=["Profile"])
 
@@ -108,9 +109,11 @@ def update_company_profile(
     if data.email: company.email = data.email
     if data.state_code is not None: company.state_code = data.state_code
     if data.pincode is not None: company.pincode = data.pincode
+    if data.public_url is not None: company.public_url = normalize_public_url(data.public_url)
 
     db.commit()
     db.refresh(company)
+    link_service.invalidate_company(company.id)
     return {"message": "Company details updated", "company": company}
 
 
@@ -1,24 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from sqlalchemy.orm import Session, joinedload
 from fastapi.responses import Response
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-import os
 
 from app.database.session import get_db
+from app.database.executor import db_executor
 from app.models.delivery_challan import DeliveryChallan
 from app.models.delivery_challan_item import DeliveryChallanItem
 from app.models.party_challan_item import PartyChallanItem
 from app.models.company import Company
 from app.services.pdf_service import generate_pdf
+from app.services.render_service import render_service
+from app.services.template_env import env
+from app.services.document_cache import document_cache
 
 router = APIRouter(prefix="/public/challan", tags=["Public Challan"])
 
-# Set up Jinja2 (Same as challan.py)
-templates_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
-env = Environment(
-    loader=FileSystemLoader(templates_dir),
-    autoescape=select_autoescape(['html', 'xml'])
-)
 
 from app.core.security import verify_url_signature
 
@@ -56,6 +52,7 @@ def render_public_error_page(title: str, message: str, status_code: int = 404):
 async def public_download_challan(
     challan_id: int,
     token: str,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """
@@ -66,143 +63,151 @@ async def public_download_challan(
     if not verify_url_signature(str(challan_id), token):
         return render_public_error_page("Link Expired or Invalid", "This download link is invalid or has expired.", status_code=403)
 
-    # Fetch challan
-    challan = db.query(DeliveryChallan).options(
-        joinedload(DeliveryChallan.party),
-        joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.item),
-        joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.party_challan),
-        joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.process)
-    ).filter(
-        DeliveryChallan.id == challan_id
-    ).first()
+    def load():
+        # Serve the rendered copy when the challan has not changed since
+        head = db.query(
+            DeliveryChallan.company_id, DeliveryChallan.challan_number, DeliveryChallan.updated_at
+        ).filter(DeliveryChallan.id == challan_id).first()
+        if not head:
+            return render_public_error_page("Delivery Challan Deleted", "This delivery challan has been deleted and is no longer available.", status_code=404)
+        version = document_cache.version("delivery_challan.html", head.updated_at)
+        cached = document_cache.get(head.company_id, "challan", challan_id, "public", version)
+        if cached:
+            return document_cache.response(request, cached, f"DC-{head.challan_number}.pdf")
+
+        # Fetch challan
+        challan = db.query(DeliveryChallan).options(
+            joinedload(DeliveryChallan.party),
+            joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.item),
+            joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.party_challan),
+            joinedload(DeliveryChallan.items).joinedload(DeliveryChallanItem.process)
+        ).filter(
+            DeliveryChallan.id == challan_id
+        ).first()
     
-    if not challan:
-        return render_public_error_page("Delivery Challan Deleted", "This delivery challan has been deleted and is no longer available.", status_code=404)
+        if not challan:
+            return render_public_error_page("Delivery Challan Deleted", "This delivery challan has been deleted and is no longer available.", status_code=404)
     
-    # Fetch company
-    company = db.query(Company).filter(Company.id == challan.company_id).first()
+        # Fetch company
+        company = db.query(Company).filter(Company.id == challan.company_id).first()
     
-    # Calculate Total Qty
-    total_qty = sum(float(item.quantity) for item in challan.items)
+        # Calculate Total Qty
+        total_qty = sum(float(item.quantity) for item in challan.items)
     
-    # Prepare items data with calculated stats (Aggregated by Item Name)
-    grouped_data = {}
+        # Prepare items data with calculated stats (Aggregated by Item Name)
+        grouped_data = {}
 
-    for item in challan.items:
-        pc_item = item.party_challan_item
-        # Group by Item ID to merge same items from different challans
-        item_id = pc_item.item_id if pc_item else (item.id if item else "Unknown")
+        for item in challan.items:
+            pc_item = item.party_challan_item
+            # Group by Item ID to merge same items from different challans
+            item_id = pc_item.item_id if pc_item else (item.id if item else "Unknown")
         
-        if item_id not in grouped_data:
-            grouped_data[item_id] = {
-                "item_obj": item, # Store first item for description
-                "pc_items": set(), # Track unique party challan items involved
-                "ref_challans": {}, # Track unique Ref Challans {pc_id: pc_obj}
-                "dispatch": 0.0,
-                "ok": 0.0,
-                "cr": 0.0,
-                "mr": 0.0
-            }
+            if item_id not in grouped_data:
+                grouped_data[item_id] = {
+                    "item_obj": item, # Store first item for description
+                    "pc_items": set(), # Track unique party challan items involved
+                    "ref_challans": {}, # Track unique Ref Challans {pc_id: pc_obj}
+                    "dispatch": 0.0,
+                    "ok": 0.0,
+                    "cr": 0.0,
+                    "mr": 0.0
+                }
         
-        # Track the pc_item to sum its ordered/delivered stats later
-        if pc_item:
-            grouped_data[item_id]["pc_items"].add(pc_item)
-            if pc_item.party_challan:
-                grouped_data[item_id]["ref_challans"][pc_item.party_challan_id] = pc_item.party_challan
+            # Track the pc_item to sum its ordered/delivered stats later
+            if pc_item:
+                grouped_data[item_id]["pc_items"].add(pc_item)
+                if pc_item.party_challan:
+                    grouped_data[item_id]["ref_challans"][pc_item.party_challan_id] = pc_item.party_challan
 
-        # Accumulate quantities
-        grouped_data[item_id]["dispatch"] += float(item.quantity)
-        grouped_data[item_id]["ok"] += float(item.ok_qty)
-        grouped_data[item_id]["cr"] += float(item.cr_qty)
-        grouped_data[item_id]["mr"] += float(item.mr_qty)
+            # Accumulate quantities
+            grouped_data[item_id]["dispatch"] += float(item.quantity)
+            grouped_data[item_id]["ok"] += float(item.ok_qty)
+            grouped_data[item_id]["cr"] += float(item.cr_qty)
+            grouped_data[item_id]["mr"] += float(item.mr_qty)
 
-    items_data = []
-    # Sort groups by Item Name
-    sorted_keys = sorted(grouped_data.keys(), key=lambda k: grouped_data[k]["item_obj"].party_challan_item.item.name if grouped_data[k]["item_obj"].party_challan_item else "")
+        items_data = []
+        # Sort groups by Item Name
+        sorted_keys = sorted(grouped_data.keys(), key=lambda k: grouped_data[k]["item_obj"].party_challan_item.item.name if grouped_data[k]["item_obj"].party_challan_item else "")
 
-    for key in sorted_keys:
-        data = grouped_data[key]
-        current_dispatch = data["dispatch"]
+        for key in sorted_keys:
+            data = grouped_data[key]
+            current_dispatch = data["dispatch"]
         
-        # Calculate stats specific to this Item across ALL involved Party Challans
-        if data["pc_items"]:
-            # Sum the Ordered/Delivered from ALL referenced Party Challan Items for this product
-            item_ordered_total = sum(float(pci.quantity_ordered) for pci in data["pc_items"])
-            item_delivered_total = sum(float(pci.quantity_delivered) for pci in data["pc_items"])
+            # Calculate stats specific to this Item across ALL involved Party Challans
+            if data["pc_items"]:
+                # Sum the Ordered/Delivered from ALL referenced Party Challan Items for this product
+                item_ordered_total = sum(float(pci.quantity_ordered) for pci in data["pc_items"])
+                item_delivered_total = sum(float(pci.quantity_delivered) for pci in data["pc_items"])
             
-            # Calculate states: 
-            # delivered_total includes current dispatch, so valid ordered balance is total - delivered
-            raw_closing_balance = item_ordered_total - item_delivered_total
+                # Calculate states: 
+                # delivered_total includes current dispatch, so valid ordered balance is total - delivered
+                raw_closing_balance = item_ordered_total - item_delivered_total
             
-            # Opening balance is what it was BEFORE this dispatch
-            # Since current dispatch is included in delivered_total, we add it back to get previous state
-            raw_opening_balance = raw_closing_balance + current_dispatch
+                # Opening balance is what it was BEFORE this dispatch
+                # Since current dispatch is included in delivered_total, we add it back to get previous state
+                raw_opening_balance = raw_closing_balance + current_dispatch
             
-            # Clamp values for display (no negative balances shown)
-            opening_qty = max(0, raw_opening_balance)
-            balance_qty = max(0, raw_closing_balance)
+                # Clamp values for display (no negative balances shown)
+                opening_qty = max(0, raw_opening_balance)
+                balance_qty = max(0, raw_closing_balance)
             
-        # Prepare Reference Strings List
-        ref_list = []
-        for pc_obj in data["ref_challans"].values():
-            # Grand Total of that specific Party Challan
-            pc_grand_total = int(sum(float(i.quantity_ordered) for i in pc_obj.items))
-            ref_str = f"{pc_obj.challan_number} | {pc_obj.challan_date.strftime('%d-%m-%Y')} | {pc_grand_total}"
-            ref_list.append(ref_str)
+            # Prepare Reference Strings List
+            ref_list = []
+            for pc_obj in data["ref_challans"].values():
+                # Grand Total of that specific Party Challan
+                pc_grand_total = int(sum(float(i.quantity_ordered) for i in pc_obj.items))
+                ref_str = f"{pc_obj.challan_number} | {pc_obj.challan_date.strftime('%d-%m-%Y')} | {pc_grand_total}"
+                ref_list.append(ref_str)
             
-        # Proxy object
-        class ProxyItem:
-            def __init__(self, original, ok, cr, mr):
-                self.party_challan_item = original.party_challan_item
-                self.process = original.process
-                self.ok_qty = int(ok)
-                self.cr_qty = int(cr)
-                self.mr_qty = int(mr)
+            # Proxy object
+            class ProxyItem:
+                def __init__(self, original, ok, cr, mr):
+                    self.party_challan_item = original.party_challan_item
+                    self.process = original.process
+                    self.ok_qty = int(ok)
+                    self.cr_qty = int(cr)
+                    self.mr_qty = int(mr)
                 
-                # Effective Rate
-                eff_rate = float(original.rate) if original.rate and original.rate > 0 else (
-                    float(original.party_challan_item.rate) if original.party_challan_item and original.party_challan_item.rate and original.party_challan_item.rate > 0 else (
-                        float(original.party_challan_item.item.rate) if original.party_challan_item and original.party_challan_item.item and original.party_challan_item.item.rate else 0.0
+                    # Effective Rate
+                    eff_rate = float(original.rate) if original.rate and original.rate > 0 else (
+                        float(original.party_challan_item.rate) if original.party_challan_item and original.party_challan_item.rate and original.party_challan_item.rate > 0 else (
+                            float(original.party_challan_item.item.rate) if original.party_challan_item and original.party_challan_item.item and original.party_challan_item.item.rate else 0.0
+                        )
                     )
-                )
-                self.rate = eff_rate
-                self.party_rate = float(original.party_rate or 0)
+                    self.rate = eff_rate
+                    self.party_rate = float(original.party_rate or 0)
                 
-                # Calculate Amount
-                total_qty = self.ok_qty + self.cr_qty + self.mr_qty
-                self.amount_formatted = "{:.2f}".format((self.rate + self.party_rate) * total_qty)
+                    # Calculate Amount
+                    total_qty = self.ok_qty + self.cr_qty + self.mr_qty
+                    self.amount_formatted = "{:.2f}".format((self.rate + self.party_rate) * total_qty)
         
-        proxy_item_obj = ProxyItem(data["item_obj"], data["ok"], data["cr"], data["mr"])
+            proxy_item_obj = ProxyItem(data["item_obj"], data["ok"], data["cr"], data["mr"])
 
-        items_data.append({
-            "item_obj": proxy_item_obj,
-            "opening": int(opening_qty),
-            "dispatch": int(current_dispatch),
-            "balance": int(balance_qty),
-            "ref_list": ref_list # Pass list of ref strings
-        })
+            items_data.append({
+                "item_obj": proxy_item_obj,
+                "opening": int(opening_qty),
+                "dispatch": int(current_dispatch),
+                "balance": int(balance_qty),
+                "ref_list": ref_list # Pass list of ref strings
+            })
 
-    # Render Template
-    # We pass qr_code=None to avoid recursive QR generation (or we could include it)
-    # The printed version already has the QR. When downloading the "original", it should probably also have it.
-    
-    import qrcode
-    import io
-    import base64
+        # Render Template
+        # We pass qr_code=None to avoid recursive QR generation (or we could include it)
+        # The printed version already has the QR. When downloading the "original", it should probably also have it.
     
-    qr_data = f"Challan: {challan.challan_number}\nDate: {challan.challan_date}\nParty: {challan.party.name if challan.party else 'N/A'}\nItems: {len(challan.items)}"
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
     
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        qr_data = f"Challan: {challan.challan_number}\nDate: {challan.challan_date}\nParty: {challan.party.name if challan.party else 'N/A'}\nItems: {len(challan.items)}"
+        return version, challan, company, items_data, total_qty, qr_data
+
+    loaded = await db_executor.run(load)
+    if isinstance(loaded, Response):
+        return loaded
+    version, challan, company, items_data, total_qty, qr_data = loaded
+    qr_code_b64 = await render_service.qr_base64(qr_data)
 
     try:
-        template = env.get_template("delivery_challan.html")
-        html = template.render(
+        html = await render_service.render(
+            env, "delivery_challan.html",
             challan=challan,
             company=company,
             party=challan.party,
@@ -213,12 +218,10 @@ async def public_download_challan(
         
         # Generate PDF
         pdf_content = await generate_pdf(html)
-        
-        return Response(
-            content=pdf_content,
-            media_type="text/html",
-            headers={"Content-Disposition": f"inline; filename=DC-{challan.challan_number}.pdf"}
-        )
+        document = document_cache.put(challan.company_id, "challan", challan_id, "public", version, pdf_content)
+        return document_cache.response(request, document, f"DC-{challan.challan_number}.pdf")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"CRITICAL ERROR GENERATING CHALLAN PDF: {e}")
         import traceback
@@ -351,7 +354,7 @@ def public_challan_summary(
         return Response(content=f"Error rendering summary: {str(e)}", status_code=500)
 
 @router.get("/dl/{code}")
-async def redirect_short_link(
+def redirect_short_link(
     code: str,
     db: Session = Depends(get_db)
 ):
@@ -1,17 +1,10 @@
-from fastapi import APIRouter, Depends, Query, Response, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Request, Response, HTTPException
 import qrcode
-import io
-import base64
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, or_, and_
 from decimal import Decimal
 import calendar
 from collections import defaultdict
-try:
-    from cachetools import TTLCache
-    dashboard_cache = TTLCache(maxsize=100, ttl=300)
-except ImportError:
-    dashboard_cache = {}
 from typing import List, Optional
 from datetime import datetime
 from jinja2 import Environment, FileSystemLoader, select_autoescape
@@ -20,10 +13,18 @@ from jinja2 import Environment, FileSystemLoader, select_autoescape
 # from starlette.concurrency import run_in_threadpool # REMOVED
 import traceback
 
-from app.services.pdf_service import generate_pdf # ADDED
+from app.services.pdf_service import generate_pdf, media_type_for # ADDED
+from app.services.render_service import render_service
+from app.services.link_service import link_service
+from app.services.cache_service import report_cache, company_tag, fy_tag
+from app.services.stock_rebuild_service import check_current_stock, create_rebuild_job, get_rebuild_job, run_rebuild_job
+from app.services.job_work_snapshot_service import compute_job_work_stock_summary
+from app.services.stock_ledger_service import build_transaction_ledger, get_outward_movements
+from app.services.party_ledger_service import get_party_balance_before
 
 
 from app.database.session import get_db
+from app.database.executor import db_executor
 from app.models.company import Company
 from app.models.user import User, UserRole
 from app.core.dependencies import get_company_id, get_active_financial_year, get_current_user
@@ -45,168 +46,58 @@ from app.models.delivery_challan_item import DeliveryChallanItem
 from app.models.party_challan_item import PartyChallanItem
 from app.schemas.report import DashboardStats
 
-from starlette.templating import Jinja2Templates
+from app.services.template_env import env
 
-import os
 router = APIRouter(prefix="/reports", tags=["Reports"])
 
-# Fix for Frozen App: Resolve templates directory relative to this file
-# reports.py is in app/routers, so we go up one level to app, then into templates
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
-
-templates = Jinja2Templates(directory=TEMPLATES_DIR)
-
-def format_indian_currency(value):
-    try:
-        value = float(value)
-    except (ValueError, TypeError):
-        return value
-    
-    # Format with 2 decimal places first
-    value_str = "{:.2f}".format(value)
-    amount, fraction = value_str.split('.')
-    
-    # Handle the last 3 digits
-    last_three = amount[-3:]
-    other_numbers = amount[:-3]
-    
-    if other_numbers:
-        last_three = ',' + last_three
-        
-    # Regex to add commas to other numbers
-    import re
-    result = re.sub(r"\B(?=(\d{2})+(?!\d))", ",", other_numbers) + last_three + "." + fraction
-    return result
-
-templates.env.filters["indian_currency"] = format_indian_currency
-
-@router.post("/recalculate-stock")
+@router.post("/recalculate-stock", status_code=202)
 def recalculate_stock(
+    background_tasks: BackgroundTasks,
     company_id: int = Depends(get_company_id),
-    db: Session = Depends(get_db)
 ):
     """
     NUCLEAR OPTION: Wipes all stock transactions and rebuilds them from documents.
-    Useful for fixing data inconsistencies during development.
+    Runs as a background job (set-based, chunked); poll
+    GET /reports/recalculate-stock/{job_id} for progress.
     """
-    # 1. Delete ALL Stock Transactions for this company
-    db.query(StockTransaction).filter(StockTransaction.company_id == company_id).delete()
-    db.flush()
-
-    # 2. Rebuild from Party Challans (IN)
-    party_challans = db.query(PartyChallan).filter(PartyChallan.company_id == company_id).all()
-    count_pc = 0
-    for pc in party_challans:
-        for item in pc.items:
-            stock_tx = StockTransaction(
-                company_id=company_id,
-                financial_year_id=pc.financial_year_id,
-                item_id=item.item_id,
-                quantity=item.quantity_ordered,
-                transaction_type="IN",
-                reference_type="PARTY_CHALLAN",
-                reference_id=pc.id,
-                created_at=pc.created_at
-            )
-            db.add(stock_tx)
-            count_pc += 1
-
-    # 3. Rebuild from Delivery Challans (OUT)
-    delivery_challans = db.query(DeliveryChallan).filter(DeliveryChallan.company_id == company_id).all()
-    count_dc = 0
-    for dc in delivery_challans:
-        for item in dc.items:
-            stock_tx = StockTransaction(
-                company_id=company_id,
-                financial_year_id=dc.financial_year_id,
-                item_id=item.item.id, # Item linked via PartyChallanItem -> Item
-                quantity=item.quantity,
-                transaction_type="OUT",
-                reference_type="DELIVERY_CHALLAN",
-                reference_id=dc.id,
-                created_at=dc.created_at
-            )
-            # Find item_id properly (DeliveryChallanItem -> PartyChallanItem -> Item)
-            if item.party_challan_item and item.party_challan_item.item_id:
-                stock_tx.item_id = item.party_challan_item.item_id
-                db.add(stock_tx)
-                count_dc += 1
-
-    # 4. Rebuild from Invoices (Direct Invoice Items ONLY) (OUT)
-    # Filter Invoices that are NOT cancelled
-    invoices = db.query(Invoice).filter(
-        Invoice.company_id == company_id,
-        Invoice.status != "CANCELLED"
-    ).all()
-    count_inv = 0
-    for inv in invoices:
-        for item in inv.items:
-            # Only if NOT linked to a Delivery Challan Item
-            if not item.delivery_challan_item_id:
-                stock_tx = StockTransaction(
-                    company_id=company_id,
-                    financial_year_id=inv.financial_year_id,
-                    item_id=item.item_id,
-                    quantity=item.quantity,
-                    transaction_type="OUT",
-                    reference_type="INVOICE",
-                    reference_id=inv.id,
-                    created_at=inv.created_at
-                )
-                db.add(stock_tx)
-                count_inv += 1
-    
-    db.commit()
+    job = create_rebuild_job(company_id)
+    if job["status"] == "queued":
+        background_tasks.add_task(run_rebuild_job, job["job_id"])
+    return job
 
-    # ---------------------------------------------------------
-    # PART 2: Fix Party Challan "Delivered Quantity" & Status
-    # ---------------------------------------------------------
-    
-    # A. Reset all PartyChallanItems delivered_qty to 0
-    db.execute("UPDATE party_challan_items SET quantity_delivered = 0")
-    db.flush()
 
-    # B. Re-sum delivered quantities from DeliveryChallans
-    # distinct() not needed if we iterate logic carefully, but let's query all DC items
-    dc_items = db.query(DeliveryChallanItem).join(DeliveryChallan).filter(
-        DeliveryChallan.company_id == company_id
-    ).all()
+@router.get("/recalculate-stock/{job_id}")
+def get_recalculate_stock_status(
+    job_id: str,
+    company_id: int = Depends(get_company_id),
+):
+    job = get_rebuild_job(job_id)
+    if not job or job["company_id"] != company_id:
+        raise HTTPException(status_code=404, detail="Rebuild job not found")
+    return job
 
-    for dci in dc_items:
-        if dci.party_challan_item_id:
-            pc_item = db.query(PartyChallanItem).get(dci.party_challan_item_id)
-            if pc_item:
-                 pc_item.quantity_delivered += dci.quantity
-                 db.add(pc_item)
-    
-    db.flush()
-
-    # C. Update Party Challan Status (Open/Partial/Completed)
-    all_pcs = db.query(PartyChallan).filter(PartyChallan.company_id == company_id).all()
-    for pc in all_pcs:
-        total_ordered = sum([i.quantity_ordered for i in pc.items])
-        total_delivered = sum([i.quantity_delivered for i in pc.items])
-
-        if total_delivered >= total_ordered and total_ordered > 0:
-            pc.status = "completed"
-        elif total_delivered > 0:
-            pc.status = "partial"
-        else:
-            pc.status = "open"
-        db.add(pc)
 
-    db.commit()
+@router.get("/stock-consistency")
+def get_stock_consistency(
+    company_id: int = Depends(get_company_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Items whose current_stock differs from SUM(stock_transactions).
+    """
+    return check_current_stock(db, company_id)
 
-    return {
-        "message": "Stock & Job Work Status Recalculated Successfully",
-        "stats": {
-            "party_challans": count_pc,
-            "delivery_challans": count_dc,
-            "direct_invoices": count_inv,
-            "status_updates": len(all_pcs)
-        }
-    }
+
+@router.post("/stock-consistency/repair")
+def repair_stock_consistency(
+    company_id: int = Depends(get_company_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Reset drifted items.current_stock to the ledger value (cheap; does not
+    rebuild the ledger from documents like /recalculate-stock).
+    """
+    return check_current_stock(db, company_id, repair=True)
 
 @router.get("/job-work")
 def get_job_work_report(
@@ -305,114 +196,18 @@ def get_job_work_stock_summary(
 ):
     """
     Returns a stock summary (Opening, Inward, Outward, Closing) for all Party/Item combinations
-    within the given date range. Correctly handles historical date-wise opening balance.
+    within the given date range. Opening balance comes from the monthly job-work snapshots
+    plus the challans of the start month (see job_work_snapshot_service).
     """
     start = parse_to_date(start_date) or datetime.now().date()
     end = parse_to_date(end_date) or datetime.now().date()
 
-    # 1. Fetch ALL Party Challan Items (Inward)
-    # We need potentially all history to calculate opening balance correctly
-    inwards = db.query(PartyChallanItem).join(PartyChallan).filter(
-        PartyChallan.company_id == company_id,
-        PartyChallan.status != "cancelled"
-    ).all()
-
-    # 2. Fetch ALL Delivery Challan Items (Outward)
-    outwards = db.query(DeliveryChallanItem).join(DeliveryChallan).options(
-        joinedload(DeliveryChallanItem.challan), 
-        joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.party_challan).joinedload(PartyChallan.party),
-        joinedload(DeliveryChallanItem.party_challan_item).joinedload(PartyChallanItem.item)
-    ).filter(
-        DeliveryChallan.company_id == company_id,
-        DeliveryChallan.status != "cancelled"
-    ).all()
-
-    stock_map = {}
-
-    # Helper key function
-    def get_key(party_id, item_id):
-        return (party_id, item_id)
-
-    # Process Inwards
-    for row in inwards:
-        # Safety check for missing relationships
-        if not row.party_challan or not row.item:
-            continue
-
-        key = get_key(row.party_challan.party_id, row.item_id)
-        if key not in stock_map:
-            stock_map[key] = {
-                "party_name": row.party_challan.party.name if (row.party_challan and row.party_challan.party) else "Unknown",
-                "gstin": row.party_challan.party.gst_number if (row.party_challan and row.party_challan.party and row.party_challan.party.gst_number) else "",
-                "item_name": row.item.name if row.item else "Unknown",
-                "opening": 0.0,
-                "inward": 0.0,
-                "outward": 0.0,
-                "closing": 0.0
-            }
-
-        qty = float(row.quantity_ordered or 0)
-        t_date = parse_to_date(row.party_challan.challan_date)
-
-        if t_date:
-            if t_date < start:
-                stock_map[key]["opening"] += qty
-            elif start <= t_date <= end:
-                stock_map[key]["inward"] += qty
-
-    # Process Outwards
-    for row in outwards:
-        if not row.party_challan_item:
-            continue
-            
-        pc_item = row.party_challan_item
-        if not pc_item.party_challan or not pc_item.item:
-            continue
-
-        key = get_key(pc_item.party_challan.party_id, pc_item.item_id)
-        
-        if key not in stock_map:
-            stock_map[key] = {
-                "party_name": pc_item.party_challan.party.name if (pc_item.party_challan and pc_item.party_challan.party) else "Unknown",
-                "gstin": pc_item.party_challan.party.gst_number if (pc_item.party_challan and pc_item.party_challan.party and pc_item.party_challan.party.gst_number) else "",
-                "item_name": pc_item.item.name if pc_item.item else "Unknown",
-                "opening": 0.0,
-                "inward": 0.0,
-                "outward": 0.0,
-                "closing": 0.0
-            }
-
-        qty = float(row.quantity or 0)
-        if not row.challan:
-            continue
-            
-        t_date = parse_to_date(row.challan.challan_date)
-
-        if t_date:
-            if t_date < start:
-                stock_map[key]["opening"] -= qty
-            elif start <= t_date <= end:
-                stock_map[key]["outward"] += qty
-
-    # Calculate Closing and Filter empty
-    result = []
-    clean_party = party_name.strip().lower() if (party_name and isinstance(party_name, str)) else None
-    if clean_party in ["all", "all parties", "undefined", "null", "none", ""]:
-        clean_party = None
-
-    for k, v in stock_map.items():
-        v["closing"] = v["opening"] + v["inward"] - v["outward"]
-        item_party = (v.get("party_name") or "").strip().lower()
-        if clean_party and item_party != clean_party:
-            continue
-        if abs(v["opening"]) > 0 or v["inward"] > 0 or v["outward"] > 0 or abs(v["closing"]) > 0:
-            result.append(v)
-
-    return result
+    return compute_job_work_stock_summary(db, company_id, start, end, party_name)
 
 
 @router.get("/job-work/stock-summary/pdf")
 async def get_job_work_stock_summary_pdf(
+    request: Request,
     start_date: str,
     end_date: str,
     party_name: Optional[str] = Query(None),
@@ -422,59 +217,61 @@ async def get_job_work_stock_summary_pdf(
     """
     Generates PDF for Job Work Stock Summary (Grouped by Party like GST Report)
     """
-    stock_data = get_job_work_stock_summary(start_date, end_date, party_name, company_id, db)
-    
-    # Group stock_data by Party
-    grouped_stock = {}
-    for item in stock_data:
-        pname = item.get("party_name") or "Unknown"
-        if pname not in grouped_stock:
-            grouped_stock[pname] = {
-                "party_name": pname,
-                "gstin": item.get("gstin") or "",
-                "item_list": [],
-                "sub_opening": 0.0,
-                "sub_inward": 0.0,
-                "sub_outward": 0.0,
-                "sub_closing": 0.0
-            }
-        grouped_stock[pname]["item_list"].append(item)
-        grouped_stock[pname]["sub_opening"] += item.get("opening", 0.0)
-        grouped_stock[pname]["sub_inward"] += item.get("inward", 0.0)
-        grouped_stock[pname]["sub_outward"] += item.get("outward", 0.0)
-        grouped_stock[pname]["sub_closing"] += item.get("closing", 0.0)
-
-    grouped_list = list(grouped_stock.values())
-
-    # Get Company Details
-    company = db.query(Company).filter(Company.id == company_id).first()
-    if not company:
-        class MockCompany:
-            name = "Company"
-            address = ""
-            gst_number = ""
-            phone = ""
-        company = MockCompany()
-    
-    # Calculate Totals
-    total_opening = sum(item['opening'] for item in stock_data)
-    total_inward = sum(item['inward'] for item in stock_data)
-    total_outward = sum(item['outward'] for item in stock_data)
-    total_closing = sum(item['closing'] for item in stock_data)
+    def load():
+        stock_data = get_job_work_stock_summary(start_date, end_date, party_name, company_id, db)
+    
+        # Group stock_data by Party
+        grouped_stock = {}
+        for item in stock_data:
+            pname = item.get("party_name") or "Unknown"
+            if pname not in grouped_stock:
+                grouped_stock[pname] = {
+                    "party_name": pname,
+                    "gstin": item.get("gstin") or "",
+                    "item_list": [],
+                    "sub_opening": 0.0,
+                    "sub_inward": 0.0,
+                    "sub_outward": 0.0,
+                    "sub_closing": 0.0
+                }
+            grouped_stock[pname]["item_list"].append(item)
+            grouped_stock[pname]["sub_opening"] += item.get("opening", 0.0)
+            grouped_stock[pname]["sub_inward"] += item.get("inward", 0.0)
+            grouped_stock[pname]["sub_outward"] += item.get("outward", 0.0)
+            grouped_stock[pname]["sub_closing"] += item.get("closing", 0.0)
+
+        grouped_list = list(grouped_stock.values())
+
+        # Get Company Details
+        company = db.query(Company).filter(Company.id == company_id).first()
+        if not company:
+            class MockCompany:
+                name = "Company"
+                address = ""
+                gst_number = ""
+                phone = ""
+            company = MockCompany()
+    
+        # Calculate Totals
+        total_opening = sum(item['opening'] for item in stock_data)
+        total_inward = sum(item['inward'] for item in stock_data)
+        total_outward = sum(item['outward'] for item in stock_data)
+        total_closing = sum(item['closing'] for item in stock_data)
+        return (
+            stock_data, grouped_list, company, total_opening, total_inward,
+            total_outward, total_closing,
+        )
+
+    (
+        stock_data, grouped_list, company, total_opening, total_inward,
+        total_outward, total_closing,
+    ) = await db_executor.run(load)
     
     # QR verification code
-    import io, base64, qrcode
-    from app.core.config import get_backend_url
-    base_url = get_backend_url()
+    base_url = link_service.base_url(request, company=company)
     p_param = f"&party_name={party_name}" if party_name else ""
     verify_url = f"{base_url}/public/reports/job-work-stock-summary?company_id={company_id}&start={start_date}&end={end_date}{p_param}"
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(verify_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    qr_code_b64 = await render_service.qr_base64(verify_url)
 
     # Safe date string formatting
     s_dt = parse_to_date(start_date)
@@ -500,8 +297,7 @@ async def get_job_work_stock_summary_pdf(
     }
 
     # 5. Render Template
-    template = templates.get_template("job_work_stock_summary.html")
-    html_content = template.render(context)
+    html_content = await render_service.render(env, "job_work_stock_summary.html", context)
 
     # 6. Generate PDF
     pdf_data = await generate_pdf(html_content, options={
@@ -513,7 +309,7 @@ async def get_job_work_stock_summary_pdf(
 
     return Response(
         content=pdf_data,
-        media_type="text/html",
+        media_type=media_type_for(pdf_data),
         headers={
             "Content-Disposition": f"attachment; filename=Job_Work_Stock_Summary.pdf"
         }
@@ -522,6 +318,7 @@ async def get_job_work_stock_summary_pdf(
 
 @router.get("/ledger/pdf")
 async def get_party_ledger_pdf(
+    request: Request,
     party_id: int = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -529,98 +326,97 @@ async def get_party_ledger_pdf(
     fy = Depends(get_active_financial_year),
     db: Session = Depends(get_db)
 ):
-    # 1. Get Company Details
-    company = db.query(Company).filter(Company.id == company_id).first()
-    party_name = None
-    if party_id:
-        party = db.query(Party).filter(Party.id == party_id).first()
-        if party:
-            party_name = party.name
+    def load():
+        # 1. Get Company Details
+        company = db.query(Company).filter(Company.id == company_id).first()
+        party_name = None
+        if party_id:
+            party = db.query(Party).filter(Party.id == party_id).first()
+            if party:
+                party_name = party.name
 
-    # 2. Query Data (Same logic as job work report)
-    query = db.query(PartyChallanItem).join(
-        PartyChallan
-    ).options(
-        joinedload(PartyChallanItem.party_challan).joinedload(PartyChallan.party),
-        joinedload(PartyChallanItem.item)
-    ).filter(
-        PartyChallan.company_id == company_id,
-        or_(
-            PartyChallan.financial_year_id == fy.id,
-            and_(
-                PartyChallan.financial_year_id != fy.id,
-                PartyChallan.status != "completed",
-                PartyChallan.status != "cancelled"
+        # 2. Query Data (Same logic as job work report)
+        query = db.query(PartyChallanItem).join(
+            PartyChallan
+        ).options(
+            joinedload(PartyChallanItem.party_challan).joinedload(PartyChallan.party),
+            joinedload(PartyChallanItem.item)
+        ).filter(
+            PartyChallan.company_id == company_id,
+            or_(
+                PartyChallan.financial_year_id == fy.id,
+                and_(
+                    PartyChallan.financial_year_id != fy.id,
+                    PartyChallan.status != "completed",
+                    PartyChallan.status != "cancelled"
+                )
             )
         )
-    )
 
-    if party_id:
-        query = query.filter(PartyChallan.party_id == party_id)
+        if party_id:
+            query = query.filter(PartyChallan.party_id == party_id)
 
-    items = query.order_by(PartyChallan.challan_date).all()
+        items = query.order_by(PartyChallan.challan_date).all()
 
-    # 3. Aggregate Data (Date-Wise Logic)
-    ledger_map = {}
+        # 3. Aggregate Data (Date-Wise Logic)
+        ledger_map = {}
     
-    # Parse dates
-    start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else fy.start_date
-    end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else fy.end_date
+        # Parse dates
+        start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else fy.start_date
+        end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else fy.end_date
 
-    for row in items:
-        key = f"{row.party_challan.party.name}-{row.item.name}"
-        if key not in ledger_map:
-            ledger_map[key] = {
-                "party": row.party_challan.party.name,
-                "item": row.item.name,
-                "opening": 0.0,
-                "in": 0.0,
-                "out": 0.0,
-                "balance": 0.0
-            }
-        
-        pending_qty = float(row.quantity_ordered) - float(row.quantity_delivered)
-        # Ensure non-negative pending (though logic should enforce it)
-        pending = max(0.0, pending_qty)
-
-        # Logic: 
-        # Challan Date < Start => Add Pending to Opening Balance
-        # Challan Date in Range => Add In/Out
-        # Challan Date > End => Ignore
-        
-        c_date = row.party_challan.challan_date
+        for row in items:
+            key = f"{row.party_challan.party.name}-{row.item.name}"
+            if key not in ledger_map:
+                ledger_map[key] = {
+                    "party": row.party_challan.party.name,
+                    "item": row.item.name,
+                    "opening": 0.0,
+                    "in": 0.0,
+                    "out": 0.0,
+                    "balance": 0.0
+                }
         
-        if c_date < start:
-             ledger_map[key]["opening"] += pending
-             ledger_map[key]["balance"] += pending
-        elif c_date <= end:
-             ledger_map[key]["in"] += float(row.quantity_ordered)
-             ledger_map[key]["out"] += float(row.quantity_delivered)
-             ledger_map[key]["balance"] += pending
-
-    # Format numbers for template & Filter zero rows
-    ledger_data = []
-    for item in ledger_map.values():
-        # Only show if there's activity or opening balance
-        if item["opening"] == 0 and item["in"] == 0 and item["out"] == 0:
-            continue
+            pending_qty = float(row.quantity_ordered) - float(row.quantity_delivered)
+            # Ensure non-negative pending (though logic should enforce it)
+            pending = max(0.0, pending_qty)
+
+            # Logic: 
+            # Challan Date < Start => Add Pending to Opening Balance
+            # Challan Date in Range => Add In/Out
+            # Challan Date > End => Ignore
+        
+            c_date = row.party_challan.challan_date
+        
+            if c_date < start:
+                 ledger_map[key]["opening"] += pending
+                 ledger_map[key]["balance"] += pending
+            elif c_date <= end:
+                 ledger_map[key]["in"] += float(row.quantity_ordered)
+                 ledger_map[key]["out"] += float(row.quantity_delivered)
+                 ledger_map[key]["balance"] += pending
+
+        # Format numbers for template & Filter zero rows
+        ledger_data = []
+        for item in ledger_map.values():
+            # Only show if there's activity or opening balance
+            if item["opening"] == 0 and item["in"] == 0 and item["out"] == 0:
+                continue
             
-        item["opening"] = f"{item['opening']:.2f}"
-        item["in"] = f"{item['in']:.2f}"
-        item["out"] = f"{item['out']:.2f}"
-        item["balance"] = f"{item['balance']:.2f}"
-        ledger_data.append(item)
+            item["opening"] = f"{item['opening']:.2f}"
+            item["in"] = f"{item['in']:.2f}"
+            item["out"] = f"{item['out']:.2f}"
+            item["balance"] = f"{item['balance']:.2f}"
+            ledger_data.append(item)
+        return company, party_name, start, end, ledger_data
+
+    company, party_name, start, end, ledger_data = await db_executor.run(load)
 
     # 4. Generate QR Code
-    import qrcode
-    import io
-    import base64
-    import socket
     from app.core.security import create_url_signature
     
     # Generate Public Download URL
-    from app.core.config import get_backend_url
-    base_url = get_backend_url()
+    base_url = link_service.base_url(request, company=company)
     
     # Sign the parameters (Include dates if needed, but token signature usually company/fy/party)
     party_val = str(party_id) if party_id else "all"
@@ -635,20 +431,12 @@ async def get_party_ledger_pdf(
     if end_date:
         download_url += f"&end_date={end_date}"
     
-    qr = qrcode.QRCode(version=None, box_size=10, border=5)
-    qr.add_data(download_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    qr_code_b64 = await render_service.qr_base64(download_url, version=None)
 
     # 5. Render HTML
     # 5. Render HTML
-    template = templates.get_template("party_ledger.html")
-    
-    html_content = template.render(
+    html_content = await render_service.render(
+        env, "party_ledger.html",
         company=company,
         financial_year=f"{fy.start_date.year}-{fy.end_date.year}",
         start_date=start,
@@ -669,7 +457,7 @@ async def get_party_ledger_pdf(
     
     return Response(
         content=pdf_data,
-        media_type="text/html",
+        media_type=media_type_for(pdf_data),
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
@@ -708,31 +496,9 @@ def get_party_statement(
     
     opening_balance = float(party.opening_balance)
     
-    # Add Invoices before start_date
-    prev_invoices = db.query(func.sum(Invoice.grand_total)).filter(
-        Invoice.party_id == party_id,
-        Invoice.company_id == company_id,
-        Invoice.invoice_date < start,
-        Invoice.status != "CANCELLED"
-    ).scalar() or 0
-    
-    # Subtract Payments Received before start_date
-    prev_received = db.query(func.sum(Payment.amount)).filter(
-        Payment.party_id == party_id,
-        Payment.company_id == company_id,
-        Payment.payment_date < start,
-        Payment.payment_type == "RECEIVED"
-    ).scalar() or 0
-
-    # Add Payments Paid before start_date (Debit)
-    prev_paid = db.query(func.sum(Payment.amount)).filter(
-        Payment.party_id == party_id,
-        Payment.company_id == company_id,
-        Payment.payment_date < start,
-        Payment.payment_type == "PAID"
-    ).scalar() or 0
-    
-    opening_balance += (float(prev_invoices) - float(prev_received) + float(prev_paid))
+    # Add Invoices / subtract Payments Received / add Payments Paid before start_date
+    prev = get_party_balance_before(db, company_id, party_id, start)
+    opening_balance += prev.net
     
     # 3. Fetch Transactions within Date Range
     invoices = db.query(Invoice).filter(
@@ -801,6 +567,7 @@ def get_party_statement(
 
 @router.get("/party-statement/pdf")
 async def get_party_statement_pdf(
+    request: Request,
     party_id: int,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -814,117 +581,107 @@ async def get_party_statement_pdf(
     start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else fy.start_date
     end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else fy.end_date
 
-    party = db.query(Party).filter(Party.id == party_id, Party.company_id == company_id).first()
-    if not party:
-        return Response(status_code=404)
+    def load():
+        party = db.query(Party).filter(Party.id == party_id, Party.company_id == company_id).first()
+        if not party:
+            return None
         
-    company = db.query(Company).filter(Company.id == company_id).first()
+        company = db.query(Company).filter(Company.id == company_id).first()
 
-    # Opening Calc
-    opening_balance = float(party.opening_balance)
-    prev_invoices = db.query(func.sum(Invoice.grand_total)).filter(
-        Invoice.party_id == party_id,
-        Invoice.company_id == company_id,
-        Invoice.invoice_date < start,
-        Invoice.status != "CANCELLED"
-    ).scalar() or 0
-    prev_received = db.query(func.sum(Payment.amount)).filter(
-        Payment.party_id == party_id,
-        Payment.company_id == company_id,
-        Payment.payment_date < start,
-        Payment.payment_type == "RECEIVED"
-    ).scalar() or 0
+        # Opening Calc
+        opening_balance = float(party.opening_balance)
+        prev = get_party_balance_before(db, company_id, party_id, start)
+        opening_balance += prev.net
     
-    prev_paid = db.query(func.sum(Payment.amount)).filter(
-        Payment.party_id == party_id,
-        Payment.company_id == company_id,
-        Payment.payment_date < start,
-        Payment.payment_type == "PAID"
-    ).scalar() or 0
-    
-    opening_balance += (float(prev_invoices) - float(prev_received) + float(prev_paid))
-    
-    # Transactions
-    invoices = db.query(Invoice).filter(
-        Invoice.party_id == party_id,
-        Invoice.company_id == company_id,
-        Invoice.invoice_date >= start,
-        Invoice.invoice_date <= end,
-        Invoice.status != "CANCELLED"
-    ).all()
+        # Transactions
+        invoices = db.query(Invoice).filter(
+            Invoice.party_id == party_id,
+            Invoice.company_id == company_id,
+            Invoice.invoice_date >= start,
+            Invoice.invoice_date <= end,
+            Invoice.status != "CANCELLED"
+        ).all()
     
-    payments = db.query(Payment).filter(
-        Payment.party_id == party_id,
-        Payment.company_id == company_id,
-        Payment.payment_date >= start,
-        Payment.payment_date <= end
-    ).all()
+        payments = db.query(Payment).filter(
+            Payment.party_id == party_id,
+            Payment.company_id == company_id,
+            Payment.payment_date >= start,
+            Payment.payment_date <= end
+        ).all()
     
-    transactions = []
+        transactions = []
     
-    for inv in invoices:
-        transactions.append({
-            "date": inv.invoice_date,
-            "type": "INVOICE",
-            "ref": inv.invoice_number,
-            "debit": float(inv.grand_total),
-            "credit": 0.0,
-            "description": "Sales Invoice"
-        })
+        for inv in invoices:
+            transactions.append({
+                "date": inv.invoice_date,
+                "type": "INVOICE",
+                "ref": inv.invoice_number,
+                "debit": float(inv.grand_total),
+                "credit": 0.0,
+                "description": "Sales Invoice"
+            })
         
-    for pay in payments:
-        transactions.append({
-            "date": pay.payment_date,
-            "type": "PAYMENT",
-            "ref": pay.reference_number or f"{pay.payment_mode}",
-            "debit": 0.0,
-            "credit": float(pay.amount),
-            "description": f"Payment Received ({pay.payment_mode})"
-        })
+        for pay in payments:
+            transactions.append({
+                "date": pay.payment_date,
+                "type": "PAYMENT",
+                "ref": pay.reference_number or f"{pay.payment_mode}",
+                "debit": 0.0,
+                "credit": float(pay.amount),
+                "description": f"Payment Received ({pay.payment_mode})"
+            })
         
-    transactions.sort(key=lambda x: x["date"])
+        transactions.sort(key=lambda x: x["date"])
     
-    # Running Balance & Totals
-    running_balance = opening_balance
-    total_debit = 0.0
-    total_credit = 0.0
+        # Running Balance & Totals
+        running_balance = opening_balance
+        total_debit = 0.0
+        total_credit = 0.0
     
-    formatted_transactions = []
+        formatted_transactions = []
     
-    # First Row: Opening
-    formatted_transactions.append({
-        "date": start,
-        "type": "OPENING",
-        "ref": "-",
-        "description": "Opening Balance",
-        "debit": None,
-        "credit": None,
-        "balance": f"{running_balance:,.2f}"
-    })
-
-    for tx in transactions:
-        running_balance += (tx["debit"] - tx["credit"])
-        total_debit += tx["debit"]
-        total_credit += tx["credit"]
-        
+        # First Row: Opening
         formatted_transactions.append({
-            "date": tx["date"],
-            "type": tx["type"],
-            "ref": tx["ref"],
-            "description": tx["description"],
-            "debit": f"{tx['debit']:,.2f}" if tx["debit"] > 0 else None,
-            "credit": f"{tx['credit']:,.2f}" if tx["credit"] > 0 else None,
+            "date": start,
+            "type": "OPENING",
+            "ref": "-",
+            "description": "Opening Balance",
+            "debit": None,
+            "credit": None,
             "balance": f"{running_balance:,.2f}"
         })
 
+        for tx in transactions:
+            running_balance += (tx["debit"] - tx["credit"])
+            total_debit += tx["debit"]
+            total_credit += tx["credit"]
+        
+            formatted_transactions.append({
+                "date": tx["date"],
+                "type": tx["type"],
+                "ref": tx["ref"],
+                "description": tx["description"],
+                "debit": f"{tx['debit']:,.2f}" if tx["debit"] > 0 else None,
+                "credit": f"{tx['credit']:,.2f}" if tx["credit"] > 0 else None,
+                "balance": f"{running_balance:,.2f}"
+            })
+        return (
+            party, company, opening_balance, formatted_transactions, running_balance,
+            total_debit, total_credit,
+        )
+
+    loaded = await db_executor.run(load)
+    if loaded is None:
+        return Response(status_code=404)
+    (
+        party, company, opening_balance, formatted_transactions, running_balance,
+        total_debit, total_credit,
+    ) = loaded
+
     # QR Code Generation
-    import qrcode
-    import io
-    import base64
     from app.core.security import create_url_signature
-    from app.core.config import get_backend_url
     
-    base_url = get_backend_url()
+    base_url = link_service.base_url(request, company=company)
     
     # Sign: company_id:party_id
     # We should match what public_reports expects.
@@ -945,19 +702,12 @@ async def get_party_statement_pdf(
     if end_date:
         download_url += f"&end_date={end_date}"
     
-    qr = qrcode.QRCode(version=None, box_size=10, border=5)
-    qr.add_data(download_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    qr_code_b64 = await render_service.qr_base64(download_url, version=None)
 
     # Render HTML
     # Render HTML
-    template = templates.get_template("party_statement.html")
-    
-    html_content = template.render(
+    html_content = await render_service.render(
+        env, "party_statement.html",
         company=company,
         party=party,
         financial_year=f"{start.year}-{end.year}",
@@ -988,7 +738,7 @@ async def get_party_statement_pdf(
     
     return Response(
         content=pdf_data,
-        media_type="text/html",
+        media_type=media_type_for(pdf_data),
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
@@ -1083,42 +833,7 @@ def get_stock_ledger(
     inwards = inward_query.order_by(PartyChallan.challan_date.asc()).all()
     
     # 4. Fetch Outward Transactions (Delivery Challans & Invoices via StockTransaction)
-    st_out_query = db.query(StockTransaction).filter(
-        StockTransaction.company_id == company_id,
-        StockTransaction.item_id == item_id,
-        StockTransaction.transaction_type == "OUT",
-        StockTransaction.created_at >= start,
-        StockTransaction.created_at <= end
-    )
-    st_out = st_out_query.all()
-    
-    # Filter outwards by party and resolve details
-    outwards = []
-    for st in st_out:
-        if st.reference_type == "DELIVERY_CHALLAN":
-            dc = db.query(DeliveryChallan).filter(DeliveryChallan.id == st.reference_id).first()
-            if dc and dc.status != 'cancelled':
-                if not party_id or dc.party_id == party_id:
-                    outwards.append({
-                        "date": dc.challan_date,
-                        "type": "OUT",
-                        "ref": dc.challan_number,
-                        "description": "Return Challan",
-                        "party_name": dc.party.name if dc.party else "Unknown",
-                        "qty": float(st.quantity)
-                    })
-        elif st.reference_type == "INVOICE":
-            inv = db.query(Invoice).filter(Invoice.id == st.reference_id).first()
-            if inv and inv.status != 'cancelled':
-                if not party_id or inv.party_id == party_id:
-                    outwards.append({
-                        "date": inv.invoice_date,
-                        "type": "OUT",
-                        "ref": inv.invoice_number,
-                        "description": "Invoice",
-                        "party_name": inv.party.name if inv.party else "Unknown",
-                        "qty": float(st.quantity)
-                    })
+    outwards = get_outward_movements(db, company_id, item_id, start, end, party_id)
     
     # 5. Merge and Sort All Transactions
     all_transactions = []
@@ -1137,7 +852,7 @@ def get_stock_ledger(
     for outw in outwards:
         all_transactions.append({
             "date": outw["date"],
-            "type": outw["type"],
+            "type": "OUT",
             "ref": outw["ref"],
             "description": outw["description"],
             "party_name": outw["party_name"],
@@ -1195,6 +910,7 @@ def get_stock_ledger(
 
 @router.get("/stock-ledger/pdf/old")
 async def get_stock_ledger_print_old(
+    request: Request,
     item_id: int,
     party_id: Optional[int] = None,
     start_date: Optional[str] = None,
@@ -1210,176 +926,89 @@ async def get_stock_ledger_print_old(
     if end_date:
         end = end.replace(hour=23, minute=59, second=59)
 
-    item = db.query(Item).filter(Item.id == item_id).first()
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
+    def load():
+        item = db.query(Item).filter(Item.id == item_id).first()
+        if not item:
+            raise HTTPException(status_code=404, detail="Item not found")
 
-    selected_party = None
-    if party_id:
-        selected_party = db.query(Party).filter(Party.id == party_id).first()
-
-    # Opening Balance
-    # Note: If party_id filters, we ideally filter Opening too.
-    # Current limitation: Opening Balance calc in SQL (prev_in - prev_out) is across ALL parties.
-    # To fix this accurately for one party, we'd need to fetch ALL historic transactions and filter in Python,
-    # or join tables in SQL. For now, we will fetch ALL and filter in Python for accuracy.
-    
-    # Fetch ALL transactions for this Item from START of time (or FY?)
-    # Usually Stock Ledger is perpetual.
-    # Let's fetch pure `transactions` in range, and handle Opening separately.
-    
-    # 1. Opening Balance Logic (Simplified: Use Global Opening if Party not selected, else 0 or recalc)
-    # Global Opening
-    prev_in = db.query(func.sum(StockTransaction.quantity)).filter(
-        StockTransaction.item_id == item_id,
-        StockTransaction.company_id == company_id,
-        StockTransaction.transaction_type == "IN",
-        StockTransaction.created_at < start
-    ).scalar() or 0
+        selected_party = None
+        if party_id:
+            selected_party = db.query(Party).filter(Party.id == party_id).first()
+
+        # Opening Balance
+        # Note: If party_id filters, we ideally filter Opening too.
+        # Current limitation: Opening Balance calc in SQL (prev_in - prev_out) is across ALL parties.
+        # To fix this accurately for one party, we'd need to fetch ALL historic transactions and filter in Python,
+        # or join tables in SQL. For now, we will fetch ALL and filter in Python for accuracy.
     
-    prev_out = db.query(func.sum(StockTransaction.quantity)).filter(
-        StockTransaction.item_id == item_id,
-        StockTransaction.company_id == company_id,
-        StockTransaction.transaction_type == "OUT",
-        StockTransaction.created_at < start
-    ).scalar() or 0
+        # Fetch ALL transactions for this Item from START of time (or FY?)
+        # Usually Stock Ledger is perpetual.
+        # Let's fetch pure `transactions` in range, and handle Opening separately.
     
-    opening_balance = float(prev_in) - float(prev_out)
+        # 1. Opening Balance Logic (Simplified: Use Global Opening if Party not selected, else 0 or recalc)
+        # Global Opening
+        prev_in = db.query(func.sum(StockTransaction.quantity)).filter(
+            StockTransaction.item_id == item_id,
+            StockTransaction.company_id == company_id,
+            StockTransaction.transaction_type == "IN",
+            StockTransaction.created_at < start
+        ).scalar() or 0
     
-    # IF PARTY SELECTED: We must recalculate opening balance by filtering historic transactions manually.
-    # This is heavy but necessary for correctness.
-    if party_id:
-        opening_balance = 0.0 # Reset
-        # Fetch all historic transactions to filter
-        all_historic = db.query(StockTransaction).filter(
+        prev_out = db.query(func.sum(StockTransaction.quantity)).filter(
             StockTransaction.item_id == item_id,
             StockTransaction.company_id == company_id,
+            StockTransaction.transaction_type == "OUT",
             StockTransaction.created_at < start
-        ).all()
-        
-        # Resolve all references (Batch fetch for performance would be better, but doing simple loop for now)
-        # This might be slow. Optimization: Only fetch IDs first.
-        # Actually, let's just stick to "In Range" for now if performance is concern?
-        # User implies "Ledger", likely wants full history.
-        # Let's leave Opening as 0 for Party-Specific view unless requested, 
-        # OR attempt to filter if list is small. 
-        # For safety/speed, let's keep Opening Balance as 0 for Party View effectively treating it as "Activity Report".
-        # Valid adjustment: "Party Statement" starts with 0 usually unless it's a financial ledger.
-        pass
-
-    # Transactions
-    transactions = db.query(StockTransaction).filter(
-        StockTransaction.item_id == item_id,
-        StockTransaction.company_id == company_id,
-        StockTransaction.created_at >= start,
-        StockTransaction.created_at <= end
-    ).order_by(StockTransaction.created_at.asc()).all()
-
-    # Fetch Party Details for transactions
-    challan_ids = [tx.reference_id for tx in transactions if tx.reference_type == "DELIVERY_CHALLAN"]
-    invoice_ids = [tx.reference_id for tx in transactions if tx.reference_type == "INVOICE"]
-    party_challan_ids = [tx.reference_id for tx in transactions if tx.reference_type == "PARTY_CHALLAN"]
-    
-    challan_map = {}
-    if challan_ids:
-        challans = db.query(DeliveryChallan).options(joinedload(DeliveryChallan.party)).filter(DeliveryChallan.id.in_(challan_ids)).all()
-        challan_map = {c.id: c for c in challans}
-        
-    invoice_map = {}
-    if invoice_ids:
-        invoices = db.query(Invoice).options(joinedload(Invoice.party)).filter(Invoice.id.in_(invoice_ids)).all()
-        invoice_map = {i.id: i for i in invoices}
+        ).scalar() or 0
+    
+        opening_balance = float(prev_in) - float(prev_out)
+    
+        # IF PARTY SELECTED: We must recalculate opening balance by filtering historic transactions manually.
+        # This is heavy but necessary for correctness.
+        if party_id:
+            opening_balance = 0.0 # Reset
+            # Fetch all historic transactions to filter
+            all_historic = db.query(StockTransaction).filter(
+                StockTransaction.item_id == item_id,
+                StockTransaction.company_id == company_id,
+                StockTransaction.created_at < start
+            ).all()
+        
+            # Resolve all references (Batch fetch for performance would be better, but doing simple loop for now)
+            # This might be slow. Optimization: Only fetch IDs first.
+            # Actually, let's just stick to "In Range" for now if performance is concern?
+            # User implies "Ledger", likely wants full history.
+            # Let's leave Opening as 0 for Party-Specific view unless requested, 
+            # OR attempt to filter if list is small. 
+            # For safety/speed, let's keep Opening Balance as 0 for Party View effectively treating it as "Activity Report".
+            # Valid adjustment: "Party Statement" starts with 0 usually unless it's a financial ledger.
+            pass
+
+        # Prepare Data for Template (documents resolved in bulk)
+        # -------------------------
+        try:
+            formatted_transactions, running_balance = build_transaction_ledger(
+                db, company_id, item_id, start, end, opening_balance, party_id
+            )
+        except Exception as e:
+            print(f"Error preparing stock ledger data: {str(e)}")
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=f"Data Prep Error: {str(e)}")
 
-    party_challan_map = {}
-    if party_challan_ids:
-        pcs = db.query(PartyChallan).options(joinedload(PartyChallan.party)).filter(PartyChallan.id.in_(party_challan_ids)).all()
-        party_challan_map = {p.id: p for p in pcs}
+        base_url = link_service.base_url(request, db=db, company_id=company_id)
+        company = db.query(Company).filter(Company.id == company_id).first()
+        return (
+            item, selected_party, opening_balance, formatted_transactions,
+            running_balance, base_url, company,
+        )
 
-    # Prepare Data for Template
-    # -------------------------
-    try:
-        formatted_transactions = []
-        running_balance = opening_balance
-        
-        for tx in transactions:
-            party_match = True # Default true if no party filter
-            
-            in_qty = float(tx.quantity) if tx.transaction_type == "IN" else 0.0
-            out_qty = float(tx.quantity) if tx.transaction_type == "OUT" else 0.0
-            
-            party_name = "-"
-            party_obj = None
-            desc = tx.reference_type or "Adjustment"
-            ref_no = str(tx.reference_id)
-
-            if tx.reference_type == "INVOICE":
-                 inv = invoice_map.get(tx.reference_id)
-                 if inv:
-                     desc = f"Invoice"
-                     ref_no = inv.invoice_number
-                     party_obj = inv.party
-                     party_name = inv.party.name if inv.party else "Unknown"
-                 else:
-                     desc = f"Invoice #{tx.reference_id}"
-                     
-            elif tx.reference_type == "DELIVERY_CHALLAN":
-                 chal = challan_map.get(tx.reference_id)
-                 if chal:
-                     desc = f"Return Challan"
-                     ref_no = chal.challan_number
-                     party_obj = chal.party
-                     party_name = chal.party.name if chal.party else "Unknown"
-                 else:
-                     desc = f"Return Challan #{tx.reference_id}"
-
-            elif tx.reference_type == "PARTY_CHALLAN":
-                 pc = party_challan_map.get(tx.reference_id)
-                 if pc:
-                     desc = f"Party Challan"
-                     ref_no = pc.challan_number
-                     party_obj = pc.party
-                     party_name = pc.party.name if pc.party else "Unknown"
-                 else:
-                     desc = f"Party Challan #{tx.reference_id}"
-
-            # FILTER BY PARTY
-            if party_id:
-                if not party_obj or party_obj.id != party_id:
-                    party_match = False
-            
-            if party_match:
-                running_balance += (in_qty - out_qty)
-                
-                date_str = "-"
-                if tx.created_at:
-                    try:
-                        date_str = tx.created_at.strftime("%d-%m-%Y")
-                    except:
-                        date_str = str(tx.created_at)
-
-                formatted_transactions.append({
-                    "date": date_str,
-                    "type": tx.transaction_type,
-                    "ref": ref_no,
-                    "description": desc,
-                    "party_name": party_name,
-                    "in_qty": in_qty,
-                    "out_qty": out_qty,
-                    "balance": f"{running_balance:.2f}"
-                })
-    except Exception as e:
-        print(f"Error preparing stock ledger data: {str(e)}")
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Data Prep Error: {str(e)}")
+    (
+        item, selected_party, opening_balance, formatted_transactions,
+        running_balance, base_url, company,
+    ) = await db_executor.run(load)
 
     # QR Code Generation
-    import qrcode
-    import io
-    import base64
     from app.core.security import create_url_signature
-    from app.core.config import get_backend_url
-    
-    base_url = get_backend_url()
     
     # Signature: company_id:item_id:party_id (party_id can be None/None -> "all")
     party_val = str(party_id) if party_id else "all"
@@ -1400,20 +1029,13 @@ async def get_stock_ledger_print_old(
     if end_date:
          download_url += f"&end_date={end_date}"
          
-    qr = qrcode.QRCode(version=None, box_size=10, border=5)
-    qr.add_data(download_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    qr_code_b64 = await render_service.qr_base64(download_url, version=None)
     
     # Render Template
     # ---------------
-    company = db.query(Company).filter(Company.id == company_id).first()
     
-    template = templates.get_template("stock_ledger_print.html")
-    html_content = template.render(
+    html_content = await render_service.render(
+        env, "stock_ledger_print.html",
         company=company,
         item=item,
         party=selected_party,
@@ -1446,7 +1068,7 @@ async def get_stock_ledger_print_old(
     
     return Response(
         content=pdf_data,
-        media_type="text/html",
+        media_type=media_type_for(pdf_data),
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
@@ -1466,9 +1088,10 @@ def get_dashboard_stats(
     6. Expense Breakdown (Pie Chart)
     7. Cash Flow Trend (Income vs Exp)
     """
-    cache_key = f"{company_id}_{fy.id}"
-    if cache_key in dashboard_cache:
-        return dashboard_cache[cache_key]
+    cache_key = f"dashboard:{company_id}:{fy.id}"
+    cached = report_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
     from app.models.payment import Payment
     from app.models.expense import Expense
@@ -1617,7 +1240,7 @@ def get_dashboard_stats(
         "expense_breakdown": expense_breakdown,
         "monthly_cashflow": monthly_cashflow
     }
-    dashboard_cache[cache_key] = result
+    report_cache.set(cache_key, result, ttl=300, tags=[company_tag(company_id), fy_tag(fy.id)])
     return result
 
 
@@ -1725,6 +1348,7 @@ def get_gst_report(
 
 @router.get("/gst/pdf")
 async def get_gst_report_pdf(
+    request: Request,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     type: str = "gstr1",
@@ -1745,99 +1369,103 @@ async def get_gst_report_pdf(
         datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else fy.end_date
     )
 
-    company = db.query(Company).filter(Company.id == company_id).first()
+    def load():
+        company = db.query(Company).filter(Company.id == company_id).first()
 
-    report_rows = []
+        report_rows = []
     
-    # Totals
-    total_taxable = 0
-    total_sgst = 0
-    total_cgst = 0
-    total_igst = 0
-    total_grand = 0
+        # Totals
+        total_taxable = 0
+        total_sgst = 0
+        total_cgst = 0
+        total_igst = 0
+        total_grand = 0
 
-    # Group by Party
-    grouped_data = {}
+        # Group by Party
+        grouped_data = {}
 
-    if type == "gstr1":
-        query = db.query(Invoice).options(joinedload(Invoice.party), joinedload(Invoice.items))
-        
-        filters = [
-            Invoice.company_id == company_id,
-            Invoice.invoice_date >= start,
-            Invoice.invoice_date <= end,
-            Invoice.status != "CANCELLED",
-        ]
+        if type == "gstr1":
+            query = db.query(Invoice).options(joinedload(Invoice.party), joinedload(Invoice.items))
         
-        if party_name:
-            # We need to join Party to filter by name if it's not a direct column on Invoice (it filters via relationship usually if joined)
-            # But joinedload doesn't always allow filtering on it easily without explicit join.
-            # Let's use explicit join or has.
-            query = query.join(Party)
-            filters.append(Party.name == party_name)
+            filters = [
+                Invoice.company_id == company_id,
+                Invoice.invoice_date >= start,
+                Invoice.invoice_date <= end,
+                Invoice.status != "CANCELLED",
+            ]
+        
+            if party_name:
+                # We need to join Party to filter by name if it's not a direct column on Invoice (it filters via relationship usually if joined)
+                # But joinedload doesn't always allow filtering on it easily without explicit join.
+                # Let's use explicit join or has.
+                query = query.join(Party)
+                filters.append(Party.name == party_name)
             
-        invoices = (
-            query
-            .filter(*filters)
-            .order_by(Invoice.invoice_date.asc())
-            .all()
-        )
+            invoices = (
+                query
+                .filter(*filters)
+                .order_by(Invoice.invoice_date.asc())
+                .all()
+            )
 
-        for inv in invoices:
-            party_name = inv.party.name if inv.party else "Unknown"
-            gstin = inv.party.gst_number if inv.party else "-"
-            party_key = f"{party_name} ({gstin})"
-
-            if party_key not in grouped_data:
-                grouped_data[party_key] = {
-                    "party_name": party_name,
-                    "gstin": gstin,
-                    "invoices": [],
-                    "sub_taxable": 0,
-                    "sub_sgst": 0,
-                    "sub_cgst": 0,
-                    "sub_igst": 0,
-                    "sub_total": 0
-                }
+            for inv in invoices:
+                inv_party_name = inv.party.name if inv.party else "Unknown"
+                gstin = inv.party.gst_number if inv.party else "-"
+                party_key = f"{inv_party_name} ({gstin})"
+
+                if party_key not in grouped_data:
+                    grouped_data[party_key] = {
+                        "party_name": inv_party_name,
+                        "gstin": gstin,
+                        "invoices": [],
+                        "sub_taxable": 0,
+                        "sub_sgst": 0,
+                        "sub_cgst": 0,
+                        "sub_igst": 0,
+                        "sub_total": 0
+                    }
 
-            taxable_value = 0.0
-            for item in inv.items:
-                 taxable_value += float(item.amount)
+                taxable_value = 0.0
+                for item in inv.items:
+                     taxable_value += float(item.amount)
 
-            if hasattr(inv, 'sub_total') and inv.sub_total:
-                 taxable_value = float(inv.sub_total)
+                if hasattr(inv, 'sub_total') and inv.sub_total:
+                     taxable_value = float(inv.sub_total)
             
-            grand_total = float(inv.grand_total)
-            total_tax = grand_total - taxable_value
+                grand_total = float(inv.grand_total)
+                total_tax = grand_total - taxable_value
             
-            sgst = total_tax / 2
-            cgst = total_tax / 2
-            igst = 0.0
+                sgst = total_tax / 2
+                cgst = total_tax / 2
+                igst = 0.0
 
-            grouped_data[party_key]["invoices"].append({
-                "date": inv.invoice_date.strftime("%d-%m-%Y"),
-                "invoice_number": inv.invoice_number,
-                "taxable_value": taxable_value,
-                "sgst": sgst,
-                "cgst": cgst,
-                "igst": igst,
-                "total_amount": grand_total
-            })
+                grouped_data[party_key]["invoices"].append({
+                    "date": inv.invoice_date.strftime("%d-%m-%Y"),
+                    "invoice_number": inv.invoice_number,
+                    "taxable_value": taxable_value,
+                    "sgst": sgst,
+                    "cgst": cgst,
+                    "igst": igst,
+                    "total_amount": grand_total
+                })
 
-            grouped_data[party_key]["sub_taxable"] += taxable_value
-            grouped_data[party_key]["sub_sgst"] += sgst
-            grouped_data[party_key]["sub_cgst"] += cgst
-            grouped_data[party_key]["sub_igst"] += igst
-            grouped_data[party_key]["sub_total"] += grand_total
-
-            total_taxable += taxable_value
-            total_sgst += sgst
-            total_cgst += cgst
-            total_igst += igst
-            total_grand += grand_total
+                grouped_data[party_key]["sub_taxable"] += taxable_value
+                grouped_data[party_key]["sub_sgst"] += sgst
+                grouped_data[party_key]["sub_cgst"] += cgst
+                grouped_data[party_key]["sub_igst"] += igst
+                grouped_data[party_key]["sub_total"] += grand_total
+
+                total_taxable += taxable_value
+                total_sgst += sgst
+                total_cgst += cgst
+                total_igst += igst
+                total_grand += grand_total
             
-    # Convert dict to sorted list
-    report_data = sorted(grouped_data.values(), key=lambda x: x["party_name"])
+        # Convert dict to sorted list
+        report_data = sorted(grouped_data.values(), key=lambda x: x["party_name"])
+        return company, report_data, total_taxable, total_sgst, total_cgst, total_igst, total_grand
+
+    company, report_data, total_taxable, total_sgst, total_cgst, total_igst, total_grand = await db_executor.run(load)
 
     # Generate QR Code with Secure Download Link
     from app.core.security import create_url_signature
@@ -1847,28 +1475,15 @@ async def get_gst_report_pdf(
     token = create_url_signature(sig_data)
     
     # 2. Construct Public URL
-    from app.core.config import get_backend_url
-    base_url = get_backend_url()
+    base_url = link_service.base_url(request, company=company)
     
     download_link = f"{base_url}/public/reports/gst/pdf?start_date={start.strftime('%Y-%m-%d')}&end_date={end.strftime('%Y-%m-%d')}&type={type}&company_id={company_id}&token={token}"
     
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(download_link)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_base64 = base64.b64encode(buffered.getvalue()).decode()
+    qr_code_base64 = await render_service.qr_base64(download_link, border=4, error_correction=qrcode.constants.ERROR_CORRECT_L)
 
     # 2. Render Template
-    template = templates.get_template("gst_report.html")
-    html_content = template.render(
+    html_content = await render_service.render(
+        env, "gst_report.html",
         company=company,
         start_date=start.strftime("%d-%m-%Y"),
         end_date=end.strftime("%d-%m-%Y"),
@@ -1894,12 +1509,14 @@ async def get_gst_report_pdf(
             """,
             "header_template": "<div></div>"
         })
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PDF Generation Failed: {str(e)}")
 
     return Response(
         content=pdf_data,
-        media_type="text/html",
+        media_type=media_type_for(pdf_data),
         headers={
             "Content-Disposition": f"attachment; filename=GST_Report_{type}.pdf",
             "Access-Control-Allow-Origin": "*",
@@ -2315,7 +1932,7 @@ async def get_stock_ledger_pdf(
     from fastapi.responses import JSONResponse
     try:
         from itertools import zip_longest
-        from app.services.pdf_service import generate_pdf
+        from app.services.pdf_service import generate_pdf, media_type_for
         from app.models.party_challan import PartyChallan
         from app.models.party_challan_item import PartyChallanItem
         from app.models.delivery_challan import DeliveryChallan
@@ -2327,271 +1944,201 @@ async def get_stock_ledger_pdf(
         # Correctly parse end date and set time to end of day if created_at is used, but for date comparison date() is fine
         end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else fy.end_date
 
-        # 2. Fetch Entities
-        item = db.query(Item).filter(Item.id == item_id).first()
-        party = db.query(Party).filter(Party.id == party_id).first()
-        company = db.query(Company).filter(Company.id == company_id).first()
-
-        if not item or not party:
-             raise HTTPException(status_code=404, detail="Item or Party not found")
+        def load():
+            # 2. Fetch Entities
+            item = db.query(Item).filter(Item.id == item_id).first()
+            party = db.query(Party).filter(Party.id == party_id).first()
+            company = db.query(Company).filter(Company.id == company_id).first()
 
-        # 3. Calculate Opening Balance
+            if not item or not party:
+                 raise HTTPException(status_code=404, detail="Item or Party not found")
 
-        # Formula: (Sum In before Start) - (Sum Out before Start)
-        
-        # Inward before start (Assuming PartyChallanItem table was reliable)
-        prev_in = db.query(func.sum(PartyChallanItem.quantity_ordered)).join(PartyChallan).filter(
-            PartyChallan.company_id == company_id,
-            PartyChallan.party_id == party_id,
-            PartyChallanItem.item_id == item_id,
-            PartyChallan.challan_date < start,
-            PartyChallan.status != "cancelled"
-        ).scalar() or 0
-
-        # Outward before start (Using StockTransaction + Parent Doc to avoid corrupted Item table)
-        
-        # DC Outwards
-        # We join StockTransaction to DeliveryChallan manually on reference_id
-        prev_out_dc = db.query(func.sum(StockTransaction.quantity)).join(
-            DeliveryChallan,
-            (StockTransaction.reference_id == DeliveryChallan.id) & (StockTransaction.reference_type == "DELIVERY_CHALLAN")
-        ).filter(
-            StockTransaction.company_id == company_id,
-            StockTransaction.item_id == item_id,
-            StockTransaction.transaction_type == "OUT",
-            DeliveryChallan.party_id == party_id,
-            DeliveryChallan.challan_date < start,
-            DeliveryChallan.status != 'cancelled'
-        ).scalar() or 0
-        
-        # Invoice Outwards
-        prev_out_inv = db.query(func.sum(StockTransaction.quantity)).join(
-            Invoice,
-            (StockTransaction.reference_id == Invoice.id) & (StockTransaction.reference_type == "INVOICE")
-        ).filter(
-            StockTransaction.company_id == company_id,
-            StockTransaction.item_id == item_id,
-            StockTransaction.transaction_type == "OUT",
-            Invoice.party_id == party_id,
-            Invoice.invoice_date < start,
-            Invoice.status != 'cancelled'
-        ).scalar() or 0
-        
-        opening_balance = float(prev_in) - (float(prev_out_dc) + float(prev_out_inv))
+            # 3. Calculate Opening Balance
 
-        # 4. Fetch Current Transactions (In Range)
+            # Formula: (Sum In before Start) - (Sum Out before Start)
         
-        # Inwards
-        inwards = db.query(PartyChallanItem).join(PartyChallan).filter(
-            PartyChallan.company_id == company_id,
-            PartyChallan.party_id == party_id,
-            PartyChallanItem.item_id == item_id,
-            PartyChallan.challan_date >= start,
-            PartyChallan.challan_date <= end,
-            PartyChallan.status != "cancelled"
-        ).order_by(PartyChallan.challan_date.asc()).all()
+            # Inward before start (Assuming PartyChallanItem table was reliable)
+            prev_in = db.query(func.sum(PartyChallanItem.quantity_ordered)).join(PartyChallan).filter(
+                PartyChallan.company_id == company_id,
+                PartyChallan.party_id == party_id,
+                PartyChallanItem.item_id == item_id,
+                PartyChallan.challan_date < start,
+                PartyChallan.status != "cancelled"
+            ).scalar() or 0
+
+            # Outward before start (Using StockTransaction + Parent Doc to avoid corrupted Item table)
+        
+            # DC Outwards
+            # We join StockTransaction to DeliveryChallan manually on reference_id
+            prev_out_dc = db.query(func.sum(StockTransaction.quantity)).join(
+                DeliveryChallan,
+                (StockTransaction.reference_id == DeliveryChallan.id) & (StockTransaction.reference_type == "DELIVERY_CHALLAN")
+            ).filter(
+                StockTransaction.company_id == company_id,
+                StockTransaction.item_id == item_id,
+                StockTransaction.transaction_type == "OUT",
+                DeliveryChallan.party_id == party_id,
+                DeliveryChallan.challan_date < start,
+                DeliveryChallan.status != 'cancelled'
+            ).scalar() or 0
+        
+            # Invoice Outwards
+            prev_out_inv = db.query(func.sum(StockTransaction.quantity)).join(
+                Invoice,
+                (StockTransaction.reference_id == Invoice.id) & (StockTransaction.reference_type == "INVOICE")
+            ).filter(
+                StockTransaction.company_id == company_id,
+                StockTransaction.item_id == item_id,
+                StockTransaction.transaction_type == "OUT",
+                Invoice.party_id == party_id,
+                Invoice.invoice_date < start,
+                Invoice.status != 'cancelled'
+            ).scalar() or 0
+        
+            opening_balance = float(prev_in) - (float(prev_out_dc) + float(prev_out_inv))
+
+            # 4. Fetch Current Transactions (In Range)
+        
+            # Inwards
+            inwards = db.query(PartyChallanItem).join(PartyChallan).filter(
+                PartyChallan.company_id == company_id,
+                PartyChallan.party_id == party_id,
+                PartyChallanItem.item_id == item_id,
+                PartyChallan.challan_date >= start,
+                PartyChallan.challan_date <= end,
+                PartyChallan.status != "cancelled"
+            ).order_by(PartyChallan.challan_date.asc()).all()
 
-        # Outwards - Logic Refactored to use StockTransaction as Source of Truth
-        # (Since DeliveryChallanItem.item_id appears to be unreliable/NULL in some cases)
-        
-        # 1. Fetch ALL Outward StockTransactions for this Item in Range
-        st_out = db.query(StockTransaction).filter(
-            StockTransaction.company_id == company_id,
-            StockTransaction.item_id == item_id,
-            StockTransaction.transaction_type == "OUT",
-            StockTransaction.created_at >= start,
-            StockTransaction.created_at <= end
-        ).all()
-        
-        # 2. Filter by Party and Resolve Details
-        all_outwards = []
-        
-        # Bulk fetch parent docs for efficiency (optional, but good practice)
-        # For now, simple loop is safer/easier to implement quickly correctly
+            # Outwards - Logic Refactored to use StockTransaction as Source of Truth
+            # (Since DeliveryChallanItem.item_id appears to be unreliable/NULL in some cases)
         
-        for st in st_out:
-            row_data = None
-            
-            if st.reference_type == "DELIVERY_CHALLAN":
-                # Check Party via Parent DC
-                dc = db.query(DeliveryChallan).filter(DeliveryChallan.id == st.reference_id).first()
-                if dc and dc.party_id == party_id and dc.status != 'cancelled':
-                    # Attempt to get breakdown from items (even if corrupted ID)
-                    dci = None
-                    if dc.items:
-                        # Try to find the item
-                        for i in dc.items:
-                             # Check if item ID matches or if it's the only item
-                             if str(i.item_id) == str(item_id) or len(dc.items) == 1:
-                                 dci = i
-                                 break
-                        # DEBUG: What if item_id is NULL? Print it.
-                        if not dci and len(dc.items) > 0:
-                            print(f"[DEBUG REPORT] DC #{dc.id} has items but no match for Item {item_id}. Inspecting:")
-                            for i in dc.items:
-                                print(f"  -> Item ID: {i.item_id}, Qty: {i.quantity}, Ok: {i.ok_qty}, Cr: {i.cr_qty}, Mr: {i.mr_qty}, PartyItemRef: {i.party_challan_item_id}")
-                            # Fallback: Just take the first one if only one? Or sum them?
-                            # If multiple, risky. But if only one, safe.
-                            if len(dc.items) == 1:
-                                dci = dc.items[0]
-
-                    # Use breakdown if available
-                    qty = float(dci.quantity or 0) if dci else float(st.quantity)
-                    ok = float(dci.ok_qty or 0) if dci else qty
-                    cr = float(dci.cr_qty or 0) if dci else 0
-                    mr = float(dci.mr_qty or 0) if dci else 0
-                    
-                    # Sanity check: If Ok+Cr+Mr != Qty, trust Qty more?
-                    # Or trust Ok+Cr+Mr sum?
-                    # If user entered 0 for Ok/Cr/Mr, then Sum is 0?
-                    # Let's trust Ok/Cr/Mr if Sum > 0
-                    if (ok + cr + mr) > 0:
-                        # Use breakdown
-                        pass
-                    else:
-                        # Default to All OK
-                        ok = qty
-                        cr = 0
-                        mr = 0
-
-                    # Found valid Outward
-                    row_data = {
-                        "date": dc.challan_date,
-                        "doc_no": dc.challan_number,
-                        "type": "DC",
-                        "qty": qty, 
-                        "ok": ok,
-                        "cr": cr,
-                        "mr": mr
-                    }
-                    
-            elif st.reference_type == "INVOICE":
-                # Check Party via Parent Invoice
-                inv = db.query(Invoice).filter(Invoice.id == st.reference_id).first()
-                # Ensure this invoice is not counting a challan we already counted?
-                # StockTransaction for Invoice is only created if it's a Direct Invoice.
-                # If Invoice references a Challan, the StockTransaction is on the Challan (usually).
-                # But if StockTransaction says INVOICE, it implies direct.
-                if inv and inv.party_id == party_id and inv.status != 'cancelled':
-                     # Try to find breakdown from InvoiceItem if possible, else default
-                     # (Skipping complex item lookup to avoid same NULL error)
-                     row_data = {
-                        "date": inv.invoice_date,
-                        "doc_no": inv.invoice_number,
-                        "type": "INV",
-                        "qty": float(st.quantity),
-                        "ok": float(st.quantity),
-                        "cr": 0,
-                        "mr": 0
-                    }
-            
-            if row_data:
-                all_outwards.append(row_data)
+            # Delivery challans / invoices of this party, resolved in bulk with their OK/CR/MR split
+            all_outwards = [
+                {
+                    "date": row["date"],
+                    "doc_no": row["ref"],
+                    "type": "DC" if row["reference_type"] == "DELIVERY_CHALLAN" else "INV",
+                    "qty": row["qty"],
+                    "ok": row["ok"],
+                    "cr": row["cr"],
+                    "mr": row["mr"],
+                }
+                for row in get_outward_movements(db, company_id, item_id, start, end, party_id, with_breakdown=True)
+            ]
 
-        # Sort by Date
-        all_outwards.sort(key=lambda x: x['date'])
+            # Sort by Date
+            all_outwards.sort(key=lambda x: x['date'])
 
-        # 5. Process Data for Side-by-Side Display
-        # We zip them. Use zip_longest
+            # 5. Process Data for Side-by-Side Display
+            # We zip them. Use zip_longest
         
         
-        inward_rows = []
+            inward_rows = []
         
-        # Calculate Total Inward for Summary
-        total_inward_qty_period = sum([float(row.quantity_ordered or 0) for row in inwards])
+            # Calculate Total Inward for Summary
+            total_inward_qty_period = sum([float(row.quantity_ordered or 0) for row in inwards])
         
-        # "Input Qty To Date" in user report likely means cumulative up to end of period OR just period total?
-        # Usually "Input Qty To Date" = Opening + Inward.
-        # User's Image: Opening (1). Input Qty To Date: 13956.
-        # Table left cum sum ends at 13956. So yes, Input Qty To Date = Cumulative Inward.
+            # "Input Qty To Date" in user report likely means cumulative up to end of period OR just period total?
+            # Usually "Input Qty To Date" = Opening + Inward.
+            # User's Image: Opening (1). Input Qty To Date: 13956.
+            # Table left cum sum ends at 13956. So yes, Input Qty To Date = Cumulative Inward.
         
-        # Revisit Loop for Inwards to track cumulative
-        cum_inward = opening_balance
-        for row in inwards:
-            qty = float(row.quantity_ordered or 0)
-            cum_inward += qty
-            inward_rows.append({
-                "date": row.party_challan.challan_date,
-                "challan_no": row.party_challan.challan_number,
-                "qty": qty,
-                "total_qty": cum_inward
-            })
+            # Revisit Loop for Inwards to track cumulative
+            cum_inward = opening_balance
+            for row in inwards:
+                qty = float(row.quantity_ordered or 0)
+                cum_inward += qty
+                inward_rows.append({
+                    "date": row.party_challan.challan_date,
+                    "challan_no": row.party_challan.challan_number,
+                    "qty": qty,
+                    "total_qty": cum_inward
+                })
             
-        # If no inwards, but we have opening, we might need a row? 
-        # Or just use opening for calculation.
+            # If no inwards, but we have opening, we might need a row? 
+            # Or just use opening for calculation.
         
-        total_inward_display = cum_inward # This matches "Input Qty to Date" logic from image
+            total_inward_display = cum_inward # This matches "Input Qty to Date" logic from image
             
-        outward_rows = []
-        
-        # Outward logic
-        # Balance logic in user image:
-        # Row 1: Bal 13733. (If Total In 13956 - Out 222 = 13734? close)
-        # Actually, let's use standard: Balance = (Opening + Total Inward So Far) - Cumulative Outward So Far?
-        # No, Side-by-Side means Inward and Outward are independent lists visually.
-        # The Balance column is on the RIGHT side.
-        # The Balance typically represents "Stock on Hand" after that specific Outward transaction.
-        # So: Balance = (Total Inward Available At That Moment) - (Cumulative Outward).
-        # "Total Inward Available" -> in visual, it's strictly Total Inward for the whole period?
-        # Or strict chronological?
-        # Strict chronological is hard with zipping.
-        # User image: Row 1 Outward Date 09/01. Row 1 Inward Date 17/01.
-        # Visual shows they are NOT chronologically synced across columns.
-        # So Balance must be calculated based on "Total Available" (Opening + All Inwards) - Cumulative Outwards.
-        # This implies a "First In First Out" or just "Pool" assumption.
-        # "Total Balance" 13955 (in summary)
-        # Row 1 Balance 13733 = 13955 - 222 (Outward)? Yes exactly.
-        # So Balance = (Total Available for Period) - Cumulative Outward.
-        # This is "Reverse Balance" or "Remaining Stock from Pool".
-        
-        total_available_pool = total_inward_display # Opening + Period Inwards
-        
-        cum_outward = 0
-        for row in all_outwards:
-             disp = row['qty']
-             cum_outward += disp
+            outward_rows = []
+        
+            # Outward logic
+            # Balance logic in user image:
+            # Row 1: Bal 13733. (If Total In 13956 - Out 222 = 13734? close)
+            # Actually, let's use standard: Balance = (Opening + Total Inward So Far) - Cumulative Outward So Far?
+            # No, Side-by-Side means Inward and Outward are independent lists visually.
+            # The Balance column is on the RIGHT side.
+            # The Balance typically represents "Stock on Hand" after that specific Outward transaction.
+            # So: Balance = (Total Inward Available At That Moment) - (Cumulative Outward).
+            # "Total Inward Available" -> in visual, it's strictly Total Inward for the whole period?
+            # Or strict chronological?
+            # Strict chronological is hard with zipping.
+            # User image: Row 1 Outward Date 09/01. Row 1 Inward Date 17/01.
+            # Visual shows they are NOT chronologically synced across columns.
+            # So Balance must be calculated based on "Total Available" (Opening + All Inwards) - Cumulative Outwards.
+            # This implies a "First In First Out" or just "Pool" assumption.
+            # "Total Balance" 13955 (in summary)
+            # Row 1 Balance 13733 = 13955 - 222 (Outward)? Yes exactly.
+            # So Balance = (Total Available for Period) - Cumulative Outward.
+            # This is "Reverse Balance" or "Remaining Stock from Pool".
+        
+            total_available_pool = total_inward_display # Opening + Period Inwards
+        
+            cum_outward = 0
+            for row in all_outwards:
+                 disp = row['qty']
+                 cum_outward += disp
              
-             # Balance = Available Pool - Cumulative Outward
-             bal = total_available_pool - cum_outward
+                 # Balance = Available Pool - Cumulative Outward
+                 bal = total_available_pool - cum_outward
              
-             outward_rows.append({
-                 "date": row['date'],
-                 "challan_no": row['doc_no'],
-                 "ok_qty": row['ok'],
-                 "cr_qty": row['cr'],
-                 "mr_qty": row['mr'],
-                 "dispatch_qty": disp,
-                 "total_qty": cum_outward,
-                 "balance": bal
-             })
-
-        # Combine
-        combined_rows = []
-        
-        # We need to handle Zip Longest ourselves or use library
-        max_len = max(len(inward_rows), len(outward_rows))
-        for i in range(max_len):
-            l = inward_rows[i] if i < len(inward_rows) else None
-            r = outward_rows[i] if i < len(outward_rows) else None
-            combined_rows.append({"left": l, "right": r})
-
-        # Totals for Footer
-        total_dispatch_qty = cum_outward
-        closing_balance = total_available_pool - total_dispatch_qty
-        
-        # Column Totals
-        total_ok_qty = sum([float(row['ok_qty']) for row in outward_rows])
-        total_cr_qty = sum([float(row['cr_qty']) for row in outward_rows])
-        total_mr_qty = sum([float(row['mr_qty']) for row in outward_rows])
+                 outward_rows.append({
+                     "date": row['date'],
+                     "challan_no": row['doc_no'],
+                     "ok_qty": row['ok'],
+                     "cr_qty": row['cr'],
+                     "mr_qty": row['mr'],
+                     "dispatch_qty": disp,
+                     "total_qty": cum_outward,
+                     "balance": bal
+                 })
+
+            # Combine
+            combined_rows = []
+        
+            # We need to handle Zip Longest ourselves or use library
+            max_len = max(len(inward_rows), len(outward_rows))
+            for i in range(max_len):
+                l = inward_rows[i] if i < len(inward_rows) else None
+                r = outward_rows[i] if i < len(outward_rows) else None
+                combined_rows.append({"left": l, "right": r})
+
+            # Totals for Footer
+            total_dispatch_qty = cum_outward
+            closing_balance = total_available_pool - total_dispatch_qty
+        
+            # Column Totals
+            total_ok_qty = sum([float(row['ok_qty']) for row in outward_rows])
+            total_cr_qty = sum([float(row['cr_qty']) for row in outward_rows])
+            total_mr_qty = sum([float(row['mr_qty']) for row in outward_rows])
+            return (
+                item, party, company, opening_balance, total_inward_display, total_available_pool,
+                combined_rows, total_ok_qty, total_cr_qty, total_mr_qty, total_dispatch_qty, closing_balance,
+            )
+
+        (
+            item, party, company, opening_balance, total_inward_display, total_available_pool,
+            combined_rows, total_ok_qty, total_cr_qty, total_mr_qty, total_dispatch_qty, closing_balance,
+        ) = await db_executor.run(load)
 
         # 6. Render HTML
-        template = templates.get_template("stock_ledger.html")
         # Format dates for display
         # Format dates for display
         start_display = start.strftime("%d/%m/%Y")
         end_display = end.strftime("%d/%m/%Y")
 
-        html_content = template.render(
+        html_content = await render_service.render(
+            env, "stock_ledger.html",
             company=company,
             party=party,
             item=item,
@@ -2624,7 +2171,7 @@ async def get_stock_ledger_pdf(
 
         return Response(
             content=pdf_data,
-            media_type="text/html",
+            media_type=media_type_for(pdf_data),
             headers={
                 "Content-Disposition": "attachment; filename=Stock_Ledger.pdf",
                 "Access-Control-Allow-Origin": "*",
@@ -2632,6 +2179,8 @@ async def get_stock_ledger_pdf(
                 "Access-Control-Allow-Headers": "*",
             },
         )
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -2698,6 +2247,7 @@ def get_grn_report(
 
 @router.get("/grn-report/pdf")
 async def get_grn_report_pdf(
+    request: Request,
     start_date: str,
     end_date: str,
     party_id: Optional[int] = None,
@@ -2712,84 +2262,80 @@ async def get_grn_report_pdf(
         start = parse_to_date(start_date) or datetime.now().date()
         end = parse_to_date(end_date) or datetime.now().date()
         
-        query = db.query(InvoiceItem).join(Invoice).join(Party).join(Item).outerjoin(DeliveryChallanItem).outerjoin(DeliveryChallan).filter(
-            Invoice.company_id == company_id,
-            Invoice.invoice_date >= start,
-            Invoice.invoice_date <= end,
-            Invoice.status != "CANCELLED"
-        )
-        
-        party_name = None
-        if party_id:
-            query = query.filter(Invoice.party_id == party_id)
-            party = db.query(Party).filter(Party.id == party_id).first()
-            if party:
-                party_name = party.name
-            
-        # Sort by Item Name first
-        items = query.order_by(Item.name.asc(), Invoice.invoice_date.desc()).all()
-        
-        # Group items by Item Name
-        grouped_data = {}
-        total_qty = 0
-        total_amount = 0
+        def load():
+            query = db.query(InvoiceItem).join(Invoice).join(Party).join(Item).outerjoin(DeliveryChallanItem).outerjoin(DeliveryChallan).filter(
+                Invoice.company_id == company_id,
+                Invoice.invoice_date >= start,
+                Invoice.invoice_date <= end,
+                Invoice.status != "CANCELLED"
+            )
         
-        for item in items:
-            qty = float(item.quantity) if item.quantity else 0
-            amt = float(item.amount) if item.amount else 0
-            total_qty += qty
-            total_amount += amt
+            party_name = None
+            if party_id:
+                query = query.filter(Invoice.party_id == party_id)
+                party = db.query(Party).filter(Party.id == party_id).first()
+                if party:
+                    party_name = party.name
             
-            challan_no = "-"
-            if item.delivery_challan_item and item.delivery_challan_item.challan:
-                 challan_no = item.delivery_challan_item.challan.challan_number
-
-            item_data = {
-                "invoice_number": item.invoice.invoice_number,
-                "invoice_date": item.invoice.invoice_date,
-                "party_name": item.invoice.party.name,
-                "grn_no": item.grn_no,
-                "challan_no": challan_no,
-                "quantity": qty,
-                "rate": float(item.rate) if item.rate else 0,
-                "amount": amt
-            }
+            # Sort by Item Name first
+            items = query.order_by(Item.name.asc(), Invoice.invoice_date.desc()).all()
+        
+            # Group items by Item Name
+            grouped_data = {}
+            total_qty = 0
+            total_amount = 0
+        
+            for item in items:
+                qty = float(item.quantity) if item.quantity else 0
+                amt = float(item.amount) if item.amount else 0
+                total_qty += qty
+                total_amount += amt
             
-            item_name = item.item.name
-            if item_name not in grouped_data:
-                grouped_data[item_name] = {
-                    "item_list": [],
-                    "total_qty": 0,
-                    "total_amount": 0
+                challan_no = "-"
+                if item.delivery_challan_item and item.delivery_challan_item.challan:
+                     challan_no = item.delivery_challan_item.challan.challan_number
+
+                item_data = {
+                    "invoice_number": item.invoice.invoice_number,
+                    "invoice_date": item.invoice.invoice_date,
+                    "party_name": item.invoice.party.name,
+                    "grn_no": item.grn_no,
+                    "challan_no": challan_no,
+                    "quantity": qty,
+                    "rate": float(item.rate) if item.rate else 0,
+                    "amount": amt
                 }
             
-            grouped_data[item_name]["item_list"].append(item_data)
-            grouped_data[item_name]["total_qty"] += qty
-            grouped_data[item_name]["total_amount"] += amt
+                item_name = item.item.name
+                if item_name not in grouped_data:
+                    grouped_data[item_name] = {
+                        "item_list": [],
+                        "total_qty": 0,
+                        "total_amount": 0
+                    }
             
-        # 2. Get Company Details
-        company = db.query(Company).filter(Company.id == company_id).first()
-        if not company:
-            class MockCompany:
-                name = "Company"
-                address = ""
-                gst_number = ""
-                phone = ""
-            company = MockCompany()
+                grouped_data[item_name]["item_list"].append(item_data)
+                grouped_data[item_name]["total_qty"] += qty
+                grouped_data[item_name]["total_amount"] += amt
+            
+            # 2. Get Company Details
+            company = db.query(Company).filter(Company.id == company_id).first()
+            if not company:
+                class MockCompany:
+                    name = "Company"
+                    address = ""
+                    gst_number = ""
+                    phone = ""
+                company = MockCompany()
+            return party_name, grouped_data, total_qty, total_amount, company
+
+        party_name, grouped_data, total_qty, total_amount, company = await db_executor.run(load)
 
         # 3. QR verification code
-        import io, base64, qrcode
-        from app.core.config import get_backend_url
-        base_url = get_backend_url()
+        base_url = link_service.base_url(request, company=company)
         p_param = f"&party_id={party_id}" if party_id else ""
         verify_url = f"{base_url}/public/reports/grn-report?company_id={company_id}&start={start_date}&end={end_date}{p_param}"
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(verify_url)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        qr_code_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        qr_code_b64 = await render_service.qr_base64(verify_url)
         
         # 4. Prepare Context
         context = {
@@ -2807,8 +2353,7 @@ async def get_grn_report_pdf(
 
         
         # 4. Render Template
-        template = templates.get_template("grn_report.html")
-        html_content = template.render(context)
+        html_content = await render_service.render(env, "grn_report.html", context)
         
         # 5. Generate PDF
         pdf_data = await generate_pdf(html_content, options={
@@ -2819,11 +2364,13 @@ async def get_grn_report_pdf(
         
         return Response(
             content=pdf_data,
-            media_type="text/html",
+            media_type=media_type_for(pdf_data),
             headers={
                 "Content-Disposition": f"attachment; filename=GRN_Report.pdf"
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
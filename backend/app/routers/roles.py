@@ -195,6 +195,7 @@ def update_role(
     
     db.commit()
     db.refresh(role)
+    PermissionService.invalidate_role_cache(role_id)
     
     # [AUDIT]
     log_audit_action(
@@ -236,6 +237,7 @@ def delete_role(
     role_name = role.name
     db.delete(role)
     db.commit()
+    PermissionService.invalidate_role_cache(role_id)
     
     # [AUDIT]
     log_audit_action(
@@ -21,6 +21,7 @@ from app.schemas.super_admin import (
 from app.schemas.auth import TokenResponse
 from app.core.admin_guard import require_super_admin
 from app.core.security import create_access_token
+from app.core.principal import invalidate_principal_user
 from app.services.super_admin_service import (
     create_company,
     create_company_admin,
@@ -485,6 +486,7 @@ def force_logout_api(
         
     user.token_version += 1
     db.commit()
+    invalidate_principal_user(user.id)
     
     # Audit log
     audit = AuditLog(
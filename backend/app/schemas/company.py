@@ -13,6 +13,7 @@ class CompanyBase(BaseModel):
     off_days: Optional[List[int]] = []
     state_code: Optional[str] = None   # GST state code — needed for E-Way Bill
     pincode: Optional[str] = None       # Pincode — needed for E-Way Bill
+    public_url: Optional[str] = None    # Custom domain for QR / share links
 
 
 class CompanyCreate(CompanyBase):
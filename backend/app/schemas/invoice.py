@@ -75,6 +75,24 @@ class InvoiceCreate(BaseModel):
     items: List[InvoiceItemCreate]
 
 
+class InvoiceBulkCreate(BaseModel):
+    invoices: List[InvoiceCreate] = Field(..., min_length=1, max_length=500)
+
+
+class InvoiceBulkResult(BaseModel):
+    index: int  # position in the request
+    invoice_id: Optional[int] = None
+    invoice_number: Optional[str] = None
+    grand_total: Optional[float] = None
+    error: Optional[str] = None
+
+
+class InvoiceBulkResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[InvoiceBulkResult]
+
+
 class InvoiceResponse(BaseModel):
     id: int
     invoice_number: str
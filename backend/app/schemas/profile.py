@@ -14,3 +14,4 @@ class CompanyProfileUpdate(BaseModel):
     email: str | None = None
     state_code: str | None = None   # GST state code — needed for E-Way Bill
     pincode: str | None = None       # Pincode — needed for E-Way Bill
+    public_url: str | None = None    # Custom domain for QR / share links ("" clears it)
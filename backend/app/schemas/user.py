@@ -152,3 +152,16 @@ class SalarySlip(BaseModel):
     
     final_payable: float
     is_paid: bool = False
+
+
+class PayrollRunSlip(SalarySlip):
+    employee_name: str
+    expense_id: Optional[int] = None  # set when paid by this run
+
+
+class PayrollRunResponse(BaseModel):
+    month: str # YYYY-MM
+    employee_count: int
+    paid_count: int  # paid by this run
+    total_payable: float  # unpaid slips before this run
+    slips: List[PayrollRunSlip]
@@ -1,5 +1,6 @@
 import os
 import shutil
+import sqlite3
 import glob
 import subprocess
 import base64
@@ -97,6 +98,41 @@ class BackupManager:
             replace_existing=True
         )
 
+        # [LEDGER] Nightly party ledger summary reconciliation — fires at 3:00 AM every day
+        self.scheduler.add_job(
+            self.reconcile_party_ledgers,
+            'cron',
+            hour=3,
+            minute=0,
+            timezone='Asia/Kolkata',
+            id='daily_party_ledger_reconcile',
+            replace_existing=True
+        )
+
+        # [CACHE] Weekly prune of QR codes not used for 90 days — Sunday 3:30 AM
+        self.scheduler.add_job(
+            self.prune_qr_cache,
+            'cron',
+            day_of_week='sun',
+            hour=3,
+            minute=30,
+            timezone='Asia/Kolkata',
+            id='weekly_qr_cache_prune',
+            replace_existing=True
+        )
+
+        # [CACHE] Weekly prune of rendered documents not re-rendered for 30 days — Sunday 3:45 AM
+        self.scheduler.add_job(
+            self.prune_document_cache,
+            'cron',
+            day_of_week='sun',
+            hour=3,
+            minute=45,
+            timezone='Asia/Kolkata',
+            id='weekly_document_cache_prune',
+            replace_existing=True
+        )
+
         self.scheduler.start()
 
         # [SMART BACKUP] Check if we missed today's backup (e.g. app was closed)
@@ -232,6 +268,39 @@ class BackupManager:
         except Exception as e:
             print(f"[BackupManager] Subscription expiry scan failed: {e}")
 
+    def reconcile_party_ledgers(self):
+        """
+        Scheduled daily job (3:00 AM) — compares party_ledger_summary with the
+        raw invoices / payments and rebuilds any party that drifted.
+        """
+        try:
+            from app.services.party_ledger_service import run_party_ledger_reconciliation
+
+            mismatches = run_party_ledger_reconciliation()
+            print(f"[BackupManager] Party ledger reconcile: {mismatches} mismatched buckets.")
+        except Exception as e:
+            print(f"[BackupManager] Party ledger reconcile failed: {e}")
+
+    def prune_qr_cache(self):
+        """Scheduled weekly job — drops on-disk QR codes unused for 90 days."""
+        try:
+            from app.services.qr_cache import prune_disk_cache
+
+            removed = prune_disk_cache(max_age_days=90)
+            print(f"[BackupManager] QR cache prune: {removed} files removed.")
+        except Exception as e:
+            print(f"[BackupManager] QR cache prune failed: {e}")
+
+    def prune_document_cache(self):
+        """Scheduled weekly job — drops rendered documents older than 30 days."""
+        try:
+            from app.services.document_cache import document_cache
+
+            removed = document_cache.prune(max_age_days=30)
+            print(f"[BackupManager] Document cache prune: {removed} files removed.")
+        except Exception as e:
+            print(f"[BackupManager] Document cache prune failed: {e}")
+
     # --- HELPER METHODS ---
     def _get_db_type(self):
         if settings.DATABASE_URL.startswith("sqlite"):
@@ -242,6 +311,19 @@ class BackupManager:
         # sqlite:///C:/path/to.db  -> C:/path/to.db
         return settings.DATABASE_URL.replace("sqlite:///", "")
 
+    def _copy_sqlite(self, source_path, target_path, standalone: bool = False):
+        """Copy a SQLite database with the backup API (WAL-safe, consistent snapshot)."""
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+            # Backup files should not depend on a -wal sidecar
+            if standalone:
+                target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+            source.close()
+
     def _get_db_config(self):
         """Parse DATABASE_URL for Postgres params"""
         from sqlalchemy.engine.url import make_url
@@ -289,8 +371,8 @@ class BackupManager:
                 source_db = self._get_sqlite_path()
                 if not os.path.exists(source_db):
                      raise Exception(f"Source DB not found at {source_db}")
-                # Simple file copy for SQLite
-                shutil.copy2(source_db, file_path)
+                # Online backup: includes pages still in the WAL file
+                self._copy_sqlite(source_db, file_path, standalone=True)
             else:
                 # PostgreSQL Logic
                 if not self._run_pg_dump(file_path, format):
@@ -422,11 +504,10 @@ class BackupManager:
         try:
             if db_type == "sqlite":
                 target_db = self._get_sqlite_path()
-                # For SQLite, we just copy the backup over the current DB
-                # CAUTION: This replaces the file immediately.
-                # In a real app, might want to close connections first.
+                # Copy the backup into the live DB through SQLite, so the
+                # WAL / shared-memory files stay consistent with it.
                 print(f"Restoring SQLite DB from {file_path} to {target_db}...")
-                shutil.copy2(file_path, target_db)
+                self._copy_sqlite(file_path, target_db)
                 return True
             else:
                 return self._restore_postgres(file_path, format)
@@ -0,0 +1,287 @@
+"""
+cache_service.py
+================
+Pluggable, tag-aware cache for report results (dashboard stats etc.).
+
+Two backends:
+    "memory" — per-process dict with TTL. Fine for the desktop app (one process).
+    "sqlite" — a small SQLite file under APP_DATA_DIR/cache shared by every
+               worker on the same host (gunicorn / Passenger), so one worker's
+               computation is reused by the others and an invalidation in one
+               worker is seen by all. No Redis required.
+
+Select with REPORT_CACHE_BACKEND in .env (default "sqlite").
+
+Usage:
+    from app.services.cache_service import report_cache, company_tag, fy_tag
+
+    hit = report_cache.get(key)
+    if hit is None:
+        hit = compute()
+        report_cache.set(key, hit, ttl=300, tags=[company_tag(cid), fy_tag(fy_id)])
+
+Invalidation is driven by data changes: any committed insert/update/delete of
+an Invoice, Payment or Expense emits an invalidation event for its
+financial-year tag (company tag if it has none) — see the Session listeners at
+the bottom of this module.
+Extra listeners can subscribe with ``on_invalidate(callback)``.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.paths import CACHE_DIR
+
+
+def company_tag(company_id: int) -> str:
+    return f"company:{company_id}"
+
+
+def fy_tag(fy_id: int) -> str:
+    return f"fy:{fy_id}"
+
+
+# ============================================================
+# BACKENDS
+# ============================================================
+class MemoryCacheBackend:
+    """In-process TTL cache with tag index."""
+
+    def __init__(self, maxsize: int = 500):
+        self.maxsize = maxsize
+        self._entries: Dict[str, Tuple[float, Any, Tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.time():
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        return value
+
+    def set(self, key: str, value: Any, ttl: int, tags: Iterable[str] = ()) -> None:
+        with self._lock:
+            if len(self._entries) >= self.maxsize and key not in self._entries:
+                # Evict the entry closest to expiry
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                self._entries.pop(oldest, None)
+            self._entries[key] = (time.time() + ttl, value, tuple(tags))
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        tags = set(tags)
+        with self._lock:
+            for key in [k for k, (_, _, t) in self._entries.items() if tags.intersection(t)]:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCacheBackend:
+    """File-backed cache shared by all worker processes on the host."""
+
+    PURGE_INTERVAL = 60  # seconds between expired-row sweeps
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = 0.0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_tags ("
+            " tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_tags_key ON cache_tags (key)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"[Cache] get failed for {key}: {e}")
+            return None
+        if not row or row[1] <= time.time():
+            return None
+        try:
+            return pickle.loads(row[0])
+        except Exception:
+            return None
+
+    def set(self, key: str, value: Any, ttl: int, tags: Iterable[str] = ()) -> None:
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, pickle.dumps(value), now + ttl),
+                )
+                conn.execute("DELETE FROM cache_tags WHERE key = ?", (key,))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO cache_tags (tag, key) VALUES (?, ?)",
+                    [(tag, key) for tag in tags],
+                )
+                if now - self._last_purge > self.PURGE_INTERVAL:
+                    self._purge_expired(conn, now)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"[Cache] set failed for {key}: {e}")
+
+    def _purge_expired(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute(
+            "DELETE FROM cache_tags WHERE key IN "
+            "(SELECT key FROM cache_entries WHERE expires_at <= ?)", (now,)
+        )
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        self._last_purge = now
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        tags = list(tags)
+        if not tags:
+            return
+        marks = ",".join("?" * len(tags))
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    f"DELETE FROM cache_entries WHERE key IN "
+                    f"(SELECT key FROM cache_tags WHERE tag IN ({marks}))", tags
+                )
+                conn.execute(
+                    f"DELETE FROM cache_tags WHERE key IN "
+                    f"(SELECT key FROM cache_tags WHERE tag IN ({marks}))", tags
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"[Cache] invalidate failed for {tags}: {e}")
+
+    def clear(self) -> None:
+        try:
+            conn = self._conn()
+            conn.execute("DELETE FROM cache_entries")
+            conn.execute("DELETE FROM cache_tags")
+        except sqlite3.Error as e:
+            logger.warning(f"[Cache] clear failed: {e}")
+
+
+# ============================================================
+# FACADE
+# ============================================================
+class ReportCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self._subscribers: List[Callable[[Set[str]], None]] = []
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.backend.get(key)
+
+    def set(self, key: str, value: Any, ttl: int = 300, tags: Iterable[str] = ()) -> None:
+        self.backend.set(key, value, ttl, tags)
+
+    def invalidate(self, *tags: str) -> None:
+        tag_set = {t for t in tags if t}
+        if not tag_set:
+            return
+        self.backend.invalidate_tags(tag_set)
+        for callback in self._subscribers:
+            try:
+                callback(tag_set)
+            except Exception as e:
+                logger.warning(f"[Cache] invalidation subscriber failed: {e}")
+
+    def on_invalidate(self, callback: Callable[[Set[str]], None]) -> None:
+        self._subscribers.append(callback)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+
+def _build_backend():
+    kind = (getattr(settings, "REPORT_CACHE_BACKEND", "sqlite") or "sqlite").lower()
+    if kind == "sqlite":
+        try:
+            return SQLiteCacheBackend(os.path.join(CACHE_DIR, "report_cache.db"))
+        except sqlite3.Error as e:
+            logger.warning(f"[Cache] SQLite backend unavailable ({e}); using in-memory cache.")
+    return MemoryCacheBackend()
+
+
+report_cache = ReportCache(_build_backend())
+
+
+# ============================================================
+# INVALIDATION EVENTS (Invoice / Payment / Expense writes)
+# ============================================================
+_PENDING_KEY = "report_cache_invalidations"
+
+
+def _tags_for(obj) -> List[str]:
+    from app.models.invoice import Invoice
+    from app.models.payment import Payment
+    from app.models.expense import Expense
+
+    if not isinstance(obj, (Invoice, Payment, Expense)):
+        return []
+    # Read loaded values only: a deleted row must not be refreshed here
+    values = inspect(obj).dict
+    tags = []
+    if values.get("financial_year_id"):
+        tags.append(fy_tag(values["financial_year_id"]))
+    elif values.get("company_id"):
+        tags.append(company_tag(values["company_id"]))
+    return tags
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_report_changes(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        pending.update(_tags_for(obj))
+
+
+@event.listens_for(Session, "after_commit")
+def _emit_report_invalidations(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        report_cache.invalidate(*pending)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_report_changes(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
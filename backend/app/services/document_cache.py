@@ -0,0 +1,257 @@
+"""
+document_cache.py
+=================
+On-disk cache of rendered documents (HTML, or PDF when a PDF backend is
+enabled) for the public / client-portal download routes.
+
+Opening a WhatsApp link used to re-query the invoice with all its items and
+re-render the template on every hit, although a sent invoice rarely changes.
+Routes now look up a cheap version first and only render on a miss:
+
+    version = document_cache.version("invoice.html", invoice.updated_at, ...)
+    cached = document_cache.get(company_id, "invoice", invoice_id, "public", version)
+    if cached: return document_cache.response(request, cached, filename)
+
+Layout: APP_DATA_DIR/cache/documents/<company>/<kind>/<id>/<variant>-<version>.bin
+
+The version covers the document's updated_at, the template file and the PDF
+backend, so edits that bump updated_at miss automatically. Everything else
+(item edits, payments, party / company / item master changes, party challan
+deliveries that move challan balances) is handled by session listeners that
+delete the affected files once the transaction commits. Responses carry an
+ETag (content hash) and Last-Modified so browsers revalidate with a 304.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from glob import glob
+from typing import Optional, Set, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.paths import CACHE_DIR
+from app.models.company import Company
+from app.models.delivery_challan import DeliveryChallan
+from app.models.delivery_challan_item import DeliveryChallanItem
+from app.models.invoice import Invoice
+from app.models.invoice_item import InvoiceItem
+from app.models.item import Item
+from app.models.party import Party
+from app.models.party_challan import PartyChallan
+from app.models.party_challan_item import PartyChallanItem
+from app.models.process import Process
+from app.services.pdf_service import media_type_for, pdf_manager
+from app.services.template_env import TEMPLATES_DIR
+
+DOCUMENT_CACHE_DIR = os.path.join(CACHE_DIR, "documents")
+
+_PENDING_KEY = "document_cache_invalidations"
+
+# (company_id or None, kind or None, doc_id or None) — None widens the scope
+Scope = Tuple[Optional[int], Optional[str], Optional[int]]
+
+
+@dataclass
+class CachedDocument:
+    path: str
+    content: bytes
+    modified: float
+
+    @property
+    def etag(self) -> str:
+        # From the bytes, not the version: invalidated edits can keep updated_at
+        return f'"{hashlib.sha256(self.content).hexdigest()[:24]}"'
+
+    @property
+    def media_type(self) -> str:
+        return media_type_for(self.content)
+
+
+# ============================================================
+# CACHE
+# ============================================================
+class DocumentCache:
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    @property
+    def root(self) -> str:
+        return DOCUMENT_CACHE_DIR
+
+    def version(self, template_name: str, *parts) -> str:
+        """Short hash of the document state, template file and PDF backend."""
+        try:
+            template_mtime = os.path.getmtime(os.path.join(TEMPLATES_DIR, template_name))
+        except OSError:
+            template_mtime = 0
+        pdf_backend = pdf_manager.backend if pdf_manager.running else "html"
+        raw = "|".join(str(p) for p in (template_name, template_mtime, pdf_backend, *parts))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:24]
+
+    def _path(self, company_id: int, kind: str, doc_id: int, variant: str, version: str) -> str:
+        return os.path.join(self.root, str(company_id), kind, str(doc_id), f"{variant}-{version}.bin")
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    def get(self, company_id: int, kind: str, doc_id: int, variant: str, version: str) -> Optional[CachedDocument]:
+        if not self.enabled:
+            return None
+        path = self._path(company_id, kind, doc_id, variant, version)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            modified = os.path.getmtime(path)
+        except OSError:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return CachedDocument(path, content, modified)
+
+    def put(self, company_id: int, kind: str, doc_id: int, variant: str, version: str, content: bytes) -> CachedDocument:
+        path = self._path(company_id, kind, doc_id, variant, version)
+        document = CachedDocument(path, content, time.time())
+        if not self.enabled:
+            return document
+        try:
+            folder = os.path.dirname(path)
+            # Older versions of this variant are dead weight now
+            for stale in glob(os.path.join(folder, f"{variant}-*.bin")):
+                os.remove(stale)
+            os.makedirs(folder, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            document.modified = os.path.getmtime(path)
+            self._count("stores")
+        except OSError as e:
+            logger.warning(f"[DocumentCache] Could not store {kind} {doc_id}: {e}")
+        return document
+
+    def response(self, request: Optional[Request], document: CachedDocument, filename: str) -> Response:
+        """Serve ``document`` with validators; 304 when the client copy is current."""
+        headers = {
+            "ETag": document.etag,
+            "Last-Modified": formatdate(document.modified, usegmt=True),
+            "Cache-Control": "private, no-cache",
+        }
+        if request is not None and self._not_modified(request, document):
+            return Response(status_code=304, headers=headers)
+        headers["Content-Disposition"] = f"inline; filename={filename}"
+        return Response(content=document.content, media_type=document.media_type, headers=headers)
+
+    @staticmethod
+    def _not_modified(request: Request, document: CachedDocument) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            return "*" in tags or document.etag in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(document.modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def invalidate(self, company_id: Optional[int] = None, kind: Optional[str] = None, doc_id: Optional[int] = None) -> int:
+        """Delete cached files in a scope (None = any). Returns directories removed."""
+        pattern = os.path.join(
+            self.root,
+            str(company_id) if company_id is not None else "*",
+            kind or "*",
+            str(doc_id) if doc_id is not None else "*",
+        )
+        removed = 0
+        for folder in glob(pattern):
+            shutil.rmtree(folder, ignore_errors=True)
+            removed += 1
+        if removed:
+            self._count("invalidations")
+        return removed
+
+    def prune(self, max_age_days: int = 30) -> int:
+        """Delete files not rewritten for ``max_age_days``. Returns files removed."""
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, enabled=self.enabled)
+
+
+document_cache = DocumentCache(enabled=settings.DOCUMENT_CACHE_ENABLED)
+
+
+# ============================================================
+# INVALIDATION (session listeners)
+# ============================================================
+def _scopes(obj) -> Set[Scope]:
+    if isinstance(obj, Invoice):
+        return {(obj.company_id, "invoice", obj.id)}
+    if isinstance(obj, InvoiceItem):
+        return {(None, "invoice", obj.invoice_id)}
+    if isinstance(obj, DeliveryChallan):
+        return {(obj.company_id, "challan", obj.id)}
+    if isinstance(obj, DeliveryChallanItem):
+        return {(None, "challan", obj.challan_id)}
+    if isinstance(obj, (PartyChallan, PartyChallanItem)):
+        # Delivered quantities feed the opening / balance columns of every challan
+        return {(getattr(obj, "company_id", None), "challan", None)}
+    if isinstance(obj, Company):
+        return {(obj.id, None, None)}
+    if isinstance(obj, (Party, Item, Process)):
+        # Master data printed on the company's documents
+        return {(obj.company_id, None, None)}
+    return set()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_document_changes(session, flush_context):
+    scopes: Set[Scope] = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if obj in session.new and isinstance(obj, (Invoice, DeliveryChallan)):
+            continue  # nothing cached for a document that did not exist
+        scopes |= _scopes(obj)
+    if scopes:
+        session.info.setdefault(_PENDING_KEY, set()).update(scopes)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_documents(session):
+    scopes = session.info.pop(_PENDING_KEY, None)
+    if not scopes or not document_cache.enabled:
+        return
+    for company_id, kind, doc_id in scopes:
+        try:
+            document_cache.invalidate(company_id, kind, doc_id)
+        except Exception as e:
+            logger.warning(f"[DocumentCache] Invalidation failed for {kind} {doc_id}: {e}")
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_document_changes(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,162 @@
+"""
+document_sequence.py
+====================
+Gapless document numbers from the ``document_sequence`` table.
+
+Number generators used to read the last document of the company / FY and
+add one. Invoices tried to serialize that with SELECT ... FOR UPDATE (a no-op
+on SQLite) followed by an unbounded loop probing one number at a time;
+challans had no locking at all, so two concurrent saves could read the same
+"last" row.
+
+Now each (company, FY, doc type, party) has one counter row, and the next
+value (or block of values, for bulk creation) comes from a single
+``UPDATE ... SET last_value = last_value + n`` (with RETURNING where the
+dialect has it) inside the document's own transaction:
+
+    * the row lock (PostgreSQL) / write lock (SQLite) is held until commit,
+      so concurrent creators take turns on one tiny row instead of scanning
+      the document table;
+    * a failed save rolls the increment back with it, so numbers stay gapless.
+
+Counter rows are created lazily, seeded from the existing documents the
+first time a sequence is used (``seed`` callback), with an
+INSERT ... ON CONFLICT DO NOTHING so two first-time creators cannot clash.
+"""
+from typing import Callable, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.document_sequence import DocumentSequence
+
+INVOICE = "INVOICE"
+DELIVERY_CHALLAN = "DELIVERY_CHALLAN"
+PARTY_CHALLAN = "PARTY_CHALLAN"
+
+_S = DocumentSequence
+
+
+def _key(company_id: int, fy_id: int, doc_type: str, party_id: int):
+    return (
+        _S.company_id == company_id,
+        _S.financial_year_id == fy_id,
+        _S.doc_type == doc_type,
+        _S.party_id == party_id,
+    )
+
+
+def _increment(db: Session, key, count: int) -> Optional[int]:
+    stmt = (
+        update(_S)
+        .where(*key)
+        .values(last_value=_S.last_value + count)
+        .execution_options(synchronize_session=False)
+    )
+    if db.get_bind().dialect.update_returning:
+        return db.execute(stmt.returning(_S.last_value)).scalar()
+    if not db.execute(stmt).rowcount:
+        return None
+    return db.execute(select(_S.last_value).where(*key)).scalar()
+
+
+def _create(db: Session, company_id: int, fy_id: int, doc_type: str, party_id: int, last_value: int) -> None:
+    values = dict(
+        company_id=company_id, financial_year_id=fy_id,
+        doc_type=doc_type, party_id=party_id, last_value=last_value,
+    )
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        db.execute(insert(_S).values(**values).on_conflict_do_nothing(
+            index_elements=["company_id", "financial_year_id", "doc_type", "party_id"]
+        ))
+        return
+    try:
+        with db.begin_nested():
+            db.execute(_S.__table__.insert().values(**values))
+    except IntegrityError:
+        pass  # created concurrently
+
+
+def next_value(
+    db: Session, company_id: int, fy_id: int, doc_type: str,
+    party_id: int = 0, seed: Optional[Callable[[], int]] = None, count: int = 1,
+) -> int:
+    """
+    Reserve the next ``count`` values and return the last of them (they are
+    released again if the transaction rolls back).
+    """
+    key = _key(company_id, fy_id, doc_type, party_id)
+    value = _increment(db, key, count)
+    if value is None:
+        _create(db, company_id, fy_id, doc_type, party_id, seed() if seed else 0)
+        value = _increment(db, key, count)
+    return value
+
+
+def peek_value(
+    db: Session, company_id: int, fy_id: int, doc_type: str,
+    party_id: int = 0, seed: Optional[Callable[[], int]] = None,
+) -> int:
+    """The value next_value() would return now, without reserving it."""
+    last = db.execute(select(_S.last_value).where(*_key(company_id, fy_id, doc_type, party_id))).scalar()
+    if last is None:
+        last = seed() if seed else 0
+    return last + 1
+
+
+def advance_to(db: Session, company_id: int, fy_id: int, doc_type: str, value: int, party_id: int = 0) -> None:
+    """Move the sequence forward to ``value`` (never backwards)."""
+    db.execute(
+        update(_S)
+        .where(*_key(company_id, fy_id, doc_type, party_id), _S.last_value < value)
+        .values(last_value=value)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def next_numbers(
+    db: Session,
+    company_id: int,
+    fy_id: int,
+    doc_type: str,
+    fmt: Callable[[int], str],
+    count: int = 1,
+    party_id: int = 0,
+    seed: Optional[Callable[[], int]] = None,
+    is_taken: Optional[Callable[[List[str]], bool]] = None,
+    highest_taken: Optional[Callable[[], int]] = None,
+    preview: bool = False,
+) -> List[str]:
+    """
+    The next ``count`` formatted document numbers, reserved in one statement.
+    If any of them is already used (typed in by hand, or by another company
+    for globally unique invoice numbers), the sequence jumps past
+    ``highest_taken()`` once instead of probing number by number.
+    ``preview`` only peeks, for the "next number" endpoints.
+    """
+    if preview:
+        last = peek_value(db, company_id, fy_id, doc_type, party_id, seed) + count - 1
+    else:
+        last = next_value(db, company_id, fy_id, doc_type, party_id, seed, count)
+    numbers = [fmt(n) for n in range(last - count + 1, last + 1)]
+    if is_taken is None or not is_taken(numbers):
+        return numbers
+
+    highest = max(highest_taken(), last)
+    if not preview:
+        advance_to(db, company_id, fy_id, doc_type, highest, party_id)
+        last = next_value(db, company_id, fy_id, doc_type, party_id, count=count)
+    else:
+        last = highest + count
+    return [fmt(n) for n in range(last - count + 1, last + 1)]
+
+
+def next_number(db: Session, company_id: int, fy_id: int, doc_type: str, fmt: Callable[[int], str], **kwargs) -> str:
+    """Single-number form of next_numbers()."""
+    return next_numbers(db, company_id, fy_id, doc_type, fmt, 1, **kwargs)[0]
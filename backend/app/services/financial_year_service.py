@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from fastapi import HTTPException
 
 from app.models.financial_year import FinancialYear
+from app.core.principal import invalidate_principal_company
 
 
 # ============================================================
@@ -113,6 +114,7 @@ def activate_financial_year(
     fy.is_active = True
     db.commit()
     db.refresh(fy)
+    invalidate_principal_company(company_id)
 
     return _fy_to_dict(fy)
 
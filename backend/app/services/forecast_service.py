@@ -0,0 +1,260 @@
+"""
+forecast_service.py
+===================
+Demand and sales forecasting for the /ai-insights prediction endpoints.
+
+One query pulls the daily quantity sold of every item over the lookback
+window into an items x days matrix; burn rates, days-to-stockout and
+projected stock curves are then computed for all items at once instead of
+re-querying each item.
+
+Model (per series):
+    * weekly seasonal index — mean demand per weekday / overall mean
+    * Holt's damped-trend exponential smoothing on the deseasonalised series
+    * forecast(h) = (level + damped trend) * seasonal index of that weekday
+
+NumPy is optional (``pip install numpy`` or the ``analytics`` extra): with it
+every item is smoothed in one vectorised pass per day; without it the same
+formulas run row by row in pure Python (desktop builds stay lean).
+
+Models are fitted on complete days (up to yesterday) and cached per company
+for the rest of the day in report_cache. Current stock and today's actual
+sales are always read live.
+
+Used by:
+    /ai-insights/predictions        -> get_stock_forecasts
+    /ai-insights/stock-projections  -> get_stock_forecasts
+    /ai-insights/sales-forecast     -> get_sales_model
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models.invoice import Invoice
+from app.models.invoice_item import InvoiceItem
+from app.models.item import Item
+from app.services.cache_service import company_tag, report_cache
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised on installs without numpy
+    np = None
+
+LOOKBACK_DAYS = 56      # 8 full weeks of history
+SEASON = 7              # weekly seasonality
+HORIZON_DAYS = 60       # how far stock is projected
+ALPHA = 0.3             # level smoothing
+BETA = 0.1              # trend smoothing
+PHI = 0.9               # trend damping
+
+
+# ============================================================
+# MODEL (vectorised with NumPy, pure-Python fallback)
+# ============================================================
+def _forecast_numpy(rows: Sequence[Sequence[float]], first_weekday: int, horizon: int) -> List[List[float]]:
+    series = np.asarray(rows, dtype=float)
+    days = series.shape[1]
+    weekdays = (first_weekday + np.arange(days)) % SEASON
+
+    means = np.stack([series[:, weekdays == d].mean(axis=1) for d in range(SEASON)], axis=1)
+    overall = means.mean(axis=1, keepdims=True)
+    seasonal = np.divide(means, overall, out=np.ones_like(means), where=overall > 0)
+
+    # A weekday that never sells says nothing about the level: skip those days
+    divisor = seasonal[:, weekdays]
+    observed = divisor > 0
+    flat = np.divide(series, divisor, out=np.zeros_like(series), where=observed)
+
+    level = flat[:, :SEASON].sum(axis=1) / np.maximum(observed[:, :SEASON].sum(axis=1), 1)
+    trend = np.zeros(len(flat))
+    for t in range(SEASON, days):
+        predicted = level + PHI * trend
+        updated = np.where(observed[:, t], ALPHA * flat[:, t] + (1 - ALPHA) * predicted, predicted)
+        trend = np.where(observed[:, t], BETA * (updated - level) + (1 - BETA) * PHI * trend, PHI * trend)
+        level = updated
+
+    steps = np.cumsum(PHI ** np.arange(1, horizon + 1))
+    future_weekdays = (first_weekday + days + np.arange(horizon)) % SEASON
+    forecast = (level[:, None] + trend[:, None] * steps[None, :]) * seasonal[:, future_weekdays]
+    return np.clip(forecast, 0, None).tolist()
+
+
+def _forecast_python(rows: Sequence[Sequence[float]], first_weekday: int, horizon: int) -> List[List[float]]:
+    forecasts = []
+    for series in rows:
+        series = [float(v) for v in series]
+        days = len(series)
+        weekdays = [(first_weekday + t) % SEASON for t in range(days)]
+
+        means = []
+        for d in range(SEASON):
+            values = [v for v, wd in zip(series, weekdays) if wd == d]
+            means.append(sum(values) / len(values) if values else 0.0)
+        overall = sum(means) / SEASON
+        seasonal = [m / overall for m in means] if overall > 0 else [1.0] * SEASON
+
+        observed = [seasonal[wd] > 0 for wd in weekdays]
+        flat = [v / seasonal[wd] if ok else 0.0 for v, wd, ok in zip(series, weekdays, observed)]
+
+        level = sum(flat[:SEASON]) / max(sum(observed[:SEASON]), 1)
+        trend = 0.0
+        for t in range(SEASON, days):
+            predicted = level + PHI * trend
+            if observed[t]:
+                updated = ALPHA * flat[t] + (1 - ALPHA) * predicted
+                trend = BETA * (updated - level) + (1 - BETA) * PHI * trend
+            else:
+                updated, trend = predicted, PHI * trend
+            level = updated
+
+        row, damped = [], 0.0
+        for h in range(horizon):
+            damped += PHI ** (h + 1)
+            value = (level + trend * damped) * seasonal[(first_weekday + days + h) % SEASON]
+            row.append(max(0.0, value))
+        forecasts.append(row)
+    return forecasts
+
+
+def forecast_series(rows: Sequence[Sequence[float]], first_weekday: int, horizon: int) -> List[List[float]]:
+    """
+    Forecast ``horizon`` days after each daily series in ``rows``.
+    ``first_weekday`` is the weekday (Mon=0) of the first column.
+    """
+    if not rows:
+        return []
+    if np is not None:
+        return _forecast_numpy(rows, first_weekday, horizon)
+    return _forecast_python(rows, first_weekday, horizon)
+
+
+# ============================================================
+# DATA
+# ============================================================
+def _window(today: date):
+    start = today - timedelta(days=LOOKBACK_DAYS)
+    return start, today - timedelta(days=1)
+
+
+def _dense(points: Dict[date, float], start: date, days: int) -> List[float]:
+    return [points.get(start + timedelta(days=i), 0.0) for i in range(days)]
+
+
+def _build_demand_model(db: Session, company_id: int, today: date) -> Dict[int, List[float]]:
+    """{item_id: daily quantity forecast starting today} for every item sold in the window."""
+    start, end = _window(today)
+    rows = db.execute(
+        select(InvoiceItem.item_id, Invoice.invoice_date, func.sum(InvoiceItem.quantity))
+        .join(Invoice, Invoice.id == InvoiceItem.invoice_id)
+        .where(
+            Invoice.company_id == company_id,
+            Invoice.invoice_date >= start,
+            Invoice.invoice_date <= end,
+            Invoice.status != "CANCELLED",
+            InvoiceItem.item_id.isnot(None),
+        )
+        .group_by(InvoiceItem.item_id, Invoice.invoice_date)
+    )
+    points: Dict[int, Dict[date, float]] = {}
+    for item_id, day, qty in rows:
+        points.setdefault(item_id, {})[day] = float(qty or 0)
+
+    item_ids = sorted(points)
+    forecasts = forecast_series(
+        [_dense(points[i], start, LOOKBACK_DAYS) for i in item_ids], start.weekday(), HORIZON_DAYS
+    )
+    return dict(zip(item_ids, forecasts))
+
+
+def _build_sales_model(db: Session, company_id: int, today: date) -> List[float]:
+    start, end = _window(today)
+    rows = db.execute(
+        select(Invoice.invoice_date, func.sum(Invoice.grand_total))
+        .where(
+            Invoice.company_id == company_id,
+            Invoice.invoice_date >= start,
+            Invoice.invoice_date <= end,
+            Invoice.status != "CANCELLED",
+        )
+        .group_by(Invoice.invoice_date)
+    )
+    series = _dense({day: float(total or 0) for day, total in rows}, start, LOOKBACK_DAYS)
+    return forecast_series([series], start.weekday(), 8)[0]
+
+
+def _seconds_until_midnight() -> int:
+    now = datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(60, int((midnight - now).total_seconds()))
+
+
+def _cached(key: str, company_id: int, build):
+    value = report_cache.get(key)
+    if value is None:
+        value = build()
+        report_cache.set(key, value, ttl=_seconds_until_midnight(), tags=[company_tag(company_id)])
+    return value
+
+
+def get_demand_model(db: Session, company_id: int, today: date) -> Dict[int, List[float]]:
+    return _cached(
+        f"forecast:demand:{company_id}:{today.isoformat()}", company_id,
+        lambda: _build_demand_model(db, company_id, today),
+    )
+
+
+def get_sales_model(db: Session, company_id: int, today: date) -> List[float]:
+    """Forecast grand total for today and the next 7 days (8 values)."""
+    return _cached(
+        f"forecast:sales:{company_id}:{today.isoformat()}", company_id,
+        lambda: _build_sales_model(db, company_id, today),
+    )
+
+
+# ============================================================
+# STOCK FORECASTS
+# ============================================================
+def _days_to_stockout(stock: float, daily: Sequence[float]) -> float:
+    consumed = 0.0
+    for day, qty in enumerate(daily):
+        if consumed + qty >= stock:
+            return day + (stock - consumed) / qty
+        consumed += qty
+    burn = consumed / len(daily) if daily else 0.0
+    return len(daily) + (stock - consumed) / burn if burn > 0 else float("inf")
+
+
+def get_stock_forecasts(db: Session, company_id: int, today: date) -> List[Dict]:
+    """
+    Stock outlook for every item with recent demand and stock on hand.
+
+    Each row: item_id, item_name, current_stock, burn_rate (forecast average
+    over the next 14 days), days_remaining and daily_forecast.
+    """
+    model = get_demand_model(db, company_id, today)
+    if not model:
+        return []
+
+    items = db.execute(
+        select(Item.id, Item.name, Item.current_stock)
+        .where(Item.company_id == company_id, Item.id.in_(model.keys()))
+    )
+    outlook = []
+    for item_id, name, current_stock in items:
+        stock = float(current_stock or 0)
+        daily = model[item_id]
+        burn_rate = sum(daily[:14]) / 14
+        if stock <= 0 or burn_rate <= 0:
+            continue
+        outlook.append({
+            "item_id": item_id,
+            "item_name": name,
+            "current_stock": stock,
+            "burn_rate": burn_rate,
+            "days_remaining": _days_to_stockout(stock, daily),
+            "daily_forecast": daily,
+        })
+    outlook.sort(key=lambda row: row["days_remaining"])
+    return outlook
@@ -0,0 +1,358 @@
+"""
+job_work_snapshot_service.py
+============================
+Monthly job-work balance snapshots and the stock-summary engine built on them.
+
+The job-work stock summary (/reports/job-work/stock-summary, its PDF and the
+public verification page) needs an opening balance per (party, item) as of
+the report's start date. Computing it from raw challans means scanning the
+company's whole history on every request.
+
+Instead, ``job_work_stock_snapshots`` keeps one row per
+(company, party, item, month) with that month's inward / outward quantity.
+A report then reads:
+    opening = SUM(snapshot rows before the start month)
+            + challan rows from the start of that month up to start_date
+    inward / outward = challan rows in [start_date, end_date]
+so only the rows from the start month onwards are scanned.
+
+Maintenance is incremental: a Session listener records which
+(company, month) buckets a flush touched — party / delivery challans and
+their lines, including the month a row moved away from — and recomputes
+just those buckets in the same transaction right before commit.
+Bulk Query.update()/delete() bypass the listener; code doing that (e.g. the
+stock rebuild) calls ``rebuild_job_work_snapshots`` afterwards.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import case, delete, event, func, insert, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from app.models.delivery_challan import DeliveryChallan
+from app.models.delivery_challan_item import DeliveryChallanItem
+from app.models.item import Item
+from app.models.job_work_snapshot import JobWorkStockSnapshot
+from app.models.party import Party
+from app.models.party_challan import PartyChallan
+from app.models.party_challan_item import PartyChallanItem
+
+Bucket = Tuple[int, date]  # (company_id, period)
+
+
+def month_start(d: date) -> date:
+    if isinstance(d, datetime):
+        d = d.date()
+    return date(d.year, d.month, 1)
+
+
+def next_month(period: date) -> date:
+    if period.month == 12:
+        return date(period.year + 1, 1, 1)
+    return date(period.year, period.month + 1, 1)
+
+
+# ============================================================
+# SOURCE QUERIES (shared by snapshots and the report)
+# ============================================================
+def _inward_query(company_id: int, *columns):
+    return (
+        select(PartyChallan.party_id, PartyChallanItem.item_id, *columns)
+        .join(PartyChallan, PartyChallan.id == PartyChallanItem.party_challan_id)
+        .where(
+            PartyChallan.company_id == company_id,
+            PartyChallan.status != "cancelled",
+        )
+        .group_by(PartyChallan.party_id, PartyChallanItem.item_id)
+    )
+
+
+def _outward_query(company_id: int, *columns):
+    # Outward is booked against the party of the originating party challan
+    return (
+        select(PartyChallan.party_id, PartyChallanItem.item_id, *columns)
+        .select_from(DeliveryChallanItem)
+        .join(DeliveryChallan, DeliveryChallan.id == DeliveryChallanItem.challan_id)
+        .join(PartyChallanItem, PartyChallanItem.id == DeliveryChallanItem.party_challan_item_id)
+        .join(PartyChallan, PartyChallan.id == PartyChallanItem.party_challan_id)
+        .where(
+            DeliveryChallan.company_id == company_id,
+            DeliveryChallan.status != "cancelled",
+        )
+        .group_by(PartyChallan.party_id, PartyChallanItem.item_id)
+    )
+
+
+# ============================================================
+# SNAPSHOT MAINTENANCE
+# ============================================================
+def refresh_snapshot_period(db: Session, company_id: int, period: date) -> int:
+    """Recompute one company's snapshot rows for the month starting at ``period``."""
+    period = month_start(period)
+    upper = next_month(period)
+
+    totals: Dict[Tuple[int, int], List] = defaultdict(lambda: [0, 0])
+    inward = _inward_query(company_id, func.sum(PartyChallanItem.quantity_ordered)).where(
+        PartyChallan.challan_date >= period, PartyChallan.challan_date < upper
+    )
+    for party_id, item_id, qty in db.execute(inward):
+        totals[(party_id, item_id)][0] = qty or 0
+
+    outward = _outward_query(company_id, func.sum(DeliveryChallanItem.quantity)).where(
+        DeliveryChallan.challan_date >= period, DeliveryChallan.challan_date < upper
+    )
+    for party_id, item_id, qty in db.execute(outward):
+        totals[(party_id, item_id)][1] = qty or 0
+
+    db.execute(
+        delete(JobWorkStockSnapshot)
+        .where(
+            JobWorkStockSnapshot.company_id == company_id,
+            JobWorkStockSnapshot.period == period,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    rows = [
+        {
+            "company_id": company_id,
+            "party_id": party_id,
+            "item_id": item_id,
+            "period": period,
+            "inward_qty": inward_qty,
+            "outward_qty": outward_qty,
+        }
+        for (party_id, item_id), (inward_qty, outward_qty) in totals.items()
+        if inward_qty or outward_qty
+    ]
+    if rows:
+        db.execute(insert(JobWorkStockSnapshot), rows)
+    return len(rows)
+
+
+def rebuild_job_work_snapshots(db: Session, company_id: int) -> int:
+    """Drop and recompute every snapshot month for a company. Caller commits."""
+    periods: Set[date] = set()
+    for model in (PartyChallan, DeliveryChallan):
+        dates = db.execute(
+            select(model.challan_date).distinct().where(
+                model.company_id == company_id, model.challan_date.isnot(None)
+            )
+        )
+        periods.update(month_start(d) for (d,) in dates)
+
+    db.execute(
+        delete(JobWorkStockSnapshot)
+        .where(JobWorkStockSnapshot.company_id == company_id)
+        .execution_options(synchronize_session=False)
+    )
+    return sum(refresh_snapshot_period(db, company_id, p) for p in sorted(periods))
+
+
+# ============================================================
+# STOCK SUMMARY ENGINE
+# ============================================================
+def _normalize_party_filter(party_name) -> Optional[str]:
+    clean = party_name.strip().lower() if (party_name and isinstance(party_name, str)) else None
+    if clean in ["all", "all parties", "undefined", "null", "none", ""]:
+        return None
+    return clean
+
+
+def compute_job_work_stock_summary(
+    db: Session,
+    company_id: int,
+    start: date,
+    end: date,
+    party_name: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Opening / inward / outward / closing per (party, item) for [start, end].
+
+    Rows with no movement and no balance are skipped; ``party_name`` filters
+    on the party's name (case-insensitive, "all" means no filter).
+    """
+    period = month_start(start)
+    stock: Dict[Tuple[int, int], Dict[str, float]] = defaultdict(
+        lambda: {"opening": 0.0, "inward": 0.0, "outward": 0.0}
+    )
+
+    # 1. Balance carried in from whole months before the start month
+    opening = (
+        select(
+            JobWorkStockSnapshot.party_id,
+            JobWorkStockSnapshot.item_id,
+            func.sum(JobWorkStockSnapshot.inward_qty - JobWorkStockSnapshot.outward_qty),
+        )
+        .where(
+            JobWorkStockSnapshot.company_id == company_id,
+            JobWorkStockSnapshot.period < period,
+        )
+        .group_by(JobWorkStockSnapshot.party_id, JobWorkStockSnapshot.item_id)
+    )
+    for party_id, item_id, qty in db.execute(opening):
+        stock[(party_id, item_id)]["opening"] += float(qty or 0)
+
+    # 2. Challan rows from the start month onwards: before start -> opening, in range -> movement
+    def split(date_col, qty_col):
+        in_window = (date_col >= period) & or_(date_col < start, date_col <= end)
+        return (
+            func.sum(case((date_col < start, qty_col), else_=0)),
+            func.sum(case(((date_col >= start) & (date_col <= end), qty_col), else_=0)),
+            in_window,
+        )
+
+    before, during, window = split(PartyChallan.challan_date, PartyChallanItem.quantity_ordered)
+    for party_id, item_id, pre, qty in db.execute(_inward_query(company_id, before, during).where(window)):
+        stock[(party_id, item_id)]["opening"] += float(pre or 0)
+        stock[(party_id, item_id)]["inward"] += float(qty or 0)
+
+    before, during, window = split(DeliveryChallan.challan_date, DeliveryChallanItem.quantity)
+    for party_id, item_id, pre, qty in db.execute(_outward_query(company_id, before, during).where(window)):
+        stock[(party_id, item_id)]["opening"] -= float(pre or 0)
+        stock[(party_id, item_id)]["outward"] += float(qty or 0)
+
+    if not stock:
+        return []
+
+    # 3. Names in one query each
+    party_ids = {k[0] for k in stock}
+    item_ids = {k[1] for k in stock}
+    parties = {
+        row.id: row for row in db.execute(
+            select(Party.id, Party.name, Party.gst_number).where(Party.id.in_(party_ids))
+        )
+    }
+    items = {
+        row.id: row.name for row in db.execute(select(Item.id, Item.name).where(Item.id.in_(item_ids)))
+    }
+
+    clean_party = _normalize_party_filter(party_name)
+    result = []
+    for (party_id, item_id), v in stock.items():
+        if item_id not in items:
+            continue
+        party = parties.get(party_id)
+        row = {
+            "party_name": party.name if party else "Unknown",
+            "gstin": (party.gst_number or "") if party else "",
+            "item_name": items[item_id] or "Unknown",
+            "opening": v["opening"],
+            "inward": v["inward"],
+            "outward": v["outward"],
+            "closing": v["opening"] + v["inward"] - v["outward"],
+        }
+        if clean_party and (row["party_name"] or "").strip().lower() != clean_party:
+            continue
+        if abs(row["opening"]) > 0 or row["inward"] > 0 or row["outward"] > 0 or abs(row["closing"]) > 0:
+            result.append(row)
+
+    result.sort(key=lambda r: ((r["party_name"] or "").lower(), (r["item_name"] or "").lower()))
+    return result
+
+
+# ============================================================
+# SESSION LISTENERS (refresh touched months before commit)
+# ============================================================
+_PENDING_KEY = "job_work_snapshot_buckets"
+
+# Columns whose change moves quantity between buckets
+_TRACKED = {
+    PartyChallan: ("company_id", "party_id", "challan_date", "status"),
+    PartyChallanItem: ("party_challan_id", "item_id", "quantity_ordered"),
+    DeliveryChallan: ("company_id", "challan_date", "status"),
+    DeliveryChallanItem: ("challan_id", "party_challan_item_id", "quantity"),
+}
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+# Keys that decide which bucket a row lands in: load the previous value on
+# assignment (even on an expired instance) so the bucket it left is refreshed too
+for _model, _keys in (
+    (PartyChallan, ("company_id", "party_id", "challan_date")),
+    (PartyChallanItem, ("party_challan_id", "item_id")),
+    (DeliveryChallan, ("company_id", "challan_date")),
+    (DeliveryChallanItem, ("challan_id", "party_challan_item_id")),
+):
+    for _key in _keys:
+        event.listen(getattr(_model, _key), "set", _load_old_value, active_history=True, retval=True)
+
+
+def _values(state, key) -> list:
+    """Current and pre-flush values of an attribute (loaded values only)."""
+    hist = state.attrs[key].history
+    values = list(hist.added or ()) + list(hist.unchanged or ()) + list(hist.deleted or ())
+    if not values and key in state.dict:
+        values = [state.dict[key]]
+    return [v for v in values if v is not None]
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_snapshot_changes(session, flush_context):
+    buckets: Set[Bucket] = set()
+    pc_ids, dc_ids, pc_links, pci_links = set(), set(), set(), set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tracked = _TRACKED.get(type(obj))
+        if not tracked:
+            continue
+        state = inspect(obj)
+        if obj in session.dirty and not any(state.attrs[k].history.has_changes() for k in tracked):
+            continue
+
+        if isinstance(obj, (PartyChallan, DeliveryChallan)):
+            for company_id in _values(state, "company_id"):
+                for d in _values(state, "challan_date"):
+                    buckets.add((company_id, month_start(d)))
+            if isinstance(obj, PartyChallan) and state.attrs["party_id"].history.deleted:
+                pc_links.add(obj.id)  # outward rows follow the challan's party
+        elif isinstance(obj, PartyChallanItem):
+            pc_ids.update(_values(state, "party_challan_id"))
+            if state.attrs["item_id"].history.deleted:
+                pci_links.add(obj.id)
+        else:
+            dc_ids.update(_values(state, "challan_id"))
+
+    if pc_ids:
+        buckets.update(
+            (c, month_start(d)) for c, d in session.connection().execute(
+                select(PartyChallan.company_id, PartyChallan.challan_date)
+                .where(PartyChallan.id.in_(pc_ids), PartyChallan.challan_date.isnot(None))
+            )
+        )
+    if dc_ids or pc_links or pci_links:
+        linked = (
+            select(DeliveryChallan.company_id, DeliveryChallan.challan_date)
+            .outerjoin(DeliveryChallanItem, DeliveryChallanItem.challan_id == DeliveryChallan.id)
+            .outerjoin(PartyChallanItem, PartyChallanItem.id == DeliveryChallanItem.party_challan_item_id)
+            .where(
+                or_(
+                    DeliveryChallan.id.in_(dc_ids),
+                    PartyChallanItem.party_challan_id.in_(pc_links),
+                    PartyChallanItem.id.in_(pci_links),
+                ),
+                DeliveryChallan.challan_date.isnot(None),
+            )
+            .distinct()
+        )
+        buckets.update((c, month_start(d)) for c, d in session.connection().execute(linked))
+
+    if buckets:
+        session.info.setdefault(_PENDING_KEY, set()).update(buckets)
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_snapshots(session):
+    # Flush first so the final flush's changes are collected too
+    session.flush()
+    buckets = session.info.pop(_PENDING_KEY, None)
+    for company_id, period in sorted(buckets or ()):
+        refresh_snapshot_period(session, company_id, period)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_snapshot_changes(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,218 @@
+"""
+link_service.py
+===============
+Builds every public link the app hands out: QR codes on printed invoices /
+challans / reports, WhatsApp share links and public download URLs.
+
+get_backend_url() used to open a UDP socket toward 8.8.8.8 on every call,
+which ran once per invoice in a bulk print and once per challan in
+prepare_challan_print_data, and it ignored reverse-proxy headers, so QR
+codes behind nginx pointed at the internal address.
+
+Resolution order of base_url():
+    1. company.public_url   — per-tenant custom domain (Company profile)
+    2. BACKEND_URL          — explicit deployment override (unless localhost)
+    3. Forwarded / X-Forwarded-Proto / -Host / -Port / -Prefix of the request
+    4. LAN address          — probed once and cached; the desktop app re-probes
+                              every LINK_REFRESH_SECONDS so a Wi-Fi / network
+                              switch is picked up without a restart
+    5. BACKEND_URL as given, else http://localhost:8000
+
+Routes resolve the base once per request and pass it to the URL helpers:
+
+    base_url = link_service.base_url(request, company=company)
+    download_url = link_service.invoice_download_url(base_url, invoice.id)
+"""
+import re
+import socket
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+from fastapi import HTTPException, Request
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.security import create_url_signature
+
+DEFAULT_PORT = 8000
+COMPANY_URL_TTL = 300  # seconds a looked-up custom domain is reused
+
+_HOST_RE = re.compile(r"^[A-Za-z0-9.\-]+(:\d{1,5})?$|^\[[0-9A-Fa-f:.]+\](:\d{1,5})?$")
+_PREFIX_RE = re.compile(r"^(/[A-Za-z0-9._~\-]+)*/?$")
+_PUBLIC_URL_RE = re.compile(r"^https?://[A-Za-z0-9.\-]+(:\d{1,5})?(/[A-Za-z0-9._~\-/]*)?$")
+
+
+# ============================================================
+# HELPERS
+# ============================================================
+def _probe_lan_ip() -> Optional[str]:
+    """Address of the interface that routes to the internet (no packet is sent)."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("8.8.8.8", 80))
+            return s.getsockname()[0]
+    except OSError:
+        return None
+
+
+def _first(value: Optional[str]) -> str:
+    """First hop of a comma-separated proxy header."""
+    return (value or "").split(",")[0].strip()
+
+
+def _parse_forwarded(value: Optional[str]) -> Dict[str, str]:
+    """RFC 7239 ``Forwarded: for=..;proto=https;host=example.com`` (first hop)."""
+    result = {}
+    for pair in _first(value).split(";"):
+        key, _, val = pair.partition("=")
+        if val:
+            result[key.strip().lower()] = val.strip().strip('"')
+    return result
+
+
+def normalize_public_url(value: Optional[str]) -> Optional[str]:
+    """Validate a tenant custom domain; returns None to clear it."""
+    value = (value or "").strip().rstrip("/")
+    if not value:
+        return None
+    if "://" not in value:
+        value = f"https://{value}"
+    if not _PUBLIC_URL_RE.match(value):
+        raise HTTPException(status_code=400, detail="Public URL must look like https://billing.example.com")
+    return value
+
+
+# ============================================================
+# SERVICE
+# ============================================================
+class LinkService:
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._lan_url: Optional[str] = None
+        self._lan_checked_at: Optional[float] = None
+        self._company_urls: Dict[int, Tuple[Optional[str], float]] = {}
+
+    # ---------------- base URL ----------------
+    def base_url(
+        self,
+        request: Optional[Request] = None,
+        *,
+        company=None,
+        db=None,
+        company_id: Optional[int] = None,
+    ) -> str:
+        """Public base URL (no trailing slash) for links of one request."""
+        custom = self._company_url(company, db, company_id)
+        if custom:
+            return custom
+
+        configured = (settings.BACKEND_URL or "").rstrip("/")
+        if configured and "localhost" not in configured:
+            return configured
+
+        forwarded = self.forwarded_base_url(request) if request is not None else None
+        if forwarded:
+            return forwarded
+
+        lan_url = self.lan_url()
+        if lan_url:
+            return lan_url
+
+        return configured or f"http://localhost:{DEFAULT_PORT}"
+
+    def forwarded_base_url(self, request: Request) -> Optional[str]:
+        """Base URL as seen by the client when the app sits behind a reverse proxy."""
+        if not settings.TRUST_PROXY_HEADERS:
+            return None
+        headers = request.headers
+        forwarded = _parse_forwarded(headers.get("forwarded"))
+        proto = forwarded.get("proto") or _first(headers.get("x-forwarded-proto"))
+        host = forwarded.get("host") or _first(headers.get("x-forwarded-host"))
+        prefix = _first(headers.get("x-forwarded-prefix")).rstrip("/")
+        if not (proto or host or prefix):
+            return None
+
+        host = host or headers.get("host", "")
+        proto = proto.lower() if proto.lower() in ("http", "https") else request.url.scheme
+        port = _first(headers.get("x-forwarded-port"))
+        if port.isdigit() and ":" not in host.rsplit("]", 1)[-1]:
+            if (proto, port) not in (("http", "80"), ("https", "443")):
+                host = f"{host}:{port}"
+        if not _HOST_RE.match(host) or not _PREFIX_RE.match(prefix or "/"):
+            logger.warning(f"[Links] Ignoring malformed forwarded headers: host={host!r} prefix={prefix!r}")
+            return None
+        return f"{proto}://{host}{prefix}"
+
+    def lan_url(self) -> Optional[str]:
+        """Cached LAN URL; re-probed every ``refresh_seconds`` (0 = resolve once)."""
+        now = time.monotonic()
+        with self._lock:
+            fresh = self._lan_checked_at is not None and (
+                self.refresh_seconds <= 0 or now - self._lan_checked_at < self.refresh_seconds
+            )
+            if fresh:
+                return self._lan_url
+        return self.refresh()
+
+    def refresh(self) -> Optional[str]:
+        """Re-probe the LAN address (network change); returns the new LAN URL."""
+        lan_ip = _probe_lan_ip()
+        url = f"http://{lan_ip}:{DEFAULT_PORT}" if lan_ip else None
+        with self._lock:
+            previous, self._lan_url = self._lan_url, url
+            self._lan_checked_at = time.monotonic()
+        if previous != url:
+            logger.info(f"[Links] LAN base URL is now {url or 'unavailable'}")
+        return url
+
+    # ---------------- tenant domains ----------------
+    def _company_url(self, company, db, company_id: Optional[int]) -> Optional[str]:
+        if company is not None:
+            return getattr(company, "public_url", None) or None
+        if db is None or not company_id:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            cached = self._company_urls.get(company_id)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        from app.models.company import Company
+        value = db.query(Company.public_url).filter(Company.id == company_id).scalar() or None
+        with self._lock:
+            self._company_urls[company_id] = (value, now + COMPANY_URL_TTL)
+        return value
+
+    def invalidate_company(self, company_id: int) -> None:
+        with self._lock:
+            self._company_urls.pop(company_id, None)
+
+    # ---------------- link builders ----------------
+    @staticmethod
+    def url(base_url: str, path: str, **params) -> str:
+        """``base_url + path`` with ``params`` (None values dropped) as the query string."""
+        query = urlencode({k: v for k, v in params.items() if v is not None})
+        return f"{base_url}{path}?{query}" if query else f"{base_url}{path}"
+
+    def invoice_download_url(self, base_url: str, invoice_id: int) -> str:
+        return self.url(base_url, f"/public/invoice/{invoice_id}/download", token=create_url_signature(str(invoice_id)))
+
+    def challan_download_url(self, base_url: str, challan_id: int) -> str:
+        return self.url(base_url, f"/public/challan/{challan_id}/download", token=create_url_signature(str(challan_id)))
+
+    def challan_summary_url(self, base_url: str, challan_id: int) -> str:
+        return self.url(base_url, f"/public/challan/{challan_id}/summary", token=create_url_signature(str(challan_id)))
+
+    def short_url(self, base_url: str, kind: str, code: str) -> str:
+        return f"{base_url}/public/{kind}/dl/{code}"
+
+
+# Desktop builds follow the machine across networks; servers resolve once.
+link_service = LinkService(
+    refresh_seconds=settings.LINK_REFRESH_SECONDS if getattr(sys, "frozen", False) else 0,
+)
@@ -0,0 +1,378 @@
+"""
+party_ledger_service.py
+=======================
+Materialized per-party receivables (``party_ledger_summary``).
+
+Outstanding-balance math (opening + invoiced - received + paid, unpaid
+invoice amount, open PENDING/PARTIAL dues) used to be recomputed from the
+invoice and payment tables by every reader: the party list, AI insights,
+the client portal dashboard and the party statement. The summary keeps one
+row per (company, party, financial year, month) so those readers sum a
+handful of rows instead.
+
+Maintenance is transactional: a Session listener records which
+(company, party, month) buckets a flush touched — Invoice, Payment and
+PaymentAllocation writes, including the bucket a row moved away from — and
+recomputes them in the same transaction right before commit.
+
+``reconcile_party_ledger`` verifies the summary against the raw tables and
+rebuilds any party that drifted (e.g. after a manual SQL fix or a restore);
+it runs nightly from the backup scheduler.
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import case, delete, event, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from app.core.logger import logger
+from app.models.invoice import Invoice
+from app.models.party_ledger_summary import PartyLedgerSummary
+from app.models.payment import Payment
+from app.models.payment_allocation import PaymentAllocation
+from app.services.job_work_snapshot_service import month_start, next_month
+
+UNDATED = date(1900, 1, 1)  # bucket for invoices / payments without a date
+OPEN_STATUSES = ("PENDING", "PARTIAL")
+TOLERANCE = 0.005
+
+Bucket = Tuple[int, int, date]  # (company_id, party_id, period)
+
+_S = PartyLedgerSummary
+_FIELDS = ("invoice_total", "invoice_paid", "open_due", "open_invoices", "received_total", "paid_total")
+
+
+class PartyBalance(NamedTuple):
+    invoice_total: float = 0.0
+    invoice_paid: float = 0.0
+    open_due: float = 0.0
+    open_invoices: int = 0
+    received_total: float = 0.0
+    paid_total: float = 0.0
+
+    @property
+    def net(self) -> float:
+        """Invoiced - received + paid (add the party's opening balance for the ledger balance)."""
+        return self.invoice_total - self.received_total + self.paid_total
+
+    @property
+    def unpaid(self) -> float:
+        """Invoiced amount not yet settled by allocations."""
+        return self.invoice_total - self.invoice_paid
+
+
+def _period(d: Optional[date]) -> date:
+    return month_start(d) if d else UNDATED
+
+
+def _date_filter(column, period: date):
+    if period == UNDATED:
+        return (column.is_(None),)
+    return (column >= period, column < next_month(period))
+
+
+# ============================================================
+# RAW AGGREGATES (source of truth)
+# ============================================================
+def _invoice_aggregate(*group_by):
+    is_open = Invoice.payment_status.in_(OPEN_STATUSES)
+    return (
+        select(
+            *group_by,
+            func.sum(Invoice.grand_total),
+            func.sum(Invoice.paid_amount),
+            func.sum(case((is_open, Invoice.grand_total - Invoice.paid_amount), else_=0)),
+            func.sum(case((is_open, 1), else_=0)),
+        )
+        .where(Invoice.status != "CANCELLED")
+        .group_by(*group_by)
+    )
+
+
+def _payment_aggregate(*group_by):
+    return (
+        select(
+            *group_by,
+            func.sum(case((Payment.payment_type == "RECEIVED", Payment.amount), else_=0)),
+            func.sum(case((Payment.payment_type == "PAID", Payment.amount), else_=0)),
+        )
+        .group_by(*group_by)
+    )
+
+
+def _merge_raw(invoice_rows, payment_rows) -> Dict[tuple, List]:
+    """Fold invoice + payment aggregate rows into {key: [six field values]}."""
+    totals: Dict[tuple, List] = defaultdict(lambda: [0, 0, 0, 0, 0, 0])
+    for *key, inv_total, inv_paid, open_due, open_count in invoice_rows:
+        row = totals[tuple(key)]
+        row[0:4] = [inv_total or 0, inv_paid or 0, open_due or 0, open_count or 0]
+    for *key, received, paid in payment_rows:
+        row = totals[tuple(key)]
+        row[4:6] = [received or 0, paid or 0]
+    return totals
+
+
+# ============================================================
+# MAINTENANCE
+# ============================================================
+def refresh_party_period(db: Session, company_id: int, party_id: int, period: date) -> int:
+    """Recompute one party's summary rows for one month (all financial years)."""
+    invoices = _invoice_aggregate(Invoice.financial_year_id).where(
+        Invoice.company_id == company_id,
+        Invoice.party_id == party_id,
+        *_date_filter(Invoice.invoice_date, period),
+    )
+    payments = _payment_aggregate(Payment.financial_year_id).where(
+        Payment.company_id == company_id,
+        Payment.party_id == party_id,
+        *_date_filter(Payment.payment_date, period),
+    )
+    totals = _merge_raw(db.execute(invoices), db.execute(payments))
+
+    db.execute(
+        delete(_S)
+        .where(_S.company_id == company_id, _S.party_id == party_id, _S.period == period)
+        .execution_options(synchronize_session=False)
+    )
+    rows = [
+        dict(zip(_FIELDS, values), company_id=company_id, party_id=party_id,
+             financial_year_id=fy_id, period=period)
+        for (fy_id,), values in totals.items()
+        if any(values)
+    ]
+    if rows:
+        db.execute(insert(_S), rows)
+    return len(rows)
+
+
+def rebuild_party_ledger(db: Session, company_id: int, party_id: Optional[int] = None) -> int:
+    """Drop and recompute summary rows for a company (or one party). Caller commits."""
+    buckets: Set[Tuple[int, date]] = set()
+    for model, date_col in ((Invoice, Invoice.invoice_date), (Payment, Payment.payment_date)):
+        query = select(model.party_id, date_col).distinct().where(model.company_id == company_id)
+        if party_id is not None:
+            query = query.where(model.party_id == party_id)
+        buckets.update((pid, _period(d)) for pid, d in db.execute(query))
+
+    wipe = delete(_S).where(_S.company_id == company_id)
+    if party_id is not None:
+        wipe = wipe.where(_S.party_id == party_id)
+    db.execute(wipe.execution_options(synchronize_session=False))
+    return sum(refresh_party_period(db, company_id, pid, period) for pid, period in sorted(buckets))
+
+
+# ============================================================
+# READERS
+# ============================================================
+def _to_balance(values) -> PartyBalance:
+    inv_total, inv_paid, open_due, open_count, received, paid = values
+    return PartyBalance(
+        float(inv_total or 0), float(inv_paid or 0), float(open_due or 0),
+        int(open_count or 0), float(received or 0), float(paid or 0),
+    )
+
+
+def party_totals_query(company_id: int, financial_year_id: Optional[int] = None):
+    """Select of (party_id, <summed summary fields>) for a company; usable as a subquery."""
+    query = (
+        select(_S.party_id, *[func.sum(getattr(_S, f)).label(f) for f in _FIELDS])
+        .where(_S.company_id == company_id)
+        .group_by(_S.party_id)
+    )
+    if financial_year_id is not None:
+        query = query.where(_S.financial_year_id == financial_year_id)
+    return query
+
+
+def get_party_balances(
+    db: Session,
+    company_id: int,
+    party_ids: Optional[Iterable[int]] = None,
+    financial_year_id: Optional[int] = None,
+) -> Dict[int, PartyBalance]:
+    """Summed totals per party (optionally limited to parties / one financial year)."""
+    query = party_totals_query(company_id, financial_year_id)
+    if party_ids is not None:
+        query = query.where(_S.party_id.in_(list(party_ids)))
+    return {party_id: _to_balance(values) for party_id, *values in db.execute(query)}
+
+
+def get_party_balance(db: Session, company_id: int, party_id: int,
+                      financial_year_id: Optional[int] = None) -> PartyBalance:
+    return get_party_balances(db, company_id, [party_id], financial_year_id).get(party_id, PartyBalance())
+
+
+def get_party_balance_before(db: Session, company_id: int, party_id: int, before: date) -> PartyBalance:
+    """
+    Totals of invoices / payments dated strictly before ``before``: whole months
+    from the summary plus the raw rows of ``before``'s own month.
+    """
+    period = month_start(before)
+    summed = db.execute(
+        select(*[func.sum(getattr(_S, f)) for f in _FIELDS]).where(
+            _S.company_id == company_id,
+            _S.party_id == party_id,
+            _S.period < period,
+            _S.period != UNDATED,
+        )
+    ).one()
+
+    invoices = _invoice_aggregate(Invoice.party_id).where(
+        Invoice.company_id == company_id,
+        Invoice.party_id == party_id,
+        Invoice.invoice_date >= period,
+        Invoice.invoice_date < before,
+    )
+    payments = _payment_aggregate(Payment.party_id).where(
+        Payment.company_id == company_id,
+        Payment.party_id == party_id,
+        Payment.payment_date >= period,
+        Payment.payment_date < before,
+    )
+    partial = _merge_raw(db.execute(invoices), db.execute(payments)).get((party_id,), [0] * 6)
+    return _to_balance([(a or 0) + (b or 0) for a, b in zip(summed, partial)])
+
+
+# ============================================================
+# RECONCILIATION
+# ============================================================
+def reconcile_party_ledger(db: Session, company_id: Optional[int] = None, repair: bool = True) -> List[Dict]:
+    """
+    Compare summary totals per party with the raw invoice / payment tables.
+    Returns the mismatches found; with ``repair`` the affected parties are
+    rebuilt (caller commits).
+    """
+    invoices = _invoice_aggregate(Invoice.company_id, Invoice.party_id)
+    payments = _payment_aggregate(Payment.company_id, Payment.party_id)
+    stored = select(_S.company_id, _S.party_id, *[func.sum(getattr(_S, f)) for f in _FIELDS]).group_by(
+        _S.company_id, _S.party_id
+    )
+    if company_id is not None:
+        invoices = invoices.where(Invoice.company_id == company_id)
+        payments = payments.where(Payment.company_id == company_id)
+        stored = stored.where(_S.company_id == company_id)
+
+    expected = _merge_raw(db.execute(invoices), db.execute(payments))
+    actual = {(cid, pid): values for cid, pid, *values in db.execute(stored)}
+
+    mismatches = []
+    for key in set(expected) | set(actual):
+        want = _to_balance(expected.get(key, [0] * 6))
+        have = _to_balance(actual.get(key, [0] * 6))
+        for field in _FIELDS:
+            if abs(getattr(want, field) - getattr(have, field)) > TOLERANCE:
+                mismatches.append({
+                    "company_id": key[0], "party_id": key[1], "field": field,
+                    "expected": getattr(want, field), "actual": getattr(have, field),
+                })
+
+    if repair:
+        for cid, pid in sorted({(m["company_id"], m["party_id"]) for m in mismatches}):
+            rebuild_party_ledger(db, cid, pid)
+    return mismatches
+
+
+def run_party_ledger_reconciliation() -> int:
+    """Scheduler entry point: reconcile every company with its own session."""
+    from app.database.session import SessionLocal
+
+    db = SessionLocal()
+    try:
+        mismatches = reconcile_party_ledger(db)
+        db.commit()
+        if mismatches:
+            parties = {(m["company_id"], m["party_id"]) for m in mismatches}
+            logger.warning(f"[PartyLedger] Repaired {len(parties)} drifted party summaries")
+        return len(mismatches)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"[PartyLedger] Reconciliation failed: {e}")
+        return -1
+    finally:
+        db.close()
+
+
+# ============================================================
+# SESSION LISTENERS (refresh touched buckets before commit)
+# ============================================================
+_PENDING_KEY = "party_ledger_buckets"
+
+# Columns whose change alters a bucket's totals
+_TRACKED = {
+    Invoice: ("company_id", "party_id", "financial_year_id", "invoice_date",
+              "grand_total", "paid_amount", "payment_status", "status"),
+    Payment: ("company_id", "party_id", "financial_year_id", "payment_date", "amount", "payment_type"),
+    PaymentAllocation: ("invoice_id", "amount"),
+}
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+# Keys that decide a row's bucket: load the previous value on assignment
+for _model, _keys in (
+    (Invoice, ("company_id", "party_id", "invoice_date")),
+    (Payment, ("company_id", "party_id", "payment_date")),
+    (PaymentAllocation, ("invoice_id",)),
+):
+    for _key in _keys:
+        event.listen(getattr(_model, _key), "set", _load_old_value, active_history=True, retval=True)
+
+
+def _values(state, key) -> list:
+    hist = state.attrs[key].history
+    values = list(hist.added or ()) + list(hist.unchanged or ()) + list(hist.deleted or ())
+    if not values and key in state.dict:
+        values = [state.dict[key]]
+    return values
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_party_ledger_changes(session, flush_context):
+    buckets: Set[Bucket] = set()
+    invoice_ids = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tracked = _TRACKED.get(type(obj))
+        if not tracked:
+            continue
+        state = inspect(obj)
+        if obj in session.dirty and not any(state.attrs[k].history.has_changes() for k in tracked):
+            continue
+
+        if isinstance(obj, PaymentAllocation):
+            invoice_ids.update(v for v in _values(state, "invoice_id") if v is not None)
+            continue
+
+        date_key = "invoice_date" if isinstance(obj, Invoice) else "payment_date"
+        for company_id in _values(state, "company_id"):
+            for party_id in _values(state, "party_id"):
+                for d in _values(state, date_key) or [None]:
+                    if company_id is not None and party_id is not None:
+                        buckets.add((company_id, party_id, _period(d)))
+
+    if invoice_ids:
+        buckets.update(
+            (c, p, _period(d)) for c, p, d in session.connection().execute(
+                select(Invoice.company_id, Invoice.party_id, Invoice.invoice_date)
+                .where(Invoice.id.in_(invoice_ids))
+            )
+        )
+
+    if buckets:
+        session.info.setdefault(_PENDING_KEY, set()).update(buckets)
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_party_ledger(session):
+    session.flush()
+    buckets = session.info.pop(_PENDING_KEY, None)
+    for company_id, party_id, period in sorted(buckets or ()):
+        refresh_party_period(session, company_id, party_id, period)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_party_ledger_changes(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,310 @@
+"""
+payroll_service.py
+==================
+Salary slips for one or many employees from a fixed number of queries.
+
+``/employees/{id}/salary`` used to compute one employee per request with
+about six queries of its own, plus an ``ALTER TABLE salary_advances`` and a
+commit every time it was called. A payroll of 150 employees meant 150 HTTP
+calls, each running DDL. (The advance columns now come from migration
+b5e8d1f3a7c9.)
+
+``compute_salary_slips`` loads the inputs for all requested employees at
+once and then computes every slip in memory. The inputs are the company
+off days, attendance, holidays, salary expenses already booked (the "is
+paid" check) and salary advances. The rules are unchanged and the single
+employee route uses the same code, so both paths always agree.
+
+``pay_salary_slips`` books the unpaid slips of a run together: one Expense
+per employee and one UPDATE settling the advances, in one transaction.
+Slips are computed before that transaction, so two runs for the same month
+could both see an employee as unpaid. The paid check is therefore repeated
+inside it, after the company's payroll lock (PostgreSQL advisory lock) or
+the SQLite write lock (taken by the first INSERT) is held.
+"""
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, or_, text, update
+from sqlalchemy.orm import Session, joinedload
+
+from app.models.attendance import Attendance, AttendanceStatus
+from app.models.company import Company
+from app.models.employee_profile import SalaryType
+from app.models.expense import Expense
+from app.models.holiday import Holiday
+from app.models.role import Role
+from app.models.salary_advance import SalaryAdvance
+from app.models.user import User
+from app.schemas.user import SalarySlip
+
+PAYROLL_LOCK_NAMESPACE = 5265753  # "PAY"
+
+
+class _DefaultProfile:
+    """Stand-in for employees without an EmployeeProfile."""
+    base_salary = 0.0
+    salary_type = SalaryType.MONTHLY
+    work_hours_per_day = 8.0
+    enable_tds = False
+    tds_percentage = 0.0
+    professional_tax = 0.0
+
+
+def salary_description(name: str, month: int, year: int) -> str:
+    """Expense description of a salary payment (also the "is paid" key)."""
+    return f"Salary for {name} - {date(year, month, 1).strftime('%B')} {year}"
+
+
+def load_employees(db: Session, company_id: int, user_ids: Optional[List[int]] = None) -> List[User]:
+    """Users with their profiles: the given ids, or every "Employee" of the company."""
+    query = db.query(User).options(joinedload(User.employee_profile)).filter(User.company_id == company_id)
+    if user_ids is None:
+        query = query.join(Role, Role.id == User.role_id).filter(Role.name == "Employee")
+    else:
+        query = query.filter(User.id.in_(user_ids))
+    return query.order_by(User.id).all()
+
+
+# ============================================================
+# COMPUTE
+# ============================================================
+def compute_salary_slips(
+    db: Session,
+    company_id: int,
+    month: int,
+    year: int,
+    users: List[User],
+    deduct_advances: bool = True,
+) -> List[SalarySlip]:
+    """Salary slips for ``users`` (in the same order), from one query per input table."""
+    if not users:
+        return []
+    user_ids = [u.id for u in users]
+    _, days_in_month = monthrange(year, month)
+    first_day, last_day = date(year, month, 1), date(year, month, days_in_month)
+
+    company = db.query(Company.off_days).filter(Company.id == company_id).first()
+    off_days = company.off_days if company and company.off_days else []  # List of ints [0-6]
+    off_days_count = sum(1 for day in range(1, days_in_month + 1) if date(year, month, day).weekday() in off_days)
+    working_days_in_month = max(1, days_in_month - off_days_count)
+
+    attendance = defaultdict(list)
+    for r in db.query(Attendance).filter(
+        Attendance.user_id.in_(user_ids),
+        Attendance.date.between(first_day, last_day),
+    ):
+        attendance[r.user_id].append(r)
+
+    holiday_dates = {
+        row.date for row in db.query(Holiday.date).filter(
+            Holiday.company_id == company_id,
+            Holiday.date.between(first_day, last_day),
+        )
+    }
+
+    descriptions = {u.id: salary_description(u.name, month, year) for u in users}
+    paid_descriptions = {
+        row.description for row in db.query(Expense.description).filter(
+            Expense.company_id == company_id,
+            Expense.category == "Salary",
+            Expense.description.in_(set(descriptions.values())),
+        )
+    }
+
+    # Advances settled in this month, plus everything dated up to its end
+    advances = defaultdict(list)
+    for adv in db.query(SalaryAdvance).filter(
+        SalaryAdvance.user_id.in_(user_ids),
+        or_(
+            and_(SalaryAdvance.deducted_month == month, SalaryAdvance.deducted_year == year),
+            SalaryAdvance.date <= last_day,
+        ),
+    ).order_by(SalaryAdvance.date.asc(), SalaryAdvance.id.asc()):
+        advances[adv.user_id].append(adv)
+
+    slips, claimed_legacy = [], False
+    for user in users:
+        is_paid = descriptions[user.id] in paid_descriptions
+        user_advances = advances[user.id]
+        if is_paid:
+            # Advances deducted by this month's payment
+            deducted = [a for a in user_advances if a.deducted_month == month and a.deducted_year == year]
+            # Legacy fallback for historical paid records created before deducted_month tracking
+            if not deducted and deduct_advances:
+                deducted = [
+                    a for a in user_advances
+                    if a.date <= last_day and a.is_deducted is True and a.deducted_month is None
+                ]
+                for adv in deducted:
+                    adv.deducted_month = month
+                    adv.deducted_year = year
+                    claimed_legacy = True
+        elif deduct_advances:
+            # Pending salary: all unsettled advances up to the end of the month
+            deducted = [a for a in user_advances if a.date <= last_day and a.is_deducted is False]
+        else:
+            deducted = []
+
+        slips.append(_slip(
+            user, month, year, working_days_in_month, attendance[user.id], holiday_dates,
+            sum(float(a.amount) for a in deducted), is_paid,
+        ))
+
+    if claimed_legacy:
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+    return slips
+
+
+def _slip(user, month, year, working_days_in_month, records, holiday_dates, total_advances, is_paid) -> SalarySlip:
+    profile = user.employee_profile or _DefaultProfile()
+    base_salary = float(profile.base_salary or 0.0)
+
+    # Exact hourly rate for overtime, based on salary type
+    daily_work_hours = float(profile.work_hours_per_day) if profile.work_hours_per_day else 8.0
+    if profile.salary_type == SalaryType.DAILY:
+        effective_daily_rate = base_salary
+    else:
+        effective_daily_rate = base_salary / working_days_in_month
+    hourly_rate = effective_daily_rate / daily_work_hours
+
+    total_hours_worked = 0.0
+    total_overtime_pay = 0.0
+    total_bonus = 0.0
+    for r in records:
+        # Exact hours worked if provided, else the status (old / legacy records)
+        if r.hours_worked and float(r.hours_worked) > 0:
+            total_hours_worked += float(r.hours_worked)
+        elif r.status == AttendanceStatus.PRESENT:
+            total_hours_worked += daily_work_hours
+        elif r.status == AttendanceStatus.HALF_DAY:
+            total_hours_worked += (daily_work_hours / 2.0)
+
+        if r.overtime_hours:
+            total_overtime_pay += float(r.overtime_hours) * hourly_rate
+        if r.bonus_amount:
+            total_bonus += float(r.bonus_amount)
+
+    # Exact hours as equivalent 'present days' for the daily rate
+    present_days = total_hours_worked / daily_work_hours if daily_work_hours > 0 else 0.0
+
+    calculated_amount = 0.0
+    if profile.salary_type == SalaryType.MONTHLY:
+        # Holidays without attendance are paid days for monthly salaries
+        attended_dates = {r.date for r in records}
+        present_days += sum(1.0 for h_date in holiday_dates if h_date not in attended_dates)
+        calculated_amount = (base_salary / working_days_in_month) * present_days
+    elif profile.salary_type == SalaryType.DAILY:
+        calculated_amount = base_salary * present_days
+
+    # Gross Earnings = Base Pay + OT + Bonus
+    gross_earnings = calculated_amount + total_overtime_pay + total_bonus
+    if profile.enable_tds:
+        tds_percentage = float(profile.tds_percentage) if profile.tds_percentage else 0.0
+        tax_deduction = (gross_earnings * tds_percentage) / 100
+    else:
+        tax_deduction = 0.0
+    professional_tax = float(profile.professional_tax) if profile.professional_tax else 0.0
+
+    final_payable = gross_earnings - total_advances - tax_deduction - professional_tax
+
+    return SalarySlip(
+        user_id=user.id,
+        month=f"{year}-{month:02d}",
+        base_salary=base_salary,
+        salary_type=profile.salary_type.value if profile.salary_type else "monthly",
+        total_days=working_days_in_month,
+        present_days=present_days,
+        total_overtime_pay=round(total_overtime_pay, 2),
+        total_bonus=round(total_bonus, 2),
+        total_advances_deducted=round(total_advances, 2),
+        tax_deduction=round(tax_deduction, 2),
+        professional_tax_deduction=round(professional_tax, 2),
+        final_payable=round(final_payable, 2),
+        is_paid=is_paid,
+    )
+
+
+# ============================================================
+# PAY
+# ============================================================
+def pay_salary_slips(
+    db: Session,
+    company_id: int,
+    fy_id: int,
+    month: int,
+    year: int,
+    users: List[User],
+    slips: List[SalarySlip],
+    payment_method: str = "Cash",
+    deduct_advances: bool = True,
+) -> Dict[int, int]:
+    """
+    Book every unpaid slip with a positive amount in one transaction.
+    Returns {user_id: expense_id} for the slips paid now.
+    """
+    names = {u.id: u.name for u in users}
+    expenses = {
+        slip.user_id: Expense(
+            company_id=company_id,
+            financial_year_id=fy_id,
+            date=date.today(),
+            category="Salary",
+            description=salary_description(names[slip.user_id], month, year),
+            amount=slip.final_payable,
+            payment_method=payment_method,
+            payee_name=names[slip.user_id],  # Employee name for cheque printing
+            status="PAID",
+        )
+        for slip in slips
+        if not slip.is_paid and slip.final_payable > 0
+    }
+    if not expenses:
+        return {}
+
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(:namespace, :company_id)"),
+            {"namespace": PAYROLL_LOCK_NAMESPACE, "company_id": company_id},
+        )
+    db.add_all(expenses.values())
+    db.flush()
+
+    # Re-check under the lock: a concurrent run may have paid some already
+    already_paid = {
+        row.description for row in db.query(Expense.description).filter(
+            Expense.company_id == company_id,
+            Expense.category == "Salary",
+            Expense.description.in_([e.description for e in expenses.values()]),
+            Expense.id.notin_([e.id for e in expenses.values()]),
+        )
+    }
+    for user_id, expense in list(expenses.items()):
+        if expense.description in already_paid:
+            db.delete(expense)
+            del expenses[user_id]
+    if not expenses:
+        db.rollback()
+        return {}
+
+    # Settle pending advances up to this month for the employees paid now
+    if deduct_advances:
+        _, days_in_month = monthrange(year, month)
+        db.execute(
+            update(SalaryAdvance)
+            .where(
+                SalaryAdvance.user_id.in_(list(expenses)),
+                SalaryAdvance.date <= date(year, month, days_in_month),
+                SalaryAdvance.is_deducted == False,
+            )
+            .values(is_deducted=True, deducted_month=month, deducted_year=year)
+            .execution_options(synchronize_session=False)
+        )
+
+    db.commit()
+    return {user_id: expense.id for user_id, expense in expenses.items()}
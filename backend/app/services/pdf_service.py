@@ -1,25 +1,367 @@
-# Client-Side PDF Generation Bypass
-# Playwright and WeasyPrint are disabled to prevent crashes on shared hosting environments (like WebHostMost)
-# This module now simply returns the raw HTML string encoded as bytes.
-# The frontend will render this HTML in a hidden iframe and trigger the native browser print dialog.
+"""
+pdf_service.py
+==============
+Server-side PDF rendering behind ``generate_pdf(html, options)``.
 
+PDF_BACKEND selects what the print routes return:
+    html        — (default) the raw HTML as bytes; the frontend renders it in a
+                  hidden iframe and triggers the browser print dialog. Safe on
+                  shared hosting (no WeasyPrint / Chromium needed).
+    weasyprint  — real PDFs rendered by WeasyPrint
+    chromium    — real PDFs rendered by headless Chromium (Playwright), one warm
+                  browser per worker
+    module:func — custom renderer factory (``func()`` returns ``render(html, options)``)
+
+Real backends run in PDF_WORKERS worker processes started by
+``pdf_manager.start()`` (spawned, so the desktop build works too). A
+pathological template can only take down its worker: a job that exceeds
+PDF_JOB_TIMEOUT is killed (504), a worker that crashes is replaced (500), and
+every worker is recycled after PDF_MAX_JOBS_PER_WORKER jobs to cap memory
+growth. At most PDF_QUEUE_SIZE requests wait for a free worker; the rest get a
+503 with Retry-After.
+
+If the backend cannot start (e.g. WeasyPrint system libraries missing) the
+manager logs the error and falls back to returning HTML. Routes should pick the
+response type with ``media_type_for(content)``.
+
+``options`` follow Playwright's page.pdf(): format, landscape, margin, print_background.
+"""
+import asyncio
+import importlib
+import multiprocessing
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import Response, StreamingResponse
+
+from app.core.config import settings
+from app.core.logger import logger
+
+WORKER_START_TIMEOUT = 60.0
+
+
+def media_type_for(content: bytes) -> str:
+    """Content type of a generate_pdf() result (PDF when a real backend rendered it)."""
+    return "application/pdf" if content[:5] == b"%PDF-" else "text/html"
+
+
+# ============================================================
+# RENDERERS (run inside the worker processes)
+# ============================================================
+def _page_css(options: Dict[str, Any]) -> str:
+    size = options.get("format", "A4")
+    orientation = "landscape" if options.get("landscape") else "portrait"
+    rules = [f"size: {size} {orientation};"]
+    margin = options.get("margin") or {}
+    if margin:
+        sides = [margin.get(side, "0") for side in ("top", "right", "bottom", "left")]
+        rules.append(f"margin: {' '.join(sides)};")
+    return "@page { " + " ".join(rules) + " }"
+
+
+def _weasyprint_renderer():
+    from weasyprint import CSS, HTML
+
+    def render(html: str, options: Dict[str, Any]) -> bytes:
+        return HTML(string=html).write_pdf(stylesheets=[CSS(string=_page_css(options))])
+
+    return render
+
+
+def _chromium_renderer():
+    from playwright.sync_api import sync_playwright
+
+    playwright = sync_playwright().start()
+    browser = playwright.chromium.launch(args=["--no-sandbox", "--disable-dev-shm-usage"])
+
+    def render(html: str, options: Dict[str, Any]) -> bytes:
+        pdf_options = {"format": "A4", "print_background": True}
+        pdf_options.update({k: v for k, v in options.items() if k in ("format", "landscape", "margin", "print_background")})
+        page = browser.new_page()
+        try:
+            page.set_content(html, wait_until="load")
+            return page.pdf(**pdf_options)
+        finally:
+            page.close()
+
+    return render
+
+
+_RENDERERS = {
+    "weasyprint": _weasyprint_renderer,
+    "chromium": _chromium_renderer,
+}
+
+
+def _load_renderer(backend: str):
+    factory = _RENDERERS.get(backend)
+    if factory is None:
+        module_name, _, attr = backend.partition(":")
+        factory = getattr(importlib.import_module(module_name), attr)
+    return factory()
+
+
+def _worker_main(conn, backend: str) -> None:
+    """Worker process loop: load the renderer once, then serve (html, options) jobs."""
+    try:
+        render = _load_renderer(backend)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if job is None:
+            break
+        html, options = job
+        try:
+            conn.send(("ok", render(html, options or {})))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+# ============================================================
+# WORKERS (parent side)
+# ============================================================
+class _RenderError(Exception):
+    pass
+
+
+class _Worker:
+    def __init__(self, backend: str):
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, backend), name="pdf-worker", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+        if not self.conn.poll(WORKER_START_TIMEOUT):
+            self.kill()
+            raise _RenderError("worker did not start in time")
+        state, detail = self.conn.recv()
+        if state != "ready":
+            self.kill()
+            raise _RenderError(detail)
+
+    def call(self, html: str, options: Optional[Dict[str, Any]], timeout: float) -> bytes:
+        """Blocking: send one job and wait for its result (TimeoutError / EOFError on failure)."""
+        self.jobs += 1
+        self.conn.send((html, options))
+        if not self.conn.poll(timeout):
+            raise TimeoutError
+        state, payload = self.conn.recv()
+        if state != "ok":
+            raise _RenderError(payload)
+        return payload
+
+    def close(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(2)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(2)
+        self.conn.close()
+
+
+# ============================================================
+# MANAGER
+# ============================================================
 class PDFManager:
-    """Mock PDFManager for compatibility with existing routes"""
+    def __init__(
+        self,
+        backend: str = "html",
+        workers: int = 2,
+        queue_size: int = 16,
+        queue_timeout: float = 30.0,
+        job_timeout: float = 60.0,
+        max_jobs_per_worker: int = 200,
+    ):
+        backend = (backend or "html").strip()
+        self.backend = backend if ":" in backend else backend.lower()
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.queue_timeout = queue_timeout
+        self.job_timeout = job_timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._idle: Optional[asyncio.Queue] = None
+        self._pending = set()
+        self._waiting = 0
+        self._stats = {"jobs": 0, "timeouts": 0, "crashes": 0, "errors": 0, "rejected": 0, "recycled": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._idle is not None
+
     async def start(self):
-        pass
-        
+        if self.backend == "html" or self.running:
+            return
+        try:
+            first = await asyncio.to_thread(_Worker, self.backend)
+        except Exception as e:
+            logger.error(f"[PDF] Backend '{self.backend}' unavailable, falling back to HTML output: {e}")
+            return
+
+        self._idle = asyncio.Queue()
+        self._idle.put_nowait(first)
+        for _ in range(self.workers - 1):
+            self._spawn_replacement()
+        logger.info(f"[PDF] Started {self.workers} '{self.backend}' worker(s)")
+
     async def stop(self):
-        pass
+        if not self.running:
+            return
+        idle, self._idle = self._idle, None
+        for task in list(self._pending):
+            task.cancel()
+        while not idle.empty():
+            await asyncio.to_thread(idle.get_nowait().close)
+
+    def _spawn_replacement(self) -> None:
+        async def spawn():
+            try:
+                worker = await asyncio.to_thread(_Worker, self.backend)
+            except Exception as e:
+                logger.error(f"[PDF] Could not start a replacement worker: {e}")
+                return
+            if self._idle is None:
+                await asyncio.to_thread(worker.close)
+            else:
+                self._idle.put_nowait(worker)
+
+        task = asyncio.get_running_loop().create_task(spawn())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _acquire(self) -> "_Worker":
+        idle = self._idle
+        if idle.empty() and self._waiting >= self.queue_size:
+            self._stats["rejected"] += 1
+            raise self._busy()
+        self._waiting += 1
+        try:
+            return await asyncio.wait_for(idle.get(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._stats["rejected"] += 1
+            raise self._busy()
+        finally:
+            self._waiting -= 1
+
+    @staticmethod
+    def _busy() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="PDF renderer is busy. Please retry in a moment.",
+            headers={"Retry-After": "5"},
+        )
 
     async def generate(self, html_content: str, options: dict = None) -> bytes:
-        return html_content.encode("utf-8")
+        if not self.running:
+            return html_content.encode("utf-8")
+
+        worker = await self._acquire()
+        started = time.perf_counter()
+        try:
+            pdf = await asyncio.to_thread(worker.call, html_content, options, self.job_timeout)
+            self._stats["jobs"] += 1
+            return pdf
+        except TimeoutError:
+            self._stats["timeouts"] += 1
+            worker.kill()
+            worker = None
+            logger.error(f"[PDF] Job exceeded {self.job_timeout}s, worker killed")
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="PDF rendering timed out")
+        except _RenderError as e:
+            self._stats["errors"] += 1
+            logger.error(f"[PDF] Rendering failed: {e}")
+            raise HTTPException(status_code=500, detail=f"PDF rendering failed: {e}")
+        except (EOFError, OSError):
+            self._stats["crashes"] += 1
+            worker.kill()
+            worker = None
+            logger.error("[PDF] Worker crashed while rendering, replacing it")
+            raise HTTPException(status_code=500, detail="PDF renderer crashed")
+        except asyncio.CancelledError:
+            # Client went away mid-job: the worker is still busy, so replace it
+            worker.kill()
+            worker = None
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if elapsed > 5:
+                logger.warning(f"[PDF] Slow job: {elapsed * 1000:.0f}ms")
+            if worker is not None and worker.jobs >= self.max_jobs_per_worker:
+                self._stats["recycled"] += 1
+                await asyncio.to_thread(worker.close)
+                worker = None
+            if self._idle is not None:
+                if worker is None:
+                    self._spawn_replacement()
+                else:
+                    self._idle.put_nowait(worker)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend if self.running else "html",
+            "workers": self.workers if self.running else 0,
+            "idle": self._idle.qsize() if self.running else 0,
+            "waiting": self._waiting,
+            **self._stats,
+        }
+
+
+pdf_manager = PDFManager(
+    backend=settings.PDF_BACKEND,
+    workers=settings.PDF_WORKERS,
+    queue_size=settings.PDF_QUEUE_SIZE,
+    queue_timeout=settings.PDF_QUEUE_TIMEOUT,
+    job_timeout=settings.PDF_JOB_TIMEOUT,
+    max_jobs_per_worker=settings.PDF_MAX_JOBS_PER_WORKER,
+)
 
-pdf_manager = PDFManager()
 
 async def generate_pdf(html_content: str, options: dict = None) -> bytes:
     """
-    Bypasses server-side PDF generation.
-    Returns the raw HTML string as bytes.
-    The frontend is responsible for triggering window.print() on this HTML.
+    Render ``html_content`` with the configured PDF backend.
+    With the default "html" backend this returns the HTML as bytes and the
+    frontend triggers window.print(); check media_type_for() on the result.
     """
-    return html_content.encode("utf-8")
\ No newline at end of file
+    return await pdf_manager.generate(html_content, options)
+
+
+async def bulk_document_response(chunks: AsyncIterator[str], filename: str) -> Response:
+    """
+    Response for a bulk print produced piece by piece (render_service.stream_pages).
+    HTML is streamed to the client as it is rendered; a real PDF backend needs
+    the whole document, so the pieces are joined and rendered in one job.
+    """
+    headers = {"Content-Disposition": f"inline; filename={filename}"}
+    # Pull the first piece now so template errors still become a proper 500
+    first = await chunks.__anext__()
+
+    if not pdf_manager.running:
+        async def body():
+            try:
+                yield first.encode("utf-8")
+                async for chunk in chunks:
+                    yield chunk.encode("utf-8")
+            except Exception as e:
+                logger.error(f"[PDF] Bulk document stream aborted: {e}")
+                raise
+
+        return StreamingResponse(body(), media_type="text/html", headers=headers)
+
+    html = first + "".join([chunk async for chunk in chunks])
+    pdf_content = await generate_pdf(html)
+    return Response(content=pdf_content, media_type=media_type_for(pdf_content), headers=headers)
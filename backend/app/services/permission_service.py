@@ -1,7 +1,9 @@
 """
 Permission checking service for RBAC system
 """
-from typing import List, Optional
+import threading
+import time
+from typing import Dict, FrozenSet, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from app.models.user import User
 from app.models.role import Role
@@ -9,9 +11,47 @@ from app.models.permission import Permission
 from app.models.role_permission import RolePermission
 
 
+# Per-role permission-code cache: role_id -> (expires_at, codes).
+# Role permissions change rarely, so each worker loads a role's codes once and
+# answers every subsequent check from memory. The TTL bounds staleness in
+# other workers; the worker that edits a role invalidates it immediately.
+ROLE_PERMISSION_CACHE_TTL = 300  # seconds
+_role_permission_cache: Dict[int, Tuple[float, FrozenSet[str]]] = {}
+_role_permission_lock = threading.Lock()
+
+
 class PermissionService:
     """Service for checking user permissions"""
     
+    @staticmethod
+    def get_role_permission_codes(role_id: int, db: Session) -> FrozenSet[str]:
+        """Get the (cached) set of permission codes granted to a role"""
+        now = time.monotonic()
+        cached = _role_permission_cache.get(role_id)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        rows = (
+            db.query(Permission.code)
+            .join(RolePermission, Permission.id == RolePermission.permission_id)
+            .filter(RolePermission.role_id == role_id)
+            .all()
+        )
+        codes = frozenset(r.code for r in rows)
+
+        with _role_permission_lock:
+            _role_permission_cache[role_id] = (now + ROLE_PERMISSION_CACHE_TTL, codes)
+        return codes
+
+    @staticmethod
+    def invalidate_role_cache(role_id: Optional[int] = None) -> None:
+        """Drop cached permission codes for one role (or all roles if None)"""
+        with _role_permission_lock:
+            if role_id is None:
+                _role_permission_cache.clear()
+            else:
+                _role_permission_cache.pop(role_id, None)
+
     @staticmethod
     def get_user_permissions(user: User, db: Session) -> List[str]:
         """Get all permission codes for a user"""
@@ -22,15 +62,7 @@ class PermissionService:
         if not user.role_id:
             return []
         
-        # Query permissions for user's role
-        permissions = (
-            db.query(Permission.code)
-            .join(RolePermission, Permission.id == RolePermission.permission_id)
-            .filter(RolePermission.role_id == user.role_id)
-            .all()
-        )
-        
-        return [p.code for p in permissions]
+        return sorted(PermissionService.get_role_permission_codes(user.role_id, db))
     
     @staticmethod
     def has_permission(user: User, permission_code: str, db: Session) -> bool:
@@ -42,40 +74,31 @@ class PermissionService:
         if not user or not user.role_id:
             return False
         
-        # Check if user's role has this permission
-        exists = (
-            db.query(Permission.id)
-            .join(RolePermission, Permission.id == RolePermission.permission_id)
-            .filter(
-                RolePermission.role_id == user.role_id,
-                Permission.code == permission_code
-            )
-            .first()
-        )
-        
-        return exists is not None
+        return permission_code in PermissionService.get_role_permission_codes(user.role_id, db)
     
     @staticmethod
     def has_any_permission(user: User, permission_codes: List[str], db: Session) -> bool:
         """Check if user has any of the specified permissions"""
         if not user or not user.role_id:
             return False
+
+        if user.legacy_role == "SUPER_ADMIN":
+            return True
         
-        for code in permission_codes:
-            if PermissionService.has_permission(user, code, db):
-                return True
-        return False
+        codes = PermissionService.get_role_permission_codes(user.role_id, db)
+        return any(code in codes for code in permission_codes)
     
     @staticmethod
     def has_all_permissions(user: User, permission_codes: List[str], db: Session) -> bool:
         """Check if user has all of the specified permissions"""
         if not user or not user.role_id:
             return False
+
+        if user.legacy_role == "SUPER_ADMIN":
+            return True
         
-        for code in permission_codes:
-            if not PermissionService.has_permission(user, code, db):
-                return False
-        return True
+        codes = PermissionService.get_role_permission_codes(user.role_id, db)
+        return all(code in codes for code in permission_codes)
     
     @staticmethod
     def get_role_permissions(role_id: int, db: Session) -> List[Permission]:
@@ -0,0 +1,139 @@
+"""
+qr_cache.py
+===========
+Content-addressed cache for QR code PNGs (base64 text).
+
+Public download URLs are signed deterministically, so every print of an
+invoice / challan encodes exactly the same payload; a bulk print of 200
+invoices used to spend most of its time in qrcode + PIL redoing that work.
+
+Key = sha256 of (payload, rendering params). Two tiers:
+    memory — per-process LRU of QR_CACHE_SIZE entries
+    disk   — APP_DATA_DIR/cache/qr/<2 hex>/<key>.b64, shared by all workers
+             and kept across restarts; stale files are pruned weekly
+
+Routes go through render_service.qr_base64 (memory hit -> no pool hop);
+sync helpers that already run on the render pool call get_qr_base64.
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from cachetools import LRUCache
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.paths import CACHE_DIR
+
+QR_CACHE_DIR = os.path.join(CACHE_DIR, "qr")
+
+_memory: LRUCache = LRUCache(maxsize=max(1, settings.QR_CACHE_SIZE))
+_lock = threading.Lock()
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+
+def make_qr_base64(data: str, box_size: int = 10, border: int = 5, version=1, **qr_options) -> str:
+    """Encode ``data`` as a black-on-white QR PNG, returned as base64 text (uncached)."""
+    import qrcode
+
+    qr = qrcode.QRCode(version=version, box_size=box_size, border=border, **qr_options)
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+def qr_key(data: str, box_size: int = 10, border: int = 5, version=1, **qr_options) -> str:
+    params = dict(qr_options, box_size=box_size, border=border, version=version)
+    raw = json.dumps([data, sorted(params.items())], default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _disk_path(key: str) -> str:
+    return os.path.join(QR_CACHE_DIR, key[:2], f"{key}.b64")
+
+
+def _count(stat: str) -> None:
+    with _lock:
+        _stats[stat] += 1
+
+
+def peek(data: str, box_size: int = 10, border: int = 5, version=1, **qr_options) -> Optional[str]:
+    """Memory tier only — cheap enough to call on the event loop."""
+    key = qr_key(data, box_size, border, version, **qr_options)
+    with _lock:
+        value = _memory.get(key)
+    if value is not None:
+        _count("memory_hits")
+    return value
+
+
+def get_qr_base64(data: str, box_size: int = 10, border: int = 5, version=1, **qr_options) -> str:
+    """Cached QR PNG (base64): memory, then disk, then encode and store in both."""
+    key = qr_key(data, box_size, border, version, **qr_options)
+    with _lock:
+        value = _memory.get(key)
+    if value is not None:
+        _count("memory_hits")
+        return value
+
+    path = _disk_path(key)
+    try:
+        with open(path, "r", encoding="ascii") as f:
+            value = f.read()
+        os.utime(path)  # keep recently used entries out of the nightly prune
+        _count("disk_hits")
+    except OSError:
+        value = None
+
+    if not value:
+        value = make_qr_base64(data, box_size, border, version, **qr_options)
+        _count("misses")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="ascii") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"[QRCache] Could not persist {key[:12]}: {e}")
+
+    with _lock:
+        _memory[key] = value
+    return value
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return dict(_stats, memory_entries=len(_memory), memory_size=_memory.maxsize)
+
+
+def clear_memory() -> None:
+    with _lock:
+        _memory.clear()
+
+
+def prune_disk_cache(max_age_days: int = 90) -> int:
+    """Delete disk entries unused for ``max_age_days``. Returns files removed."""
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    if not os.path.isdir(QR_CACHE_DIR):
+        return 0
+    for root, _, files in os.walk(QR_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
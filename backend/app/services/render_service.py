@@ -0,0 +1,270 @@
+"""
+render_service.py
+=================
+Bounded worker pool for the CPU-bound parts of printing: QR PNG encoding
+(qrcode + PIL) and Jinja template rendering.
+
+The print / public download routes are ``async def``; doing that work inline
+blocked the event loop, so one large bulk print stalled every other request
+on the worker. Routes now ``await`` this service instead:
+
+    qr_code = await render_service.qr_base64(download_url)
+    html = await render_service.render(env, "invoice.html", invoice=invoice, ...)
+    data = await render_service.run("challan.prepare", prepare_challan_print_data, challan, base_url)
+
+Threads (not processes) are used: templates receive ORM objects that may
+still lazy-load relationships, which cannot cross a process boundary. The
+request's Session is only ever touched by one job at a time.
+
+Backpressure: at most RENDER_WORKERS jobs run and RENDER_QUEUE_SIZE wait.
+A caller that cannot get a slot within RENDER_QUEUE_TIMEOUT seconds gets a
+503 with Retry-After instead of piling more work onto the pool. A caller
+cancelled while it waits (client gone) does not keep the slot it was waiting
+for.
+
+QR codes are served from qr_cache first; only misses are encoded on the pool.
+
+Bulk prints stream: ``stream_pages`` renders the template shell once, then
+each batch of documents is loaded and rendered to page fragments in one pool
+job, so memory stays bounded by the batch size (BULK_PRINT_BATCH_SIZE), not
+by how many documents were requested. Bulk templates wrap one document in
+``{% block page scoped %}`` and mark where pages go with PAGES_MARKER.
+
+Per-label timing (queue wait / run time, count, errors) is kept in memory
+and served by GET /health/render.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Tuple
+
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.services import qr_cache
+
+SLOW_JOB_SECONDS = 2.0
+PAGES_MARKER = "<!-- pages -->"
+
+
+# ============================================================
+# JOBS (run inside the pool)
+# ============================================================
+def _render_template(env, template_name: str, args: tuple, context: Dict[str, Any]) -> str:
+    return env.get_template(template_name).render(*args, **context)
+
+
+def _render_shell(env, template_name: str, context: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
+    """Template rendered without pages, split at PAGES_MARKER, plus its exported macros."""
+    module = env.get_template(template_name).make_module(context)
+    head, marker, tail = str(module).partition(PAGES_MARKER)
+    if not marker:
+        raise ValueError(f"{template_name} has no {PAGES_MARKER} marker")
+    exported = {k: v for k, v in vars(module).items() if not k.startswith("_")}
+    return head, tail, exported
+
+
+def _render_pages(env, template_name: str, pages: Iterable[Any], context: Dict[str, Any]) -> str:
+    template = env.get_template(template_name)
+    render_page = template.blocks["page"]
+    return "".join(
+        "".join(render_page(template.new_context(dict(context, data=data))))
+        for data in pages
+    )
+
+
+# ============================================================
+# METRICS
+# ============================================================
+class _JobStats:
+    __slots__ = ("count", "errors", "run_total", "run_max", "wait_total", "wait_max", "last_run")
+
+    def __init__(self):
+        self.count = self.errors = 0
+        self.run_total = self.run_max = self.wait_total = self.wait_max = self.last_run = 0.0
+
+    def record(self, waited: float, ran: float, failed: bool) -> None:
+        self.count += 1
+        self.errors += int(failed)
+        self.run_total += ran
+        self.run_max = max(self.run_max, ran)
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        self.last_run = ran
+
+    def as_dict(self) -> Dict[str, Any]:
+        count = self.count or 1
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.run_total / count * 1000, 2),
+            "max_ms": round(self.run_max * 1000, 2),
+            "last_ms": round(self.last_run * 1000, 2),
+            "avg_wait_ms": round(self.wait_total / count * 1000, 2),
+            "max_wait_ms": round(self.wait_max * 1000, 2),
+        }
+
+
+# ============================================================
+# SERVICE
+# ============================================================
+class RenderService:
+    def __init__(self, max_workers: int, queue_size: int, queue_timeout: float):
+        self.max_workers = max(1, max_workers)
+        self.queue_size = max(0, queue_size)
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _JobStats] = {}
+        self._in_flight = 0
+        self._rejected = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="render"
+                    )
+        return self._executor
+
+    async def _wait_for_slot(self) -> bool:
+        """
+        Blocking acquire on a helper thread. If the caller is cancelled while
+        it waits, the thread still finishes; a slot it gets then is released.
+        """
+        waiter = asyncio.ensure_future(asyncio.to_thread(self._slots.acquire, True, self.queue_timeout))
+        try:
+            return await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            waiter.add_done_callback(self._release_abandoned_slot)
+            raise
+
+    def _release_abandoned_slot(self, waiter: "asyncio.Future") -> None:
+        if not waiter.cancelled() and waiter.exception() is None and waiter.result():
+            self._slots.release()
+
+    async def _acquire_slot(self, label: str) -> None:
+        if self._slots.acquire(blocking=False):
+            return
+        if self.queue_timeout > 0 and await self._wait_for_slot():
+            return
+        with self._lock:
+            self._rejected += 1
+        logger.warning(f"[Render] Pool saturated, rejected '{label}'")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Document renderer is busy. Please retry in a moment.",
+            headers={"Retry-After": "2"},
+        )
+
+    async def run(self, label: str, fn: Callable, *args, **kwargs) -> Any:
+        """Run ``fn(*args, **kwargs)`` on the pool and await its result."""
+        queued_at = time.perf_counter()
+        await self._acquire_slot(label)
+        with self._lock:
+            self._in_flight += 1
+
+        timings = {}
+
+        def job():
+            started = time.perf_counter()
+            timings["wait"] = started - queued_at
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings["run"] = time.perf_counter() - started
+
+        failed = False
+        try:
+            context = contextvars.copy_context()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), functools.partial(context.run, job))
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._slots.release()
+            waited, ran = timings.get("wait", 0.0), timings.get("run", 0.0)
+            with self._lock:
+                self._in_flight -= 1
+                self._stats.setdefault(label, _JobStats()).record(waited, ran, failed)
+            if ran > SLOW_JOB_SECONDS:
+                logger.warning(f"[Render] Slow job '{label}': {ran * 1000:.0f}ms (waited {waited * 1000:.0f}ms)")
+
+    async def qr_base64(self, data: str, box_size: int = 10, border: int = 5, **qr_options) -> str:
+        """QR PNG as base64 via qr_cache; only cache misses reach the pool."""
+        cached = qr_cache.peek(data, box_size, border, **qr_options)
+        if cached is not None:
+            return cached
+        return await self.run("qr", qr_cache.get_qr_base64, data, box_size, border, **qr_options)
+
+    async def qr_base64_many(self, payloads: List[str], box_size: int = 10, border: int = 5, **qr_options) -> List[str]:
+        """Bulk variant: memory hits inline, every miss encoded in a single pool job."""
+        results = [qr_cache.peek(p, box_size, border, **qr_options) for p in payloads]
+        missing = [i for i, value in enumerate(results) if value is None]
+        if missing:
+            encoded = await self.run(
+                "qr.bulk",
+                lambda: [qr_cache.get_qr_base64(payloads[i], box_size, border, **qr_options) for i in missing],
+            )
+            for i, value in zip(missing, encoded):
+                results[i] = value
+        return results
+
+    async def render(self, env, template_name: str, *args, **context) -> str:
+        """``env.get_template(template_name).render(*args, **context)`` on the pool."""
+        return await self.run(f"template:{template_name}", _render_template, env, template_name, args, context)
+
+    async def stream_pages(
+        self,
+        label: str,
+        env,
+        template_name: str,
+        batches: Iterable[Any],
+        load_batch: Callable[[Any], List[Any]],
+        context: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """
+        Yield a bulk document piece by piece: the shell head, one fragment per
+        batch (``load_batch(batch)`` returns the page data, run on the pool
+        together with the render), then the shell tail.
+        """
+        head, tail, macros = await self.run(f"template:{template_name}", _render_shell, env, template_name, context)
+        page_context = dict(context, **macros)
+        yield head
+        for batch in batches:
+            yield await self.run(
+                label,
+                lambda batch=batch: _render_pages(env, template_name, load_batch(batch), page_context),
+            )
+        yield tail
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "queue_size": self.queue_size,
+                "in_flight": self._in_flight,
+                "rejected": self._rejected,
+                "jobs": {label: stats.as_dict() for label, stats in sorted(self._stats.items())},
+                "qr_cache": qr_cache.stats(),
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+render_service = RenderService(
+    max_workers=settings.RENDER_WORKERS,
+    queue_size=settings.RENDER_QUEUE_SIZE,
+    queue_timeout=settings.RENDER_QUEUE_TIMEOUT,
+)
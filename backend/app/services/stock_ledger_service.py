@@ -0,0 +1,258 @@
+"""
+stock_ledger_service.py
+=======================
+Shared query engine for the item stock ledger reports.
+
+Stock transactions only carry (reference_type, reference_id). The ledger
+routes used to resolve each one with its own ``db.query(...).first()``, so a
+busy item cost one round trip per movement. Everything here resolves the
+referenced documents in bulk: one column-only query per reference_type
+(delivery challans, invoices, party challans, plus the delivery lines for the
+OK/CR/MR breakdown), whatever the number of transactions.
+
+Used by:
+    /reports/stock-ledger           -> get_outward_movements
+    /reports/stock-ledger/pdf       -> get_outward_movements(with_breakdown=True)
+    /reports/stock-ledger/pdf/old   -> build_transaction_ledger
+    /public/reports/stock/download  -> build_transaction_ledger
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.delivery_challan import DeliveryChallan
+from app.models.delivery_challan_item import DeliveryChallanItem
+from app.models.invoice import Invoice
+from app.models.party import Party
+from app.models.party_challan import PartyChallan
+from app.models.stock_transaction import StockTransaction
+
+
+class LedgerDocument(NamedTuple):
+    reference_type: str
+    id: int
+    number: str
+    date: Optional[date]
+    party_id: Optional[int]
+    party_name: str
+    status: Optional[str]
+
+
+class DeliveryLine(NamedTuple):
+    item_id: Optional[int]
+    quantity: float
+    ok_qty: float
+    cr_qty: float
+    mr_qty: float
+
+
+# reference_type -> (model, number column, date column)
+_DOCUMENTS = {
+    "DELIVERY_CHALLAN": (DeliveryChallan, DeliveryChallan.challan_number, DeliveryChallan.challan_date),
+    "INVOICE": (Invoice, Invoice.invoice_number, Invoice.invoice_date),
+    "PARTY_CHALLAN": (PartyChallan, PartyChallan.challan_number, PartyChallan.challan_date),
+}
+
+_LABELS = {
+    "DELIVERY_CHALLAN": "Return Challan",
+    "INVOICE": "Invoice",
+    "PARTY_CHALLAN": "Party Challan",
+}
+
+DocumentMap = Dict[Tuple[str, int], LedgerDocument]
+
+
+# ============================================================
+# BULK RESOLVERS
+# ============================================================
+def resolve_documents(db: Session, transactions: Iterable[StockTransaction]) -> DocumentMap:
+    """Load every document referenced by ``transactions``: one query per reference_type."""
+    ids_by_type: Dict[str, set] = defaultdict(set)
+    for tx in transactions:
+        if tx.reference_type in _DOCUMENTS and tx.reference_id is not None:
+            ids_by_type[tx.reference_type].add(tx.reference_id)
+
+    documents: DocumentMap = {}
+    for ref_type, ids in ids_by_type.items():
+        model, number_col, date_col = _DOCUMENTS[ref_type]
+        rows = db.execute(
+            select(model.id, number_col, date_col, model.party_id, Party.name, model.status)
+            .outerjoin(Party, Party.id == model.party_id)
+            .where(model.id.in_(ids))
+        )
+        for doc_id, number, doc_date, party_id, party_name, status in rows:
+            documents[(ref_type, doc_id)] = LedgerDocument(
+                ref_type, doc_id, number, doc_date, party_id, party_name or "Unknown", status
+            )
+    return documents
+
+
+def resolve_delivery_lines(db: Session, challan_ids: Iterable[int]) -> Dict[int, List[DeliveryLine]]:
+    """Delivery challan lines grouped by challan, in one query."""
+    challan_ids = set(challan_ids)
+    lines: Dict[int, List[DeliveryLine]] = defaultdict(list)
+    if not challan_ids:
+        return lines
+    rows = db.execute(
+        select(
+            DeliveryChallanItem.challan_id,
+            DeliveryChallanItem.item_id,
+            DeliveryChallanItem.quantity,
+            DeliveryChallanItem.ok_qty,
+            DeliveryChallanItem.cr_qty,
+            DeliveryChallanItem.mr_qty,
+        )
+        .where(DeliveryChallanItem.challan_id.in_(challan_ids))
+        .order_by(DeliveryChallanItem.id)
+    )
+    for challan_id, item_id, qty, ok, cr, mr in rows:
+        lines[challan_id].append(DeliveryLine(
+            item_id, float(qty or 0), float(ok or 0), float(cr or 0), float(mr or 0)
+        ))
+    return lines
+
+
+def _match_delivery_line(lines: List[DeliveryLine], item_id: int) -> Optional[DeliveryLine]:
+    # Line item_id may be NULL on older challans; a single-line challan is unambiguous
+    for line in lines:
+        if str(line.item_id) == str(item_id) or len(lines) == 1:
+            return line
+    return None
+
+
+# ============================================================
+# LEDGER BUILDERS
+# ============================================================
+def get_outward_movements(
+    db: Session,
+    company_id: int,
+    item_id: int,
+    start,
+    end,
+    party_id: Optional[int] = None,
+    with_breakdown: bool = False,
+) -> List[Dict]:
+    """
+    OUT movements of an item between ``start`` and ``end`` (by transaction time),
+    resolved to their delivery challan / invoice and filtered by party.
+
+    Each row: date, ref, reference_type, description, party_name, qty and,
+    with ``with_breakdown``, the delivery line's ok / cr / mr split.
+    """
+    transactions = db.query(StockTransaction).filter(
+        StockTransaction.company_id == company_id,
+        StockTransaction.item_id == item_id,
+        StockTransaction.transaction_type == "OUT",
+        StockTransaction.created_at >= start,
+        StockTransaction.created_at <= end,
+    ).order_by(StockTransaction.id).all()
+
+    documents = resolve_documents(db, transactions)
+    lines_by_challan = {}
+    if with_breakdown:
+        lines_by_challan = resolve_delivery_lines(
+            db, [tx.reference_id for tx in transactions if tx.reference_type == "DELIVERY_CHALLAN"]
+        )
+
+    movements = []
+    for tx in transactions:
+        if tx.reference_type not in ("DELIVERY_CHALLAN", "INVOICE"):
+            continue
+        doc = documents.get((tx.reference_type, tx.reference_id))
+        if not doc or doc.status == "cancelled":
+            continue
+        if party_id and doc.party_id != party_id:
+            continue
+
+        qty = float(tx.quantity)
+        row = {
+            "date": doc.date,
+            "ref": doc.number,
+            "reference_type": tx.reference_type,
+            "description": _LABELS[tx.reference_type],
+            "party_name": doc.party_name,
+            "qty": qty,
+        }
+        if with_breakdown:
+            ok, cr, mr = qty, 0.0, 0.0
+            if tx.reference_type == "DELIVERY_CHALLAN":
+                line = _match_delivery_line(lines_by_challan.get(doc.id, []), item_id)
+                if line:
+                    qty = line.quantity
+                    # Trust the OK/CR/MR split only when it was filled in
+                    ok, cr, mr = (line.ok_qty, line.cr_qty, line.mr_qty) if (line.ok_qty + line.cr_qty + line.mr_qty) > 0 else (qty, 0.0, 0.0)
+                    row["qty"] = qty
+            row.update(ok=ok, cr=cr, mr=mr)
+        movements.append(row)
+    return movements
+
+
+def build_transaction_ledger(
+    db: Session,
+    company_id: int,
+    item_id: int,
+    start,
+    end,
+    opening_balance: float,
+    party_id: Optional[int] = None,
+) -> Tuple[List[Dict], float]:
+    """
+    Every IN / OUT transaction of an item in range with a running balance,
+    formatted for stock_ledger_print.html. Returns (rows, closing balance).
+    """
+    transactions = db.query(StockTransaction).filter(
+        StockTransaction.item_id == item_id,
+        StockTransaction.company_id == company_id,
+        StockTransaction.created_at >= start,
+        StockTransaction.created_at <= end,
+    ).order_by(StockTransaction.created_at.asc()).all()
+
+    documents = resolve_documents(db, transactions)
+
+    rows = []
+    running_balance = opening_balance
+    for tx in transactions:
+        in_qty = float(tx.quantity) if tx.transaction_type == "IN" else 0.0
+        out_qty = float(tx.quantity) if tx.transaction_type == "OUT" else 0.0
+
+        desc = tx.reference_type or "Adjustment"
+        ref_no = str(tx.reference_id)
+        party_name = "-"
+        doc_party_id = None
+
+        if tx.reference_type in _LABELS:
+            doc = documents.get((tx.reference_type, tx.reference_id))
+            if doc:
+                desc = _LABELS[tx.reference_type]
+                ref_no = doc.number
+                party_name = doc.party_name
+                doc_party_id = doc.party_id
+            else:
+                desc = f"{_LABELS[tx.reference_type]} #{tx.reference_id}"
+
+        if party_id and doc_party_id != party_id:
+            continue
+
+        running_balance += (in_qty - out_qty)
+
+        date_str = "-"
+        if tx.created_at:
+            try:
+                date_str = tx.created_at.strftime("%d-%m-%Y")
+            except Exception:
+                date_str = str(tx.created_at)
+
+        rows.append({
+            "date": date_str,
+            "type": tx.transaction_type,
+            "ref": ref_no,
+            "description": desc,
+            "party_name": party_name,
+            "in_qty": in_qty,
+            "out_qty": out_qty,
+            "balance": f"{running_balance:.2f}",
+        })
+    return rows, running_balance
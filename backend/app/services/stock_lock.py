@@ -0,0 +1,52 @@
+"""
+stock_lock.py
+=============
+Per-company lock around writes to the stock ledger.
+
+The stock rebuild (stock_rebuild_service) deletes and re-derives a company's
+stock_transactions in one transaction. Document routes that post stock at
+the same time must not interleave with it: a challan saved mid-rebuild would
+be counted twice (its own rows plus the rebuilt ones), or lose its rows.
+
+Both sides take ``lock_company_stock(db, company_id)`` inside their
+transaction; it is held until commit / rollback:
+
+    * PostgreSQL: ``pg_advisory_xact_lock(STOCK_LOCK_NAMESPACE, company_id)``,
+      so only writers of the same company wait, and plain reads never do;
+    * SQLite: a no-op, as there is a single writer anyway (write serializer
+      plus SQLite's own lock) and the rebuild holds it from its first DELETE.
+
+The create / update / delete routes of party challans, delivery challans and
+invoices take the lock before reading the document state they post from.
+Any other flush that writes StockTransaction rows takes it through the
+``before_flush`` listener below. Core INSERTs bypass that listener, so the
+bulk invoice import takes the lock itself.
+"""
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.models.stock_transaction import StockTransaction
+
+STOCK_LOCK_NAMESPACE = 5395531  # "STK"
+
+
+def lock_company_stock(db: Session, company_id: int) -> None:
+    """Take the company's stock lock for the rest of the current transaction."""
+    conn = db.connection()
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(
+        text("SELECT pg_advisory_xact_lock(:namespace, :company_id)"),
+        {"namespace": STOCK_LOCK_NAMESPACE, "company_id": company_id},
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def _lock_stock_writers(session, flush_context, instances):
+    company_ids = {
+        obj.company_id
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, StockTransaction) and obj.company_id is not None
+    }
+    for company_id in sorted(company_ids):
+        lock_company_stock(session, company_id)
@@ -0,0 +1,453 @@
+"""
+stock_rebuild_service.py
+========================
+Set-based rebuild of a company's stock ledger and job-work status.
+
+Replaces the old row-by-row /reports/recalculate-stock loop. Every phase is a
+handful of INSERT ... SELECT / UPDATE ... FROM statements run over bounded
+id-ranges of documents (CHUNK_SIZE at a time). Progress is written to the
+shared report cache so any worker can answer the status endpoint. Every
+save stamps a heartbeat; a queued / running job that has not saved for
+STALE_AFTER seconds (its worker died or restarted) is marked failed, so
+it no longer blocks new rebuilds of the company.
+
+The whole rebuild is one transaction under the company's stock lock
+(stock_lock), which the document routes take too:
+    * a challan / invoice saved meanwhile waits, so it is neither counted
+      twice nor lost;
+    * readers keep seeing the old ledger until the new one is committed;
+    * a failure rolls everything back instead of leaving a truncated ledger.
+
+Phases:
+    1. delete       — remove the company's stock_transactions
+    2. party_challans / delivery_challans / invoices
+                    — re-insert IN / OUT rows from the source documents
+    3. job_work     — recompute party_challan_items.quantity_delivered and
+                      party_challan.status from delivery challans
+    4. current_stock — recompute items.current_stock from stock_transactions
+    5. snapshots    — rebuild the monthly job-work balance snapshots, since the
+                      bulk status updates above bypass their Session listener
+
+check_current_stock() compares items.current_stock (kept by the stock
+triggers) with the ledger and can reset drifted items without a rebuild.
+"""
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func, insert, literal, select, update, delete
+from sqlalchemy.orm import Session
+
+from app.core.logger import logger
+from app.database.session import SessionLocal
+from app.models.delivery_challan import DeliveryChallan
+from app.models.delivery_challan_item import DeliveryChallanItem
+from app.models.invoice import Invoice
+from app.models.invoice_item import InvoiceItem
+from app.models.item import Item
+from app.models.party_challan import PartyChallan
+from app.models.party_challan_item import PartyChallanItem
+from app.models.stock_transaction import StockTransaction
+from app.services.cache_service import report_cache
+from app.services.job_work_snapshot_service import rebuild_job_work_snapshots
+from app.services.stock_lock import lock_company_stock
+
+CHUNK_SIZE = 500          # documents per statement batch
+JOB_TTL = 24 * 60 * 60    # keep finished job status for a day
+STALE_AFTER = 5 * 60      # seconds without progress before a job counts as dead
+
+_ST = StockTransaction.__table__
+_ST_COLUMNS = [
+    _ST.c.company_id,
+    _ST.c.financial_year_id,
+    _ST.c.item_id,
+    _ST.c.quantity,
+    _ST.c.transaction_type,
+    _ST.c.reference_type,
+    _ST.c.reference_id,
+    _ST.c.created_at,
+]
+
+
+# ============================================================
+# JOB STATUS (shared across workers via report_cache)
+# ============================================================
+def _job_key(job_id: str) -> str:
+    return f"stock-rebuild:{job_id}"
+
+
+def _active_key(company_id: int) -> str:
+    return f"stock-rebuild-active:{company_id}"
+
+
+def get_rebuild_job(job_id: str) -> Optional[Dict]:
+    job = report_cache.get(_job_key(job_id))
+    if job and job["status"] in ("queued", "running") and time.time() - job.get("heartbeat", 0) > STALE_AFTER:
+        logger.warning(f"[StockRebuild] Job {job_id} stopped reporting progress; marking it failed")
+        job.update(status="failed", error="Rebuild stopped responding", finished_at=datetime.utcnow().isoformat())
+        _save_job(job)
+    return job
+
+
+def _save_job(job: Dict) -> None:
+    job["heartbeat"] = time.time()
+    report_cache.set(_job_key(job["job_id"]), dict(job), ttl=JOB_TTL)
+
+
+def create_rebuild_job(company_id: int) -> Dict:
+    """Register a new rebuild job, or return the one already running for the company."""
+    active_id = report_cache.get(_active_key(company_id))
+    if active_id:
+        active = get_rebuild_job(active_id)
+        if active and active["status"] in ("queued", "running"):
+            return active
+
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "company_id": company_id,
+        "status": "queued",
+        "phase": None,
+        "processed": 0,
+        "total": 0,
+        "stats": {},
+        "error": None,
+        "started_at": None,
+        "finished_at": None,
+    }
+    _save_job(job)
+    report_cache.set(_active_key(company_id), job["job_id"], ttl=JOB_TTL)
+    return job
+
+
+def run_rebuild_job(job_id: str) -> None:
+    """Background entry point: runs the rebuild with its own DB session."""
+    job = get_rebuild_job(job_id)
+    if not job:
+        return
+
+    job.update(status="running", started_at=datetime.utcnow().isoformat())
+    _save_job(job)
+
+    def progress(phase: str, processed: int, total: int):
+        job.update(phase=phase, processed=processed, total=total)
+        _save_job(job)
+
+    db = SessionLocal()
+    try:
+        job["stats"] = rebuild_company_stock(db, job["company_id"], progress=progress)
+        job.update(status="completed", phase=None)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"[StockRebuild] Job {job_id} failed: {e}")
+        job.update(status="failed", error=str(e))
+    finally:
+        db.close()
+        job["finished_at"] = datetime.utcnow().isoformat()
+        _save_job(job)
+
+
+# ============================================================
+# REBUILD ENGINE
+# ============================================================
+def _id_chunks(db: Session, model, company_id: int, chunk_size: int) -> List[tuple]:
+    """Split a company's document ids into (first_id, last_id) ranges of chunk_size rows."""
+    ids = [
+        row[0] for row in db.execute(
+            select(model.id).where(model.company_id == company_id).order_by(model.id)
+        )
+    ]
+    return [(chunk[0], chunk[-1]) for chunk in (ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size))]
+
+
+def _rebuild_party_challans(db: Session, company_id: int, lo: int, hi: int) -> int:
+    source = (
+        select(
+            literal(company_id),
+            PartyChallan.financial_year_id,
+            PartyChallanItem.item_id,
+            PartyChallanItem.quantity_ordered,
+            literal("IN"),
+            literal("PARTY_CHALLAN"),
+            PartyChallan.id,
+            PartyChallan.created_at,
+        )
+        .join(PartyChallanItem, PartyChallanItem.party_challan_id == PartyChallan.id)
+        .where(PartyChallan.company_id == company_id, PartyChallan.id.between(lo, hi))
+    )
+    return db.execute(insert(_ST).from_select(_ST_COLUMNS, source)).rowcount
+
+
+def _rebuild_delivery_challans(db: Session, company_id: int, lo: int, hi: int) -> int:
+    # Item comes from the linked PartyChallanItem; unlinked lines carry no stock
+    source = (
+        select(
+            literal(company_id),
+            DeliveryChallan.financial_year_id,
+            PartyChallanItem.item_id,
+            DeliveryChallanItem.quantity,
+            literal("OUT"),
+            literal("DELIVERY_CHALLAN"),
+            DeliveryChallan.id,
+            DeliveryChallan.created_at,
+        )
+        .join(DeliveryChallanItem, DeliveryChallanItem.challan_id == DeliveryChallan.id)
+        .join(PartyChallanItem, PartyChallanItem.id == DeliveryChallanItem.party_challan_item_id)
+        .where(
+            DeliveryChallan.company_id == company_id,
+            DeliveryChallan.id.between(lo, hi),
+            PartyChallanItem.item_id.isnot(None),
+        )
+    )
+    return db.execute(insert(_ST).from_select(_ST_COLUMNS, source)).rowcount
+
+
+def _rebuild_invoices(db: Session, company_id: int, lo: int, hi: int) -> int:
+    # Direct invoice lines only: challan-linked lines were already issued by the DC
+    source = (
+        select(
+            literal(company_id),
+            Invoice.financial_year_id,
+            InvoiceItem.item_id,
+            InvoiceItem.quantity,
+            literal("OUT"),
+            literal("INVOICE"),
+            Invoice.id,
+            Invoice.created_at,
+        )
+        .join(InvoiceItem, InvoiceItem.invoice_id == Invoice.id)
+        .where(
+            Invoice.company_id == company_id,
+            Invoice.id.between(lo, hi),
+            Invoice.status != "CANCELLED",
+            InvoiceItem.delivery_challan_item_id.is_(None),
+            InvoiceItem.item_id.isnot(None),
+        )
+    )
+    return db.execute(insert(_ST).from_select(_ST_COLUMNS, source)).rowcount
+
+
+def _rebuild_job_work(db: Session, company_id: int, lo: int, hi: int) -> int:
+    pc_ids = (
+        select(PartyChallan.id)
+        .where(PartyChallan.company_id == company_id, PartyChallan.id.between(lo, hi))
+        .scalar_subquery()
+    )
+
+    # A. quantity_delivered = SUM(delivery lines) per party challan item
+    db.execute(
+        update(PartyChallanItem)
+        .where(PartyChallanItem.party_challan_id.in_(pc_ids))
+        .values(quantity_delivered=0)
+        .execution_options(synchronize_session=False)
+    )
+    delivered = (
+        select(
+            DeliveryChallanItem.party_challan_item_id.label("pci_id"),
+            func.sum(DeliveryChallanItem.quantity).label("qty"),
+        )
+        .join(DeliveryChallan, DeliveryChallan.id == DeliveryChallanItem.challan_id)
+        .where(
+            DeliveryChallan.company_id == company_id,
+            DeliveryChallanItem.party_challan_item_id.in_(
+                select(PartyChallanItem.id).where(PartyChallanItem.party_challan_id.in_(pc_ids))
+            ),
+        )
+        .group_by(DeliveryChallanItem.party_challan_item_id)
+        .subquery()
+    )
+    db.execute(
+        update(PartyChallanItem)
+        .where(
+            PartyChallanItem.id == delivered.c.pci_id,
+            PartyChallanItem.party_challan_id.in_(pc_ids),
+        )
+        .values(quantity_delivered=func.coalesce(delivered.c.qty, 0))
+        .execution_options(synchronize_session=False)
+    )
+
+    # B. status from ordered vs delivered totals (challans without lines stay "open")
+    db.execute(
+        update(PartyChallan)
+        .where(PartyChallan.id.in_(pc_ids))
+        .values(status="open")
+        .execution_options(synchronize_session=False)
+    )
+    totals = (
+        select(
+            PartyChallanItem.party_challan_id.label("pc_id"),
+            func.sum(PartyChallanItem.quantity_ordered).label("ordered"),
+            func.sum(PartyChallanItem.quantity_delivered).label("delivered"),
+        )
+        .where(PartyChallanItem.party_challan_id.in_(pc_ids))
+        .group_by(PartyChallanItem.party_challan_id)
+        .subquery()
+    )
+    return db.execute(
+        update(PartyChallan)
+        .where(PartyChallan.id == totals.c.pc_id)
+        .values(status=case(
+            ((totals.c.delivered >= totals.c.ordered) & (totals.c.ordered > 0), "completed"),
+            (totals.c.delivered > 0, "partial"),
+            else_="open",
+        ))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def _ledger_net(company_id: int):
+    """Net quantity per item from stock_transactions (IN - OUT)."""
+    return (
+        select(
+            StockTransaction.item_id.label("item_id"),
+            func.sum(case(
+                (StockTransaction.transaction_type == "IN", StockTransaction.quantity),
+                (StockTransaction.transaction_type == "OUT", -StockTransaction.quantity),
+                else_=0,
+            )).label("qty"),
+        )
+        .where(StockTransaction.company_id == company_id)
+        .group_by(StockTransaction.item_id)
+        .subquery()
+    )
+
+
+def _rebuild_current_stock(db: Session, company_id: int) -> int:
+    net = _ledger_net(company_id)
+    db.execute(
+        update(Item)
+        .where(Item.company_id == company_id)
+        .values(current_stock=0)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(
+        update(Item)
+        .where(Item.id == net.c.item_id, Item.company_id == company_id)
+        .values(current_stock=net.c.qty)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def rebuild_company_stock(db: Session, company_id: int, progress=None, chunk_size: int = CHUNK_SIZE) -> Dict:
+    """
+    Wipe and rebuild stock_transactions, job-work status and items.current_stock
+    for one company, in a single transaction. Returns per-phase row counts.
+    """
+    def report(phase, processed, total):
+        if progress:
+            progress(phase, processed, total)
+
+    stats = {
+        "deleted": 0,
+        "party_challans": 0,
+        "delivery_challans": 0,
+        "direct_invoices": 0,
+        "status_updates": 0,
+        "items_updated": 0,
+        "snapshots": 0,
+    }
+
+    try:
+        lock_company_stock(db, company_id)
+
+        # 1. Delete existing transactions in bounded batches
+        report("delete", 0, 0)
+        while True:
+            batch = select(StockTransaction.id).where(
+                StockTransaction.company_id == company_id
+            ).limit(chunk_size * 10).scalar_subquery()
+            removed = db.execute(
+                delete(StockTransaction)
+                .where(StockTransaction.id.in_(batch))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            stats["deleted"] += removed
+            report("delete", stats["deleted"], stats["deleted"])
+            if removed == 0:
+                break
+
+        # 2. Re-insert from source documents, then 3. job-work status
+        phases = [
+            ("party_challans", PartyChallan, _rebuild_party_challans),
+            ("delivery_challans", DeliveryChallan, _rebuild_delivery_challans),
+            ("direct_invoices", Invoice, _rebuild_invoices),
+            ("status_updates", PartyChallan, _rebuild_job_work),
+        ]
+        for phase, model, step in phases:
+            chunks = _id_chunks(db, model, company_id, chunk_size)
+            report(phase, 0, len(chunks))
+            for n, (lo, hi) in enumerate(chunks, start=1):
+                stats[phase] += step(db, company_id, lo, hi)
+                report(phase, n, len(chunks))
+
+        # 4. Items.current_stock from the rebuilt ledger
+        report("current_stock", 0, 1)
+        stats["items_updated"] = _rebuild_current_stock(db, company_id)
+        report("current_stock", 1, 1)
+
+        # 5. Job-work snapshots (challan statuses may have changed)
+        report("snapshots", 0, 1)
+        stats["snapshots"] = rebuild_job_work_snapshots(db, company_id)
+        report("snapshots", 1, 1)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return stats
+
+
+# ============================================================
+# CONSISTENCY CHECK
+# ============================================================
+def check_current_stock(db: Session, company_id: int, repair: bool = False, tolerance: float = 0.001) -> Dict:
+    """
+    Compare items.current_stock with SUM(stock_transactions) for one company.
+    ``repair`` resets the drifted items to the ledger value (the ledger
+    itself is not touched; use the full rebuild if documents and ledger
+    disagree).
+    """
+    net = _ledger_net(company_id)
+    ledger = func.coalesce(net.c.qty, 0)
+    rows = db.execute(
+        select(Item.id, Item.name, Item.current_stock, ledger.label("ledger_stock"))
+        .outerjoin(net, net.c.item_id == Item.id)
+        .where(Item.company_id == company_id)
+        .order_by(Item.id)
+    ).all()
+
+    mismatches = [
+        {
+            "item_id": row.id,
+            "item_name": row.name,
+            "current_stock": float(row.current_stock or 0),
+            "ledger_stock": float(row.ledger_stock or 0),
+            "difference": round(float(row.current_stock or 0) - float(row.ledger_stock or 0), 3),
+        }
+        for row in rows
+        if abs(float(row.current_stock or 0) - float(row.ledger_stock or 0)) > tolerance
+    ]
+
+    repaired = 0
+    if repair and mismatches:
+        # Re-read the ledger in the UPDATE itself, so concurrent postings are counted
+        ledger_qty = (
+            select(func.sum(case(
+                (StockTransaction.transaction_type == "IN", StockTransaction.quantity),
+                (StockTransaction.transaction_type == "OUT", -StockTransaction.quantity),
+                else_=0,
+            )))
+            .where(StockTransaction.item_id == Item.id)
+            .scalar_subquery()
+        )
+        repaired = db.execute(
+            update(Item)
+            .where(Item.id.in_([row["item_id"] for row in mismatches]))
+            .values(current_stock=func.coalesce(ledger_qty, 0))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        logger.warning(f"[StockCheck] Company {company_id}: reset current_stock on {repaired} item(s)")
+
+    return {"items_checked": len(rows), "mismatches": mismatches, "repaired": repaired}
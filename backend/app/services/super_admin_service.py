@@ -15,6 +15,7 @@ from app.models.employee_profile import EmployeeProfile
 from app.models.audit_log import AuditLog
 from app.core.security import get_password_hash
 from app.services.audit_service import log_audit_action
+from app.core.principal import invalidate_principal_company
 
 
 from sqlalchemy.exc import IntegrityError
@@ -141,6 +142,7 @@ def extend_subscription(
         
     db.commit()
     db.refresh(company)
+    invalidate_principal_company(company.id)
     
     log_audit_action(db, admin_id, "EXTEND_SUBSCRIPTION", company.id, f"Extended to {company.subscription_end}")
 
@@ -0,0 +1,109 @@
+"""
+template_env.py
+===============
+The one Jinja environment used by every print / report route.
+
+Routers used to build their own ``Environment(loader=FileSystemLoader(...))``
+(plus a ``Jinja2Templates`` in reports.py), so each template was compiled once
+per router per process and again after every restart. Now they share:
+
+    from app.services.template_env import env
+    html = await render_service.render(env, "invoice.html", ...)
+
+Compiled templates are persisted in APP_DATA_DIR/cache/templates (Jinja
+checks the source checksum, so edited templates recompile), and
+``precompile_templates()`` warms everything in app/templates at startup so
+the first print after a restart does not pay for compilation.
+
+Shared filters: ``indian_currency`` and ``format_inr`` (also available as
+the ``format_inr`` / ``format_currency`` globals the templates call).
+"""
+import hashlib
+import os
+import re
+import time
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.paths import CACHE_DIR
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+TEMPLATE_CACHE_DIR = os.path.join(CACHE_DIR, "templates")
+
+
+# ============================================================
+# FILTERS
+# ============================================================
+def format_inr(number) -> str:
+    """12345678.5 -> '1,23,45,678.50' (Indian digit grouping)."""
+    try:
+        s, *d = str("{:.2f}".format(float(number))).partition(".")
+        r = ",".join([s[x-2:x] for x in range(-3, -len(s), -2)][::-1] + [s[-3:]])
+        return "".join([r] + d) if r else d[0]
+    except (TypeError, ValueError):
+        return str(number)
+
+
+def format_indian_currency(value):
+    """Like format_inr, but returns non-numeric values unchanged."""
+    try:
+        value = float(value)
+    except (ValueError, TypeError):
+        return value
+
+    amount, fraction = "{:.2f}".format(value).split(".")
+    last_three = amount[-3:]
+    other_numbers = amount[:-3]
+    if other_numbers:
+        last_three = "," + last_three
+    return re.sub(r"\B(?=(\d{2})+(?!\d))", ",", other_numbers) + last_three + "." + fraction
+
+
+# ============================================================
+# ENVIRONMENT
+# ============================================================
+class _BytecodeCache(FileSystemBytecodeCache):
+    def get_cache_key(self, name, filename=None):
+        # Key on the template name only: the frozen desktop build unpacks the
+        # templates to a new temp folder on every launch, so keying on the
+        # absolute filename would never hit. The source checksum still guards
+        # against stale code.
+        return hashlib.sha1(name.encode("utf-8")).hexdigest()
+
+
+def _bytecode_cache():
+    if not settings.TEMPLATE_BYTECODE_CACHE:
+        return None
+    try:
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+        return _BytecodeCache(TEMPLATE_CACHE_DIR, "%s.jinja")
+    except OSError as e:
+        logger.warning(f"[Templates] Bytecode cache disabled: {e}")
+        return None
+
+
+env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(["html", "xml"]),
+    bytecode_cache=_bytecode_cache(),
+)
+env.filters["indian_currency"] = format_indian_currency
+env.filters["format_inr"] = format_inr
+env.globals["format_inr"] = format_inr
+env.globals["format_currency"] = format_inr
+
+
+def precompile_templates() -> int:
+    """Compile (or load from the bytecode cache) every template. Returns the count."""
+    started = time.perf_counter()
+    compiled = 0
+    for name in env.list_templates(extensions=["html", "xml"]):
+        try:
+            env.get_template(name)
+            compiled += 1
+        except Exception as e:
+            logger.error(f"[Templates] Could not compile {name}: {e}")
+    logger.info(f"[Templates] Precompiled {compiled} template(s) in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return compiled
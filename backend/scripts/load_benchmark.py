@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+SmartBill Concurrent Load Benchmark
+===================================
+Fires concurrent authenticated requests at the list endpoints (invoices,
+challans, parties) and reports throughput and latency, to compare request
+handling before / after changes to the routing or permission layers.
+
+The app runs in-process (httpx ASGI transport) against a throw-away SQLite
+file seeded with one company, so nothing touches the configured database.
+--db-latency-ms adds a sleep before every statement to stand in for the
+network round-trip to PostgreSQL; handlers that block the event loop show
+up as a collapse in throughput once requests overlap.
+
+Usage:
+    python scripts/load_benchmark.py --requests 400 --concurrency 40 --db-latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# -- Ensure backend directory is on sys.path ---------------------------------
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# -- Point the app at a scratch database BEFORE importing it ------------------
+_DB_DIR = tempfile.mkdtemp(prefix="smartbill-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}"
+os.environ["REPORT_CACHE_BACKEND"] = "memory"
+os.environ["DB_LOOP_GUARD"] = "off"
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+
+ENDPOINTS = ["/invoice/?limit=20", "/challan/?limit=20", "/party/"]
+
+
+def seed(invoices: int):
+    from datetime import date, timedelta
+
+    from app.core.security import create_access_token, get_password_hash
+    from app.database.base import Base
+    from app.database.session import SessionLocal, engine
+    from app.models.company import Company
+    from app.models.financial_year import FinancialYear
+    from app.models.invoice import Invoice
+    from app.models.party import Party
+    from app.models.permission import Permission
+    from app.models.role import Role
+    from app.models.role_permission import RolePermission
+    from app.models.user import User
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        company = Company(
+            name="Benchmark Co",
+            subscription_start=date.today() - timedelta(days=1),
+            subscription_end=date.today() + timedelta(days=30),
+            is_active=True,
+        )
+        db.add(company)
+        db.flush()
+        today = date.today()
+        start = date(today.year if today.month >= 4 else today.year - 1, 4, 1)
+        fy = FinancialYear(
+            company_id=company.id, start_date=start, end_date=date(start.year + 1, 3, 31),
+            is_active=True, is_locked=False,
+        )
+        role = Role(company_id=company.id, name="Benchmark Role")
+        parties = [Party(company_id=company.id, name=f"Benchmark Party {n}") for n in range(20)]
+        db.add_all([fy, role, *parties])
+        db.flush()
+        for code in ("invoices.view", "challans.view", "parties.view"):
+            module, action = code.split(".")
+            permission = Permission(module=module, action=action, code=code)
+            db.add(permission)
+            db.flush()
+            db.add(RolePermission(role_id=role.id, permission_id=permission.id))
+        db.add_all([
+            Invoice(
+                company_id=company.id, financial_year_id=fy.id, party_id=parties[n % 20].id,
+                invoice_number=f"INV/BENCH/{n + 1:04d}", invoice_date=start,
+                subtotal=100, gst_amount=18, grand_total=118, status="OPEN",
+            )
+            for n in range(invoices)
+        ])
+        user = User(
+            name="Benchmark User", email="benchmark@example.com",
+            password_hash=get_password_hash("benchmark"),
+            company_id=company.id, role_id=role.id, legacy_role="USER", is_active=True,
+        )
+        db.add(user)
+        db.commit()
+        return create_access_token(data={
+            "user_id": user.id, "company_id": company.id, "role": "USER",
+            "token_version": user.token_version,
+        })
+    finally:
+        db.close()
+
+
+def add_db_latency(seconds: float):
+    if seconds <= 0:
+        return
+    from sqlalchemy import event
+    from app.database.session import engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _latency(*args):
+        time.sleep(seconds)
+
+
+async def run(token: str, total: int, concurrency: int):
+    import httpx
+    from app.main import app
+
+    headers = {"Authorization": f"Bearer {token}"}
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one(n):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(ENDPOINTS[n % len(ENDPOINTS)], headers=headers)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        await asyncio.gather(*(one(n) for n in range(min(concurrency, total))))  # warm-up
+        latencies.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "elapsed": elapsed,
+        "throughput": total / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load benchmark for the list endpoints")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=30)
+    parser.add_argument("--invoices", type=int, default=200, help="invoices to seed")
+    parser.add_argument("--db-latency-ms", type=float, default=5.0,
+                        help="simulated round-trip per SQL statement")
+    args = parser.parse_args()
+
+    import logging
+    logging.getLogger("smartbill").setLevel(logging.WARNING)  # no per-request access log
+
+    token = seed(args.invoices)
+    add_db_latency(args.db_latency_ms / 1000)
+    result = asyncio.run(run(token, args.requests, args.concurrency))
+
+    print(f"requests={args.requests} concurrency={args.concurrency} db_latency={args.db_latency_ms}ms")
+    print(f"elapsed     {result['elapsed']:.2f}s")
+    print(f"throughput  {result['throughput']:.1f} req/s")
+    print(f"latency     p50 {result['p50']:.0f}ms  p95 {result['p95']:.0f}ms")
+    print(f"errors      {result['errors']}")
+    sys.exit(1 if result["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
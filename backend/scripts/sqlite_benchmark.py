@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+SmartBill SQLite Engine Benchmark
+=================================
+Compares the desktop SQLite engine profile (app/database/sqlite_profile.py)
+with the previous engine setup (QueuePool arguments shared with PostgreSQL,
+no PRAGMAs) under concurrent requests.
+
+Each worker thread plays a desktop client: mostly invoice list reads
+(joined to party, with a count) and every few operations an invoice save
+(read party, insert invoice + 3 lines, update item stock, commit). Both
+configurations run against fresh copies of the same seeded database file
+in a temp directory.
+
+Usage:
+    python scripts/sqlite_benchmark.py --threads 16 --seconds 10 --write-ratio 0.2
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+# -- Ensure backend directory is on sys.path ---------------------------------
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+_DB_DIR = tempfile.mkdtemp(prefix="smartbill-sqlite-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'unused.db')}"
+os.environ["DB_LOOP_GUARD"] = "off"
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload, sessionmaker
+
+from app.database import sqlite_profile
+from app.database.base import Base
+import app.models  # noqa: F401  (register every table)
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.invoice_item import InvoiceItem
+from app.models.item import Item
+from app.models.party import Party
+
+
+def legacy_engine(url):
+    # The engine session.py created before the SQLite profile
+    return create_engine(url, pool_pre_ping=True, pool_size=10, max_overflow=20, pool_recycle=1800)
+
+
+def profile_engine(url):
+    engine = create_engine(url, **sqlite_profile.engine_kwargs(url))
+    sqlite_profile.configure(engine, url)
+    return engine
+
+
+def seed(path, invoices):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    company = Company(
+        name="Benchmark Co",
+        subscription_start=date.today() - timedelta(days=1),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db.add(company)
+    db.flush()
+    fy = FinancialYear(company_id=company.id, start_date=date(2030, 4, 1), end_date=date(2031, 3, 31), is_active=True)
+    parties = [Party(company_id=company.id, name=f"Party {n}") for n in range(50)]
+    items = [Item(company_id=company.id, name=f"Item {n}", rate=10, current_stock=10 ** 6) for n in range(20)]
+    db.add_all([fy, *parties, *items])
+    db.flush()
+    for n in range(invoices):
+        db.add(Invoice(
+            company_id=company.id, financial_year_id=fy.id, party_id=parties[n % 50].id,
+            invoice_number=f"SEED/{n}", subtotal=100, gst_amount=18, grand_total=118, status="OPEN",
+            items=[InvoiceItem(item_id=items[(n + k) % 20].id, quantity=1, rate=100, amount=100) for k in range(3)],
+        ))
+    db.commit()
+    ids = (company.id, fy.id, [p.id for p in parties], [i.id for i in items])
+    db.close()
+    engine.dispose()
+    return ids
+
+
+def run(engine, ids, threads, seconds, write_ratio):
+    company_id, fy_id, party_ids, item_ids = ids
+    Session = sessionmaker(bind=engine, autoflush=False)
+    stop = time.perf_counter() + seconds
+    lock = threading.Lock()
+    stats = {"reads": 0, "writes": 0, "locked": 0, "read_ms": [], "write_ms": []}
+    counter = iter(range(10 ** 9))
+
+    def read(db):
+        query = db.query(Invoice).filter(Invoice.company_id == company_id, Invoice.financial_year_id == fy_id)
+        query.with_entities(func.count(Invoice.id)).scalar()
+        query.options(joinedload(Invoice.party)).order_by(Invoice.id.desc()).limit(50).all()
+
+    def write(db):
+        party = db.get(Party, random.choice(party_ids))
+        lines = random.sample(item_ids, 3)
+        db.add(Invoice(
+            company_id=company_id, financial_year_id=fy_id, party_id=party.id,
+            invoice_number=f"BENCH/{threading.get_ident()}/{next(counter)}",
+            subtotal=300, gst_amount=54, grand_total=354, status="OPEN",
+            items=[InvoiceItem(item_id=i, quantity=1, rate=100, amount=100) for i in lines],
+        ))
+        db.flush()
+        db.query(Item).filter(Item.id.in_(lines)).update(
+            {Item.current_stock: Item.current_stock - 1}, synchronize_session=False
+        )
+        db.commit()
+
+    def worker():
+        while time.perf_counter() < stop:
+            is_write = random.random() < write_ratio
+            db = Session()
+            started = time.perf_counter()
+            try:
+                (write if is_write else read)(db)
+                ok = True
+            except OperationalError as e:
+                db.rollback()
+                ok = False
+                if "locked" not in str(e):
+                    raise
+            finally:
+                db.close()
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                if not ok:
+                    stats["locked"] += 1
+                elif is_write:
+                    stats["writes"] += 1
+                    stats["write_ms"].append(elapsed)
+                else:
+                    stats["reads"] += 1
+                    stats["read_ms"].append(elapsed)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    stats["elapsed"] = time.perf_counter() - started
+    engine.dispose()
+    return stats
+
+
+def p95(values):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, int(len(values) * 0.95) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the SQLite engine profile with the previous setup")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--invoices", type=int, default=2000, help="invoices to seed")
+    args = parser.parse_args()
+
+    template = os.path.join(_DB_DIR, "template.db")
+    ids = seed(template, args.invoices)
+    try:
+        for name, make in (("previous", legacy_engine), ("profile", profile_engine)):
+            path = os.path.join(_DB_DIR, f"{name}.db")
+            shutil.copy(template, path)
+            s = run(make(f"sqlite:///{path}"), ids, args.threads, args.seconds, args.write_ratio)
+            ops = s["reads"] + s["writes"]
+            print(
+                f"{name:9} {ops / s['elapsed']:8.1f} ops/s  "
+                f"reads {s['reads']:6d} (p50 {statistics.median(s['read_ms'] or [0]):6.1f} ms, p95 {p95(s['read_ms']):6.1f} ms)  "
+                f"writes {s['writes']:5d} (p50 {statistics.median(s['write_ms'] or [0]):6.1f} ms, p95 {p95(s['write_ms']):6.1f} ms)  "
+                f"locked errors {s['locked']}"
+            )
+    finally:
+        shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,10 @@ import sys
 
 # Set test environment configuration before any app imports
 os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+os.environ["REPORT_CACHE_BACKEND"] = "memory"
+# The shared Jinja env would otherwise write compiled templates to
+# APP_DATA_DIR/cache/templates, i.e. the source tree on Linux
+os.environ["TEMPLATE_BYTECODE_CACHE"] = "false"
 
 # Add the project root to sys.path so we can import 'app'
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -44,6 +48,16 @@ def create_test_database():
     yield
     Base.metadata.drop_all(bind=engine)
 
+@pytest.fixture(autouse=True)
+def isolated_qr_cache(tmp_path, monkeypatch):
+    """
+    Keep the QR disk cache out of the source tree (APP_DATA_DIR is the
+    backend directory on Linux).
+    """
+    from app.services import qr_cache
+    monkeypatch.setattr(qr_cache, "QR_CACHE_DIR", str(tmp_path / "qr"))
+
+
 @pytest.fixture
 def db_session():
     """
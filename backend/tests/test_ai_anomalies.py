@@ -0,0 +1,83 @@
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app.core.security import get_password_hash
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.party import Party
+from app.models.user import User
+
+
+def _add_party(db_session, company, fy, name, invoices):
+    party = Party(company_id=company.id, name=name, opening_balance=0)
+    db_session.add(party)
+    db_session.flush()
+    for n, (days_ago, total, payment_status) in enumerate(invoices):
+        db_session.add(Invoice(
+            company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+            invoice_number=f"INV/ANOM/{party.id}/{n}", invoice_date=date.today() - timedelta(days=days_ago),
+            grand_total=total, paid_amount=0, payment_status=payment_status, status="OPEN",
+        ))
+    return party
+
+
+def test_anomalies_use_constant_queries(client, db_session):
+    company = Company(
+        name="Anomaly Co",
+        subscription_start=date.today() - timedelta(days=1),
+        subscription_end=date.today() + timedelta(days=30),
+        is_active=True,
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(
+        company_id=company.id, start_date=date.today() - timedelta(days=200),
+        end_date=date.today() + timedelta(days=165), is_active=True, is_locked=False,
+    )
+    db_session.add_all([fy, User(
+        name="Anomaly Admin", email="anomalies@example.com",
+        password_hash=get_password_hash("secret123"),
+        company_id=company.id, legacy_role="COMPANY_ADMIN", is_active=True,
+    )])
+    db_session.flush()
+
+    _add_party(db_session, company, fy, "Anomaly Dormant", [(60, 5000, "PAID")])
+    _add_party(db_session, company, fy, "Anomaly Whale", [(90, 150000, "PAID"), (400, 1000, "PAID")])
+    _add_party(db_session, company, fy, "Anomaly Debtor", [(5, 60000, "PENDING")])
+    _add_party(db_session, company, fy, "Anomaly Regular", [(10, 2000, "PAID")])
+    db_session.commit()
+
+    token = client.post("/auth/login", json={
+        "email": "anomalies@example.com", "password": "secret123", "remember": False,
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.get("/ai-insights/anomalies", headers=headers)  # warm principal caches
+
+    def count_statements():
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+        try:
+            response = client.get("/ai-insights/anomalies", headers=headers)
+        finally:
+            event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+        assert response.status_code == 200
+        return len(statements), response.json()
+
+    baseline, body = count_statements()
+    by_title = {a["title"]: a for a in body}
+    assert by_title["Dormant Customer: Anomaly Dormant"]["metadata"]["days_since"] == 60
+    whale = by_title["Risk: High Value Customer Dormant (Anomaly Whale)"]
+    assert (whale["severity"], whale["metadata"]["total_spent"]) == ("high", 151000)
+    assert by_title["High Outstanding: Anomaly Debtor"]["metadata"]["amount"] == 60000
+    assert not [t for t in by_title if "Anomaly Regular" in t]
+
+    for n in range(20):
+        _add_party(db_session, company, fy, f"Anomaly Extra {n}", [(70, 80000, "PENDING")])
+    db_session.commit()
+
+    grown, body = count_statements()
+    assert grown == baseline
+    assert len(body) == 3 + 2 * 20
@@ -0,0 +1,120 @@
+import ast
+import asyncio
+import glob
+import os
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from app.core.config import settings
+from app.core.security import create_url_signature
+from app.database import executor as executor_module
+from app.database import sqlite_profile
+from app.database.executor import BlockingDBCallError, db_executor
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.party import Party
+from app.services import document_cache as cache_module
+
+ROUTERS_DIR = os.path.join(os.path.dirname(__file__), "..", "app", "routers")
+
+
+def _blocking_calls(func):
+    """``db.<method>(...)`` calls and calls passing ``db``, outside nested functions."""
+    found = []
+
+    def visit(node):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+                continue
+            if isinstance(child, ast.Call):
+                target = child.func
+                if isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and target.value.id == "db":
+                    found.append(child.lineno)
+                args = list(child.args) + [k.value for k in child.keywords]
+                if any(isinstance(a, ast.Name) and a.id == "db" for a in args):
+                    found.append(child.lineno)
+            visit(child)
+
+    visit(func)
+    return found
+
+
+def test_async_routes_do_not_touch_the_session_on_the_loop():
+    offenders = []
+    for path in sorted(glob.glob(os.path.join(ROUTERS_DIR, "*.py"))):
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.AsyncFunctionDef):
+                offenders += [f"{os.path.basename(path)}:{line} ({node.name})" for line in _blocking_calls(node)]
+    assert not offenders, "Wrap these in db_executor.run(): " + ", ".join(offenders)
+
+
+def test_default_workers_fit_the_connection_pool(monkeypatch):
+    monkeypatch.setattr(settings, "SQLITE_POOL_SIZE", 3)
+    desktop_size = sqlite_profile.engine_kwargs("sqlite:///desktop.db")["pool_size"]
+    desktop = SimpleNamespace(pool=QueuePool(lambda: None, pool_size=desktop_size))
+    server = SimpleNamespace(pool=QueuePool(lambda: None, pool_size=10, max_overflow=20))
+    assert executor_module.default_workers(desktop) == 3
+    assert executor_module.default_workers(server) == executor_module.DEFAULT_WORKERS == 8
+    assert executor_module.default_workers(SimpleNamespace(pool=StaticPool(lambda: None))) == 8
+
+
+def test_loop_guard(db_session, monkeypatch):
+    async def query_on_loop():
+        return db_session.execute(text("SELECT 1")).scalar()
+
+    async def query_on_executor():
+        return await db_executor.run(lambda: db_session.execute(text("SELECT 1")).scalar())
+
+    monkeypatch.setattr(settings, "DB_LOOP_GUARD", "raise")
+    with pytest.raises(BlockingDBCallError):
+        asyncio.run(query_on_loop())
+    assert asyncio.run(query_on_executor()) == 1
+    assert db_session.execute(text("SELECT 1")).scalar() == 1  # no loop, no check
+
+    monkeypatch.setattr(settings, "DB_LOOP_GUARD", "warn")
+    monkeypatch.setattr(executor_module, "_reported", set())
+    warnings = []
+    monkeypatch.setattr(executor_module.logger, "warning", warnings.append)
+    for _ in range(3):
+        assert asyncio.run(query_on_loop()) == 1
+    assert len(warnings) == 1 and "test_async_db_usage.py" in warnings[0]
+
+
+def test_public_downloads_run_without_blocking_the_loop(client, db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "DOCUMENT_CACHE_DIR", str(tmp_path))
+    company = Company(
+        name="Loop Guard Co",
+        subscription_start=date.today() - timedelta(days=1),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(company_id=company.id, start_date=date(2037, 4, 1), end_date=date(2038, 3, 31))
+    party = Party(company_id=company.id, name="Loop Guard Party")
+    db_session.add_all([fy, party])
+    db_session.flush()
+    invoice = Invoice(
+        company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+        invoice_number="INV/LOOP/1", subtotal=100, gst_amount=18, grand_total=118, status="OPEN",
+    )
+    db_session.add(invoice)
+    db_session.commit()
+
+    monkeypatch.setattr(settings, "DB_LOOP_GUARD", "raise")
+    response = client.get(f"/public/invoice/{invoice.id}/download?token={create_url_signature(str(invoice.id))}")
+    assert response.status_code == 200 and b"INV/LOOP/1" in response.content
+
+    token = create_url_signature(f"{company.id}:{fy.id}:all")
+    response = client.get(f"/public/reports/ledger/download?company_id={company.id}&fy_id={fy.id}&token={token}")
+    assert response.status_code == 200
+
+    token = create_url_signature(f"{company.id}:{party.id}")
+    response = client.get(f"/public/reports/statement/download?company_id={company.id}&party_id={party.id}&token={token}")
+    assert response.status_code == 200 and b"Loop Guard Party" in response.content
@@ -0,0 +1,101 @@
+import asyncio
+import re
+from datetime import date, timedelta
+
+from jinja2 import DictLoader, Environment
+
+from app.core.config import settings
+from app.core.security import create_access_token, get_password_hash
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.party import Party
+from app.models.permission import Permission
+from app.models.role import Role
+from app.models.role_permission import RolePermission
+from app.models.user import User
+from app.services.render_service import RenderService, render_service
+
+BULK_TEMPLATE = """<html><body>
+<!-- pages -->
+{% for data in docs %}{% block page scoped %}<p>{{ data.n }}</p>{% endblock %}{% endfor %}
+</body></html>"""
+
+
+def test_stream_pages_matches_full_render():
+    service = RenderService(max_workers=2, queue_size=4, queue_timeout=0)
+    env = Environment(loader=DictLoader({"bulk.html": BULK_TEMPLATE}))
+    loaded = []
+
+    def load_batch(batch):
+        loaded.append(batch)
+        return [{"n": n} for n in batch]
+
+    async def scenario():
+        batches = [[1, 2], [3, 4], [5]]
+        return [chunk async for chunk in service.stream_pages("bulk", env, "bulk.html", batches, load_batch, {"docs": []})]
+
+    try:
+        chunks = asyncio.run(scenario())
+    finally:
+        service.shutdown()
+
+    assert len(chunks) == 5  # head, three batches, tail
+    assert loaded == [[1, 2], [3, 4], [5]]
+    full = env.get_template("bulk.html").render(docs=[{"n": n} for n in range(1, 6)])
+    normalize = lambda html: re.sub(r"\s+|<!-- pages -->", "", html)
+    assert normalize("".join(chunks)) == normalize(full)
+
+
+def test_bulk_invoice_print_streams_in_input_order(client, db_session, monkeypatch):
+    company = Company(
+        name="Bulk Print Co",
+        subscription_start=date.today() - timedelta(days=1),
+        subscription_end=date.today() + timedelta(days=30),
+        is_active=True,
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(company_id=company.id, start_date=date(2026, 4, 1), end_date=date(2027, 3, 31), is_active=True)
+    party = Party(company_id=company.id, name="Bulk Print Party")
+    permission = db_session.query(Permission).filter_by(code="invoices.view").first()
+    if not permission:
+        permission = Permission(module="invoices", action="view", code="invoices.view")
+        db_session.add(permission)
+    role = Role(company_id=company.id, name="Bulk Printer")
+    db_session.add_all([fy, party, role])
+    db_session.flush()
+    db_session.add(RolePermission(role_id=role.id, permission_id=permission.id))
+    user = User(
+        name="Bulk Printer", email="bulkprint@example.com",
+        password_hash=get_password_hash("secret123"),
+        company_id=company.id, role_id=role.id, legacy_role="USER", is_active=True,
+    )
+    db_session.add(user)
+    invoices = [
+        Invoice(company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+                invoice_number=f"INV/BULK/{n:03d}", subtotal=100, gst_amount=18, grand_total=118, status="OPEN")
+        for n in range(12)
+    ]
+    db_session.add_all(invoices)
+    db_session.commit()
+
+    token = create_access_token(data={
+        "user_id": user.id, "company_id": company.id, "role": "USER", "token_version": user.token_version,
+    })
+    monkeypatch.setattr(settings, "BULK_PRINT_BATCH_SIZE", 5)
+
+    batch_jobs = lambda: render_service.metrics()["jobs"].get("invoice.bulk", {}).get("count", 0)
+    before = batch_jobs()
+
+    ids = [inv.id for inv in reversed(invoices)] + [999999]
+    response = client.post("/invoice/bulk-print", json={"invoice_ids": ids},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert "content-length" not in response.headers  # streamed, not buffered
+    assert batch_jobs() - before == 3  # 12 invoices in batches of 5
+
+    html = response.text
+    positions = [html.index(f"INV/BULK/{n:03d}") for n in reversed(range(12))]
+    assert positions == sorted(positions)
+    assert html.rstrip().endswith("</html>")
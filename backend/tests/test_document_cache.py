@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.core.security import create_url_signature
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.party import Party
+from app.services import document_cache as cache_module
+from app.services.document_cache import document_cache
+
+
+@pytest.fixture
+def isolated_document_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "DOCUMENT_CACHE_DIR", str(tmp_path / "documents"))
+    return tmp_path / "documents"
+
+
+def make_invoice(db_session, number):
+    company = Company(
+        name="Doc Cache Co",
+        subscription_start=date.today() - timedelta(days=1),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(company_id=company.id, start_date=date(2026, 4, 1), end_date=date(2027, 3, 31))
+    party = Party(company_id=company.id, name="Doc Cache Party")
+    db_session.add_all([fy, party])
+    db_session.flush()
+    invoice = Invoice(
+        company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+        invoice_number=number, subtotal=1000, gst_amount=180, grand_total=1180, status="OPEN",
+    )
+    db_session.add(invoice)
+    db_session.commit()
+    return company, party, invoice
+
+
+def test_public_download_served_from_cache(client, db_session, isolated_document_cache):
+    company, party, invoice = make_invoice(db_session, "INV/DOC/1")
+    url = f"/public/invoice/{invoice.id}/download?token={create_url_signature(str(invoice.id))}"
+
+    first = client.get(url)
+    assert first.status_code == 200 and b"INV/DOC/1" in first.content
+    assert len(list(isolated_document_cache.rglob("*.bin"))) == 1
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        second = client.get(url)
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+    assert second.content == first.content
+    assert len(statements) == 1  # only the version lookup, no render
+
+    revalidated = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+    assert revalidated.status_code == 304
+
+    # Editing the invoice or its party drops the rendered copy
+    invoice.notes = "Deliver to gate 2"
+    db_session.commit()
+    assert not list(isolated_document_cache.rglob("*.bin"))
+    client.get(url)
+    party.name = "Renamed Party"
+    db_session.commit()
+    assert not list(isolated_document_cache.rglob("*.bin"))
+
+    third = client.get(url)
+    assert b"Renamed Party" in third.content
+    assert third.headers["etag"] != first.headers["etag"]
+
+
+def test_rolled_back_changes_keep_the_cache(db_session, isolated_document_cache):
+    company, party, invoice = make_invoice(db_session, "INV/DOC/2")
+    version = document_cache.version("invoice.html", invoice.updated_at)
+    document_cache.put(company.id, "invoice", invoice.id, "public", version, b"<html>cached</html>")
+
+    invoice.notes = "never saved"
+    db_session.flush()
+    db_session.rollback()
+    assert document_cache.get(company.id, "invoice", invoice.id, "public", version).content == b"<html>cached</html>"
+
+    assert document_cache.invalidate(company_id=company.id) == 1
+    assert document_cache.get(company.id, "invoice", invoice.id, "public", version) is None
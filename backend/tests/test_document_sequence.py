@@ -0,0 +1,109 @@
+import threading
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database.base import Base
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.party import Party
+from app.routers.challan import generate_challan_number
+from app.routers.invoice import generate_invoice_number
+from app.services import document_sequence
+
+
+def make_company(db_session, name, year=2031):
+    company = Company(
+        name=name,
+        subscription_start=date.today() - timedelta(days=1),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(company_id=company.id, start_date=date(year, 4, 1), end_date=date(year + 1, 3, 31))
+    party = Party(company_id=company.id, name=f"{name} Party")
+    db_session.add_all([fy, party])
+    db_session.flush()
+    return company, fy, party
+
+
+def add_invoice(db_session, company, fy, party, number):
+    db_session.add(Invoice(
+        company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+        invoice_number=number, grand_total=100, status="OPEN",
+    ))
+    db_session.flush()
+
+
+def test_invoice_numbers_continue_and_stay_gapless(db_session):
+    company, fy, party = make_company(db_session, "Sequence Co")
+    add_invoice(db_session, company, fy, party, "INV/31-32/007")
+    db_session.commit()
+
+    assert generate_invoice_number(db_session, company.id, fy.id, preview=True) == "INV/31-32/008"
+    assert generate_invoice_number(db_session, company.id, fy.id, preview=True) == "INV/31-32/008"
+
+    # A failed save hands its number back
+    assert generate_invoice_number(db_session, company.id, fy.id) == "INV/31-32/008"
+    db_session.rollback()
+    number = generate_invoice_number(db_session, company.id, fy.id)
+    assert number == "INV/31-32/008"
+    add_invoice(db_session, company, fy, party, number)
+    db_session.commit()
+    assert generate_invoice_number(db_session, company.id, fy.id) == "INV/31-32/009"
+    db_session.rollback()
+
+    # Challans count per party
+    other = Party(company_id=company.id, name="Second Party")
+    db_session.add(other)
+    db_session.flush()
+    assert [generate_challan_number(db_session, company.id, fy.id, party.id) for _ in range(2)] == ["DC-001", "DC-002"]
+    assert generate_challan_number(db_session, company.id, fy.id, other.id) == "DC-001"
+    db_session.rollback()
+
+
+def test_numbers_used_elsewhere_are_skipped_in_one_jump(db_session):
+    first, first_fy, first_party = make_company(db_session, "Taken Numbers Co", year=2033)
+    for n in range(1, 41):
+        add_invoice(db_session, first, first_fy, first_party, f"INV/33-34/{n:03d}")
+    second, second_fy, _ = make_company(db_session, "Late Starter Co", year=2033)
+    db_session.commit()
+
+    # Invoice numbers are globally unique: the new company continues after them
+    assert generate_invoice_number(db_session, second.id, second_fy.id, preview=True) == "INV/33-34/041"
+    assert generate_invoice_number(db_session, second.id, second_fy.id) == "INV/33-34/041"
+    assert generate_invoice_number(db_session, second.id, second_fy.id) == "INV/33-34/042"
+    db_session.rollback()
+
+
+def test_concurrent_allocations_never_repeat(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sequence.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        company, fy, _ = make_company(db, "Concurrent Co")
+        db.commit()
+        company_id, fy_id = company.id, fy.id
+
+    values, errors = [], []
+
+    def worker():
+        try:
+            for _ in range(10):
+                with Session() as db:
+                    values.append(document_sequence.next_value(db, company_id, fy_id, document_sequence.PARTY_CHALLAN))
+                    db.commit()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+
+    assert not errors
+    assert sorted(values) == list(range(1, 61))
@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.invoice_item import InvoiceItem
+from app.models.item import Item
+from app.models.party import Party
+from app.services import forecast_service
+from app.services.forecast_service import forecast_series, get_stock_forecasts
+
+
+def _weekday_pattern(weeks=8):
+    # Monday-first weeks: 10 a day on weekdays, nothing at the weekend
+    return [10.0 if day % 7 < 5 else 0.0 for day in range(weeks * 7)]
+
+
+def test_forecast_keeps_weekly_seasonality():
+    forecast = forecast_series([_weekday_pattern()], first_weekday=0, horizon=7)[0]
+    assert [round(v) for v in forecast] == [10, 10, 10, 10, 10, 0, 0]
+
+
+def test_numpy_and_python_paths_agree():
+    pytest.importorskip("numpy")
+    rows = [_weekday_pattern(), [float(day % 5) for day in range(56)], [0.0] * 56]
+    fast = forecast_service._forecast_numpy(rows, 3, 30)
+    slow = forecast_service._forecast_python(rows, 3, 30)
+    for a, b in zip(fast, slow):
+        assert a == pytest.approx(b)
+
+
+def test_stock_forecasts_load_all_items_in_one_query(db_session):
+    company = Company(
+        name="Forecast Co",
+        subscription_start=date.today(),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(company_id=company.id, start_date=date.today() - timedelta(days=90),
+                       end_date=date.today() + timedelta(days=275))
+    party = Party(company_id=company.id, name="Forecast Buyer")
+    items = [Item(company_id=company.id, name=f"Forecast Item {n}", rate=1, current_stock=30 * (n + 1))
+             for n in range(10)]
+    db_session.add_all([fy, party, *items])
+    db_session.flush()
+
+    for day in range(1, 57):
+        invoice = Invoice(
+            company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+            invoice_number=f"INV/FC/{day}", invoice_date=date.today() - timedelta(days=day), status="OPEN",
+        )
+        invoice.items = [InvoiceItem(item_id=item.id, quantity=5, rate=1, amount=5) for item in items]
+        db_session.add(invoice)
+    db_session.commit()
+    company_id = company.id
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        outlook = get_stock_forecasts(db_session, company_id, date.today())
+        first_call = len(statements)
+        get_stock_forecasts(db_session, company_id, date.today())
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+
+    # demand series for every item + live stock; the cached model skips the former
+    assert first_call == 2
+    assert len(statements) - first_call == 1
+
+    assert len(outlook) == 10
+    assert outlook[0]["item_name"] == "Forecast Item 0"
+    assert outlook[0]["burn_rate"] == pytest.approx(5, rel=0.01)
+    assert outlook[0]["days_remaining"] == pytest.approx(6, rel=0.01)
@@ -0,0 +1,113 @@
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app.core.security import create_access_token, get_password_hash
+from app.models.audit_log import AuditLog
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.invoice_item import InvoiceItem
+from app.models.item import Item
+from app.models.party import Party
+from app.models.permission import Permission
+from app.models.role import Role
+from app.models.role_permission import RolePermission
+from app.models.stock_transaction import StockTransaction
+from app.models.user import User
+from app.routers import invoice as invoice_router
+
+
+def test_bulk_invoice_creation(client, db_session, monkeypatch):
+    company = Company(
+        name="Bulk Billing Co",
+        subscription_start=date.today() - timedelta(days=1),
+        subscription_end=date.today() + timedelta(days=30),
+        is_active=True,
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(
+        company_id=company.id, start_date=date(2035, 4, 1), end_date=date(2036, 3, 31),
+        is_active=True, is_locked=False,
+    )
+    parties = [Party(company_id=company.id, name=f"Bulk Billing Party {n}") for n in range(3)]
+    items = [Item(company_id=company.id, name=f"Bulk Billing Item {n}", rate=10, current_stock=100) for n in range(2)]
+    permission = db_session.query(Permission).filter_by(code="invoices.create").first()
+    if not permission:
+        permission = Permission(module="invoices", action="create", code="invoices.create")
+        db_session.add(permission)
+    role = Role(company_id=company.id, name="Bulk Biller")
+    db_session.add_all([fy, role, *parties, *items])
+    db_session.flush()
+    db_session.add(RolePermission(role_id=role.id, permission_id=permission.id))
+    user = User(
+        name="Bulk Biller", email="bulkbiller@example.com",
+        password_hash=get_password_hash("secret123"),
+        company_id=company.id, role_id=role.id, legacy_role="USER", is_active=True,
+    )
+    db_session.add(user)
+    db_session.commit()
+    token = create_access_token(data={
+        "user_id": user.id, "company_id": company.id, "role": "USER", "token_version": user.token_version,
+    })
+
+    payload = [
+        {
+            "party_id": parties[n % 3].id,
+            "invoice_date": "2035-04-30",
+            "gst_rate": 18,
+            "items": [
+                {"item_id": items[0].id, "quantity": 2, "rate": 50},
+                {"item_id": items[1].id, "quantity": 1, "rate": 100},
+            ],
+        }
+        for n in range(30)
+    ]
+    payload[4]["party_id"] = 999999
+    payload[7]["items"] = []
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    locks = []
+
+    def recording_lock(db, company_id):
+        locks.append((company_id, len(statements)))
+        lock_company_stock(db, company_id)
+
+    lock_company_stock = invoice_router.lock_company_stock
+    monkeypatch.setattr(invoice_router, "lock_company_stock", recording_lock)
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        response = client.post("/invoice/bulk", json={"invoices": payload},
+                               headers={"Authorization": f"Bearer {token}"})
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["created"], body["failed"]) == (28, 2)
+    assert body["results"][4]["error"] == "Party not found"
+    assert body["results"][7]["error"] == "Invoice must contain at least one item"
+
+    created = [r for r in body["results"] if r["invoice_id"]]
+    assert [r["invoice_number"] for r in created] == [f"INV/35-36/{n:03d}" for n in range(1, 29)]
+    assert all(r["grand_total"] == 236.0 for r in created)
+
+    # The company stock lock is taken before anything is written
+    assert [company_id for company_id, _ in locks] == [company.id]
+    assert not any(s.lstrip().upper().startswith("INSERT") for s in statements[:locks[0][1]])
+
+    # Multi-row inserts, not one statement per line
+    assert sum(s.startswith("INSERT INTO invoice_items") for s in statements) == 1
+    assert sum(s.startswith("INSERT INTO stock_transactions") for s in statements) == 1
+
+    invoice_ids = [r["invoice_id"] for r in created]
+    assert db_session.query(InvoiceItem).filter(InvoiceItem.invoice_id.in_(invoice_ids)).count() == 56
+    assert db_session.query(StockTransaction).filter(
+        StockTransaction.reference_type == "INVOICE", StockTransaction.reference_id.in_(invoice_ids)
+    ).count() == 56
+    assert db_session.query(AuditLog).filter(
+        AuditLog.company_id == company.id, AuditLog.action == "INVOICE_CREATE"
+    ).count() == 28
+    assert db_session.query(Invoice).filter(Invoice.company_id == company.id).count() == 28
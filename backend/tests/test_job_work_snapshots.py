@@ -0,0 +1,98 @@
+from datetime import date, timedelta
+
+from app.models.company import Company
+from app.models.delivery_challan import DeliveryChallan
+from app.models.delivery_challan_item import DeliveryChallanItem
+from app.models.financial_year import FinancialYear
+from app.models.item import Item
+from app.models.job_work_snapshot import JobWorkStockSnapshot
+from app.models.party import Party
+from app.models.party_challan import PartyChallan
+from app.models.party_challan_item import PartyChallanItem
+from app.services.job_work_snapshot_service import (
+    compute_job_work_stock_summary,
+    rebuild_job_work_snapshots,
+)
+
+
+def _snapshots(db, company_id):
+    return {
+        (s.period, float(s.inward_qty), float(s.outward_qty))
+        for s in db.query(JobWorkStockSnapshot).filter_by(company_id=company_id)
+    }
+
+
+def test_snapshots_follow_challan_writes_and_feed_summary(db_session):
+    company = Company(
+        name="Snapshot Co",
+        subscription_start=date.today(),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(company_id=company.id, start_date=date(2026, 4, 1), end_date=date(2027, 3, 31))
+    party = Party(company_id=company.id, name="Snapshot Party", gst_number="27AAAAA0000A1Z5")
+    db_session.add_all([fy, party])
+    db_session.flush()
+    item = Item(company_id=company.id, name="Flange", rate=5)
+    db_session.add(item)
+    db_session.flush()
+
+    def party_challan(number, day, qty):
+        pc = PartyChallan(
+            company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+            challan_number=number, challan_date=day, status="open",
+        )
+        pc.items.append(PartyChallanItem(item_id=item.id, quantity_ordered=qty, quantity_delivered=0))
+        db_session.add(pc)
+        return pc
+
+    pc_apr = party_challan("SNAP-1", date(2026, 4, 10), 100)
+    party_challan("SNAP-2", date(2026, 6, 3), 20)
+    db_session.commit()
+
+    dc = DeliveryChallan(
+        company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+        challan_number="SNAP-DC-1", challan_date=date(2026, 5, 20), status="sent",
+    )
+    dc.items.append(DeliveryChallanItem(party_challan_item_id=pc_apr.items[0].id, item_id=item.id, quantity=30))
+    db_session.add(dc)
+    db_session.commit()
+
+    assert _snapshots(db_session, company.id) == {
+        (date(2026, 4, 1), 100.0, 0.0),
+        (date(2026, 5, 1), 0.0, 30.0),
+        (date(2026, 6, 1), 20.0, 0.0),
+    }
+
+    # Opening = April + May snapshots + June rows before the 15th
+    rows = compute_job_work_stock_summary(db_session, company.id, date(2026, 6, 15), date(2026, 6, 30))
+    assert rows == [{
+        "party_name": "Snapshot Party",
+        "gstin": "27AAAAA0000A1Z5",
+        "item_name": "Flange",
+        "opening": 90.0,
+        "inward": 0.0,
+        "outward": 0.0,
+        "closing": 90.0,
+    }]
+
+    # Moving the delivery into June empties May's bucket and shows as outward
+    dc.challan_date = date(2026, 6, 20)
+    db_session.commit()
+    assert (date(2026, 5, 1), 0.0, 30.0) not in _snapshots(db_session, company.id)
+    rows = compute_job_work_stock_summary(db_session, company.id, date(2026, 6, 15), date(2026, 6, 30), "snapshot party")
+    assert (rows[0]["opening"], rows[0]["outward"], rows[0]["closing"]) == (120.0, 30.0, 90.0)
+
+    # Cancelled challans drop out; other party names filter everything
+    pc_apr.status = "cancelled"
+    db_session.commit()
+    rows = compute_job_work_stock_summary(db_session, company.id, date(2026, 6, 15), date(2026, 6, 30))
+    assert rows[0]["opening"] == 20.0
+    assert compute_job_work_stock_summary(db_session, company.id, date(2026, 6, 15), date(2026, 6, 30), "Other") == []
+
+    # Incremental state equals a full rebuild
+    incremental = _snapshots(db_session, company.id)
+    rebuild_job_work_snapshots(db_session, company.id)
+    db_session.commit()
+    assert _snapshots(db_session, company.id) == incremental
@@ -0,0 +1,104 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.models.company import Company
+from app.services import link_service as link_module
+from app.services.link_service import LinkService, normalize_public_url
+
+
+def make_request(headers=None, host="127.0.0.1:8000"):
+    raw = [(b"host", host.encode())] + [
+        (k.lower().encode(), v.encode()) for k, v in (headers or {}).items()
+    ]
+    return Request({
+        "type": "http", "method": "GET", "scheme": "http", "path": "/",
+        "query_string": b"", "headers": raw, "server": ("127.0.0.1", 8000),
+    })
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    calls = []
+
+    def fake_probe():
+        calls.append(1)
+        return "192.168.1.20"
+
+    monkeypatch.setattr(link_module, "_probe_lan_ip", fake_probe)
+    monkeypatch.setattr(settings, "BACKEND_URL", None)
+    return calls
+
+
+def test_lan_address_is_probed_once(probes):
+    service = LinkService(refresh_seconds=0)
+    urls = {service.base_url() for _ in range(200)}
+    assert urls == {"http://192.168.1.20:8000"}
+    assert len(probes) == 1
+
+
+def test_desktop_mode_follows_network_changes(probes, monkeypatch):
+    service = LinkService(refresh_seconds=30)
+    clock = [1000.0]
+    monkeypatch.setattr(link_module.time, "monotonic", lambda: clock[0])
+
+    assert service.base_url() == "http://192.168.1.20:8000"
+    clock[0] += 10
+    service.base_url()
+    assert len(probes) == 1
+
+    monkeypatch.setattr(link_module, "_probe_lan_ip", lambda: "10.0.0.7")
+    clock[0] += 30
+    assert service.base_url() == "http://10.0.0.7:8000"
+
+
+def test_forwarded_headers_and_precedence(probes, monkeypatch):
+    service = LinkService(refresh_seconds=0)
+    proxied = make_request({
+        "X-Forwarded-Proto": "https",
+        "X-Forwarded-Host": "bills.example.com, internal:8000",
+        "X-Forwarded-Prefix": "/api",
+    })
+    # Ignored unless the deployment opts in
+    assert service.base_url(proxied) == "http://192.168.1.20:8000"
+    monkeypatch.setattr(settings, "TRUST_PROXY_HEADERS", True)
+    assert service.base_url(proxied) == "https://bills.example.com/api"
+    assert service.base_url(make_request({"Forwarded": 'for=1.2.3.4;proto=https;host="erp.example.in"'})) == "https://erp.example.in"
+    # Malformed values fall back to the LAN address
+    assert service.base_url(make_request({"X-Forwarded-Host": "evil.com/<script>"})) == "http://192.168.1.20:8000"
+
+    monkeypatch.setattr(settings, "BACKEND_URL", "https://api.smartbill.in/")
+    assert service.base_url(proxied) == "https://api.smartbill.in"
+
+    company = Company(public_url="https://billing.acme.in")
+    assert service.base_url(proxied, company=company) == "https://billing.acme.in"
+    assert len(probes) == 1  # the LAN address is probed once and cached
+
+
+def test_company_domain_lookup_is_cached(db_session, probes):
+    from datetime import date, timedelta
+
+    company = Company(
+        name="Link Co",
+        public_url=normalize_public_url("links.example.com/"),
+        subscription_start=date.today(),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db_session.add(company)
+    db_session.commit()
+    assert company.public_url == "https://links.example.com"
+
+    service = LinkService(refresh_seconds=0)
+    base = service.base_url(db=db_session, company_id=company.id)
+    assert base == "https://links.example.com"
+    assert service.invoice_download_url(base, 5).startswith("https://links.example.com/public/invoice/5/download?token=")
+
+    company.public_url = None
+    db_session.commit()
+    assert service.base_url(db=db_session, company_id=company.id) == "https://links.example.com"
+    service.invalidate_company(company.id)
+    assert service.base_url(db=db_session, company_id=company.id) == "http://192.168.1.20:8000"
+
+    with pytest.raises(HTTPException):
+        normalize_public_url("javascript:alert(1)")
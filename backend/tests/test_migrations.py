@@ -0,0 +1,85 @@
+import os
+from datetime import date, timedelta
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database.init_db import init_db
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.item import Item
+from app.models.party import Party
+from app.models.party_challan import PartyChallan
+from app.models.party_challan_item import PartyChallanItem
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Last revision before the tables that create_all now also creates
+PRE_SNAPSHOT_REVISION = "7393ccc785ba"
+
+
+def test_upgrade_after_init_db(tmp_path, monkeypatch):
+    """
+    Startup runs init_db() (create_all) before the migrations, so the new
+    tables already exist when their revisions run. The older revisions use
+    PostgreSQL-only DDL, so the database is stamped where an existing install
+    would be.
+    """
+    url = f"sqlite:///{tmp_path / 'startup.db'}"
+    monkeypatch.setattr(settings, "DATABASE_URL", url)
+    init_db()
+
+    engine = create_engine(url)
+    with Session(engine) as db:
+        company = Company(
+            name="Migration Co",
+            subscription_start=date.today(),
+            subscription_end=date.today() + timedelta(days=30),
+        )
+        db.add(company)
+        db.flush()
+        fy = FinancialYear(company_id=company.id, start_date=date(2045, 4, 1), end_date=date(2046, 3, 31))
+        party = Party(company_id=company.id, name="Migration Party")
+        item = Item(company_id=company.id, name="Migration Bolt", rate=10)
+        db.add_all([fy, party, item])
+        db.flush()
+        pc = PartyChallan(
+            company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+            challan_number="PC-MIG-1", challan_date=date(2045, 5, 3), status="open",
+        )
+        pc.items.append(PartyChallanItem(item_id=item.id, quantity_ordered=12, quantity_delivered=0))
+        db.add_all([pc, Invoice(
+            company_id=company.id, financial_year_id=fy.id, party_id=party.id, invoice_number="INV/MIG/1",
+            invoice_date=date(2045, 5, 9), grand_total=500, paid_amount=100, payment_status="PARTIAL", status="OPEN",
+        )])
+        db.commit()
+        ids = (company.id, party.id, item.id, fy.id)
+    with engine.begin() as conn:
+        # Rows written by the app while the migrations were failing
+        conn.execute(text("DELETE FROM party_ledger_summary"))
+        conn.execute(text("UPDATE job_work_stock_snapshots SET inward_qty = 999"))
+
+    config = Config()
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    command.stamp(config, PRE_SNAPSHOT_REVISION)
+    command.upgrade(config, "head")
+
+    company_id, party_id, item_id, fy_id = ids
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT version_num FROM alembic_version")).scalar() == "b5e8d1f3a7c9"
+        assert "public_url" in {c["name"] for c in inspect(conn).get_columns("company")}
+        snapshots = conn.execute(text(
+            "SELECT party_id, item_id, period, inward_qty, outward_qty FROM job_work_stock_snapshots WHERE company_id = :c"
+        ), {"c": company_id}).all()
+        ledger = conn.execute(text(
+            "SELECT party_id, financial_year_id, invoice_total, open_due, open_invoices FROM party_ledger_summary WHERE company_id = :c"
+        ), {"c": company_id}).all()
+    engine.dispose()
+
+    assert [(p, i, str(d)[:10], float(inq), float(outq)) for p, i, d, inq, outq in snapshots] == [
+        (party_id, item_id, "2045-05-01", 12.0, 0.0)
+    ]
+    assert [(p, f, float(t), float(d), n) for p, f, t, d, n in ledger] == [(party_id, fy_id, 500.0, 400.0, 1)]
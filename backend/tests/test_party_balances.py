@@ -0,0 +1,85 @@
+import re
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app.core.security import get_password_hash
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.party import Party
+from app.models.payment import Payment
+from app.models.permission import Permission
+from app.models.role import Role
+from app.models.role_permission import RolePermission
+from app.models.user import User
+
+
+def test_party_list_balances_from_ledger_summary(client, db_session):
+    company = Company(
+        name="Balance Co",
+        subscription_start=date.today() - timedelta(days=1),
+        subscription_end=date.today() + timedelta(days=30),
+        is_active=True,
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(
+        company_id=company.id, start_date=date(2026, 4, 1), end_date=date(2027, 3, 31),
+        is_active=True, is_locked=False,
+    )
+    permission = db_session.query(Permission).filter_by(code="parties.view").first()
+    if not permission:
+        permission = Permission(module="parties", action="view", code="parties.view")
+        db_session.add(permission)
+    role = Role(company_id=company.id, name="Balance Viewer")
+    db_session.add(role)
+    db_session.flush()
+    db_session.add(RolePermission(role_id=role.id, permission_id=permission.id))
+    user = User(
+        name="Balance Admin", email="balances@example.com",
+        password_hash=get_password_hash("secret123"),
+        company_id=company.id, role_id=role.id, legacy_role="USER", is_active=True,
+    )
+    db_session.add_all([fy, user])
+    db_session.flush()
+
+    parties = [Party(company_id=company.id, name=f"Balance Party {n}", opening_balance=100) for n in range(5)]
+    db_session.add_all(parties)
+    db_session.flush()
+    for n, party in enumerate(parties):
+        db_session.add_all([
+            Invoice(company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+                    invoice_number=f"INV/BAL/{n}/1", grand_total=1000, status="OPEN"),
+            Invoice(company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+                    invoice_number=f"INV/BAL/{n}/2", grand_total=500, status="CANCELLED"),
+            Payment(company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+                    payment_date=date(2026, 5, 1), amount=300, payment_type="RECEIVED"),
+            Payment(company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+                    payment_date=date(2026, 5, 2), amount=50, payment_type="PAID"),
+        ])
+    db_session.commit()
+
+    token = client.post("/auth/login", json={
+        "email": "balances@example.com", "password": "secret123", "remember": False,
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.get("/party/", headers=headers)  # warm principal / permission caches
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        response = client.get("/party/", headers=headers)
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body) == 5
+    for row in body:
+        assert row["current_balance"] == 100 + 1000 - 300 + 50
+        assert row["total_received"] == 300
+    # Balances come from party_ledger_summary in one grouped read, not from invoices / payments
+    assert len([s for s in statements if "party_ledger_summary" in s]) == 1
+    assert not [s for s in statements if re.search(r"\bFROM (invoice|payments)\b", s)]
@@ -0,0 +1,110 @@
+from datetime import date, timedelta
+
+from sqlalchemy import delete
+
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.party import Party
+from app.models.party_ledger_summary import PartyLedgerSummary
+from app.models.payment import Payment
+from app.models.payment_allocation import PaymentAllocation
+from app.services.party_ledger_service import (
+    get_party_balance,
+    get_party_balance_before,
+    reconcile_party_ledger,
+)
+
+
+def _setup(db_session, name):
+    company = Company(
+        name=name,
+        subscription_start=date.today(),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(company_id=company.id, start_date=date(2026, 4, 1), end_date=date(2027, 3, 31))
+    party = Party(company_id=company.id, name=f"{name} Party", opening_balance=0)
+    db_session.add_all([fy, party])
+    db_session.flush()
+    return company, fy, party
+
+
+def test_summary_follows_invoice_payment_and_allocation_commits(db_session):
+    company, fy, party = _setup(db_session, "Ledger Summary Co")
+    invoice = Invoice(
+        company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+        invoice_number="INV/PLS/1", invoice_date=date(2026, 5, 10),
+        grand_total=1000, paid_amount=0, payment_status="PENDING", status="OPEN",
+    )
+    payment = Payment(
+        company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+        payment_date=date(2026, 6, 5), amount=400, payment_type="RECEIVED",
+    )
+    db_session.add_all([invoice, payment])
+    db_session.commit()
+
+    balance = get_party_balance(db_session, company.id, party.id)
+    assert (balance.invoice_total, balance.received_total, balance.net) == (1000, 400, 600)
+    assert (balance.open_due, balance.open_invoices) == (1000, 1)
+
+    # Allocation settles part of the invoice
+    db_session.add(PaymentAllocation(payment_id=payment.id, invoice_id=invoice.id, amount=400))
+    invoice.paid_amount = 400
+    invoice.payment_status = "PARTIAL"
+    db_session.commit()
+    balance = get_party_balance(db_session, company.id, party.id, fy.id)
+    assert (balance.unpaid, balance.open_due) == (600, 600)
+
+    # Moving the invoice to another month empties the old bucket
+    invoice.invoice_date = date(2026, 7, 1)
+    db_session.commit()
+    periods = {
+        row.period for row in db_session.query(PartyLedgerSummary).filter_by(party_id=party.id)
+    }
+    assert periods == {date(2026, 6, 1), date(2026, 7, 1)}
+    before = get_party_balance_before(db_session, company.id, party.id, date(2026, 7, 1))
+    assert (before.invoice_total, before.received_total) == (0, 400)
+
+    invoice.status = "CANCELLED"
+    db_session.commit()
+    balance = get_party_balance(db_session, company.id, party.id)
+    assert (balance.invoice_total, balance.open_invoices, balance.net) == (0, 0, -400)
+
+
+def test_balance_before_mixes_whole_months_with_partial_month(db_session):
+    company, fy, party = _setup(db_session, "Ledger Before Co")
+    for n, day in enumerate([date(2026, 4, 20), date(2026, 5, 3), date(2026, 5, 25)]):
+        db_session.add(Invoice(
+            company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+            invoice_number=f"INV/PLB/{n}", invoice_date=day, grand_total=100 * (n + 1), status="OPEN",
+        ))
+    db_session.add(Payment(
+        company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+        payment_date=date(2026, 5, 10), amount=50, payment_type="PAID",
+    ))
+    db_session.commit()
+
+    before = get_party_balance_before(db_session, company.id, party.id, date(2026, 5, 15))
+    assert (before.invoice_total, before.paid_total, before.net) == (300, 50, 350)
+
+
+def test_reconcile_repairs_drifted_summary(db_session):
+    company, fy, party = _setup(db_session, "Ledger Drift Co")
+    db_session.add(Invoice(
+        company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+        invoice_number="INV/PLD/1", invoice_date=date(2026, 8, 1), grand_total=750, status="OPEN",
+    ))
+    db_session.commit()
+
+    db_session.execute(delete(PartyLedgerSummary).where(PartyLedgerSummary.party_id == party.id))
+    db_session.commit()
+    assert get_party_balance(db_session, company.id, party.id).invoice_total == 0
+
+    mismatches = reconcile_party_ledger(db_session, company.id)
+    db_session.commit()
+    assert {(m["party_id"], m["field"]) for m in mismatches} >= {(party.id, "invoice_total")}
+    assert {m["party_id"] for m in mismatches} == {party.id}
+    assert get_party_balance(db_session, company.id, party.id).invoice_total == 750
+    assert reconcile_party_ledger(db_session, company.id) == []
@@ -0,0 +1,126 @@
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app.core.security import create_access_token, get_password_hash
+from app.models.attendance import Attendance, AttendanceStatus
+from app.models.company import Company
+from app.models.employee_profile import EmployeeProfile, SalaryType
+from app.models.expense import Expense
+from app.models.financial_year import FinancialYear
+from app.models.holiday import Holiday
+from app.models.role import Role
+from app.models.salary_advance import SalaryAdvance
+from app.models.user import User
+from app.services.payroll_service import compute_salary_slips, load_employees, pay_salary_slips
+
+
+def test_payroll_run_matches_single_slips_and_pays_in_one_go(client, db_session):
+    company = Company(
+        name="Payroll Run Co",
+        subscription_start=date.today() - timedelta(days=1),
+        subscription_end=date.today() + timedelta(days=30),
+        off_days=[6],
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(
+        company_id=company.id, start_date=date(2043, 4, 1), end_date=date(2044, 3, 31), is_active=True,
+    )
+    role = Role(company_id=company.id, name="Employee")
+    db_session.add_all([fy, role, Holiday(company_id=company.id, name="Founders Day", date=date(2043, 5, 15))])
+    db_session.flush()
+
+    admin = User(
+        name="Payroll Admin", email="payrolladmin@example.com", password_hash=get_password_hash("secret123"),
+        company_id=company.id, legacy_role="COMPANY_ADMIN", is_active=True,
+    )
+    employees = [
+        User(name=f"Payroll Employee {n}", company_id=company.id, role_id=role.id, legacy_role="USER", is_active=True)
+        for n in range(12)
+    ]
+    db_session.add_all([admin, *employees])
+    db_session.flush()
+    for n, emp in enumerate(employees):
+        if n % 4 != 3:  # every fourth employee has no profile
+            db_session.add(EmployeeProfile(
+                user_id=emp.id,
+                salary_type=SalaryType.DAILY if n % 2 else SalaryType.MONTHLY,
+                base_salary=800 if n % 2 else 26000,
+                enable_tds=n % 3 == 0, tds_percentage=10, professional_tax=200,
+            ))
+        for day in range(1, 11 + n):
+            db_session.add(Attendance(
+                user_id=emp.id, date=date(2043, 5, day),
+                status=AttendanceStatus.HALF_DAY if day % 5 == 0 else AttendanceStatus.PRESENT,
+                hours_worked=0, overtime_hours=1 if day % 3 == 0 else 0, bonus_amount=100 if day == 1 else 0,
+            ))
+        db_session.add(SalaryAdvance(user_id=emp.id, amount=500 + n, date=date(2043, 5, 2), is_deducted=False))
+    db_session.add(SalaryAdvance(user_id=employees[0].id, amount=999, date=date(2043, 6, 2), is_deducted=False))
+    db_session.commit()
+
+    headers = {"Authorization": "Bearer " + create_access_token(data={
+        "user_id": admin.id, "company_id": company.id, "role": "COMPANY_ADMIN", "token_version": admin.token_version,
+    })}
+    singles = {
+        emp.id: client.get(f"/employees/{emp.id}/salary?month=5&year=2043", headers=headers).json()
+        for emp in employees
+    }
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        response = client.post("/employees/payroll/run?month=5&year=2043", headers=headers)
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+    assert response.status_code == 200, response.text
+    run = response.json()
+
+    assert run["employee_count"] == 12 and run["paid_count"] == 0
+    for slip in run["slips"]:
+        expected = singles[slip.pop("user_id")]
+        expected.pop("user_id")
+        assert slip.pop("employee_name").startswith("Payroll Employee")
+        assert slip.pop("expense_id") is None
+        assert slip == expected
+    assert run["slips"][0]["total_advances_deducted"] == 500  # June advance not included
+    # Same query count whatever the number of employees, and no DDL
+    payroll_queries = [s for s in statements if "attendance" in s or "salary_advances" in s or "holidays" in s]
+    assert len(payroll_queries) == 3
+    assert not any(s.lstrip().upper().startswith("ALTER") for s in statements)
+
+    # Employees cannot run payroll
+    employee_headers = {"Authorization": "Bearer " + create_access_token(data={
+        "user_id": employees[0].id, "company_id": company.id, "role": "USER",
+        "token_version": employees[0].token_version,
+    })}
+    assert client.post("/employees/payroll/run?month=5&year=2043", headers=employee_headers).status_code == 403
+
+    # Slips computed before a concurrent run paid them
+    users = load_employees(db_session, company.id)
+    stale_slips = compute_salary_slips(db_session, company.id, 5, 2043, users)
+
+    response = client.post("/employees/payroll/run?month=5&year=2043&persist=true", headers=headers)
+    assert response.status_code == 200, response.text
+    run = response.json()
+    payable = [s for s in run["slips"] if s["final_payable"] > 0]
+    assert run["paid_count"] == len(payable) > 0
+    assert all(s["expense_id"] for s in payable)
+    assert db_session.query(Expense).filter(
+        Expense.company_id == company.id, Expense.category == "Salary"
+    ).count() == len(payable)
+    advance = db_session.query(SalaryAdvance).filter(
+        SalaryAdvance.user_id == payable[0]["user_id"], SalaryAdvance.date == date(2043, 5, 2)
+    ).one()
+    assert (advance.is_deducted, advance.deducted_month, advance.deducted_year) == (True, 5, 2043)
+
+    again = client.post("/employees/payroll/run?month=5&year=2043&persist=true", headers=headers).json()
+    assert again["paid_count"] == 0
+    paid_slip = next(s for s in again["slips"] if s["user_id"] == payable[0]["user_id"])
+    assert paid_slip["is_paid"] and paid_slip["total_advances_deducted"] == payable[0]["total_advances_deducted"]
+
+    assert pay_salary_slips(db_session, company.id, fy.id, 5, 2043, users, stale_slips) == {}
+    assert db_session.query(Expense).filter(
+        Expense.company_id == company.id, Expense.category == "Salary"
+    ).count() == len(payable)
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.pdf_service import PDFManager, media_type_for
+
+
+def fake_renderer():
+    """Renderer factory loaded inside the worker processes."""
+    pid = os.getpid()
+
+    def render(html, options):
+        if html == "slow":
+            time.sleep(30)
+        if html == "pause":
+            time.sleep(1)
+        if html == "crash":
+            os._exit(1)
+        if html == "broken":
+            raise ValueError("bad template")
+        return f"%PDF-{pid}-{options.get('landscape', False)}".encode()
+
+    return render
+
+
+def make_manager(**kwargs):
+    kwargs.setdefault("workers", 1)
+    kwargs.setdefault("queue_timeout", 10)
+    return PDFManager(backend=f"{__name__}:fake_renderer", **kwargs)
+
+
+def test_html_backend_returns_html():
+    manager = PDFManager(backend="html")
+
+    async def scenario():
+        await manager.start()
+        return await manager.generate("<p>Hi</p>")
+
+    content = asyncio.run(scenario())
+    assert content == b"<p>Hi</p>" and media_type_for(content) == "text/html"
+    assert not manager.running
+
+
+def test_warm_workers_render_and_recycle():
+    manager = make_manager(max_jobs_per_worker=2)
+
+    async def scenario():
+        await manager.start()
+        try:
+            results = [await manager.generate("<p>x</p>", {"landscape": True}) for _ in range(3)]
+            await asyncio.sleep(0)
+            return results
+        finally:
+            await manager.stop()
+
+    results = asyncio.run(scenario())
+    assert all(media_type_for(r) == "application/pdf" and r.endswith(b"-True") for r in results)
+    # Same warm process for the first two jobs, a fresh one after recycling
+    assert results[0] == results[1] != results[2]
+    assert manager.metrics()["recycled"] == 1
+
+
+def test_bad_jobs_are_isolated():
+    manager = make_manager(job_timeout=0.5)
+
+    async def scenario():
+        await manager.start()
+        errors = []
+        try:
+            for html in ("broken", "slow", "crash"):
+                with pytest.raises(HTTPException) as excinfo:
+                    await manager.generate(html)
+                errors.append(excinfo.value.status_code)
+            # The pool replaced the killed / crashed workers
+            ok = await manager.generate("<p>still alive</p>")
+        finally:
+            await manager.stop()
+        return errors, ok
+
+    errors, ok = asyncio.run(scenario())
+    assert errors == [500, 504, 500]
+    assert ok.startswith(b"%PDF-")
+    metrics = manager.metrics()
+    assert (metrics["errors"], metrics["timeouts"], metrics["crashes"]) == (1, 1, 1)
+
+
+def test_full_queue_rejects_with_503():
+    manager = make_manager(queue_size=0, job_timeout=5)
+
+    async def scenario():
+        await manager.start()
+        try:
+            busy = asyncio.create_task(manager.generate("pause"))
+            await asyncio.sleep(0.1)
+            with pytest.raises(HTTPException) as excinfo:
+                await manager.generate("<p>b</p>")
+            await busy
+        finally:
+            await manager.stop()
+        return excinfo.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 503 and error.headers["Retry-After"]
@@ -0,0 +1,99 @@
+import inspect
+from datetime import date, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.permissions import require_any_permission, require_permission
+from app.core.security import create_access_token, get_password_hash
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.permission import Permission
+from app.models.role import Role
+from app.models.role_permission import RolePermission
+from app.models.user import User
+from app.services.permission_service import PermissionService
+
+
+def _make_role(db_session, name, codes):
+    role = Role(name=name, is_active=True)
+    db_session.add(role)
+    db_session.flush()
+    for code in codes:
+        perm = db_session.query(Permission).filter(Permission.code == code).first()
+        if not perm:
+            module, action = code.split(".")
+            perm = Permission(module=module, action=action, code=code)
+            db_session.add(perm)
+            db_session.flush()
+        db_session.add(RolePermission(role_id=role.id, permission_id=perm.id))
+    db_session.commit()
+    return role
+
+
+def test_role_permissions_are_cached_until_invalidated(db_session):
+    role = _make_role(db_session, "Cache Test Role", ["parties.view", "items.view"])
+    user = User(name="Perm User", role_id=role.id, legacy_role="USER")
+
+    PermissionService.invalidate_role_cache(role.id)
+    assert PermissionService.has_permission(user, "parties.view", db_session)
+    assert PermissionService.has_any_permission(user, ["invoices.view", "items.view"], db_session)
+    assert not PermissionService.has_all_permissions(user, ["items.view", "invoices.view"], db_session)
+
+    # Revoke in the DB: the cached set still answers until invalidated
+    db_session.query(RolePermission).filter(RolePermission.role_id == role.id).delete()
+    db_session.commit()
+    assert PermissionService.has_permission(user, "parties.view", db_session)
+
+    PermissionService.invalidate_role_cache(role.id)
+    assert not PermissionService.has_permission(user, "parties.view", db_session)
+    assert PermissionService.get_user_permissions(user, db_session) == []
+
+
+def test_decorated_handlers_keep_their_kind():
+    @require_permission("invoices.view")
+    def sync_handler(db=None, current_user=None):
+        return "sync"
+
+    @require_any_permission("invoices.view", "invoices.create")
+    async def async_handler(db=None, current_user=None):
+        return "async"
+
+    assert not inspect.iscoroutinefunction(sync_handler)
+    assert inspect.iscoroutinefunction(async_handler)
+    assert list(inspect.signature(sync_handler).parameters) == ["db", "current_user"]
+
+    with pytest.raises(HTTPException) as exc:
+        sync_handler(db=object())
+    assert exc.value.status_code == 401
+
+
+def test_sync_route_runs_off_the_event_loop(client, db_session, monkeypatch):
+    role = _make_role(db_session, "Loop Guard Viewer", ["parties.view"])
+    company = Company(
+        name="Permission Loop Co",
+        subscription_start=date.today() - timedelta(days=1),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db_session.add(company)
+    db_session.flush()
+    db_session.add(FinancialYear(
+        company_id=company.id, start_date=date(2039, 4, 1), end_date=date(2040, 3, 31), is_active=True,
+    ))
+    user = User(
+        name="Loop Viewer", email="loopviewer@example.com",
+        password_hash=get_password_hash("secret123"),
+        company_id=company.id, role_id=role.id, legacy_role="USER", is_active=True,
+    )
+    db_session.add(user)
+    db_session.commit()
+    headers = {"Authorization": "Bearer " + create_access_token(data={
+        "user_id": user.id, "company_id": company.id, "role": "USER", "token_version": user.token_version,
+    })}
+
+    monkeypatch.setattr(settings, "DB_LOOP_GUARD", "raise")
+    assert client.get("/party/", headers=headers).status_code == 200
+    response = client.get("/invoice/", headers=headers)
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Permission denied: invoices.view required"
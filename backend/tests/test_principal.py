@@ -0,0 +1,89 @@
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app.core.principal import resolve_principal
+from app.core.security import get_password_hash
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.subscription_plan import SubscriptionPlan
+from app.models.user import User
+
+
+def _seed_company_user(db_session, email):
+    plan = SubscriptionPlan(name="Pro", feature_flags=["AI_INSIGHTS"])
+    db_session.add(plan)
+    db_session.flush()
+    company = Company(
+        name=f"Co {email}",
+        subscription_start=date.today() - timedelta(days=1),
+        subscription_end=date.today() + timedelta(days=30),
+        is_active=True,
+        plan_id=plan.id,
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(
+        company_id=company.id,
+        start_date=date(2026, 4, 1),
+        end_date=date(2027, 3, 31),
+        is_active=True,
+        is_locked=False,
+    )
+    user = User(
+        name="Principal User",
+        email=email,
+        password_hash=get_password_hash("secret123"),
+        company_id=company.id,
+        legacy_role="COMPANY_ADMIN",
+        is_active=True,
+    )
+    db_session.add_all([fy, user])
+    db_session.commit()
+    return company, fy, user
+
+
+def test_principal_resolves_once_and_invalidates_on_commit(db_session):
+    company, fy, user = _seed_company_user(db_session, "principal@example.com")
+
+    ctx = resolve_principal(db_session, user.id, user.token_version)
+    assert ctx.company_id == company.id
+    assert ctx.feature_flags == ("AI_INSIGHTS",)
+    assert ctx.active_fy_row["id"] == fy.id
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        assert resolve_principal(db_session, user.id, user.token_version) is ctx
+        db_session.expunge_all()
+        attached = ctx.attach_user(db_session)
+        assert attached.id == user.id and attached in db_session
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+    assert statements == []
+
+    # Deactivation is picked up by the commit listener
+    attached.is_active = False
+    db_session.commit()
+    assert resolve_principal(db_session, user.id, user.token_version) is None
+
+
+def test_active_fy_dependency_uses_principal(client, db_session):
+    company, fy, user = _seed_company_user(db_session, "principal-api@example.com")
+    token = client.post("/auth/login", json={
+        "email": "principal-api@example.com",
+        "password": "secret123",
+        "remember": False,
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/financial-year/active", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["id"] == fy.id
+
+    company.is_active = False
+    db_session.commit()
+    response = client.get("/reports/dashboard-stats", headers=headers)
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Company is inactive or not found"
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from app.services import qr_cache
+from app.services.render_service import RenderService
+
+
+@pytest.fixture
+def isolated_qr_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(qr_cache, "QR_CACHE_DIR", str(tmp_path / "qr"))
+    qr_cache.clear_memory()
+    yield tmp_path / "qr"
+    qr_cache.clear_memory()
+
+
+def test_qr_cache_tiers(isolated_qr_cache):
+    before = qr_cache.stats()
+    url = "https://example.com/public/invoice/1/download?token=abc"
+
+    first = qr_cache.get_qr_base64(url)
+    assert qr_cache.get_qr_base64(url) == first
+    qr_cache.clear_memory()
+    assert qr_cache.get_qr_base64(url) == first
+
+    after = qr_cache.stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["memory_hits"] - before["memory_hits"] == 1
+    assert after["disk_hits"] - before["disk_hits"] == 1
+    assert first == qr_cache.make_qr_base64(url)
+
+    # Rendering params are part of the key
+    assert qr_cache.get_qr_base64(url, border=1) != first
+    assert len(list(isolated_qr_cache.rglob("*.b64"))) == 2
+
+
+def test_bulk_qr_only_encodes_misses(isolated_qr_cache):
+    service = RenderService(max_workers=2, queue_size=4, queue_timeout=1)
+    urls = [f"https://example.com/public/invoice/{n}/download?token=t{n}" for n in range(200)]
+    try:
+        first = asyncio.run(service.qr_base64_many(urls))
+        second = asyncio.run(service.qr_base64_many(urls))
+    finally:
+        service.shutdown()
+
+    assert first == second and len(set(first)) == 200
+    # One pool job for the 200 misses, none for the repeat print
+    assert service.metrics()["jobs"]["qr.bulk"]["count"] == 1
+
+
+def test_prune_drops_stale_entries(isolated_qr_cache):
+    qr_cache.get_qr_base64("stale")
+    qr_cache.get_qr_base64("fresh")
+    stale = qr_cache._disk_path(qr_cache.qr_key("stale"))
+    old = time.time() - 100 * 86400
+    os.utime(stale, (old, old))
+
+    assert qr_cache.prune_disk_cache(max_age_days=90) == 1
+    assert not os.path.exists(stale)
+    assert len(list(isolated_qr_cache.rglob("*.b64"))) == 1
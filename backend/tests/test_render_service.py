@@ -0,0 +1,108 @@
+import asyncio
+import base64
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+from jinja2 import DictLoader, Environment
+
+from app.services.render_service import RenderService
+
+
+def test_render_jobs_run_off_the_event_loop():
+    service = RenderService(max_workers=2, queue_size=2, queue_timeout=0)
+    env = Environment(loader=DictLoader({"hello.html": "Hello {{ name }}"}))
+
+    def slow_job():
+        time.sleep(0.2)
+        return threading.current_thread().name
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        worker, html, qr = await asyncio.gather(
+            service.run("slow", slow_job),
+            service.render(env, "hello.html", name="World"),
+            service.qr_base64("https://example.com/dl/abc"),
+        )
+        task.cancel()
+        return ticks, worker, html, qr
+
+    try:
+        ticks, worker, html, qr = asyncio.run(scenario())
+    finally:
+        service.shutdown()
+
+    assert ticks >= 10  # the loop kept running while the job slept
+    assert worker.startswith("render")
+    assert html == "Hello World"
+    assert base64.b64decode(qr).startswith(b"\x89PNG")
+
+    jobs = service.metrics()["jobs"]
+    assert jobs["slow"]["count"] == 1 and jobs["slow"]["max_ms"] >= 200
+    assert jobs["template:hello.html"]["count"] == 1
+
+
+def test_saturated_pool_rejects_with_503():
+    service = RenderService(max_workers=1, queue_size=0, queue_timeout=0.05)
+    release = threading.Event()
+
+    async def scenario():
+        blocker = asyncio.create_task(service.run("block", release.wait, 5))
+        await asyncio.sleep(0.05)
+        try:
+            with pytest.raises(HTTPException) as excinfo:
+                await service.run("extra", lambda: None)
+        finally:
+            release.set()
+            await blocker
+        # Slot is free again once the blocking job finished
+        await service.run("extra", lambda: None)
+        return excinfo.value
+
+    try:
+        error = asyncio.run(scenario())
+    finally:
+        service.shutdown()
+
+    assert error.status_code == 503
+    assert error.headers["Retry-After"]
+    metrics = service.metrics()
+    assert metrics["rejected"] == 1 and metrics["in_flight"] == 0
+    assert metrics["jobs"]["extra"]["count"] == 1
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    service = RenderService(max_workers=1, queue_size=0, queue_timeout=2)
+    release = threading.Event()
+
+    async def scenario():
+        blocker = asyncio.create_task(service.run("block", release.wait, 5))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.create_task(service.run("waiter", lambda: None))
+        await asyncio.sleep(0.05)
+        waiter.cancel()  # e.g. the client disconnected
+        release.set()
+        await blocker
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # The helper thread got the freed slot after the cancel; it is handed back
+        await asyncio.sleep(0.2)
+        return await asyncio.wait_for(service.run("after", lambda: "ok"), 1)
+
+    try:
+        result = asyncio.run(scenario())
+    finally:
+        service.shutdown()
+
+    assert result == "ok"
+    assert service._slots.acquire(blocking=False)
+    assert "waiter" not in service.metrics()["jobs"]
@@ -0,0 +1,54 @@
+from datetime import date, timedelta
+
+from app.models.company import Company
+from app.models.expense import Expense
+from app.models.financial_year import FinancialYear
+from app.services.cache_service import (
+    SQLiteCacheBackend,
+    company_tag,
+    fy_tag,
+    report_cache,
+)
+
+
+def test_sqlite_backend_is_shared_and_tag_invalidated(tmp_path):
+    path = str(tmp_path / "report_cache.db")
+    worker_a = SQLiteCacheBackend(path)
+    worker_b = SQLiteCacheBackend(path)
+
+    worker_a.set("dashboard:1:1", {"revenue": 10.0}, ttl=60, tags=[company_tag(1), fy_tag(1)])
+    worker_a.set("dashboard:1:2", {"revenue": 20.0}, ttl=60, tags=[company_tag(1), fy_tag(2)])
+    assert worker_b.get("dashboard:1:1") == {"revenue": 10.0}
+
+    worker_b.invalidate_tags([fy_tag(1)])
+    assert worker_a.get("dashboard:1:1") is None
+    assert worker_a.get("dashboard:1:2") == {"revenue": 20.0}
+
+    worker_a.set("expired", 1, ttl=-1)
+    assert worker_b.get("expired") is None
+
+
+def test_expense_commit_invalidates_fy_tag(db_session):
+    company = Company(
+        name="Cache Co",
+        subscription_start=date.today(),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(company_id=company.id, start_date=date(2026, 4, 1), end_date=date(2027, 3, 31))
+    db_session.add(fy)
+    db_session.commit()
+
+    key = f"dashboard:{company.id}:{fy.id}"
+    report_cache.set(key, {"expenses": 0.0}, tags=[company_tag(company.id), fy_tag(fy.id)])
+    assert report_cache.get(key) is not None
+
+    db_session.add(Expense(
+        company_id=company.id,
+        financial_year_id=fy.id,
+        category="Rent",
+        amount=100,
+    ))
+    db_session.commit()
+    assert report_cache.get(key) is None
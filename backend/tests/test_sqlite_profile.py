@@ -0,0 +1,97 @@
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+from app.database import sqlite_profile
+from app.services.backup_service import backup_manager
+
+
+def _engine(path):
+    url = f"sqlite:///{path}"
+    engine = create_engine(url, **sqlite_profile.engine_kwargs(url))
+    return engine, sqlite_profile.configure(engine, url)
+
+
+def test_file_database_pragmas(tmp_path):
+    engine, _ = _engine(tmp_path / "profile.db")
+    with engine.connect() as conn:
+        pragmas = {p: conn.execute(text(f"PRAGMA {p}")).scalar()
+                   for p in ("journal_mode", "synchronous", "foreign_keys", "busy_timeout")}
+    engine.dispose()
+    assert pragmas == {"journal_mode": "wal", "synchronous": 1, "foreign_keys": 1, "busy_timeout": 30000}
+    assert "pool_size" not in sqlite_profile.engine_kwargs("sqlite:///:memory:")
+
+
+def test_writers_are_serialized(tmp_path):
+    engine, serializer = _engine(tmp_path / "writers.db")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE counter (n INTEGER)"))
+        conn.execute(text("INSERT INTO counter VALUES (0)"))
+    assert not serializer._lock.locked()
+
+    errors = []
+
+    def writer():
+        try:
+            for _ in range(20):
+                with engine.begin() as conn:
+                    conn.execute(text("UPDATE counter SET n = n + 1"))
+                    conn.execute(text("SELECT n FROM counter")).scalar()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert not serializer._lock.locked()
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT n FROM counter")).scalar() == 120
+
+    # A failed transaction gives the lock back too
+    conn = engine.connect()
+    conn.execute(text("INSERT INTO counter VALUES (1)"))
+    assert serializer._lock.locked()
+    conn.rollback()
+    conn.close()
+    assert not serializer._lock.locked()
+
+    # Ownership is per connection, not per thread
+    serializer.timeout = 0.05
+    first, second = engine.connect(), engine.connect()
+    first.execute(text("INSERT INTO counter VALUES (2)"))
+    assert first.info.get(sqlite_profile._HOLDS_LOCK)
+    started = time.perf_counter()
+    serializer.acquire(second.info)  # same thread, other connection: waits, then gives up
+    assert time.perf_counter() - started >= 0.05
+    assert not second.info.get(sqlite_profile._HOLDS_LOCK)
+    first.commit()
+    serializer.acquire(second.info)
+    assert second.info.get(sqlite_profile._HOLDS_LOCK)
+    serializer.release(second.info)
+    first.close()
+    second.close()
+    assert not serializer._lock.locked()
+    engine.dispose()
+
+
+def test_sqlite_backup_includes_wal_pages(tmp_path):
+    engine, _ = _engine(tmp_path / "live.db")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        conn.execute(text("INSERT INTO t VALUES (42)"))
+    keep_open = engine.connect()  # keeps the WAL from being checkpointed away
+    keep_open.execute(text("SELECT 1"))
+
+    backup_manager._copy_sqlite(str(tmp_path / "live.db"), str(tmp_path / "copy.db"), standalone=True)
+    keep_open.close()
+    engine.dispose()
+
+    copy = sqlite3.connect(tmp_path / "copy.db")
+    assert copy.execute("SELECT x FROM t").fetchall() == [(42,)]
+    assert copy.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+    copy.close()
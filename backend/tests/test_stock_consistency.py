@@ -0,0 +1,95 @@
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, delete, insert, text, update
+
+from app.database.stock_triggers import ensure_stock_triggers
+from app.models.company import Company
+from app.models.financial_year import FinancialYear
+from app.models.item import Item
+from app.models.stock_transaction import StockTransaction
+from app.services.stock_rebuild_service import check_current_stock
+
+
+def _stock(db_session, item):
+    db_session.expire(item)
+    return float(item.current_stock)
+
+
+def test_triggers_keep_current_stock_in_step(db_session):
+    company = Company(
+        name="Stock Trigger Co",
+        subscription_start=date.today(),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(company_id=company.id, start_date=date(2041, 4, 1), end_date=date(2042, 3, 31))
+    bolt, nut = (
+        Item(company_id=company.id, name="Trigger Bolt", rate=10),
+        Item(company_id=company.id, name="Trigger Nut", rate=10),
+    )
+    db_session.add_all([fy, bolt, nut])
+    db_session.flush()
+
+    def txn(item, qty, kind):
+        return StockTransaction(
+            company_id=company.id, financial_year_id=fy.id, item_id=item.id,
+            quantity=qty, transaction_type=kind, reference_type="INVOICE", reference_id=1,
+        )
+
+    # ORM inserts
+    inward, outward = txn(bolt, 50, "IN"), txn(bolt, 20, "OUT")
+    db_session.add_all([inward, outward])
+    db_session.commit()
+    assert _stock(db_session, bolt) == 30
+
+    # ORM update of quantity and of item_id
+    outward.quantity = 5
+    db_session.commit()
+    assert _stock(db_session, bolt) == 45
+    outward.item_id = nut.id
+    db_session.commit()
+    assert (_stock(db_session, bolt), _stock(db_session, nut)) == (50, -5)
+
+    # Core statements, as used by the stock rebuild
+    db_session.execute(insert(StockTransaction.__table__).values(
+        company_id=company.id, financial_year_id=fy.id, item_id=nut.id,
+        quantity=10, transaction_type="IN", reference_type="PARTY_CHALLAN", reference_id=2,
+    ))
+    db_session.execute(delete(StockTransaction).where(StockTransaction.id == inward.id))
+    db_session.commit()
+    assert (_stock(db_session, bolt), _stock(db_session, nut)) == (0, 5)
+
+    assert check_current_stock(db_session, company.id) == {"items_checked": 2, "mismatches": [], "repaired": 0}
+
+    # Drift (e.g. a database from before the triggers) is reported and repaired
+    db_session.execute(update(Item).where(Item.id == nut.id).values(current_stock=99))
+    db_session.commit()
+    report = check_current_stock(db_session, company.id)
+    assert report["mismatches"] == [{
+        "item_id": nut.id, "item_name": "Trigger Nut",
+        "current_stock": 99.0, "ledger_stock": 5.0, "difference": 94.0,
+    }]
+    assert check_current_stock(db_session, company.id, repair=True)["repaired"] == 1
+    assert _stock(db_session, nut) == 5
+    assert check_current_stock(db_session, company.id)["mismatches"] == []
+
+
+def test_ensure_stock_triggers_on_existing_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, current_stock NUMERIC DEFAULT 0)"))
+        conn.execute(text(
+            "CREATE TABLE stock_transactions (id INTEGER PRIMARY KEY, item_id INTEGER, "
+            "quantity NUMERIC, transaction_type VARCHAR(10))"
+        ))
+        conn.execute(text("INSERT INTO items (id, current_stock) VALUES (1, 0)"))
+        conn.execute(text("INSERT INTO stock_transactions (item_id, quantity, transaction_type) VALUES (1, 8, 'IN')"))
+
+    assert ensure_stock_triggers(engine) is True
+    assert ensure_stock_triggers(engine) is False
+    with engine.begin() as conn:
+        assert conn.execute(text("SELECT current_stock FROM items")).scalar() == 8
+        conn.execute(text("INSERT INTO stock_transactions (item_id, quantity, transaction_type) VALUES (1, 3, 'OUT')"))
+        assert conn.execute(text("SELECT current_stock FROM items")).scalar() == 5
+    engine.dispose()
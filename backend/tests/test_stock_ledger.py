@@ -0,0 +1,81 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+from app.models.company import Company
+from app.models.delivery_challan import DeliveryChallan
+from app.models.delivery_challan_item import DeliveryChallanItem
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.item import Item
+from app.models.party import Party
+from app.models.stock_transaction import StockTransaction
+from app.services.stock_ledger_service import build_transaction_ledger, get_outward_movements
+
+
+def test_ledger_resolves_documents_in_constant_queries(db_session):
+    company = Company(
+        name="Ledger Co",
+        subscription_start=date.today(),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(company_id=company.id, start_date=date(2026, 4, 1), end_date=date(2027, 3, 31))
+    buyer = Party(company_id=company.id, name="Ledger Buyer")
+    other = Party(company_id=company.id, name="Ledger Other")
+    item = Item(company_id=company.id, name="Shaft", rate=1)
+    db_session.add_all([fy, buyer, other, item])
+    db_session.flush()
+
+    for n in range(12):
+        party = buyer if n % 2 == 0 else other
+        dc = DeliveryChallan(
+            company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+            challan_number=f"LDG-DC-{n}", challan_date=date(2026, 5, 1), status="sent",
+        )
+        dc.items.append(DeliveryChallanItem(item_id=item.id, quantity=5, ok_qty=4, cr_qty=1, mr_qty=0))
+        db_session.add(dc)
+        db_session.flush()
+        db_session.add(StockTransaction(
+            company_id=company.id, financial_year_id=fy.id, item_id=item.id, quantity=5,
+            transaction_type="OUT", reference_type="DELIVERY_CHALLAN", reference_id=dc.id,
+        ))
+    invoice = Invoice(
+        company_id=company.id, financial_year_id=fy.id, party_id=buyer.id,
+        invoice_number="INV/LEDGER/001", invoice_date=date(2026, 5, 2), status="OPEN",
+    )
+    db_session.add(invoice)
+    db_session.flush()
+    db_session.add(StockTransaction(
+        company_id=company.id, financial_year_id=fy.id, item_id=item.id, quantity=2,
+        transaction_type="OUT", reference_type="INVOICE", reference_id=invoice.id,
+    ))
+    db_session.commit()
+
+    company_id, item_id, buyer_id = company.id, item.id, buyer.id
+    statements = []
+    engine = db_session.get_bind()
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        start, end = datetime(2000, 1, 1), datetime(2100, 1, 1)
+        outwards = get_outward_movements(db_session, company_id, item_id, start, end, buyer_id, with_breakdown=True)
+        outward_queries = len(statements)
+        rows, closing = build_transaction_ledger(db_session, company_id, item_id, start, end, 0.0)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    # transactions + delivery challans + invoices + delivery lines, regardless of row count
+    assert outward_queries == 4
+    assert len(statements) - outward_queries == 3
+
+    assert len(outwards) == 7
+    assert {o["party_name"] for o in outwards} == {"Ledger Buyer"}
+    dc_row = next(o for o in outwards if o["reference_type"] == "DELIVERY_CHALLAN")
+    assert (dc_row["qty"], dc_row["ok"], dc_row["cr"]) == (5.0, 4.0, 1.0)
+    assert next(o for o in outwards if o["reference_type"] == "INVOICE")["ref"] == "INV/LEDGER/001"
+
+    assert len(rows) == 13
+    assert closing == -62.0
+    assert rows[-1]["balance"] == "-62.00"
@@ -0,0 +1,107 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.models.company import Company
+from app.models.delivery_challan import DeliveryChallan
+from app.models.delivery_challan_item import DeliveryChallanItem
+from app.models.financial_year import FinancialYear
+from app.models.invoice import Invoice
+from app.models.invoice_item import InvoiceItem
+from app.models.item import Item
+from app.models.party import Party
+from app.models.party_challan import PartyChallan
+from app.models.party_challan_item import PartyChallanItem
+from app.models.stock_transaction import StockTransaction
+from app.services import stock_rebuild_service
+from app.services.stock_rebuild_service import rebuild_company_stock
+
+
+def test_rebuild_company_stock_matches_documents(db_session, monkeypatch):
+    company = Company(
+        name="Rebuild Co",
+        subscription_start=date.today(),
+        subscription_end=date.today() + timedelta(days=30),
+    )
+    db_session.add(company)
+    db_session.flush()
+    fy = FinancialYear(company_id=company.id, start_date=date(2026, 4, 1), end_date=date(2027, 3, 31))
+    party = Party(company_id=company.id, name="Rebuild Party")
+    db_session.add_all([fy, party])
+    db_session.flush()
+    item = Item(company_id=company.id, name="Casting", rate=10, current_stock=999)
+    db_session.add(item)
+    db_session.flush()
+
+    pcs = []
+    for n in range(3):
+        pc = PartyChallan(
+            company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+            challan_number=f"PC-{n}", status="open",
+        )
+        pc.items.append(PartyChallanItem(item_id=item.id, quantity_ordered=10, quantity_delivered=0))
+        pcs.append(pc)
+    db_session.add_all(pcs)
+    db_session.flush()
+
+    # PC-0 fully delivered, PC-1 partially, PC-2 untouched
+    dc = DeliveryChallan(
+        company_id=company.id, financial_year_id=fy.id, party_id=party.id, challan_number="DC-1",
+    )
+    dc.items.append(DeliveryChallanItem(party_challan_item_id=pcs[0].items[0].id, item_id=item.id, quantity=10))
+    dc.items.append(DeliveryChallanItem(party_challan_item_id=pcs[1].items[0].id, item_id=item.id, quantity=4))
+    db_session.add(dc)
+
+    invoice = Invoice(
+        company_id=company.id, financial_year_id=fy.id, party_id=party.id,
+        invoice_number="INV/REBUILD/001", status="OPEN",
+    )
+    invoice.items.append(InvoiceItem(item_id=item.id, quantity=1, rate=10, amount=10))
+    db_session.add(invoice)
+    db_session.commit()
+
+    progress = []
+    stats = rebuild_company_stock(
+        db_session, company.id,
+        progress=lambda phase, done, total: progress.append(phase),
+        chunk_size=2,
+    )
+
+    assert stats["party_challans"] == 3
+    assert stats["delivery_challans"] == 2
+    assert stats["direct_invoices"] == 1
+    assert "status_updates" in progress and "current_stock" in progress
+
+    db_session.expire_all()
+    assert db_session.query(StockTransaction).filter_by(company_id=company.id).count() == 6
+    assert float(db_session.get(Item, item.id).current_stock) == 30 - 14 - 1
+    assert [pc.status for pc in pcs] == ["completed", "partial", "open"]
+    assert float(pcs[1].items[0].quantity_delivered) == 4
+
+    # Rebuilding again is idempotent
+    rebuild_company_stock(db_session, company.id)
+    assert db_session.query(StockTransaction).filter_by(company_id=company.id).count() == 6
+
+    # A failing rebuild leaves the previous ledger in place
+    def broken(*args):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(stock_rebuild_service, "_rebuild_invoices", broken)
+    with pytest.raises(RuntimeError):
+        rebuild_company_stock(db_session, company.id)
+    db_session.expire_all()
+    assert db_session.query(StockTransaction).filter_by(company_id=company.id).count() == 6
+    assert float(db_session.get(Item, item.id).current_stock) == 15
+
+
+def test_stale_rebuild_job_does_not_block_new_ones(monkeypatch):
+    company_id = 987654  # jobs only live in the report cache
+    job = stock_rebuild_service.create_rebuild_job(company_id)
+    assert stock_rebuild_service.create_rebuild_job(company_id)["job_id"] == job["job_id"]
+
+    # The worker died mid-rebuild: no progress saved within STALE_AFTER
+    monkeypatch.setattr(stock_rebuild_service, "STALE_AFTER", -1)
+    fresh = stock_rebuild_service.create_rebuild_job(company_id)
+    assert fresh["job_id"] != job["job_id"] and fresh["status"] == "queued"
+    stale = stock_rebuild_service.get_rebuild_job(job["job_id"])
+    assert stale["status"] == "failed" and stale["error"]
@@ -0,0 +1,75 @@
+"""
+EXPLAIN regression for the stock ledger access paths.
+
+Seeds a standalone SQLite database with 1M stock_transactions and checks that
+every ledger query the app issues is answered from an index, not a full
+table scan. Set STOCK_EXPLAIN_ROWS to seed a different size.
+"""
+import os
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, func, text
+from sqlalchemy.orm import Session
+
+import app.models  # noqa: F401  (registers every table on Base.metadata)
+from app.database.base import Base
+from app.models.stock_transaction import StockTransaction
+from app.services.stock_ledger_service import build_transaction_ledger, get_outward_movements
+
+SEED_ROWS = int(os.getenv("STOCK_EXPLAIN_ROWS", "1000000"))
+
+
+def _seed(conn, rows):
+    conn.execute(text(f"""
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {rows})
+        INSERT INTO stock_transactions
+            (company_id, financial_year_id, item_id, quantity, transaction_type,
+             reference_type, reference_id, created_at)
+        SELECT n % 20 + 1, 1, n % 2000 + 1, 1,
+               CASE WHEN n % 3 = 0 THEN 'OUT' ELSE 'IN' END,
+               CASE n % 3 WHEN 0 THEN 'DELIVERY_CHALLAN' WHEN 1 THEN 'PARTY_CHALLAN' ELSE 'INVOICE' END,
+               n, datetime('2024-01-01', '+' || (n % 900) || ' days')
+        FROM seq
+    """))
+    conn.execute(text("ANALYZE"))
+
+
+def test_stock_ledger_queries_use_indexes():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        _seed(conn, SEED_ROWS)
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "stock_transactions" in statement and not statement.lstrip().upper().startswith("EXPLAIN"):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    start, end = datetime(2024, 6, 1), datetime(2024, 9, 30, 23, 59, 59)
+    with Session(engine) as db:
+        get_outward_movements(db, 3, 42, start, end, party_id=7, with_breakdown=True)
+        build_transaction_ledger(db, 3, 42, start, end, 0.0)
+        # Opening balance (reports.get_stock_ledger)
+        db.query(func.sum(StockTransaction.quantity)).filter(
+            StockTransaction.item_id == 42,
+            StockTransaction.company_id == 3,
+            StockTransaction.transaction_type == "IN",
+            StockTransaction.created_at < start,
+        ).scalar()
+        # Document reversal (challan / invoice update & delete)
+        db.query(StockTransaction).filter(
+            StockTransaction.reference_type == "DELIVERY_CHALLAN",
+            StockTransaction.reference_id == 99,
+        ).all()
+    event.remove(engine, "before_cursor_execute", capture)
+
+    assert len(captured) == 4
+    with engine.connect() as conn:
+        for statement, parameters in captured:
+            plan = " | ".join(
+                row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+            )
+            assert "SCAN stock_transactions" not in plan, f"{plan}\n{statement}"
+            assert "USING INDEX idx_st_" in plan or "USING COVERING INDEX idx_st_" in plan, plan
@@ -0,0 +1,41 @@
+import os
+
+from jinja2 import Environment, FileSystemLoader
+
+from app.routers import challan, invoice, reports
+from app.services import template_env as template_module
+from app.services.template_env import env, format_inr, precompile_templates
+
+
+def test_routers_share_one_environment():
+    assert challan.env is env and invoice.env is env and reports.env is env
+    assert env.filters["indian_currency"](1234567.5) == "12,34,567.50"
+    assert format_inr(1234567.5) == "12,34,567.50" and format_inr("n/a") == "n/a"
+    assert env.filters["indian_currency"]("n/a") == "n/a"
+    assert env.from_string("{{ 100000 | format_inr }}").render() == "1,00,000.00"
+
+
+def test_precompile_fills_the_bytecode_cache(tmp_path):
+    templates = [name for name in os.listdir(template_module.TEMPLATES_DIR) if name.endswith(".html")]
+    assert precompile_templates() == len(templates)
+
+    def fresh_env(folder):
+        # Same templates unpacked somewhere else, as in the frozen desktop build
+        return Environment(
+            loader=FileSystemLoader(folder),
+            bytecode_cache=template_module._BytecodeCache(str(tmp_path), "%s.jinja"),
+        )
+
+    fresh_env(template_module.TEMPLATES_DIR).get_template("invoice.html")
+    cached = list(tmp_path.iterdir())
+    assert len(cached) == 1
+
+    copy = tmp_path / "unpacked"
+    copy.mkdir()
+    (copy / "invoice.html").write_bytes(open(os.path.join(template_module.TEMPLATES_DIR, "invoice.html"), "rb").read())
+    compiled = []
+    second = fresh_env(str(copy))
+    original_compile = second.compile
+    second.compile = lambda *args, **kwargs: compiled.append(args) or original_compile(*args, **kwargs)
+    second.get_template("invoice.html")
+    assert compiled == []  # loaded from the bytecode cache
@@ -86,6 +86,11 @@ export const recalculateStock = async () => {
   return response.data;
 };
 
+export const getRecalculateStockStatus = async (jobId) => {
+  const response = await api.get(`/reports/recalculate-stock/${jobId}`);
+  return response.data;
+};
+
 export const getDashboardStats = async () => {
   const response = await api.get("/reports/dashboard-stats");
   return response.data;
@@ -27,6 +27,7 @@ import {
   getPartyStatementPDF,
   getStockLedger,
   recalculateStock,
+  getRecalculateStockStatus,
   getGSTReport,
   getGSTReportPDF,
   getTrueStockLedgerPDF,
@@ -535,9 +536,18 @@ export default function Reports() {
       return;
     try {
       const loadingToast = toast.loading("Recalculating Stock...");
-      await recalculateStock();
-      toast.success("Stock Ledger has been successfully rebuilt!");
+      let job = await recalculateStock();
+      // Rebuild runs as a background job on the server: poll until it finishes
+      while (job.status === "queued" || job.status === "running") {
+        await new Promise((resolve) => setTimeout(resolve, 1500));
+        job = await getRecalculateStockStatus(job.job_id);
+      }
       toast.dismiss(loadingToast);
+      if (job.status !== "completed") {
+        toast.error(job.error || "Failed to recalculate stock");
+        return;
+      }
+      toast.success("Stock Ledger has been successfully rebuilt!");
       // Refresh if an item is selected
       if (activeTab === "stock" && selectedItem) {
         fetchStockLedger();